@@ -0,0 +1,314 @@
+import json
+import os
+import time
+from datetime import date, datetime, timedelta
+from typing import NamedTuple
+
+import changes
+import db
+import reports
+
+# Heavy reports run with DuckDB over a Parquet snapshot instead of against
+# school.db. The export reads the live database in short keyset chunks, so it
+# never holds a long read. Payments (by id) and invoices (by generated_date)
+# are append-only and exported incrementally from a watermark; students and
+# results change in place and are rewritten in full, though students is kept
+# as it is when the change log shows no student was touched since last time.
+# manifest.json lists the files that make up the snapshot and is replaced
+# last, so a half-finished export is never visible.
+ANALYTICS_DIR = 'analytics'
+EXPORT_CHUNK = 50000
+COMPACT_PARTS = 32
+PASS_MARKS = 40.0
+
+# Per table: the columns written, the keyset query (key columns first, then the
+# columns), the key to start from, whether exports continue from the last key,
+# whether the query takes the export's cutoff time, and the change_events table
+# that shows whether a full copy needs rewriting
+SNAPSHOTS = {
+    'students': {
+        'columns': [('student_id', 'string'), ('first_name', 'string'), ('last_name', 'string'),
+                    ('class_name', 'string'), ('roll_number', 'string'), ('gender', 'string'), ('doa', 'string'),
+                    ('outstanding_balance', 'double'), ('extra_balance', 'double')],
+        'query': '''SELECT student_id, student_id, first_name, last_name, class_name, roll_number, gender, doa,
+                           COALESCE(outstanding_balance, 0.0), COALESCE(extra_balance, 0.0)
+                    FROM students WHERE student_id > ? ORDER BY student_id LIMIT ?''',
+        'start': ('',),
+        'incremental': False,
+        'changes': 'students',
+    },
+    'results': {
+        'columns': [('student_id', 'string'), ('subject', 'string'), ('marks', 'double')],
+        'query': "SELECT rowid, student_id, subject, marks FROM results WHERE rowid > ? ORDER BY rowid LIMIT ?",
+        'start': (0,),
+        'incremental': False,
+    },
+    # class_name is the student's class when the payment was exported, which
+    # for a regular export is the class it was paid in
+    'payments': {
+        'columns': [('id', 'int64'), ('payment_id', 'string'), ('student_id', 'string'), ('class_name', 'string'),
+                    ('amount', 'double'), ('payment_date', 'string')],
+        'query': '''SELECT p.id, p.id, p.payment_id, p.student_id, s.class_name, p.amount, p.payment_date
+                    FROM payments p LEFT JOIN students s ON s.student_id = p.student_id
+                    WHERE p.id > ? ORDER BY p.id LIMIT ?''',
+        'start': (0,),
+        'incremental': True,
+    },
+    # Only invoices generated before the current second are exported, so an
+    # invoice saved in the same second as the export is not skipped next time.
+    # A family invoice is posted for every sibling on it, so its period is looked
+    # up rather than joined, which would repeat the invoice.
+    'invoices': {
+        'columns': [('invoice_id', 'string'), ('student_id', 'string'), ('class_name', 'string'),
+                    ('school_fee', 'double'), ('bus_fee', 'double'), ('period', 'string'), ('generated_date', 'string')],
+        'query': '''SELECT i.generated_date, i.invoice_id, i.invoice_id, i.student_id, s.class_name, i.school_fee,
+                           i.bus_fee, (SELECT MIN(pi.period) FROM posted_invoices pi WHERE pi.invoice_id = i.invoice_id),
+                           i.generated_date
+                    FROM invoices i
+                    LEFT JOIN students s ON s.student_id = i.student_id
+                    WHERE (i.generated_date, i.invoice_id) > (?, ?) AND i.generated_date < ?
+                    ORDER BY i.generated_date, i.invoice_id LIMIT ?''',
+        'start': ('', ''),
+        'incremental': True,
+        'cutoff': True,
+    },
+}
+
+class DuesByClass(NamedTuple):
+    class_name: str
+    students: int
+    students_owing: int
+    outstanding: float
+    advance: float
+    owing_paid_last_30_days: int
+    owing_paid_31_to_90_days: int
+    owing_no_payment_90_days: int
+    owing_never_paid: int
+
+class SubjectPerformance(NamedTuple):
+    class_name: str
+    subject: str
+    students: int
+    average: float
+    highest: float
+    lowest: float
+    pass_rate: float
+
+def manifest_path(directory):
+    return os.path.join(directory, 'manifest.json')
+
+def read_manifest(directory=None):
+    directory = directory or ANALYTICS_DIR
+    try:
+        with open(manifest_path(directory), encoding='utf-8') as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return None
+
+def write_manifest(directory, manifest):
+    partial = manifest_path(directory) + '.partial'
+    with open(partial, 'w', encoding='utf-8') as f:
+        json.dump(manifest, f, indent=2)
+    os.replace(partial, manifest_path(directory))
+
+def arrow_schema(pa, spec):
+    return pa.schema([(name, pa.type_for_alias(type_name)) for name, type_name in spec['columns']])
+
+# Write one table's rows after `key` into a new Parquet file, a chunk (and row
+# group) at a time. Returns the rows written and the last key.
+def export_part(conn, pa, pq, spec, key, cutoff, path):
+    schema = arrow_schema(pa, spec)
+    width = len(spec['start'])
+    rows_written = 0
+    with pq.ParquetWriter(path, schema, compression='zstd') as writer:
+        while True:
+            params = list(key) + ([cutoff] if spec.get('cutoff') else []) + [EXPORT_CHUNK]
+            rows = conn.execute(spec['query'], params).fetchall()
+            if not rows:
+                break
+            key = tuple(rows[-1][:width])
+            columns = list(zip(*rows))[width:]
+            writer.write_table(pa.Table.from_arrays([pa.array(column, type=field.type)
+                                                     for column, field in zip(columns, schema)], schema=schema))
+            rows_written += len(rows)
+            if len(rows) < EXPORT_CHUNK:
+                break
+        if not rows_written:
+            writer.write_table(schema.empty_table())
+    return rows_written, key
+
+# Merge a table's parts into one file, a part at a time
+def compact_parts(pq, directory, files, path):
+    with pq.ParquetWriter(path, pq.read_schema(os.path.join(directory, files[0])), compression='zstd') as writer:
+        for name in files:
+            writer.write_table(pq.read_table(os.path.join(directory, name)))
+
+# Bring the snapshot up to date: new payments and invoices since the last
+# export, and fresh copies of students and results. full=True re-exports
+# everything (after invoices were archived or back-dated, for instance).
+def export_snapshot(directory=None, full=False, progress=None):
+    try:
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+    except ImportError:
+        raise ValueError("The analytics snapshot needs the pyarrow package (pip install pyarrow).")
+    directory = directory or ANALYTICS_DIR
+    started = time.perf_counter()
+    previous = read_manifest(directory) or {'tables': {}}
+    manifest = {'tables': {}}
+    cutoff = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+    summary = {'directory': directory, 'full': full, 'tables': {}}
+    for name in SNAPSHOTS:
+        os.makedirs(os.path.join(directory, name), exist_ok=True)
+    # Files left by an export that stopped before its manifest was written
+    listed = {file for entry in previous['tables'].values() for file in entry['files']}
+    for name in SNAPSHOTS:
+        for file in os.listdir(os.path.join(directory, name)):
+            if f"{name}/{file}" not in listed:
+                os.remove(os.path.join(directory, name, file))
+    conn = None
+    try:
+        conn = db.get_connection()
+        # Events up to here were committed before any table is read. The events
+        # after the last export's seq are kept until this consumer moves past them.
+        change_seq = changes.latest_seq(conn)
+        last_seq = previous.get('change_seq')
+        tracked = last_seq is not None and changes.get_position(conn, 'analytics') == last_seq
+        for done, (name, spec) in enumerate(SNAPSHOTS.items()):
+            entry = dict(previous['tables'].get(name) or {'files': [], 'rows': 0, 'watermark': None, 'next_part': 1})
+            if (not full and tracked and spec.get('changes') and entry['files']
+                    and not changes.changed_since(conn, spec['changes'], last_seq)):
+                manifest['tables'][name] = entry
+                summary['tables'][name] = {'exported': 0, 'rows': entry['rows'], 'files': len(entry['files']),
+                                           'unchanged': True}
+                if progress:
+                    progress((done + 1) / len(SNAPSHOTS), f"{name}: unchanged")
+                continue
+            if full or not spec['incremental'] or entry['watermark'] is None:
+                key, files, total = spec['start'], [], 0
+            else:
+                key, files, total = tuple(entry['watermark']), list(entry['files']), entry['rows']
+            part = entry['next_part']
+            file = f"{name}/{part:06d}.parquet"
+            rows, key = export_part(conn, pa, pq, spec, key, cutoff, os.path.join(directory, file))
+            part += 1
+            if rows or not files:
+                files.append(file)
+            else:
+                os.remove(os.path.join(directory, file))
+            if len(files) > COMPACT_PARTS:
+                compacted = f"{name}/{part:06d}.parquet"
+                compact_parts(pq, directory, files, os.path.join(directory, compacted))
+                files, part = [compacted], part + 1
+            manifest['tables'][name] = {'files': files, 'rows': total + rows, 'watermark': list(key), 'next_part': part}
+            summary['tables'][name] = {'exported': rows, 'rows': total + rows, 'files': len(files)}
+            if progress:
+                progress((done + 1) / len(SNAPSHOTS), f"{name}: {rows} rows")
+    finally:
+        if conn:
+            conn.close()
+    manifest['exported_at'] = cutoff
+    manifest['change_seq'] = change_seq
+    write_manifest(directory, manifest)
+    conn = None
+    try:
+        conn = db.get_connection()
+        changes.set_position(conn, 'analytics', change_seq)
+        conn.commit()
+    finally:
+        if conn:
+            conn.close()
+    for file in listed - {file for entry in manifest['tables'].values() for file in entry['files']}:
+        os.remove(os.path.join(directory, file))
+    summary['exported_at'] = cutoff
+    summary['seconds'] = round(time.perf_counter() - started, 3)
+    return summary
+
+# In-memory DuckDB connection with a view per snapshot table
+def open_snapshot(directory=None):
+    try:
+        import duckdb
+    except ImportError:
+        raise ValueError("Analytics reports need the duckdb package (pip install duckdb).")
+    directory = directory or ANALYTICS_DIR
+    manifest = read_manifest(directory)
+    if manifest is None:
+        raise ValueError(f"No analytics snapshot in {directory}. Export one first (cli.py analytics export).")
+    conn = duckdb.connect()
+    for name, entry in manifest['tables'].items():
+        files = ", ".join("'" + os.path.join(directory, file).replace("'", "''") + "'" for file in entry['files'])
+        conn.execute(f"CREATE VIEW {name} AS SELECT * FROM read_parquet([{files}])")
+    return conn
+
+# When the snapshot was taken, and its row counts
+def snapshot_info(directory=None):
+    manifest = read_manifest(directory)
+    if manifest is None:
+        return None
+    return {'exported_at': manifest['exported_at'],
+            'rows': {name: entry['rows'] for name, entry in manifest['tables'].items()}}
+
+# Collection totals between two dates (inclusive), like reports.collection_summary
+def collection_summary(start, end, by='month', per_class=False, directory=None):
+    if by not in reports.PERIODS:
+        raise ValueError(f"Unknown period: {by}. Use one of: {', '.join(reports.PERIODS)}")
+    class_column = "COALESCE(class_name, '')" if per_class else "''"
+    conn = None
+    try:
+        conn = open_snapshot(directory)
+        rows = conn.execute(f'''SELECT {reports.PERIODS[by]} AS period, {class_column} AS class, COUNT(*), SUM(amount)
+                                FROM (SELECT payment_date AS collection_date, class_name, amount FROM payments)
+                                WHERE collection_date BETWEEN ? AND ?
+                                GROUP BY period, class''', [start, end]).fetchall()
+    finally:
+        if conn:
+            conn.close()
+    totals = [reports.CollectionTotal(*row) for row in rows]
+    totals.sort(key=lambda total: (total.period, reports.class_rank(total.class_name)))
+    return totals
+
+# Balances per class, with how long ago the students who owe last paid
+def dues_by_class(as_of=None, directory=None):
+    as_of = date.fromisoformat(as_of) if as_of else date.today()
+    day_30, day_90 = (as_of - timedelta(days=30)).isoformat(), (as_of - timedelta(days=90)).isoformat()
+    conn = None
+    try:
+        conn = open_snapshot(directory)
+        rows = conn.execute('''WITH last_paid AS (
+                                   SELECT student_id, MAX(payment_date) AS last_payment FROM payments
+                                   WHERE payment_date <= ? GROUP BY student_id
+                               ),
+                               owing AS (
+                                   SELECT s.class_name, s.outstanding_balance, s.extra_balance,
+                                          s.outstanding_balance > 0.005 AS owes, l.last_payment
+                                   FROM students s LEFT JOIN last_paid l ON l.student_id = s.student_id
+                               )
+                               SELECT COALESCE(class_name, ''), COUNT(*), COUNT(*) FILTER (WHERE owes),
+                                      ROUND(SUM(outstanding_balance), 2), ROUND(SUM(extra_balance), 2),
+                                      COUNT(*) FILTER (WHERE owes AND last_payment > ?),
+                                      COUNT(*) FILTER (WHERE owes AND last_payment <= ? AND last_payment > ?),
+                                      COUNT(*) FILTER (WHERE owes AND last_payment <= ?),
+                                      COUNT(*) FILTER (WHERE owes AND last_payment IS NULL)
+                               FROM owing GROUP BY 1''', [as_of.isoformat(), day_30, day_30, day_90, day_90]).fetchall()
+    finally:
+        if conn:
+            conn.close()
+    return sorted((DuesByClass(*row) for row in rows), key=lambda row: reports.class_rank(row.class_name))
+
+# Marks per class and subject: average, range and the share at or above PASS_MARKS
+def academic_performance(class_name=None, directory=None):
+    query = '''SELECT COALESCE(s.class_name, ''), r.subject, COUNT(DISTINCT r.student_id), ROUND(AVG(r.marks), 1),
+                      MAX(r.marks), MIN(r.marks), ROUND(100.0 * AVG(CASE WHEN r.marks >= ? THEN 1 ELSE 0 END), 1)
+               FROM results r LEFT JOIN students s ON s.student_id = r.student_id'''
+    params = [PASS_MARKS]
+    if class_name:
+        query += " WHERE s.class_name = ?"
+        params.append(class_name)
+    conn = None
+    try:
+        conn = open_snapshot(directory)
+        rows = conn.execute(query + " GROUP BY 1, 2", params).fetchall()
+    finally:
+        if conn:
+            conn.close()
+    return sorted((SubjectPerformance(*row) for row in rows), key=lambda row: (reports.class_rank(row.class_name), row.subject))
@@ -0,0 +1,223 @@
+import hmac
+import json
+import os
+import sqlite3
+from concurrent.futures import ThreadPoolExecutor
+
+import tornado.httpserver
+import tornado.ioloop
+import tornado.web
+
+import auth
+import changes
+import db
+import service
+
+# Tornado ships with Streamlit, so the API needs no extra dependency.
+# Blocking SQLite and ReportLab work runs on a thread pool sized like the connection pool.
+executor = None
+
+# Every route except POST /login needs "Authorization: Bearer <token>", where the
+# token is a session from POST /login (the same sessions the app uses) or the
+# SCHOOL_API_TOKEN configured for scripts and integrations.
+API_TOKEN = os.environ.get('SCHOOL_API_TOKEN')
+
+# Run a blocking service call on the worker threads
+async def run_blocking(fn, *args):
+    return await tornado.ioloop.IOLoop.current().run_in_executor(executor, fn, *args)
+
+class BaseHandler(tornado.web.RequestHandler):
+    def set_default_headers(self):
+        self.set_header('Content-Type', 'application/json')
+
+    def bearer_token(self):
+        scheme, _, token = self.request.headers.get('Authorization', '').partition(' ')
+        return token.strip() if scheme.lower() == 'bearer' else ''
+
+    # Reject the request unless it carries the API token or a live session
+    async def prepare(self):
+        token = self.bearer_token()
+        if token and API_TOKEN and hmac.compare_digest(token.encode(), API_TOKEN.encode()):
+            self.current_user = 'api'
+            return
+        self.current_user = await run_blocking(auth.session_user, token) if token else None
+        if not self.current_user:
+            self.set_header('WWW-Authenticate', 'Bearer')
+            self.send_json({'error': "Authentication required"}, 401)
+
+    def json_body(self):
+        try:
+            body = json.loads(self.request.body or b'{}')
+        except json.JSONDecodeError:
+            raise tornado.web.HTTPError(400, reason="Request body must be JSON")
+        if not isinstance(body, dict):
+            raise tornado.web.HTTPError(400, reason="Request body must be a JSON object")
+        return body
+
+    def number(self, body, name, default=0.0):
+        try:
+            return float(body.get(name, default))
+        except (TypeError, ValueError):
+            raise tornado.web.HTTPError(400, reason=f"{name} must be a number")
+
+    def send_json(self, data, status=200):
+        self.set_status(status)
+        self.finish(json.dumps(data, default=str))
+
+    async def call(self, fn, *args, status=200):
+        try:
+            result = await run_blocking(fn, *args)
+        except db.StudentNotFound as e:
+            self.send_json({'error': str(e)}, 404)
+            return
+        except ValueError as e:
+            self.send_json({'error': str(e)}, 400)
+            return
+        except sqlite3.OperationalError as e:
+            self.send_json({'error': f"Database error: {e}"}, 503)
+            return
+        self.send_json(result, status)
+
+# POST /login {"username", "password"} -> {"token"}; DELETE /login ends that session
+class LoginHandler(BaseHandler):
+    async def prepare(self):
+        if self.request.method != 'POST':
+            await super().prepare()
+
+    async def post(self):
+        body = self.json_body()
+        try:
+            token = await run_blocking(auth.login, body.get('username'), body.get('password'), self.request.remote_ip)
+        except ValueError as e:
+            self.send_json({'error': str(e)}, 429)
+            return
+        if token is None:
+            self.send_json({'error': "Invalid username or password"}, 401)
+            return
+        self.send_json({'token': token, 'expires_in': auth.SESSION_HOURS * 3600}, 201)
+
+    async def delete(self):
+        if self.current_user != 'api':
+            await run_blocking(auth.end_session, self.bearer_token())
+        self.set_status(204)
+        self.finish()
+
+class StudentsHandler(BaseHandler):
+    async def get(self):
+        await self.call(service.list_students)
+
+    async def post(self):
+        body = self.json_body()
+        try:
+            student_id = await run_blocking(service.admit_student, body)
+        except ValueError as e:
+            self.send_json({'error': str(e)}, 400)
+            return
+        self.send_json({'student_id': student_id}, 201)
+
+class StudentHandler(BaseHandler):
+    async def get(self, student_id):
+        student = await run_blocking(db.get_student, student_id)
+        if not student:
+            self.send_json({'error': str(db.StudentNotFound())}, 404)
+            return
+        self.send_json(service.student_to_dict(student))
+
+class InvoicesHandler(BaseHandler):
+    async def get(self):
+        await self.call(service.find_documents, 'invoice', self.get_query_argument('student_id', None))
+
+    async def post(self):
+        body = self.json_body()
+        await self.call(service.issue_invoice, body.get('student_id'),
+                        self.number(body, 'school_fee'), self.number(body, 'bus_fee'), status=201)
+
+class InvoiceBatchHandler(BaseHandler):
+    async def post(self):
+        body = self.json_body()
+        await self.call(service.issue_invoices_for_all, self.number(body, 'school_fee'),
+                        self.number(body, 'bus_fee'), body.get('class_name'), status=201)
+
+class PaymentsHandler(BaseHandler):
+    async def post(self):
+        body = self.json_body()
+        await self.call(service.take_payment, body.get('student_id'), self.number(body, 'school_fee'),
+                        self.number(body, 'bus_fee'), self.number(body, 'amount'), status=201)
+
+class ReceiptsHandler(BaseHandler):
+    async def get(self):
+        await self.call(service.find_documents, 'receipt', self.get_query_argument('student_id', None))
+
+class ReportCardsHandler(BaseHandler):
+    async def get(self):
+        await self.call(service.find_documents, 'report_card', self.get_query_argument('student_id', None),
+                        self.get_query_argument('academic_year', None))
+
+    async def post(self):
+        body = self.json_body()
+        student_id = body.get('student_id')
+        try:
+            results = service.parse_results(student_id, body.get('results', []))
+        except ValueError as e:
+            self.send_json({'error': str(e)}, 400)
+            return
+        await self.call(service.issue_result_card, student_id, results,
+                        body.get('academic_year', "2024-2025"),
+                        self.number(body, 'attendance_percentage') if 'attendance_percentage' in body else None, status=201)
+
+class DocumentPdfHandler(BaseHandler):
+    async def get(self, kind, document_id):
+        pdf_data = await run_blocking(db.get_document_pdf, kind, document_id)
+        if pdf_data is None:
+            self.send_json({'error': "Document not found"}, 404)
+            return
+        self.set_header('Content-Type', 'application/pdf')
+        self.set_header('Content-Disposition', f'attachment; filename="{kind}_{document_id}.pdf"')
+        self.finish(pdf_data)
+
+# Poll the change log: GET /changes?after=<seq>&table=payments&table=...
+class ChangesHandler(BaseHandler):
+    async def get(self):
+        try:
+            after = int(self.get_query_argument('after', '0'))
+            limit = min(int(self.get_query_argument('limit', str(changes.READ_LIMIT))), changes.READ_LIMIT)
+        except ValueError:
+            raise tornado.web.HTTPError(400, reason="after and limit must be whole numbers")
+        await self.call(lambda: [event._asdict() for event in
+                                 changes.read_changes(after, self.get_query_arguments('table'), limit)])
+
+# Build the Tornado application with every route
+def make_app():
+    return tornado.web.Application([
+        (r'/login', LoginHandler),
+        (r'/students', StudentsHandler),
+        (r'/students/([^/]+)', StudentHandler),
+        (r'/invoices', InvoicesHandler),
+        (r'/invoices/batch', InvoiceBatchHandler),
+        (r'/payments', PaymentsHandler),
+        (r'/receipts', ReceiptsHandler),
+        (r'/report-cards', ReportCardsHandler),
+        (r'/changes', ChangesHandler),
+        (r'/documents/(invoice|receipt|report_card)/([^/]+)\.pdf', DocumentPdfHandler),
+    ])
+
+# Start the API server on a pooled database; blocks until the IOLoop stops
+def serve(host='127.0.0.1', port=8600, pool_size=8, db_path=None):
+    global executor
+    if db_path:
+        db.DB_PATH = db_path
+    db.init_db()
+    db.enable_connection_pool(pool_size)
+    executor = ThreadPoolExecutor(max_workers=pool_size)
+    server = tornado.httpserver.HTTPServer(make_app())
+    server.listen(port, address=host)
+    print(f"School API listening on http://{host}:{port} (db={db.DB_PATH}, pool={pool_size})")
+    try:
+        tornado.ioloop.IOLoop.current().start()
+    finally:
+        server.stop()
+        executor.shutdown(wait=True)
+        db.disable_connection_pool()
+
+if __name__ == "__main__":
+    serve()
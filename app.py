@@ -1,872 +1,34 @@
+import os
 import streamlit as st
 import sqlite3
-import pandas as pd
-from datetime import datetime
-from reportlab.lib.pagesizes import A5
-from reportlab.lib import colors
-from reportlab.platypus import SimpleDocTemplate, Table, TableStyle, Paragraph, Spacer, HRFlowable
-from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
-from reportlab.lib.units import inch
-import io
-import hashlib
 import uuid
-import time
+import auth
+from db import (init_db, enable_replica, add_student, get_all_students, get_student, record_payment,
+                save_invoice, search_invoices, save_receipt, search_receipts, save_report_card, search_report_cards,
+                get_document_pdf)
+from documents import generate_invoice, generate_receipt, generate_result_card
 
-# Initialize SQLite database and handle schema migration
-def init_db():
-    conn = None
-    try:
-        conn = sqlite3.connect('school.db', timeout=10)
-        c = conn.cursor()
-    
-        # Create students table
-        c.execute('''CREATE TABLE IF NOT EXISTS students (
-            student_id TEXT PRIMARY KEY,
-            first_name VARCHAR(50) NOT NULL,
-            middle_name VARCHAR(50) DEFAULT '',
-            last_name VARCHAR(50) NOT NULL,
-            mother_name TEXT NOT NULL,
-            father_name TEXT NOT NULL,
-            address TEXT,
-            email TEXT,
-            mobile_number VARCHAR(15),
-            dob TEXT,
-            class_name VARCHAR(10),
-            whatsapp_no TEXT,
-            gender VARCHAR(20),
-            doa TEXT,
-            roll_number TEXT,
-            outstanding_balance REAL DEFAULT 0.0,
-            extra_balance REAL DEFAULT 0.0
-        )''')
-    
-        # Check and drop tuition_fee, bus_fee, total_amount if they exist
-        c.execute("PRAGMA table_info(students)")
-        columns = [col[1] for col in c.fetchall()]
-        if 'tuition_fee' in columns or 'bus_fee' in columns or 'total_amount' in columns:
-            c.execute('''CREATE TABLE students_temp (
-                student_id TEXT PRIMARY KEY,
-                first_name VARCHAR(50) NOT NULL,
-                middle_name VARCHAR(50),
-                last_name VARCHAR(50) NOT NULL,
-                mother_name TEXT,
-                father_name TEXT,
-                address TEXT,
-                email TEXT,
-                mobile_number VARCHAR(15),
-                dob TEXT,
-                class_name VARCHAR(10),
-                whatsapp_no TEXT,
-                gender VARCHAR(20),
-                doa TEXT,
-                roll_number TEXT,
-                outstanding_balance REAL DEFAULT 0.0,
-                extra_balance REAL DEFAULT 0.0
-            )''')
-            c.execute('''INSERT INTO students_temp (
-                student_id, first_name, middle_name, last_name,
-                mother_name, father_name, address, email,
-                mobile_number, dob, class_name, whatsapp_no,
-                gender, doa, roll_number, outstanding_balance, extra_balance)
-                SELECT student_id, first_name, middle_name, last_name,
-                mother_name, father_name, address, email,
-                mobile_number, dob, class_name, whatsapp_no,
-                gender, doa, roll_number, outstanding_balance, 0.0
-                FROM students''')
-            c.execute("DROP TABLE students")
-            c.execute("ALTER TABLE students_temp RENAME TO students")
-        
-        # Ensure roll_number column exists
-        c.execute("PRAGMA table_info(students)")
-        columns = [col[1] for col in c.fetchall()]
-        if 'roll_number' not in columns:
-            c.execute("ALTER TABLE students ADD COLUMN roll_number TEXT")
-        
-        # Ensure outstanding_balance column exists
-        if 'outstanding_balance' not in columns:
-            c.execute("ALTER TABLE students ADD COLUMN outstanding_balance REAL DEFAULT 0.0")
-        
-        # Ensure extra_balance column exists
-        if 'extra_balance' not in columns:
-            c.execute("ALTER TABLE students ADD COLUMN extra_balance REAL DEFAULT 0.0")
-        
-        # Create payments table
-        c.execute('''CREATE TABLE IF NOT EXISTS payments (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            payment_id TEXT NOT NULL,
-            student_id TEXT,
-            amount REAL NOT NULL,
-            payment_date TEXT,
-            FOREIGN KEY(student_id) REFERENCES students(student_id)
-        )''')
-        
-        # Create results table
-        c.execute('''CREATE TABLE IF NOT EXISTS results (
-            student_id TEXT,
-            subject TEXT NOT NULL,
-            marks REAL NOT NULL,
-            FOREIGN KEY(student_id) REFERENCES students(student_id)
-        )''')
-        
-        # Create users table
-        c.execute('''CREATE TABLE IF NOT EXISTS users (
-            username TEXT PRIMARY KEY NOT NULL,
-            password TEXT NOT NULL
-        )''')
-        
-        # Create report_cards table
-        c.execute('''CREATE TABLE IF NOT EXISTS report_cards (
-            report_id TEXT PRIMARY KEY,
-            student_id TEXT,
-            academic_year TEXT,
-            pdf_data BLOB,
-            generated_date TEXT,
-            FOREIGN KEY(student_id) REFERENCES students(student_id)
-        )''')
-        
-        # Create invoices table
-        c.execute('''CREATE TABLE IF NOT EXISTS invoices (
-            invoice_id TEXT PRIMARY KEY,
-            student_id TEXT,
-            school_fee REAL,
-            bus_fee REAL,
-            pdf_data BLOB,
-            generated_date TEXT,
-            FOREIGN KEY(student_id) REFERENCES students(student_id)
-        )''')
-        
-        # Create receipts table
-        c.execute('''CREATE TABLE IF NOT EXISTS receipts (
-            receipt_id TEXT PRIMARY KEY,
-            student_id TEXT,
-            payment_id TEXT,
-            pdf_data BLOB,
-            generated_date TEXT,
-            FOREIGN KEY(student_id) REFERENCES students(student_id),
-            FOREIGN KEY(payment_id) REFERENCES payments(payment_id)
-        )''')
-        
-        # Check if admin user exists, if not, create it
-        c.execute("SELECT * FROM users WHERE username = ?", ('admin',))
-        user = c.fetchone()
-        if not user:
-            hashed_password = hashlib.sha256('admin123'.encode()).hexdigest()
-            c.execute("INSERT INTO users (username, password) VALUES (?, ?)",
-                   ('admin', hashed_password))
-        
-        conn.commit()
-    except sqlite3.OperationalError as e:
-        print(f"Database error during initialization: {e}")
-        raise
-    except Exception as e:
-        print(f"Error during database initialization: {e}")
-        raise
-    finally:
-        if conn:
-            conn.close()
-
-# Generate next student ID in EPSXXXX format
-def get_next_student_id():
-    conn = None
-    try:
-        conn = sqlite3.connect('school.db', timeout=10)
-        c = conn.cursor()
-        c.execute("SELECT student_id FROM students WHERE student_id LIKE 'EPS%' ORDER BY student_id DESC LIMIT 1")
-        last_id = c.fetchone()
-        if last_id:
-            last_number = int(last_id[0].replace('EPS', ''))
-            next_number = last_number + 1
-        else:
-            next_number = 1001
-        student_id = f'EPS{next_number:04d}'
-        return student_id
-    finally:
-        if conn:
-            conn.close()
-
-# Verify login credentials
-def verify_login(username, password):
-    conn = None
-    try:
-        conn = sqlite3.connect('school.db', timeout=10)
-        c = conn.cursor()
-        hashed_password = hashlib.sha256(password.encode()).hexdigest()
-        c.execute("SELECT * FROM users WHERE username = ? AND password = ?", (username, hashed_password))
-        user = c.fetchone()
-        return user is not None
-    finally:
-        if conn:
-            conn.close()
-
-# Add student to database
-def add_student(data):
-    conn = None
-    try:
-        conn = sqlite3.connect('school.db', timeout=10)
-        c = conn.cursor()
-        student_id = get_next_student_id()
-        c.execute('''INSERT INTO students (student_id, first_name, middle_name, last_name, mother_name, father_name,
-                   address, email, mobile_number, dob, class_name, whatsapp_no, gender, doa, roll_number, outstanding_balance, extra_balance)
-                   VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, 0.0, 0.0)''',
-                  (student_id, *data))
-        conn.commit()
-        return student_id
-    finally:
-        if conn:
-            conn.close()
-
-# Fetch all students
-def get_all_students():
-    conn = None
-    try:
-        conn = sqlite3.connect('school.db', timeout=10)
-        df = pd.read_sql_query("SELECT * FROM students", conn)
-        return df
-    finally:
-        if conn:
-            conn.close()
-
-# Fetch student by ID
-def get_student(student_id):
-    conn = None
-    try:
-        conn = sqlite3.connect('school.db', timeout=10)
-        c = conn.cursor()
-        c.execute("SELECT * FROM students WHERE student_id = ?", (student_id,))
-        student = c.fetchone()
-        return student
-    finally:
-        if conn:
-            conn.close()
-
-# Update student's outstanding and extra balances
-def update_balances(c, student_id, new_outstanding, new_extra):
-    c.execute("UPDATE students SET outstanding_balance = ?, extra_balance = ? WHERE student_id = ?",
-              (new_outstanding, new_extra, student_id))
-
-# Record payment
-def record_payment(student_id, school_fee, bus_fee, amount):
-    conn = None
-    max_retries = 3
-    retry_delay = 1
-    
-    for attempt in range(max_retries):
-        try:
-            conn = sqlite3.connect('school.db', timeout=10)
-            c = conn.cursor()
-            
-            payment_id = f'PAY{str(uuid.uuid4())[:8]}'
-            payment_date = datetime.now().strftime("%Y-%m-%d")
-            
-            c.execute("INSERT INTO payments (payment_id, student_id, amount, payment_date) VALUES (?, ?, ?, ?)",
-                      (payment_id, student_id, amount, payment_date))
-            
-            total_due = school_fee + bus_fee
-            
-            c.execute("SELECT outstanding_balance, extra_balance FROM students WHERE student_id = ?", (student_id,))
-            current_outstanding, current_extra = c.fetchone()
-            current_outstanding = current_outstanding or 0.0
-            current_extra = current_extra or 0.0
-            
-            effective_total_due = total_due - current_extra
-            effective_total_due = max(0, effective_total_due)
-            transaction_difference = amount - effective_total_due
-            
-            if transaction_difference < 0:
-                new_outstanding = current_outstanding - transaction_difference
-                new_extra = 0.0
-                transaction_outstanding = -transaction_difference
-                transaction_extra = 0.0
-            else:
-                new_outstanding = 0.0
-                new_extra = transaction_difference
-                transaction_outstanding = 0.0
-                transaction_extra = transaction_difference if transaction_difference > 0 else 0.0
-            
-            update_balances(c, student_id, new_outstanding, new_extra)
-            
-            conn.commit()
-            return (payment_id, payment_date, transaction_outstanding, transaction_extra, new_outstanding, new_extra)
-        
-        except sqlite3.OperationalError as e:
-            if "database is locked" in str(e) and attempt < max_retries - 1:
-                print(f"Database is locked, retrying ({attempt + 1}/{max_retries})...")
-                time.sleep(retry_delay)
-                continue
-            else:
-                print(f"Database error in record_payment: {e}")
-                raise
-        except Exception as e:
-            print(f"Error in record_payment: {e}")
-            raise
-        finally:
-            if conn:
-                conn.close()
-
-# Save invoice to database
-def save_invoice(student_id, school_fee, bus_fee, pdf_buffer, invoice_id):
-    conn = None
-    try:
-        conn = sqlite3.connect('school.db', timeout=10)
-        c = conn.cursor()
-        generated_date = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-        pdf_data = pdf_buffer.getvalue()
-        c.execute("INSERT INTO invoices (invoice_id, student_id, school_fee, bus_fee, pdf_data, generated_date) VALUES (?, ?, ?, ?, ?, ?)",
-                  (invoice_id, student_id, school_fee, bus_fee, pdf_data, generated_date))
-        conn.commit()
-        return invoice_id
-    finally:
-        if conn:
-            conn.close()
-
-# Search invoices by student ID
-def search_invoices(student_id):
-    conn = None
-    try:
-        conn = sqlite3.connect('school.db', timeout=10)
-        query = "SELECT invoice_id, student_id, school_fee, bus_fee, pdf_data, generated_date FROM invoices WHERE 1=1"
-        params = []
-        if student_id:
-            query += " AND student_id = ?"
-            params.append(student_id)
-        query += " ORDER BY generated_date DESC"
-        df = pd.read_sql_query(query, conn, params=params)
-        return df
-    finally:
-        if conn:
-            conn.close()
-
-# Generate PDF invoice
-def generate_invoice(student, school_fee, bus_fee, invoice_id):
-    buffer = io.BytesIO()
-    pdf = SimpleDocTemplate(buffer, pagesize=A5, topMargin=0.3*inch, bottomMargin=0.3*inch, leftMargin=0.3*inch, rightMargin=0.3*inch)
-    elements = []
-    styles = getSampleStyleSheet()
-    
-    bold_center = ParagraphStyle(name='BoldCenter', fontSize=12, alignment=1, fontName='Helvetica-Bold', textColor=colors.black)
-    subheader_center = ParagraphStyle(name='SubHeaderCenter', fontSize=8, alignment=1, fontName='Helvetica', textColor=colors.grey)
-    normal_center = ParagraphStyle(name='NormalCenter', fontSize=8, alignment=1, fontName='Helvetica')
-    normal_left = ParagraphStyle(name='NormalLeft', fontSize=8, alignment=0, fontName='Helvetica')
-    
-    header_data = [
-        [
-            [
-                Paragraph("Evergreen Public School", bold_center),
-                Spacer(1, 0.05*inch),
-                Paragraph("Tirmohani, Nawada Persauni, Gopalganj, Bihar, Pin Code – 841440", subheader_center),
-                Paragraph("Proprietor: Ansar Ali (Munna)", subheader_center),
-            ]
-        ]
-    ]
-    header_table = Table(header_data, colWidths=[A5[0] - 0.6*inch])
-    header_table.setStyle(TableStyle([
-        ('BOX', (0, 0), (-1, -1), 0.5, colors.black),
-        ('ALIGN', (0, 0), (-1, -1), 'CENTER'),
-        ('VALIGN', (0, 0), (-1, -1), 'MIDDLE'),
-        ('LEFTPADDING', (0, 0), (-1, -1), 4),
-        ('RIGHTPADDING', (0, 0), (-1, -1), 4),
-        ('TOPPADDING', (0, 0), (-1, -1), 4),
-        ('BOTTOMPADDING', (0, 0), (-1, -1), 4),
-        ('BACKGROUND', (0, 0), (-1, -1), colors.lightgrey),
-    ]))
-    elements.append(header_table)
-    elements.append(Spacer(1, 0.1*inch))
-    
-    invoice_date = datetime.now().strftime("%Y-%m-%d")
-    elements.append(Paragraph("Fee Invoice", ParagraphStyle(name='InvoiceTitle', fontSize=10, alignment=1, fontName='Helvetica-Bold')))
-    elements.append(Spacer(1, 0.05*inch))
-    invoice_details_data = [
-        [Paragraph(f"<b>Invoice No:</b> {invoice_id}", normal_left),
-         Paragraph(f"<b>Date:</b> {invoice_date}", normal_left)]
-    ]
-    invoice_details_table = Table(invoice_details_data, colWidths=[(A5[0] - 0.6*inch)/2, (A5[0] - 0.6*inch)/2])
-    invoice_details_table.setStyle(TableStyle([
-        ('VALIGN', (0, 0), (-1, -1), 'TOP'),
-        ('LEFTPADDING', (0, 0), (-1, -1), 2),
-        ('RIGHTPADDING', (0, 0), (-1, -1), 2),
-        ('FONTSIZE', (0, 0), (-1, -1), 8),
-    ]))
-    elements.append(invoice_details_table)
-    elements.append(Spacer(1, 0.1*inch))
-    
-    student_details_data = [
-        [Paragraph(f"<b>Name:</b> {student[1]} {student[2] or ''} {student[3]}", normal_left),
-         Paragraph(f"<b>Class:</b> {student[10]}", normal_left)],
-        [Paragraph(f"<b>Student ID:</b> {student[0]}", normal_left),
-         Paragraph(f"<b>Roll Number:</b> {student[14]}", normal_left)]
-    ]
-    student_details_table = Table(student_details_data, colWidths=[(A5[0] - 0.6*inch)/2, (A5[0] - 0.6*inch)/2])
-    student_details_table.setStyle(TableStyle([
-        ('VALIGN', (0, 0), (-1, -1), 'TOP'),
-        ('LEFTPADDING', (0, 0), (-1, -1), 2),
-        ('RIGHTPADDING', (0, 0), (-1, -1), 2),
-        ('FONTSIZE', (0, 0), (-1, -1), 8),
-        ('BOX', (0, 0), (-1, -1), 0.5, colors.grey),
-        ('INNERGRID', (0, 0), (-1, -1), 0.25, colors.grey),
-    ]))
-    elements.append(student_details_table)
-    elements.append(Spacer(1, 0.1*inch))
-    
-    outstanding_balance = student[15] or 0.0
-    extra_balance = student[16] or 0.0
-    subtotal = school_fee + bus_fee
-    adjusted_total = subtotal + outstanding_balance - extra_balance
-    adjusted_total = max(0, adjusted_total)
-    
-    fee_data = [
-        ['S.No.', 'Description', 'Amount'],
-        ['1', 'School Fee', f'₹{school_fee:.2f}'],
-        ['2', 'Bus Fee', f'₹{bus_fee:.2f}'],
-    ]
-    row_count = 3
-    if outstanding_balance > 0:
-        fee_data.append([str(row_count), 'Previous Outstanding', f'₹{outstanding_balance:.2f}'])
-        row_count += 1
-    if extra_balance > 0:
-        fee_data.append([str(row_count), 'Previous Extra (Deducted)', f'₹{extra_balance:.2f}'])
-        row_count += 1
-    fee_data.append(['', 'Total', f'₹{adjusted_total:.2f}'])
-    
-    fee_table = Table(fee_data, colWidths=[0.5*inch, (A5[0] - 1.3*inch), 1.2*inch])
-    fee_table.setStyle(TableStyle([
-        ('BACKGROUND', (0, 0), (-1, 0), colors.grey),
-        ('TEXTCOLOR', (0, 0), (-1, 0), colors.whitesmoke),
-        ('ALIGN', (0, 0), (-1, -1), 'CENTER'),
-        ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
-        ('FONTSIZE', (0, 0), (-1, -1), 8),
-        ('BOTTOMPADDING', (0, 0), (-1, 0), 4),
-        ('GRID', (0, 0), (-1, -1), 0.5, colors.black),
-        ('FONTNAME', (1, -1), (2, -1), 'Helvetica-Bold'),
-        ('BACKGROUND', (1, -1), (2, -1), colors.lightgrey),
-        ('BACKGROUND', (1, 2), (2, 2), colors.yellow) if outstanding_balance > 0 else ('BACKGROUND', (0, 0), (0, 0), colors.white),
-        ('BACKGROUND', (1, 3), (2, 3), colors.lightgreen) if extra_balance > 0 and outstanding_balance > 0 else 
-        ('BACKGROUND', (1, 2), (2, 2), colors.lightgreen) if extra_balance > 0 else ('BACKGROUND', (0, 0), (0, 0), colors.white),
-    ]))
-    elements.append(fee_table)
-    elements.append(Spacer(1, 0.2*inch))
-    
-    footer_data = [
-        [Paragraph("________________________", normal_center)],
-        [Paragraph("Authorized Signature", normal_center)],
-        [Paragraph(f"Date: {invoice_date}", normal_center)]
-    ]
-    footer_table = Table(footer_data, colWidths=[A5[0] - 0.6*inch])
-    footer_table.setStyle(TableStyle([
-        ('ALIGN', (0, 0), (-1, -1), 'CENTER'),
-        ('VALIGN', (0, 0), (-1, -1), 'TOP'),
-        ('FONTSIZE', (0, 0), (-1, -1), 8),
-    ]))
-    elements.append(footer_table)
-    
-    pdf.build(elements)
-    buffer.seek(0)
-    return buffer
-
-# Save receipt to database
-def save_receipt(student_id, payment_id, pdf_buffer):
-    conn = None
-    try:
-        conn = sqlite3.connect('school.db', timeout=10)
-        c = conn.cursor()
-        receipt_id = f'REC{str(uuid.uuid4())[:8]}'
-        generated_date = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-        pdf_data = pdf_buffer.getvalue()
-        c.execute("INSERT INTO receipts (receipt_id, student_id, payment_id, pdf_data, generated_date) VALUES (?, ?, ?, ?, ?)",
-                  (receipt_id, student_id, payment_id, pdf_data, generated_date))
-        conn.commit()
-        return receipt_id
-    finally:
-        if conn:
-            conn.close()
-
-# Search receipts by student ID
-def search_receipts(student_id):
-    conn = None
-    try:
-        conn = sqlite3.connect('school.db', timeout=10)
-        query = "SELECT receipt_id, student_id, payment_id, pdf_data, generated_date FROM receipts WHERE 1=1"
-        params = []
-        if student_id:
-            query += " AND student_id = ?"
-            params.append(student_id)
-        query += " ORDER BY generated_date DESC"
-        df = pd.read_sql_query(query, conn, params=params)
-        return df
-    finally:
-        if conn:
-            conn.close()
-
-# Redesigned Payment Receipt with modern design
-def generate_receipt(student, school_fee, bus_fee, amount, payment_id, payment_date, transaction_outstanding, transaction_extra, total_outstanding, total_extra):
-    buffer = io.BytesIO()
-    pdf = SimpleDocTemplate(buffer, pagesize=A5, topMargin=0.3*inch, bottomMargin=0.3*inch, leftMargin=0.3*inch, rightMargin=0.3*inch)
-    elements = []
-    styles = getSampleStyleSheet()
-    
-    # Define modern styles
-    bold_center = ParagraphStyle(name='BoldCenter', fontSize=12, alignment=1, fontName='Helvetica-Bold', textColor=colors.black)
-    subheader_center = ParagraphStyle(name='SubHeaderCenter', fontSize=8, alignment=1, fontName='Helvetica', textColor=colors.grey)
-    normal_center = ParagraphStyle(name='NormalCenter', fontSize=8, alignment=1, fontName='Helvetica')
-    normal_left = ParagraphStyle(name='NormalLeft', fontSize=8, alignment=0, fontName='Helvetica')
-    title_style = ParagraphStyle(name='Title', fontSize=14, alignment=1, fontName='Helvetica-Bold', textColor=colors.darkblue, spaceAfter=6)
-    label_style = ParagraphStyle(name='Label', fontSize=8, fontName='Helvetica-Bold', alignment=0)
-    
-    # Modern Header
-    header_data = [
-        [
-            Paragraph("[School Logo]", normal_center),  # Placeholder for logo
-            [
-                Paragraph("Evergreen Public School", bold_center),
-                Spacer(1, 0.05*inch),
-                Paragraph("Tirmohani, Nawada Persauni", subheader_center),
-                Paragraph("Gopalganj, Bihar – 841440", subheader_center),
-                Paragraph("Proprietor: Ansar Ali (Munna)", subheader_center),
-            ]
-        ]
-    ]
-    header_table = Table(header_data, colWidths=[1*inch, A5[0] - 1.6*inch])
-    header_table.setStyle(TableStyle([
-        ('BOX', (0, 0), (-1, -1), 0.5, colors.black),
-        ('ALIGN', (0, 0), (-1, -1), 'CENTER'),
-        ('VALIGN', (0, 0), (-1, -1), 'MIDDLE'),
-        ('LEFTPADDING', (0, 0), (-1, -1), 4),
-        ('RIGHTPADDING', (0, 0), (-1, -1), 4),
-        ('TOPPADDING', (0, 0), (-1, -1), 4),
-        ('BOTTOMPADDING', (0, 0), (-1, -1), 4),
-        ('BACKGROUND', (0, 0), (-1, -1), colors.lightgrey),
-    ]))
-    elements.append(header_table)
-    elements.append(Spacer(1, 0.1*inch))
-    
-    # Receipt Title and Details
-    elements.append(Paragraph("Payment Receipt", title_style))
-    receipt_details_data = [
-        [Paragraph(f"<b>Payment ID:</b> {payment_id}", normal_left),
-         Paragraph(f"<b>Date:</b> {payment_date}", normal_left)]
-    ]
-    receipt_details_table = Table(receipt_details_data, colWidths=[(A5[0] - 0.6*inch)/2, (A5[0] - 0.6*inch)/2])
-    receipt_details_table.setStyle(TableStyle([
-        ('VALIGN', (0, 0), (-1, -1), 'TOP'),
-        ('LEFTPADDING', (0, 0), (-1, -1), 2),
-        ('RIGHTPADDING', (0, 0), (-1, -1), 2),
-        ('FONTSIZE', (0, 0), (-1, -1), 8),
-    ]))
-    elements.append(receipt_details_table)
-    elements.append(Spacer(1, 0.1*inch))
-    
-    # Student Information
-    student_data = [
-        [Paragraph(f"<b>Name:</b> {student[1]} {student[2] or ''} {student[3]}", normal_left),
-         Paragraph(f"<b>Class:</b> {student[10]}", normal_left)],
-        [Paragraph(f"<b>Student ID:</b> {student[0]}", normal_left),
-         Paragraph(f"<b>Roll Number:</b> {student[14]}", normal_left)],
-    ]
-    student_table = Table(student_data, colWidths=[(A5[0] - 0.6*inch)/2, (A5[0] - 0.6*inch)/2])
-    student_table.setStyle(TableStyle([
-        ('VALIGN', (0, 0), (-1, -1), 'TOP'),
-        ('LEFTPADDING', (0, 0), (-1, -1), 2),
-        ('RIGHTPADDING', (0, 0), (-1, -1), 2),
-        ('FONTSIZE', (0, 0), (-1, -1), 8),
-        ('BOX', (0, 0), (-1, -1), 0.5, colors.grey),
-        ('INNERGRID', (0, 0), (-1, -1), 0.25, colors.grey),
-    ]))
-    elements.append(student_table)
-    elements.append(Spacer(1, 0.1*inch))
-    
-    # Fee Details Table
-    total_due = school_fee + bus_fee
-    previous_extra = student[16] or 0.0
-    effective_total_due = max(0, total_due - previous_extra)
-    payment_type = "Full Payment" if amount >= effective_total_due else "Partial Payment"
-    
-    data = [
-        ['Description', 'Amount'],
-        ['School Fee', f'₹{school_fee:.2f}'],
-        ['Bus Fee', f'₹{bus_fee:.2f}'],
-        ['Total Due', f'₹{total_due:.2f}'],
-    ]
-    row_count = 4
-    if previous_extra > 0:
-        data.append(['Previous Extra (Deducted)', f'₹{previous_extra:.2f}'])
-        data.append(['Effective Total Due', f'₹{effective_total_due:.2f}'])
-        row_count += 2
-    data.extend([
-        ['Amount Paid', f'₹{amount:.2f}'],
-        ['Outstanding (This Transaction)', f'₹{transaction_outstanding:.2f}'],
-    ])
-    row_count += 2
-    if transaction_extra > 0:
-        data.append(['Extra Amount (This Transaction)', f'₹{transaction_extra:.2f}'])
-        row_count += 1
-    data.extend([
-        ['Total Outstanding Balance', f'₹{total_outstanding:.2f}'],
-        ['Total Extra Balance', f'₹{total_extra:.2f}'],
-        ['Payment Type', payment_type]
-    ])
-    
-    table = Table(data, colWidths=[3*inch, 1.5*inch])
-    table.setStyle(TableStyle([
-        ('BACKGROUND', (0, 0), (-1, 0), colors.grey),
-        ('TEXTCOLOR', (0, 0), (-1, 0), colors.whitesmoke),
-        ('ALIGN', (0, 0), (-1, -1), 'CENTER'),
-        ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
-        ('FONTSIZE', (0, 0), (-1, -1), 8),
-        ('BOTTOMPADDING', (0, 0), (-1, 0), 4),
-        ('GRID', (0, 0), (-1, -1), 0.5, colors.black),
-        ('FONTNAME', (0, row_count-5), (0, row_count-1), 'Helvetica-Bold'),
-        ('BACKGROUND', (0, 1), (-1, 1), colors.white),
-        ('BACKGROUND', (0, 2), (-1, 2), colors.lightgrey),
-        ('BACKGROUND', (0, 3), (-1, 3), colors.white),
-        ('BACKGROUND', (0, row_count-5), (-1, row_count-5), colors.lightgreen if amount >= effective_total_due else colors.lightcoral),
-        ('BACKGROUND', (0, row_count-4), (-1, row_count-4), colors.yellow if transaction_outstanding > 0 else colors.lightgrey),
-        ('BACKGROUND', (0, row_count-3), (-1, row_count-3), colors.lightgreen) if transaction_extra > 0 else ('BACKGROUND', (0, 0), (0, 0), colors.white),
-        ('BACKGROUND', (0, row_count-2), (-1, row_count-2), colors.yellow if total_outstanding > 0 else colors.lightgrey),
-        ('BACKGROUND', (0, row_count-1), (-1, row_count-1), colors.lightgreen if total_extra > 0 else colors.lightgrey),
-        ('BACKGROUND', (0, row_count), (-1, row_count), colors.lightblue),
-    ]))
-    elements.append(table)
-    elements.append(Spacer(1, 0.1*inch))
-    
-    # Divider Line
-    elements.append(HRFlowable(width="100%", thickness=0.5, color=colors.grey))
-    elements.append(Spacer(1, 0.05*inch))
-    
-    # Modern Footer
-    footer_data = [
-        [Paragraph(f"Date: {payment_date}", normal_left),
-         Paragraph("Thank you for your payment!", normal_center),
-         Paragraph("Authorized Signature: __________________", normal_left)]
-    ]
-    footer_table = Table(footer_data, colWidths=[1.5*inch, 1.5*inch, 2*inch])
-    footer_table.setStyle(TableStyle([
-        ('VALIGN', (0, 0), (-1, -1), 'TOP'),
-        ('FONTSIZE', (0, 0), (-1, -1), 8),
-    ]))
-    elements.append(footer_table)
-    
-    pdf.build(elements)
-    buffer.seek(0)
-    return buffer
-
-# Save report card to database
-def save_report_card(student_id, academic_year, pdf_buffer):
-    conn = None
-    try:
-        conn = sqlite3.connect('school.db', timeout=10)
-        c = conn.cursor()
-        report_id = f'REP{str(uuid.uuid4())[:8]}'
-        generated_date = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-        pdf_data = pdf_buffer.getvalue()
-        c.execute("INSERT INTO report_cards (report_id, student_id, academic_year, pdf_data, generated_date) VALUES (?, ?, ?, ?, ?)",
-                  (report_id, student_id, academic_year, pdf_data, generated_date))
-        conn.commit()
-        return report_id
-    finally:
-        if conn:
-            conn.close()
+# The session token is kept in session state and, so a refresh stays signed in,
+# a SameSite cookie; never in the URL. The server-side session decides: the
+# token is checked on every rerun, so a logout or password change ends it.
+SESSION_COOKIE = 'eps_session'
 
-# Search report cards by student ID and academic year
-def search_report_cards(student_id, academic_year):
-    conn = None
-    try:
-        conn = sqlite3.connect('school.db', timeout=10)
-        query = "SELECT report_id, student_id, academic_year, pdf_data, generated_date FROM report_cards WHERE 1=1"
-        params = []
-        if student_id:
-            query += " AND student_id = ?"
-            params.append(student_id)
-        if academic_year:
-            query += " AND academic_year = ?"
-            params.append(academic_year)
-        query += " ORDER BY generated_date DESC"
-        df = pd.read_sql_query(query, conn, params=params)
-        return df
-    finally:
-        if conn:
-            conn.close()
-
-# Generate PDF result card
-def generate_result_card(student, results, academic_year="2024-2025", attendance_percentage=95):
-    buffer = io.BytesIO()
-    pdf = SimpleDocTemplate(buffer, pagesize=A5, topMargin=0.3*inch, bottomMargin=0.3*inch, leftMargin=0.5*inch, rightMargin=0.5*inch)
-    elements = []
-    styles = getSampleStyleSheet()
-    
-    header_style = ParagraphStyle(name='Header', fontSize=16, alignment=1, fontName='Helvetica-Bold', textColor=colors.darkblue)
-    subheader_style = ParagraphStyle(name='SubHeader', fontSize=9, alignment=1, fontName='Helvetica', textColor=colors.grey)
-    normal_center = ParagraphStyle(name='NormalCenter', fontSize=8, alignment=1)
-    normal_center_bold = ParagraphStyle(name='NormalCenterBold', fontSize=8, alignment=1, fontName='Helvetica-Bold')
-    normal_left = ParagraphStyle(name='NormalLeft', fontSize=8, alignment=0)
-    small_left = ParagraphStyle(name='SmallLeft', fontSize=7, alignment=0)
-    
-    header_data = [
-        [
-            [
-                Paragraph("Evergreen Public School", header_style),
-                Spacer(1, 0.05*inch),
-                Paragraph("Tirmohani, Nawada Persauni, Gopalganj, Bihar, Pin Code – 841440", subheader_style),
-                Paragraph("Proprietor: Ansar Ali (Munna)", subheader_style),
-                Spacer(1, 0.05*inch),
-                Paragraph(f"Academic Year: {academic_year}", normal_center_bold),
-            ]
-        ]
-    ]
-    header_table = Table(header_data, colWidths=[A5[0] - 1*inch])
-    header_table.setStyle(TableStyle([
-        ('BOX', (0, 0), (-1, -1), 1, colors.black),
-        ('ALIGN', (0, 0), (-1, -1), 'CENTER'),
-        ('VALIGN', (0, 0), (-1, -1), 'MIDDLE'),
-        ('LEFTPADDING', (0, 0), (-1, -1), 8),
-        ('RIGHTPADDING', (0, 0), (-1, -1), 8),
-        ('TOPPADDING', (0, 0), (-1, -1), 8),
-        ('BOTTOMPADDING', (0, 0), (-1, -1), 8),
-        ('BACKGROUND', (0, 0), (-1, -1), colors.lightgrey),
-    ]))
-    elements.append(header_table)
-    elements.append(Spacer(1, 0.1*inch))
-    
-    student_data = [
-        [Paragraph(f"<b>Name:</b> {student[1]} {student[2] or ''} {student[3]}", normal_left),
-         Paragraph(f"<b>Class:</b> {student[10]}", normal_left)],
-        [Paragraph(f"<b>Student ID:</b> {student[0]}", normal_left),
-         Paragraph(f"<b>Roll Number:</b> {student[14]}", normal_left)],
-        [Paragraph(f"<b>Father's Name:</b> {student[5]}", normal_left),
-         Paragraph(f"<b>Mother's Name:</b> {student[4]}", normal_left)],
-        [Paragraph(f"<b>Date of Birth:</b> {student[9]}", normal_left),
-         Paragraph(f"<b>Admission Date:</b> {student[13]}", normal_left)]
-    ]
-    student_table = Table(student_data, colWidths=[2.5*inch, 2.5*inch])
-    student_table.setStyle(TableStyle([
-        ('VALIGN', (0, 0), (-1, -1), 'TOP'),
-        ('LEFTPADDING', (0, 0), (-1, -1), 4),
-        ('RIGHTPADDING', (0, 0), (-1, -1), 4),
-        ('BOX', (0, 0), (-1, -1), 0.5, colors.grey),
-        ('INNERGRID', (0, 0), (-1, -1), 0.25, colors.grey),
-        ('FONTSIZE', (0, 0), (-1, -1), 8),
-    ]))
-    elements.append(student_table)
-    elements.append(Spacer(1, 0.1*inch))
-    
-    max_marks_per_subject = 100
-    passing_marks = 40
-    data = [['S.No.', 'Subject', 'Marks', 'Max', 'Grade', 'Status']]
-    total_marks = 0
-    total_max_marks = 0
-    for idx, result in enumerate(results, 1):
-        marks = result[2]
-        total_marks += marks
-        total_max_marks += max_marks_per_subject
-        if marks >= 90:
-            subject_grade = "A+"
-        elif marks >= 80:
-            subject_grade = "A"
-        elif marks >= 70:
-            subject_grade = "B"
-        elif marks >= 60:
-            subject_grade = "C"
-        elif marks >= 50:
-            subject_grade = "D"
-        elif marks >= 40:
-            subject_grade = "E"
-        else:
-            subject_grade = "F"
-        status = "Pass" if marks >= passing_marks else "Fail"
-        row = [str(idx), result[1], f"{marks:.0f}", f"{max_marks_per_subject:.0f}", subject_grade, status]
-        data.append(row)
-    
-    marks_table = Table(data, colWidths=[0.4*inch, 1.8*inch, 0.8*inch, 0.8*inch, 0.6*inch, 0.6*inch])
-    marks_table.setStyle(TableStyle([
-        ('BACKGROUND', (0, 0), (-1, 0), colors.grey),
-        ('TEXTCOLOR', (0, 0), (-1, 0), colors.whitesmoke),
-        ('ALIGN', (0, 0), (-1, -1), 'CENTER'),
-        ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
-        ('FONTSIZE', (0, 0), (-1, -1), 8),
-        ('BOTTOMPADDING', (0, 0), (-1, 0), 4),
-        ('GRID', (0, 0), (-1, -1), 0.5, colors.black),
-        ('VALIGN', (0, 0), (-1, -1), 'MIDDLE'),
-    ]))
-    for i in range(1, len(data)):
-        status = data[i][5]
-        bg_color = colors.lightgreen if status == "Pass" else colors.lightcoral
-        marks_table.setStyle(TableStyle([
-            ('BACKGROUND', (0, i), (-1, i), bg_color),
-        ]))
-    elements.append(Paragraph("Academic Performance", styles['Heading4']))
-    elements.append(Spacer(1, 0.05*inch))
-    elements.append(marks_table)
-    elements.append(Spacer(1, 0.1*inch))
-    
-    percentage = (total_marks / total_max_marks * 100) if total_max_marks > 0 else 0
-    if percentage >= 90:
-        overall_grade = "A+"
-        remarks = "Outstanding! Keep up the excellent work."
-    elif percentage >= 80:
-        overall_grade = "A"
-        remarks = "Excellent. Continue to strive for greatness."
-    elif percentage >= 70:
-        overall_grade = "B"
-        remarks = "Good. Focus on consistency."
-    elif percentage >= 60:
-        overall_grade = "C"
-        remarks = "Satisfactory. Work on weak areas."
-    elif percentage >= 50:
-        overall_grade = "D"
-        remarks = "Needs improvement. Seek help."
-    elif percentage >= 40:
-        overall_grade = "E"
-        remarks = "Below average. Extra effort needed."
-    else:
-        overall_grade = "F"
-        remarks = "Unsatisfactory. Immediate attention needed."
-    
-    summary_data = [
-        ['Total Marks', f"{total_marks:.0f}"],
-        ['Max Marks', f"{total_max_marks:.0f}"],
-        ['Percentage', f"{percentage:.1f}%"],
-        ['Grade', overall_grade],
-        ['Attendance', f"{attendance_percentage}%"],
-        ['Remarks', remarks]
-    ]
-    summary_table = Table(summary_data, colWidths=[1.2*inch, 3.8*inch])
-    summary_table.setStyle(TableStyle([
-        ('ALIGN', (0, 0), (-1, -1), 'CENTER'),
-        ('FONTNAME', (0, 0), (0, -1), 'Helvetica-Bold'),
-        ('FONTSIZE', (0, 0), (-1, -1), 8),
-        ('BOTTOMPADDING', (0, 0), (-1, -1), 4),
-        ('GRID', (0, 0), (-1, -1), 0.5, colors.black),
-        ('VALIGN', (0, 0), (-1, -1), 'MIDDLE'),
-        ('BACKGROUND', (0, 0), (0, -1), colors.lightgrey),
-        ('BACKGROUND', (1, 3), (1, 3), colors.lightgreen if percentage >= 60 else colors.lightcoral),
-        ('BACKGROUND', (1, 4), (1, 4), colors.lightgreen if attendance_percentage >= 75 else colors.yellow),
-    ]))
-    elements.append(Paragraph("Summary", styles['Heading4']))
-    elements.append(Spacer(1, 0.05*inch))
-    elements.append(summary_table)
-    elements.append(Spacer(1, 0.1*inch))
-    
-    footer_data = [
-        [Paragraph(f"Date: {datetime.now().strftime('%Y-%m-%d')}", small_left),
-         Paragraph("School Stamp", normal_center),
-         Paragraph("____________________", normal_center)],
-        ['', '', Paragraph("Principal's Signature", normal_center)]
-    ]
-    footer_table = Table(footer_data, colWidths=[1.5*inch, 1.5*inch, 2*inch])
-    footer_table.setStyle(TableStyle([
-        ('VALIGN', (0, 0), (-1, -1), 'TOP'),
-        ('FONTSIZE', (0, 0), (-1, -1), 8),
-    ]))
-    elements.append(footer_table)
-    
-    pdf.build(elements)
-    buffer.seek(0)
-    return buffer
+def write_session_cookie(value, max_age):
+    import streamlit.components.v1 as components
+    components.html(f"""<script>
+        parent.document.cookie = '{SESSION_COOKIE}={value}; Max-Age={max_age}; Path=/; SameSite=Strict'
+            + (parent.location.protocol === 'https:' ? '; Secure' : '');
+        </script>""", height=0)
 
 # Main app with login
 def main():
-    if 'logged_in' not in st.session_state:
-        st.session_state.logged_in = False
+    token = st.session_state.get('session_token') or st.context.cookies.get(SESSION_COOKIE)
+    st.session_state.logged_in = bool(token) and auth.session_user(token) is not None
+    st.session_state.session_token = token if st.session_state.logged_in else None
     
     if not st.session_state.logged_in:
+        if st.session_state.pop('clear_session_cookie', False):
+            write_session_cookie('', 0)
         st.title("Evergreen Public School - Login")
         st.write("Tirmohani, Nawada Persauni, Gopalganj, Bihar, Pin Code – 841440")
         st.write("Proprietor: Ansar Ali (Munna)")
@@ -877,22 +39,33 @@ def main():
             submitted = st.form_submit_button("Login")
             
             if submitted:
-                if verify_login(username, password):
-                    st.session_state.logged_in = True
-                    st.success("Login successful!")
-                    st.rerun()
+                try:
+                    token = auth.login(username, password, st.context.ip_address)
+                except ValueError as e:
+                    st.error(str(e))
                 else:
-                    st.error("Invalid username or password")
+                    if token:
+                        st.session_state.session_token = token
+                        st.session_state.session_cookie_written = False
+                        st.success("Login successful!")
+                        st.rerun()
+                    else:
+                        st.error("Invalid username or password")
     else:
+        if not st.session_state.get('session_cookie_written', True):
+            write_session_cookie(token, auth.SESSION_HOURS * 3600)
+            st.session_state.session_cookie_written = True
         st.title("Evergreen Public School Management System")
         st.write("Tirmohani, Nawada Persauni, Gopalganj, Bihar, Pin Code – 841440")
         st.write("Proprietor: Ansar Ali (Munna)")
         
         if st.button("Logout"):
-            st.session_state.logged_in = False
+            auth.end_session(token)
+            st.session_state.session_token = None
+            st.session_state.clear_session_cookie = True
             st.rerun()
         
-        menu = ["Student Admission", "Generate Invoice", "Record Payment", "Student Report", "Result Card", "Search Report Card"]
+        menu = ["Student Admission", "Generate Invoice", "Record Payment", "Student Report", "Families", "Result Card", "Search Report Card", "Attendance", "Fee Schedule", "Year-End Promotion", "Collections", "Background Jobs"]
         choice = st.sidebar.selectbox("Select Option", menu)
         
         if choice == "Student Admission":
@@ -925,7 +98,7 @@ def main():
         
         elif choice == "Generate Invoice":
             st.subheader("Generate Invoice")
-            action = st.selectbox("Select Action", ["Generate New Invoice", "Reprint Invoice"])
+            action = st.selectbox("Select Action", ["Generate New Invoice", "Invoice Posted Charges", "Reprint Invoice"])
             
             if action == "Generate New Invoice":
                 student_id = st.text_input("Enter Student ID")
@@ -933,8 +106,8 @@ def main():
                 bus_fee = st.number_input("Bus Fee", min_value=0.0, step=100.0)
                 student = get_student(student_id)
                 if student:
-                    outstanding_balance = student[15] or 0.0
-                    extra_balance = student[16] or 0.0
+                    outstanding_balance = student.outstanding_balance or 0.0
+                    extra_balance = student.extra_balance or 0.0
                     subtotal = school_fee + bus_fee
                     adjusted_total = subtotal + outstanding_balance - extra_balance
                     adjusted_total = max(0, adjusted_total)
@@ -942,7 +115,7 @@ def main():
                     st.write(f"Previous Extra Balance: ₹{extra_balance:.2f}")
                     st.write(f"Total (After Adjustments): ₹{adjusted_total:.2f}")
                 if st.button("Generate"):
-                    if school_fee == 0 and bus_fee == 0 and (not student or (student[15] == 0 and student[16] == 0)):
+                    if school_fee == 0 and bus_fee == 0 and (not student or (student.outstanding_balance == 0 and student.extra_balance == 0)):
                         st.error("Please enter at least one fee (School Fee or Bus Fee), or ensure there is an outstanding or extra balance.")
                     else:
                         if student:
@@ -952,58 +125,93 @@ def main():
                             st.download_button(
                                 label="Download Invoice",
                                 data=pdf_buffer,
-                                file_name=f"invoice_{student[1]}_{student[3]}_{student[14]}.pdf",
+                                file_name=f"invoice_{student.first_name}_{student.last_name}_{student.roll_number}.pdf",
                                 mime="application/pdf"
                             )
                             st.success(f"Invoice generated and saved with ID: {invoice_id}")
                         else:
                             st.error("Student not found!")
             
+            elif action == "Invoice Posted Charges":
+                import fees
+                import service
+                student_id = st.text_input("Enter Student ID")
+                period = st.text_input("Month (YYYY-MM)", value=fees.normalise_period())
+                with_siblings = st.checkbox("One invoice for the student and their siblings")
+                if st.button("Generate"):
+                    try:
+                        if with_siblings:
+                            import families
+                            invoice = families.issue_household_invoice(student_id, period)
+                        else:
+                            invoice = service.issue_posted_invoice(student_id, period)
+                        st.download_button(
+                            label="Download Invoice",
+                            data=get_document_pdf('invoice', invoice['invoice_id']),
+                            file_name=f"invoice_{student_id}_{invoice['period']}.pdf",
+                            mime="application/pdf"
+                        )
+                        st.success(f"Invoice generated and saved with ID: {invoice['invoice_id']}")
+                        if with_siblings:
+                            st.write(f"Students on this invoice: {', '.join(invoice['student_ids'])}")
+                    except ValueError as e:
+                        st.error(str(e))
+
             elif action == "Reprint Invoice":
                 student_id = st.text_input("Enter Student ID to Search")
                 if st.button("Search"):
-                    invoices = search_invoices(student_id)
-                    if not invoices.empty:
+                    invoices = search_invoices(student_id, primary=True)
+                    if invoices:
                         st.write("### Found Invoices")
-                        for idx, row in invoices.iterrows():
+                        for row in invoices:
                             col1, col2, col3 = st.columns([2, 2, 1])
                             with col1:
-                                st.write(f"Student ID: {row['student_id']}")
-                                st.write(f"School Fee: ₹{row['school_fee']:.2f}")
+                                st.write(f"Student ID: {row.student_id}")
+                                st.write(f"School Fee: ₹{row.school_fee:.2f}")
                             with col2:
-                                st.write(f"Bus Fee: ₹{row['bus_fee']:.2f}")
-                                st.write(f"Generated on: {row['generated_date']}")
+                                st.write(f"Bus Fee: ₹{row.bus_fee:.2f}")
+                                st.write(f"Generated on: {row.generated_date}")
                             with col3:
                                 st.download_button(
                                     label="Download",
-                                    data=row['pdf_data'],
-                                    file_name=f"invoice_{row['student_id']}_{row['invoice_id']}.pdf",
+                                    data=row.pdf_data,
+                                    file_name=f"invoice_{row.student_id}_{row.invoice_id}.pdf",
                                     mime="application/pdf",
-                                    key=f"download_invoice_{row['invoice_id']}"
+                                    key=f"download_invoice_{row.invoice_id}"
                                 )
                     else:
                         st.info("No invoices found for the given student ID.")
         
         elif choice == "Record Payment":
             st.subheader("Record Payment")
-            action = st.selectbox("Select Action", ["Record New Payment", "Reprint Receipt"])
+            action = st.selectbox("Select Action", ["Record New Payment", "Record Family Payment", "Reprint Receipt"])
             
             if action == "Record New Payment":
+                import fees
+                # Once this month's charges are posted they are already in the balance
+                posted = fees.get_posting(fees.normalise_period())
                 student_id = st.text_input("Enter Student ID")
-                school_fee = st.number_input("School Fee", min_value=0.0, step=100.0, value=1200.0)
-                bus_fee = st.number_input("Bus Fee", min_value=0.0, step=100.0, value=500.0)
+                school_fee = st.number_input("School Fee", min_value=0.0, step=100.0, value=0.0 if posted else 1200.0)
+                bus_fee = st.number_input("Bus Fee", min_value=0.0, step=100.0, value=0.0 if posted else 500.0)
                 total = school_fee + bus_fee
+                if posted:
+                    st.caption(f"Charges for {posted['period']} were posted on {posted['posted_at']}; leave the fees at 0 to pay against the balance.")
                 st.write(f"Total Due (This Transaction): ₹{total:.2f}")
                 student = get_student(student_id)
+                effective_total = total
                 if student:
-                    previous_extra = student[16] or 0.0
-                    effective_total = max(0, total - previous_extra)
+                    previous_extra = student.extra_balance or 0.0
+                    if total == 0:
+                        effective_total = max(0, (student.outstanding_balance or 0.0) - previous_extra)
+                        st.write(f"Outstanding Balance: ₹{student.outstanding_balance or 0.0:.2f}")
+                    else:
+                        effective_total = max(0, total - previous_extra)
                     st.write(f"Previous Extra Balance: ₹{previous_extra:.2f}")
                     st.write(f"Effective Total Due: ₹{effective_total:.2f}")
                 amount = st.number_input("Payment Amount", min_value=0.0, step=100.0)
                 if st.button("Record Payment"):
-                    if school_fee == 0 and bus_fee == 0:
-                        st.error("Please enter at least one fee (School Fee or Bus Fee).")
+                    if school_fee == 0 and bus_fee == 0 and not (student and (student.outstanding_balance or 0) > 0):
+                        st.error("Please enter at least one fee (School Fee or Bus Fee), or pay against an outstanding balance.")
                     elif amount <= 0:
                         st.error("Payment Amount must be greater than zero.")
                     else:
@@ -1017,7 +225,7 @@ def main():
                                 st.download_button(
                                     label="Download Receipt",
                                     data=pdf_buffer,
-                                    file_name=f"receipt_{student[1]}_{student[3]}_{student[14]}.pdf",
+                                    file_name=f"receipt_{student.first_name}_{student.last_name}_{student.roll_number}.pdf",
                                     mime="application/pdf"
                                 )
                                 st.success(f"{payment_type} Payment of ₹{amount:.2f} recorded successfully! Receipt ID: {receipt_id}, Total Outstanding: ₹{total_outstanding:.2f}, Total Extra: ₹{total_extra:.2f}")
@@ -1026,27 +234,58 @@ def main():
                         else:
                             st.error("Student not found!")
             
+            elif action == "Record Family Payment":
+                import families
+                student_id = st.text_input("Enter Student ID (any sibling)")
+                st.caption("The payment clears each sibling's balance in admission order; anything left over is kept as advance.")
+                if student_id:
+                    try:
+                        members = families.siblings(student_id)
+                        st.dataframe([{'Student ID': m.student_id, 'Name': f"{m.first_name} {m.last_name}", 'Class': m.class_name,
+                                       'Outstanding': m.outstanding_balance or 0.0, 'Extra': m.extra_balance or 0.0}
+                                      for m in members])
+                        family_due = sum((m.outstanding_balance or 0.0) - (m.extra_balance or 0.0) for m in members)
+                        st.write(f"Family Balance Due: ₹{max(0.0, family_due):.2f}")
+                    except ValueError as e:
+                        st.error(str(e))
+                amount = st.number_input("Payment Amount", min_value=0.0, step=100.0)
+                if st.button("Record Payment"):
+                    try:
+                        payment = families.take_family_payment(student_id, amount)
+                        st.download_button(
+                            label="Download Receipt",
+                            data=get_document_pdf('receipt', payment['receipt_id']),
+                            file_name=f"receipt_family_{student_id}_{payment['payment_id']}.pdf",
+                            mime="application/pdf"
+                        )
+                        st.dataframe(payment['allocations'])
+                        st.success(f"Payment of ₹{amount:.2f} recorded for a family of {len(payment['allocations'])} students! Receipt ID: {payment['receipt_id']}, Total Outstanding: ₹{payment['total_outstanding']:.2f}, Total Extra: ₹{payment['total_extra']:.2f}")
+                    except ValueError as e:
+                        st.error(str(e))
+                    except sqlite3.OperationalError as e:
+                        st.error(f"Database error: {e}. Please try again.")
+
             elif action == "Reprint Receipt":
                 student_id = st.text_input("Enter Student ID to Search")
                 if st.button("Search"):
-                    receipts = search_receipts(student_id)
-                    if not receipts.empty:
+                    receipts = search_receipts(student_id, primary=True)
+                    if receipts:
                         st.write("### Found Receipts")
-                        for idx, row in receipts.iterrows():
+                        for row in receipts:
                             col1, col2, col3 = st.columns([2, 2, 1])
                             with col1:
-                                st.write(f"Student ID: {row['student_id']}")
-                                st.write(f"Payment ID: {row['payment_id']}")
+                                st.write(f"Student ID: {row.student_id}")
+                                st.write(f"Payment ID: {row.payment_id}")
                             with col2:
-                                st.write(f"Generated on: {row['generated_date']}")
-                                st.write(f"Receipt ID: {row['receipt_id']}")
+                                st.write(f"Generated on: {row.generated_date}")
+                                st.write(f"Receipt ID: {row.receipt_id}")
                             with col3:
                                 st.download_button(
                                     label="Download",
-                                    data=row['pdf_data'],
-                                    file_name=f"receipt_{row['student_id']}_{row['receipt_id']}.pdf",
+                                    data=row.pdf_data,
+                                    file_name=f"receipt_{row.student_id}_{row.receipt_id}.pdf",
                                     mime="application/pdf",
-                                    key=f"download_receipt_{row['receipt_id']}"
+                                    key=f"download_receipt_{row.receipt_id}"
                                 )
                     else:
                         st.info("No receipts found for the given student ID.")
@@ -1065,14 +304,68 @@ def main():
                 )
             else:
                 st.info("No students found.")
-        
+
+        elif choice == "Families":
+            import families
+            st.subheader("Families")
+            st.caption("Siblings are matched on their parents' names and mobile number. Link or separate students the match gets wrong.")
+            student_id = st.text_input("Enter Student ID")
+            if student_id:
+                try:
+                    members = families.siblings(student_id)
+                    st.dataframe([{'Student ID': m.student_id, 'Name': f"{m.first_name} {m.last_name}", 'Class': m.class_name,
+                                   'Roll Number': m.roll_number, 'Father': m.father_name, 'Mother': m.mother_name,
+                                   'Mobile': m.mobile_number} for m in members])
+                except ValueError as e:
+                    st.error(str(e))
+            col1, col2, col3 = st.columns(3)
+            with col1:
+                sibling_id = st.text_input("Sibling's Student ID")
+                if st.button("Link as Siblings"):
+                    try:
+                        linked = families.link_students(student_id, sibling_id)
+                        st.success(f"Moved {', '.join(linked['moved'])} into household {linked['household_id']}.")
+                    except ValueError as e:
+                        st.error(str(e))
+            with col2:
+                if st.button("Separate Student"):
+                    try:
+                        families.separate_student(student_id)
+                        st.success(f"{student_id} now has a household of their own.")
+                    except ValueError as e:
+                        st.error(str(e))
+            with col3:
+                if st.button("Undo Manual Change"):
+                    try:
+                        cleared = families.clear_override(student_id)
+                        st.success(f"{student_id} is back in household {cleared['household_id']}.")
+                    except ValueError as e:
+                        st.error(str(e))
+
+            st.write("### All Families")
+            family_list = families.list_families()
+            if family_list:
+                st.dataframe([family._asdict() for family in family_list])
+            else:
+                st.info("No families with more than one student yet.")
+            if st.button("Rebuild Household Index"):
+                rebuilt = families.rebuild_index()
+                st.success(f"Indexed {rebuilt['students']} students into {rebuilt['households']} households ({rebuilt['families']} with siblings).")
+
         elif choice == "Result Card":
             st.subheader("Result Card")
             action = st.selectbox("Select Action", ["Generate New Result Card", "Reprint Result Card"])
             
             if action == "Generate New Result Card":
+                import attendance
+                import promotion
                 student_id = st.text_input("Enter Student ID")
-                attendance_percentage = st.number_input("Attendance Percentage", min_value=0.0, max_value=100.0, value=95.0, step=1.0)
+                academic_year = st.text_input("Academic Year", value=promotion.current_academic_year())
+                record = attendance.student_attendance(student_id, academic_year) if student_id else None
+                if record and record.marked:
+                    st.write(f"Attendance register: present {record.present} of {record.marked} days ({record.percentage}%)")
+                attendance_percentage = st.number_input("Attendance Percentage", min_value=0.0, max_value=100.0,
+                                                        value=record.percentage if record and record.marked else 95.0, step=1.0)
                 subjects = st.text_area("Enter Subjects and Marks (e.g., Math:80, Science:75)", placeholder="Math:80\nScience:75")
                 if st.button("Generate"):
                     student = get_student(student_id)
@@ -1095,14 +388,13 @@ def main():
                                 break
                         else:
                             if results:
-                                academic_year = "2024-2025"
                                 pdf_buffer = generate_result_card(student, results, academic_year, attendance_percentage)
-                                report_id = save_report_card(student_id, academic_year, pdf_buffer)
+                                report_id = save_report_card(student_id, academic_year, pdf_buffer, results)
                                 st.success(f"Result card generated and saved with ID: {report_id}")
                                 st.download_button(
                                     label="Download Result Card",
                                     data=pdf_buffer,
-                                    file_name=f"result_{student[1]}_{student[3]}_{student[14]}_{academic_year}.pdf",
+                                    file_name=f"result_{student.first_name}_{student.last_name}_{student.roll_number}_{academic_year}.pdf",
                                     mime="application/pdf"
                                 )
                     else:
@@ -1112,24 +404,24 @@ def main():
                 student_id = st.text_input("Enter Student ID to Search")
                 academic_year = st.text_input("Academic Year (e.g., 2024-2025)", value="")
                 if st.button("Search"):
-                    report_cards = search_report_cards(student_id, academic_year if academic_year else None)
-                    if not report_cards.empty:
+                    report_cards = search_report_cards(student_id, academic_year if academic_year else None, primary=True)
+                    if report_cards:
                         st.write("### Found Result Cards")
-                        for idx, row in report_cards.iterrows():
+                        for row in report_cards:
                             col1, col2, col3 = st.columns([2, 2, 1])
                             with col1:
-                                st.write(f"Student ID: {row['student_id']}")
-                                st.write(f"Academic Year: {row['academic_year']}")
+                                st.write(f"Student ID: {row.student_id}")
+                                st.write(f"Academic Year: {row.academic_year}")
                             with col2:
-                                st.write(f"Generated on: {row['generated_date']}")
-                                st.write(f"Report ID: {row['report_id']}")
+                                st.write(f"Generated on: {row.generated_date}")
+                                st.write(f"Report ID: {row.report_id}")
                             with col3:
                                 st.download_button(
                                     label="Download",
-                                    data=row['pdf_data'],
-                                    file_name=f"result_{row['student_id']}_{row['academic_year']}.pdf",
+                                    data=row.pdf_data,
+                                    file_name=f"result_{row.student_id}_{row.academic_year}.pdf",
                                     mime="application/pdf",
-                                    key=f"download_report_{row['report_id']}"
+                                    key=f"download_report_{row.report_id}"
                                 )
                     else:
                         st.info("No result cards found for the given criteria.")
@@ -1139,28 +431,329 @@ def main():
             student_id = st.text_input("Enter Student ID to Search")
             academic_year = st.text_input("Academic Year (e.g., 2024-2025)", value="")
             if st.button("Search"):
-                report_cards = search_report_cards(student_id, academic_year if academic_year else None)
-                if not report_cards.empty:
+                report_cards = search_report_cards(student_id, academic_year if academic_year else None, primary=True)
+                if report_cards:
                     st.write("### Found Result Cards")
-                    for idx, row in report_cards.iterrows():
+                    for row in report_cards:
                         col1, col2, col3 = st.columns([2, 2, 1])
                         with col1:
-                            st.write(f"Student ID: {row['student_id']}")
-                            st.write(f"Academic Year: {row['academic_year']}")
+                            st.write(f"Student ID: {row.student_id}")
+                            st.write(f"Academic Year: {row.academic_year}")
                         with col2:
-                            st.write(f"Generated on: {row['generated_date']}")
-                            st.write(f"Report ID: {row['report_id']}")
+                            st.write(f"Generated on: {row.generated_date}")
+                            st.write(f"Report ID: {row.report_id}")
                         with col3:
                             st.download_button(
                                 label="Download",
-                                data=row['pdf_data'],
-                                file_name=f"result_{row['student_id']}_{row['academic_year']}.pdf",
+                                data=row.pdf_data,
+                                file_name=f"result_{row.student_id}_{row.academic_year}.pdf",
                                 mime="application/pdf",
-                                key=f"download_search_{row['report_id']}"
+                                key=f"download_search_{row.report_id}"
                             )
                 else:
                     st.info("No report cards found for the given criteria.")
 
+        elif choice == "Attendance":
+            import attendance
+            import promotion
+            st.subheader("Attendance")
+            action = st.selectbox("Select Action", ["Mark Class Attendance", "Attendance Summary"])
+            class_name = st.selectbox("Class", ["Nursery", "LKG", "UKG", "1", "2", "3", "4", "5", "6", "7", "8", "9", "10"])
+
+            if action == "Mark Class Attendance":
+                day = st.date_input("Date")
+                students = attendance.class_list(class_name)
+                labels = {student_id: f"{roll_number or '-'}. {first_name} {last_name} ({student_id})"
+                          for student_id, first_name, last_name, roll_number in students}
+                absent = st.multiselect("Absent Students (everyone else is marked present)", list(labels),
+                                        format_func=lambda student_id: labels[student_id])
+                st.write(f"Present: {len(students) - len(absent)} of {len(students)}")
+                if st.button("Save Attendance"):
+                    try:
+                        summary = attendance.mark_class(class_name, day, absent)
+                        st.success(f"Attendance saved for class {class_name} on {day}: "
+                                   f"{summary['present']} present, {summary['absent']} absent.")
+                    except ValueError as e:
+                        st.error(str(e))
+
+            elif action == "Attendance Summary":
+                academic_year = st.text_input("Academic Year", value=promotion.current_academic_year())
+                try:
+                    records = attendance.summarise(academic_year, class_name)
+                except ValueError as e:
+                    st.error(str(e))
+                    records = []
+                if records:
+                    below = [record for record in records if record.percentage is not None and record.percentage < 75]
+                    st.write(f"### {len(records)} students, {len(below)} below 75% attendance")
+                    st.dataframe([record._asdict() for record in records])
+                    totals = attendance.daily_totals(academic_year, class_name)
+                    st.write("### Attendance by Day (%)")
+                    st.line_chart({'Present %': {day: round(100.0 * present / marked, 1) for day, present, marked in totals}})
+                else:
+                    st.info("No attendance marked for this class and session.")
+
+        elif choice == "Fee Schedule":
+            import fees
+            import jobs
+            st.subheader("Fee Schedule")
+            with st.form("fee_form"):
+                col1, col2 = st.columns(2)
+                with col1:
+                    class_name = st.selectbox("Class", ["Nursery", "LKG", "UKG", "1", "2", "3", "4", "5", "6", "7", "8", "9", "10"])
+                    fee_head = st.selectbox("Fee Head", fees.FEE_HEADS)
+                with col2:
+                    amount = st.number_input("Monthly Amount", min_value=0.0, step=100.0)
+                    months = st.text_input("Charged in Months (e.g. 9,3; blank = every month)", value="")
+                if st.form_submit_button("Save Fee"):
+                    try:
+                        fees.set_fee(class_name, fee_head, amount, months)
+                        st.success(f"{fee_head.title()} fee for class {class_name} set to ₹{amount:.2f}")
+                    except ValueError as e:
+                        st.error(str(e))
+            schedule = fees.list_fees()
+            if schedule:
+                st.dataframe([fee._asdict() for fee in schedule])
+            else:
+                st.info("No fees scheduled yet.")
+
+            st.write("### Post Monthly Charges")
+            period = st.text_input("Month (YYYY-MM)", value=fees.normalise_period())
+            col1, col2 = st.columns(2)
+            with col1:
+                if st.button("Post Charges"):
+                    try:
+                        posting = fees.post_charges(period)
+                        if posting['already_posted']:
+                            st.info(f"Charges for {posting['period']} were already posted on {posting['posted_at']}.")
+                        else:
+                            st.success(f"Posted ₹{posting['amount']:.2f} to {posting['students']} students for {posting['period']}.")
+                    except ValueError as e:
+                        st.error(str(e))
+            with col2:
+                by_family = st.checkbox("One invoice per family")
+                if st.button("Queue Invoices for Month"):
+                    try:
+                        job_id = jobs.enqueue('post_charges', {'period': fees.normalise_period(period), 'invoices': True,
+                                                               'by_family': by_family})
+                        st.success(f"Job {job_id} queued. Follow it under Background Jobs.")
+                    except ValueError as e:
+                        st.error(str(e))
+            postings = fees.list_postings()
+            if postings:
+                st.dataframe(postings)
+
+        elif choice == "Year-End Promotion":
+            import promotion
+            st.subheader("Year-End Promotion")
+            st.caption("Moves every student up one class (Nursery → LKG → UKG → 1 … 10 → Graduated) and renumbers rolls in each class.")
+            academic_year = st.text_input("New Academic Year (e.g. 2025-2026)", value=promotion.current_academic_year())
+            roll_order = st.selectbox("Assign Roll Numbers By", list(promotion.ROLL_ORDERS),
+                                      format_func=lambda order: order.replace('_', ' ').title())
+            hold_back = st.text_input("Students Repeating Their Class (comma-separated IDs, optional)", value="")
+            hold_back = [sid.strip() for sid in hold_back.split(',') if sid.strip()]
+            col1, col2 = st.columns(2)
+            with col1:
+                preview = st.button("Preview")
+            with col2:
+                confirm = st.checkbox("I have checked the preview")
+                apply = st.button("Promote Students", disabled=not confirm)
+            if preview or apply:
+                try:
+                    summary = promotion.promote(academic_year, roll_order, hold_back, dry_run=not apply)
+                    if apply:
+                        st.success(f"Promoted {summary['promoted']} students, {summary['graduated']} graduated, "
+                                   f"{summary['held_back']} held back ({summary['seconds']} s).")
+                    else:
+                        st.info(f"Preview: {summary['promoted']} would be promoted, {summary['graduated']} would graduate, "
+                                f"{summary['held_back']} held back. Nothing has been changed.")
+                    if summary['unrecognised']:
+                        st.warning(f"{summary['unrecognised']} students are in classes outside the ladder and will stay where they are.")
+                    st.dataframe(summary['classes'])
+                    st.write("Sample of new roll numbers:")
+                    st.dataframe(summary['sample'])
+                except ValueError as e:
+                    st.error(str(e))
+            runs = promotion.list_promotion_runs()
+            if runs:
+                st.write("### Past Promotions")
+                st.dataframe(runs)
+
+        elif choice == "Collections":
+            import reports
+            st.subheader("Collections")
+            action = st.selectbox("Select Report", ["Day Book", "Collection Summary", "Dues by Class (Analytics Snapshot)",
+                                                    "Academic Performance (Analytics Snapshot)"])
+
+            if action == "Day Book":
+                day = st.date_input("Date")
+                entries = reports.day_book(str(day))
+                if entries:
+                    st.write(f"### {len(entries)} payments, total ₹{sum(entry.amount for entry in entries):.2f}")
+                    st.dataframe([entry._asdict() for entry in entries])
+                    st.download_button(
+                        label="Download Day Book as CSV",
+                        data=reports.to_csv(entries),
+                        file_name=f"day_book_{day}.csv",
+                        mime="text/csv"
+                    )
+                else:
+                    st.info("No payments recorded on this day.")
+
+            elif action == "Collection Summary":
+                col1, col2 = st.columns(2)
+                with col1:
+                    start = st.date_input("From")
+                    by = st.selectbox("Group By", ["month", "day", "academic_year", "year"])
+                with col2:
+                    end = st.date_input("To")
+                    per_class = st.checkbox("Split by Class")
+                if start > end:
+                    st.error("'From' date must be on or before the 'To' date.")
+                else:
+                    totals = reports.collection_summary(str(start), str(end), by, per_class)
+                    if totals:
+                        st.write(f"### Total collected: ₹{sum(total.amount for total in totals):.2f} "
+                                 f"from {sum(total.payments for total in totals)} payments")
+                        st.dataframe([total._asdict() if per_class else {'period': total.period, 'payments': total.payments, 'amount': total.amount}
+                                      for total in totals])
+                        st.download_button(
+                            label="Download Summary as CSV",
+                            data=reports.to_csv(totals),
+                            file_name=f"collections_{start}_{end}_{by}.csv",
+                            mime="text/csv"
+                        )
+                    else:
+                        st.info("No collections in this date range.")
+
+            else:
+                import analytics
+                info = analytics.snapshot_info()
+                if info is None:
+                    st.info("No analytics snapshot yet. Queue \"Refresh Analytics Snapshot\" under Background Jobs.")
+                else:
+                    st.caption(f"From the analytics snapshot taken {info['exported_at']}.")
+                    try:
+                        if action == "Dues by Class (Analytics Snapshot)":
+                            records = analytics.dues_by_class()
+                            st.write(f"### Outstanding: ₹{sum(record.outstanding for record in records):.2f} "
+                                     f"from {sum(record.students_owing for record in records)} students")
+                            file_name = "dues_by_class.csv"
+                        else:
+                            class_name = st.selectbox("Class", ["All Classes", "Nursery", "LKG", "UKG", "1", "2", "3", "4", "5", "6", "7", "8", "9", "10"])
+                            records = analytics.academic_performance(None if class_name == "All Classes" else class_name)
+                            file_name = "academic_performance.csv"
+                        st.dataframe([record._asdict() for record in records])
+                        st.download_button(
+                            label="Download as CSV",
+                            data=reports.to_csv(records),
+                            file_name=file_name,
+                            mime="text/csv"
+                        )
+                    except ValueError as e:
+                        st.error(str(e))
+
+        elif choice == "Background Jobs":
+            import jobs
+            st.subheader("Background Jobs")
+            st.caption("Jobs run in the worker process (python worker.py) and survive server restarts.")
+            job_type = st.selectbox("Queue a Job", ["Invoices for a Class / Whole School", "Export Student Report",
+                                                    "Export Stored PDFs", "Print Batch (One Merged PDF)",
+                                                    "Send Documents to Parents (Email / WhatsApp)",
+                                                    "Reconcile Payments and Receipts", "Check Student Balances",
+                                                    "Refresh Analytics Snapshot"])
+            with st.form("queue_job_form"):
+                payload = {}
+                if job_type == "Invoices for a Class / Whole School":
+                    kind = 'bulk_invoices'
+                    class_name = st.selectbox("Class", ["All Classes", "Nursery", "LKG", "UKG", "1", "2", "3", "4", "5", "6", "7", "8", "9", "10"])
+                    payload['school_fee'] = st.number_input("School Fee", min_value=0.0, step=100.0)
+                    payload['bus_fee'] = st.number_input("Bus Fee", min_value=0.0, step=100.0)
+                    if class_name != "All Classes":
+                        payload['class_name'] = class_name
+                elif job_type == "Export Student Report":
+                    kind = 'export_students'
+                elif job_type == "Export Stored PDFs":
+                    kind = 'export_documents'
+                    payload['kind'] = st.selectbox("Document Type", ["invoice", "receipt", "report_card"])
+                    payload['student_id'] = st.text_input("Student ID (Optional)") or None
+                elif job_type == "Print Batch (One Merged PDF)":
+                    kind = 'print_documents'
+                    payload['kind'] = st.selectbox("Document Type", ["invoice", "receipt", "report_card"])
+                    class_name = st.selectbox("Class", ["All Classes", "Nursery", "LKG", "UKG", "1", "2", "3", "4", "5", "6", "7", "8", "9", "10"])
+                    if class_name != "All Classes":
+                        payload['class_name'] = class_name
+                    payload['period'] = st.text_input("Invoices for Month (YYYY-MM, Optional)") or None
+                    payload['two_up'] = st.checkbox("Two A5 Documents per A4 Sheet", value=True)
+                    payload['cut_marks'] = st.checkbox("Cut Marks", value=True)
+                elif job_type == "Send Documents to Parents (Email / WhatsApp)":
+                    kind = 'dispatch_documents'
+                    payload['kind'] = st.selectbox("Document Type", ["invoice", "receipt", "report_card"])
+                    class_name = st.selectbox("Class", ["All Classes", "Nursery", "LKG", "UKG", "1", "2", "3", "4", "5", "6", "7", "8", "9", "10"])
+                    if class_name != "All Classes":
+                        payload['class_name'] = class_name
+                    payload['period'] = st.text_input("Invoices for Month (YYYY-MM, Optional)") or None
+                    payload['start'] = st.text_input("Generated On or After (YYYY-MM-DD, Optional)") or None
+                    payload['channels'] = st.multiselect("Send By", ["email", "whatsapp"], default=["email", "whatsapp"])
+                    payload['resend'] = st.checkbox("Send again to parents who already received it")
+                elif job_type == "Check Student Balances":
+                    kind = 'check_balances'
+                    payload['repair'] = st.checkbox("Repair mismatched balances from the ledger")
+                elif job_type == "Refresh Analytics Snapshot":
+                    kind = 'export_analytics'
+                    payload['full'] = st.checkbox("Rebuild from scratch (after archiving or back-dated entries)")
+                else:
+                    kind = 'reconcile_receipts'
+                if st.form_submit_button("Queue Job"):
+                    job_id = jobs.enqueue(kind, payload)
+                    st.success(f"Job {job_id} queued. It will appear below with its progress.")
+            if job_type == "Send Documents to Parents (Email / WhatsApp)":
+                import dispatch
+                status = dispatch.delivery_status()
+                if status:
+                    st.write("Delivery Status")
+                    st.dataframe(status)
+                failed = dispatch.list_dispatches('failed', limit=20)
+                if failed:
+                    st.write("Recent Failures")
+                    st.dataframe([{k: d[k] for k in ('kind', 'document_id', 'channel', 'recipient', 'attempts', 'error')}
+                                  for d in failed])
+
+            st.button("Refresh")
+            job_list = jobs.list_jobs(limit=20)
+            if not job_list:
+                st.info("No jobs yet.")
+            for job in job_list:
+                col1, col2, col3 = st.columns([2, 2, 1])
+                with col1:
+                    st.write(f"Job {job['id']}: {job['kind']}")
+                    st.write(f"Queued on: {job['created_at']}")
+                with col2:
+                    st.write(f"Status: {job['status']} (attempt {job['attempts']}/{job['max_attempts']})")
+                    if job['status'] == 'running':
+                        st.progress(min(1.0, job['progress']), text=job['message'] or "Working...")
+                    elif job['status'] == 'failed':
+                        st.write(f"Error: {job['error']}")
+                    elif job['result']:
+                        st.write(f"Result: {job['result']}")
+                with col3:
+                    if job['status'] == 'done' and job['result_name']:
+                        result_name, result_data = jobs.get_job_result_file(job['id'])
+                        st.download_button(
+                            label="Download",
+                            data=result_data,
+                            file_name=result_name,
+                            key=f"download_job_{job['id']}"
+                        )
+                    elif job['status'] in ('queued', 'running'):
+                        if st.button("Cancel", key=f"cancel_job_{job['id']}"):
+                            jobs.cancel(job['id'])
+                            st.rerun()
+
+# Reports read from a replica only when SCHOOL_REPLICA names one (e.g. school_replica.db);
+# it can lag the database by up to SCHOOL_REPLICA_MAX_STALENESS seconds
 if __name__ == "__main__":
     init_db()
-    main()
\ No newline at end of file
+    if os.environ.get('SCHOOL_REPLICA'):
+        enable_replica(os.environ['SCHOOL_REPLICA'], float(os.environ.get('SCHOOL_REPLICA_MAX_STALENESS', '60')))
+    main()
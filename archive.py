@@ -0,0 +1,149 @@
+import os
+import re
+from datetime import date, datetime
+
+import db
+
+# Which rows of each document table belong to an academic year
+ARCHIVE_SOURCES = {
+    'invoice': "generated_date >= ? AND generated_date < ?",
+    'receipt': "generated_date >= ? AND generated_date < ?",
+    'report_card': "academic_year = ?",
+}
+
+# The school session runs April to March: "2024-2025" is 2024-04-01 up to 2025-04-01
+def academic_year_bounds(academic_year):
+    match = re.fullmatch(r'(\d{4})-(\d{4})', academic_year or '')
+    if not match or int(match.group(2)) != int(match.group(1)) + 1:
+        raise ValueError(f"Academic year must look like 2024-2025, got: {academic_year}")
+    return f"{match.group(1)}-04-01", f"{match.group(2)}-04-01"
+
+# Academic year a date falls in
+def academic_year_of(day):
+    start = day.year if day.month >= 4 else day.year - 1
+    return f"{start}-{start + 1}"
+
+def where_params(kind, academic_year):
+    if kind == 'report_card':
+        return [academic_year]
+    return list(academic_year_bounds(academic_year))
+
+# Size in bytes of a SQLite database as the pager sees it
+def database_size(path):
+    return os.path.getsize(path) if os.path.exists(path) else 0
+
+# Create the document tables (and their indexes) inside the attached archive with the live schema
+def create_archive_tables(c, schema):
+    for kind in ARCHIVE_SOURCES:
+        table = db.DOCUMENT_TABLES[kind][0]
+        c.execute("SELECT sql FROM main.sqlite_master WHERE type = 'table' AND name = ?", (table,))
+        ddl = c.fetchone()[0]
+        ddl = re.sub(r'^CREATE TABLE\s+"?' + table + r'"?', f'CREATE TABLE IF NOT EXISTS {schema}.{table}', ddl, count=1)
+        c.execute(ddl)
+        c.execute("SELECT sql FROM main.sqlite_master WHERE type = 'index' AND tbl_name = ? AND sql IS NOT NULL", (table,))
+        for (ddl,) in c.fetchall():
+            c.execute(re.sub(r'^CREATE INDEX\s+(IF NOT EXISTS\s+)?', f'CREATE INDEX IF NOT EXISTS {schema}.', ddl, count=1))
+
+# Move a closed academic year's invoices, receipts and report cards (with their PDFs)
+# into archive/school_<year>.db in one transaction, leaving a BLOB-free index behind
+def archive_year(academic_year, vacuum=False, today=None):
+    start, end = academic_year_bounds(academic_year)
+    today = (today or date.today()).strftime("%Y-%m-%d")
+    if end > today:
+        raise ValueError(f"Academic year {academic_year} is still open; only closed years can be archived.")
+    os.makedirs(db.ARCHIVE_DIR, exist_ok=True)
+    path = db.archive_path(academic_year)
+    counts = {}
+    conn = None
+    try:
+        conn = db.get_connection()
+        c = conn.cursor()
+        c.execute("ATTACH DATABASE ? AS archive", (path,))
+        try:
+            create_archive_tables(c, 'archive')
+            c.execute("BEGIN IMMEDIATE")
+            try:
+                for kind, where in ARCHIVE_SOURCES.items():
+                    table, id_column = db.DOCUMENT_TABLES[kind]
+                    params = where_params(kind, academic_year)
+                    c.execute(f"INSERT OR REPLACE INTO archive.{table} SELECT * FROM main.{table} WHERE {where}", params)
+                    c.execute(f'''INSERT OR REPLACE INTO archived_documents (kind, document_id, student_id, academic_year)
+                                  SELECT ?, {id_column}, student_id, ? FROM main.{table} WHERE {where}''',
+                              [kind, academic_year] + params)
+                    c.execute(f"DELETE FROM main.{table} WHERE {where}", params)
+                    counts[table] = c.rowcount
+                c.execute('''INSERT INTO archived_years (academic_year, file_path, invoices, receipts, report_cards, archived_at)
+                             VALUES (?, ?, ?, ?, ?, ?)
+                             ON CONFLICT(academic_year) DO UPDATE SET
+                                 file_path = excluded.file_path,
+                                 invoices = invoices + excluded.invoices,
+                                 receipts = receipts + excluded.receipts,
+                                 report_cards = report_cards + excluded.report_cards,
+                                 archived_at = excluded.archived_at''',
+                          (academic_year, path, counts['invoices'], counts['receipts'], counts['report_cards'],
+                           datetime.now().strftime("%Y-%m-%d %H:%M:%S")))
+                conn.commit()
+            except Exception:
+                conn.rollback()
+                raise
+        finally:
+            c.execute("DETACH DATABASE archive")
+    finally:
+        if conn:
+            conn.close()
+    if vacuum:
+        compact_live_database()
+    return {'academic_year': academic_year, 'file': path, **counts}
+
+# Archive every closed year that still has documents in the live database
+def archive_closed_years(vacuum=False, today=None):
+    current = academic_year_of(today or date.today())
+    conn = None
+    try:
+        conn = db.get_connection()
+        c = conn.cursor()
+        c.execute('''SELECT MIN(day) FROM (SELECT MIN(generated_date) AS day FROM invoices
+                     UNION ALL SELECT MIN(generated_date) FROM receipts)''')
+        first_day = c.fetchone()[0]
+        c.execute("SELECT DISTINCT academic_year FROM report_cards WHERE academic_year < ?", (current,))
+        years = {row[0] for row in c.fetchall() if row[0]}
+    finally:
+        if conn:
+            conn.close()
+    if first_day:
+        first_year = int(academic_year_of(datetime.strptime(first_day[:10], "%Y-%m-%d"))[:4])
+        years.update(f"{year}-{year + 1}" for year in range(first_year, int(current[:4])))
+    archived = []
+    for year in sorted(years):
+        try:
+            academic_year_bounds(year)
+        except ValueError:
+            print(f"Skipping report cards with unrecognised academic year: {year}")
+            continue
+        archived.append(archive_year(year, today=today))
+    if vacuum and archived:
+        compact_live_database()
+    return archived
+
+# Reclaim the space freed by archiving
+def compact_live_database():
+    conn = None
+    try:
+        conn = db.get_connection()
+        conn.execute("VACUUM")
+    finally:
+        if conn:
+            conn.close()
+
+# List archived academic years with their document counts
+def list_archived_years():
+    conn = None
+    try:
+        conn = db.get_connection()
+        c = conn.cursor()
+        c.execute("SELECT academic_year, file_path, invoices, receipts, report_cards, archived_at FROM archived_years ORDER BY academic_year")
+        columns = ['academic_year', 'file_path', 'invoices', 'receipts', 'report_cards', 'archived_at']
+        return [dict(zip(columns, row)) for row in c.fetchall()]
+    finally:
+        if conn:
+            conn.close()
@@ -0,0 +1,219 @@
+from datetime import date
+from typing import NamedTuple
+
+import archive
+import db
+
+# Attendance is kept per student per academic year as two bitsets: `marked`
+# (days attendance was taken) and `present`. Bit n is day n counted from
+# 1 April, lowest bit of the first byte first, so a whole session is 46 bytes.
+DAYS = 366
+BITSET_BYTES = (DAYS + 7) // 8
+
+class Attendance(NamedTuple):
+    student_id: str
+    academic_year: str
+    present: int
+    marked: int
+    percentage: float
+
+# Academic year a day falls in and its bit number within that year
+def day_index(day=None):
+    if day is None:
+        day = date.today()
+    elif isinstance(day, str):
+        try:
+            day = date.fromisoformat(day)
+        except ValueError:
+            raise ValueError(f"Invalid date: {day}. Use YYYY-MM-DD.")
+    if day > date.today():
+        raise ValueError("Attendance cannot be marked for a future date.")
+    academic_year = archive.academic_year_of(day)
+    return academic_year, (day - date(int(academic_year[:4]), 4, 1)).days
+
+def set_bit(bits, index, value):
+    if value:
+        bits[index // 8] |= 1 << (index % 8)
+    else:
+        bits[index // 8] &= ~(1 << (index % 8)) & 0xFF
+
+def percentage(present, marked):
+    return round(100.0 * present / marked, 1) if marked else None
+
+# Set bits in each bitset. NumPy counts the bits of the stacked bitsets a row
+# at a time; without it each one is counted with int.bit_count.
+def popcounts(bitsets):
+    try:
+        import numpy as np
+    except ImportError:
+        return [int.from_bytes(bits, 'little').bit_count() for bits in bitsets]
+    if not bitsets:
+        return []
+    array = np.frombuffer(b"".join(bitsets), dtype=np.uint8).reshape(len(bitsets), BITSET_BYTES)
+    return np.bitwise_count(array).sum(axis=1, dtype=np.int64).tolist()
+
+# How many of the given bitsets have each day's bit set: [count for day 0, 1, ...].
+# NumPy unpacks the stacked bitsets and sums the columns in one pass.
+def column_counts(bitsets):
+    try:
+        import numpy as np
+    except ImportError:
+        return [sum(bits[n // 8] >> (n % 8) & 1 for bits in bitsets) for n in range(DAYS)]
+    if not bitsets:
+        return [0] * DAYS
+    array = np.frombuffer(b"".join(bitsets), dtype=np.uint8).reshape(len(bitsets), BITSET_BYTES)
+    return np.unpackbits(array, axis=1, count=DAYS, bitorder='little').sum(axis=0, dtype=np.int64).tolist()
+
+# Students of a class in roll order, for the marking sheet
+def class_list(class_name):
+    conn = None
+    try:
+        conn = db.get_connection()
+        return conn.execute('''SELECT student_id, first_name, last_name, roll_number FROM students WHERE class_name = ?
+                               ORDER BY CAST(roll_number AS INTEGER), student_id''', (class_name,)).fetchall()
+    finally:
+        if conn:
+            conn.close()
+
+# Take attendance for a whole class on one day: everyone present except `absent`.
+# Marking the same day again overwrites it.
+def mark_class(class_name, day=None, absent=()):
+    academic_year, index = day_index(day)
+    absent = set(absent)
+    conn = None
+    try:
+        conn = db.get_connection()
+        c = conn.cursor()
+        c.execute("BEGIN IMMEDIATE")
+        try:
+            c.execute("SELECT student_id FROM students WHERE class_name = ?", (class_name,))
+            student_ids = [row[0] for row in c.fetchall()]
+            if not student_ids:
+                raise ValueError(f"No students in class {class_name}.")
+            unknown = absent - set(student_ids)
+            if unknown:
+                raise ValueError(f"Not in class {class_name}: {', '.join(sorted(unknown))}")
+            c.execute('''INSERT OR IGNORE INTO attendance (student_id, academic_year, present, marked)
+                         SELECT student_id, ?, zeroblob(?), zeroblob(?) FROM students WHERE class_name = ?''',
+                      (academic_year, BITSET_BYTES, BITSET_BYTES, class_name))
+            c.execute('''SELECT a.student_id, a.present, a.marked FROM attendance a
+                         JOIN students s ON s.student_id = a.student_id
+                         WHERE s.class_name = ? AND a.academic_year = ?''', (class_name, academic_year))
+            updates = []
+            for student_id, present, marked in c.fetchall():
+                present, marked = bytearray(present), bytearray(marked)
+                set_bit(marked, index, True)
+                set_bit(present, index, student_id not in absent)
+                updates.append((bytes(present), bytes(marked), student_id, academic_year))
+            c.executemany("UPDATE attendance SET present = ?, marked = ? WHERE student_id = ? AND academic_year = ?", updates)
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+    finally:
+        if conn:
+            conn.close()
+    return {'class_name': class_name, 'academic_year': academic_year, 'day_index': index,
+            'students': len(student_ids), 'present': len(student_ids) - len(absent), 'absent': len(absent)}
+
+# Correct one student's attendance for a day
+def set_attendance(student_id, day=None, present=True):
+    academic_year, index = day_index(day)
+    conn = None
+    try:
+        conn = db.get_connection()
+        c = conn.cursor()
+        c.execute("BEGIN IMMEDIATE")
+        try:
+            c.execute("SELECT present, marked FROM attendance WHERE student_id = ? AND academic_year = ?",
+                      (student_id, academic_year))
+            row = c.fetchone()
+            if row is None and not c.execute("SELECT 1 FROM students WHERE student_id = ?", (student_id,)).fetchone():
+                raise db.StudentNotFound()
+            present_bits = bytearray(row[0] if row else BITSET_BYTES)
+            marked_bits = bytearray(row[1] if row else BITSET_BYTES)
+            set_bit(marked_bits, index, True)
+            set_bit(present_bits, index, present)
+            c.execute('''INSERT INTO attendance (student_id, academic_year, present, marked) VALUES (?, ?, ?, ?)
+                         ON CONFLICT (student_id, academic_year) DO UPDATE SET present = excluded.present, marked = excluded.marked''',
+                      (student_id, academic_year, bytes(present_bits), bytes(marked_bits)))
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+    finally:
+        if conn:
+            conn.close()
+
+# Present and marked day counts with the percentage, for a class or the whole school
+def summarise(academic_year, class_name=None):
+    archive.academic_year_bounds(academic_year)
+    conn = None
+    try:
+        conn = db.get_read_connection()
+        query = '''SELECT a.student_id, a.present, a.marked FROM attendance a
+                   JOIN students s ON s.student_id = a.student_id WHERE a.academic_year = ?'''
+        params = [academic_year]
+        if class_name:
+            query += " AND s.class_name = ?"
+            params.append(class_name)
+        rows = conn.execute(query + " ORDER BY LENGTH(a.student_id), a.student_id", params).fetchall()
+    finally:
+        if conn:
+            conn.close()
+    present = popcounts([row[1] for row in rows])
+    marked = popcounts([row[2] for row in rows])
+    return [Attendance(row[0], academic_year, p, m, percentage(p, m)) for row, p, m in zip(rows, present, marked)]
+
+# Day-by-day totals for a class or the whole school: [(day, present, marked)]
+# for every day attendance was taken
+def daily_totals(academic_year, class_name=None):
+    archive.academic_year_bounds(academic_year)
+    conn = None
+    try:
+        conn = db.get_read_connection()
+        query = '''SELECT a.present, a.marked FROM attendance a
+                   JOIN students s ON s.student_id = a.student_id WHERE a.academic_year = ?'''
+        params = [academic_year]
+        if class_name:
+            query += " AND s.class_name = ?"
+            params.append(class_name)
+        rows = conn.execute(query, params).fetchall()
+    finally:
+        if conn:
+            conn.close()
+    present = column_counts([row[0] for row in rows])
+    marked = column_counts([row[1] for row in rows])
+    start = date(int(academic_year[:4]), 4, 1).toordinal()
+    return [(date.fromordinal(start + n).isoformat(), present[n], marked[n]) for n in range(DAYS) if marked[n]]
+
+# One student's attendance for a session, or None if it was never taken
+def student_attendance(student_id, academic_year):
+    conn = None
+    try:
+        conn = db.get_connection()
+        row = conn.execute("SELECT present, marked FROM attendance WHERE student_id = ? AND academic_year = ?",
+                           (student_id, academic_year)).fetchone()
+    finally:
+        if conn:
+            conn.close()
+    if row is None:
+        return None
+    present, marked = (int.from_bytes(bits, 'little').bit_count() for bits in row)
+    return Attendance(student_id, academic_year, present, marked, percentage(present, marked))
+
+# Days of a session a student was marked absent, as ISO dates
+def absent_days(student_id, academic_year):
+    conn = None
+    try:
+        conn = db.get_connection()
+        row = conn.execute("SELECT present, marked FROM attendance WHERE student_id = ? AND academic_year = ?",
+                           (student_id, academic_year)).fetchone()
+    finally:
+        if conn:
+            conn.close()
+    if row is None:
+        return []
+    absent = int.from_bytes(row[1], 'little') & ~int.from_bytes(row[0], 'little')
+    start = date(int(academic_year[:4]), 4, 1).toordinal()
+    return [date.fromordinal(start + n).isoformat() for n in range(DAYS) if absent >> n & 1]
@@ -0,0 +1,209 @@
+import hashlib
+import hmac
+import os
+import secrets
+import threading
+import time
+from datetime import datetime
+from typing import NamedTuple
+
+import db
+
+# A successful login stores a session row and hands the browser a signed token
+# ("<session id>.<signature>"). Checking a token costs an HMAC and a dict
+# lookup: sessions are cached in memory and looked up again only after
+# CACHE_SECONDS, so quick successive page loads and reruns do not touch the
+# database. Ending a session drops it from this process's cache at once; other
+# processes (the API, another app server) stop accepting it within CACHE_SECONDS.
+# Failed logins are counted per username and per client address; too many
+# within FAILURE_WINDOW lock that username or address for LOCK_SECONDS.
+SESSION_HOURS = 12
+CACHE_SECONDS = 10
+CACHE_SIZE = 1000
+MAX_USER_FAILURES = 5
+MAX_CLIENT_FAILURES = 20
+FAILURE_WINDOW = 900
+LOCK_SECONDS = 900
+
+# (database, token hash) -> (username, expires_at, checked_at)
+_sessions = {}
+_secrets = {}
+_lock = threading.Lock()
+
+class Session(NamedTuple):
+    username: str
+    created_at: str
+    expires_at: str
+
+# Signing key: SCHOOL_SESSION_SECRET, or the random key init_db stored
+def signing_secret():
+    secret = os.environ.get('SCHOOL_SESSION_SECRET') or _secrets.get(db.DB_PATH)
+    if secret:
+        return secret
+    conn = None
+    try:
+        conn = db.get_connection()
+        row = conn.execute("SELECT secret FROM session_keys WHERE id = 1").fetchone()
+    finally:
+        if conn:
+            conn.close()
+    if row is None:
+        raise ValueError("No session key: run init-db first")
+    _secrets[db.DB_PATH] = row[0]
+    return row[0]
+
+def sign(session_id):
+    return hmac.new(signing_secret().encode(), session_id.encode(), hashlib.sha256).hexdigest()
+
+def token_hash(session_id):
+    return hashlib.sha256(session_id.encode()).hexdigest()
+
+def failure_keys(username, client):
+    return [f"user:{username.strip().lower()}"] + ([f"client:{client}"] if client else [])
+
+def check_throttle(conn, keys):
+    now = time.time()
+    locked = conn.execute(f"SELECT MAX(locked_until) FROM login_failures WHERE key IN ({', '.join('?' for _ in keys)})",
+                          keys).fetchone()[0]
+    if locked and locked > now:
+        minutes = int((locked - now) // 60) + 1
+        raise ValueError(f"Too many failed logins. Try again in {minutes} minute{'s' if minutes > 1 else ''}.")
+
+# Count a failed login; the count starts again once FAILURE_WINDOW has passed
+def record_failure(conn, key, limit):
+    now = time.time()
+    conn.execute('''INSERT INTO login_failures (key, failures, first_failed) VALUES (?, 1, ?)
+                    ON CONFLICT (key) DO UPDATE SET
+                        failures = CASE WHEN first_failed < ? THEN 1 ELSE failures + 1 END,
+                        first_failed = CASE WHEN first_failed < ? THEN excluded.first_failed ELSE first_failed END''',
+                 (key, now, now - FAILURE_WINDOW, now - FAILURE_WINDOW))
+    conn.execute("UPDATE login_failures SET locked_until = ? WHERE key = ? AND failures >= ?",
+                 (now + LOCK_SECONDS, key, limit))
+
+def remember(key, username, expires_at):
+    with _lock:
+        if len(_sessions) >= CACHE_SIZE:
+            _sessions.pop(next(iter(_sessions)))
+        _sessions[key] = (username, expires_at, time.time())
+
+def forget(key):
+    with _lock:
+        _sessions.pop(key, None)
+
+# Check a username and password and start a session. Returns the session token,
+# or None if the credentials are wrong; raises ValueError while locked out.
+def login(username, password, client=None):
+    keys = failure_keys(username or '', client)
+    conn = None
+    try:
+        conn = db.get_connection()
+        check_throttle(conn, keys)
+    finally:
+        if conn:
+            conn.close()
+    valid = bool(username and password) and db.verify_login(username, password)
+    now = time.time()
+    conn = None
+    try:
+        conn = db.get_connection()
+        if not valid:
+            record_failure(conn, keys[0], MAX_USER_FAILURES)
+            if client:
+                record_failure(conn, keys[1], MAX_CLIENT_FAILURES)
+            conn.commit()
+            return None
+        session_id = secrets.token_urlsafe(24)
+        expires_at = now + SESSION_HOURS * 3600
+        conn.execute("DELETE FROM login_failures WHERE key = ?", (keys[0],))
+        conn.execute("INSERT INTO sessions (token_hash, username, created_at, expires_at) VALUES (?, ?, ?, ?)",
+                     (token_hash(session_id), username, datetime.now().strftime("%Y-%m-%d %H:%M:%S"), expires_at))
+        conn.commit()
+    finally:
+        if conn:
+            conn.close()
+    remember((db.DB_PATH, token_hash(session_id)), username, expires_at)
+    return f"{session_id}.{sign(session_id)}"
+
+# The username a token belongs to, or None if it is forged, expired or ended
+def session_user(token):
+    session_id, _, signature = (token or '').partition('.')
+    if not session_id or not hmac.compare_digest(signature.encode(), sign(session_id).encode()):
+        return None
+    key = (db.DB_PATH, token_hash(session_id))
+    now = time.time()
+    cached = _sessions.get(key)
+    if cached and cached[1] > now and now - cached[2] < CACHE_SECONDS:
+        return cached[0]
+    conn = None
+    try:
+        conn = db.get_connection()
+        row = conn.execute("SELECT username, expires_at FROM sessions WHERE token_hash = ?", (key[1],)).fetchone()
+    finally:
+        if conn:
+            conn.close()
+    if row is None or row[1] <= now:
+        forget(key)
+        return None
+    remember(key, row[0], row[1])
+    return row[0]
+
+def end_session(token):
+    session_id = (token or '').partition('.')[0]
+    forget((db.DB_PATH, token_hash(session_id)))
+    conn = None
+    try:
+        conn = db.get_connection()
+        conn.execute("DELETE FROM sessions WHERE token_hash = ?", (token_hash(session_id),))
+        conn.commit()
+    finally:
+        if conn:
+            conn.close()
+
+# Drop a user's cached sessions in this process
+def forget_user(username):
+    with _lock:
+        for key in [key for key, cached in _sessions.items() if cached[0] == username]:
+            del _sessions[key]
+
+# Sign a user out everywhere. Other processes notice within CACHE_SECONDS.
+def end_user_sessions(username):
+    forget_user(username)
+    conn = None
+    try:
+        conn = db.get_connection()
+        c = conn.cursor()
+        c.execute("DELETE FROM sessions WHERE username = ?", (username,))
+        conn.commit()
+        return c.rowcount
+    finally:
+        if conn:
+            conn.close()
+
+def list_sessions():
+    conn = None
+    try:
+        conn = db.get_connection()
+        return [Session(username, created_at, datetime.fromtimestamp(expires_at).strftime("%Y-%m-%d %H:%M:%S"))
+                for username, created_at, expires_at in conn.execute(
+                    "SELECT username, created_at, expires_at FROM sessions WHERE expires_at > ? ORDER BY created_at",
+                    (time.time(),))]
+    finally:
+        if conn:
+            conn.close()
+
+# Delete expired sessions and failure counts that no longer lock anyone out
+def prune_sessions():
+    now = time.time()
+    conn = None
+    try:
+        conn = db.get_connection()
+        c = conn.cursor()
+        c.execute("DELETE FROM sessions WHERE expires_at <= ?", (now,))
+        sessions = c.rowcount
+        c.execute("DELETE FROM login_failures WHERE first_failed < ? AND COALESCE(locked_until, 0) < ?",
+                  (now - FAILURE_WINDOW, now))
+        conn.commit()
+        return {'sessions': sessions, 'failure_counts': c.rowcount}
+    finally:
+        if conn:
+            conn.close()
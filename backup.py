@@ -0,0 +1,138 @@
+import gzip
+import os
+import shutil
+import sqlite3
+import tempfile
+import time
+from datetime import datetime
+
+import db
+
+BACKUP_DIR = 'backups'
+BACKUP_PREFIX = 'school-'
+PAGES_PER_STEP = 64
+# Seconds to wait before retrying a step when the source is busy or locked
+STEP_SLEEP = 0.005
+MAX_RESTARTS = 20
+
+class TooManyRestarts(Exception):
+    pass
+
+# Copy the live database page-by-page with the online backup API.
+# Between steps the source lock is released, so record_payment and friends keep
+# writing; a write from another connection makes SQLite restart the copy, and
+# after MAX_RESTARTS the remainder is copied in one step to guarantee progress.
+def snapshot(dest_path, pages=PAGES_PER_STEP, sleep=STEP_SLEEP):
+    stats = {'steps': 0, 'restarts': 0, 'single_step_fallback': False}
+    last_remaining = [None]
+
+    def progress(status, remaining, total):
+        stats['steps'] += 1
+        stats['pages'] = total
+        if last_remaining[0] is not None and remaining > last_remaining[0]:
+            stats['restarts'] += 1
+            if stats['restarts'] >= MAX_RESTARTS:
+                raise TooManyRestarts()
+        last_remaining[0] = remaining
+
+    source = sqlite3.connect(db.DB_PATH, timeout=10)
+    target = sqlite3.connect(dest_path)
+    try:
+        try:
+            source.backup(target, pages=pages, progress=progress, sleep=sleep)
+        except TooManyRestarts:
+            stats['single_step_fallback'] = True
+            source.backup(target, pages=-1)
+    finally:
+        target.close()
+        source.close()
+    return stats
+
+# Run PRAGMA quick_check (or the slower integrity_check) on a snapshot
+def verify(path, full=False):
+    conn = sqlite3.connect(f'file:{path}?mode=ro', uri=True)
+    try:
+        rows = conn.execute("PRAGMA integrity_check" if full else "PRAGMA quick_check").fetchall()
+    finally:
+        conn.close()
+    problems = [row[0] for row in rows if row[0] != 'ok']
+    return problems
+
+# Verify a finished backup file, decompressing .gz snapshots to a temporary file first
+def verify_backup(path, full=False):
+    if not path.endswith('.gz'):
+        return verify(path, full)
+    fd, tmp_path = tempfile.mkstemp(suffix='.db')
+    try:
+        with os.fdopen(fd, 'wb') as out, gzip.open(path, 'rb') as src:
+            shutil.copyfileobj(src, out, 1024 * 1024)
+        return verify(tmp_path, full)
+    finally:
+        os.remove(tmp_path)
+
+# Take a verified snapshot of school.db into the backup directory and rotate old ones
+def backup_database(backup_dir=None, compress=False, full_check=False, keep=14, pages=PAGES_PER_STEP, sleep=STEP_SLEEP):
+    backup_dir = backup_dir or BACKUP_DIR
+    os.makedirs(backup_dir, exist_ok=True)
+    stamp = datetime.now().strftime("%Y%m%d-%H%M%S")
+    final_path = os.path.join(backup_dir, f"{BACKUP_PREFIX}{stamp}.db")
+    partial_path = final_path + '.partial'
+
+    started = time.perf_counter()
+    stats = snapshot(partial_path, pages, sleep)
+    stats['copy_seconds'] = round(time.perf_counter() - started, 3)
+
+    started = time.perf_counter()
+    problems = verify(partial_path, full_check)
+    stats['verify_seconds'] = round(time.perf_counter() - started, 3)
+    if problems:
+        os.replace(partial_path, final_path + '.corrupt')
+        raise RuntimeError(f"Backup failed verification: {'; '.join(problems[:5])}")
+
+    if compress:
+        final_path += '.gz'
+        started = time.perf_counter()
+        with open(partial_path, 'rb') as src, gzip.open(final_path + '.partial', 'wb', compresslevel=6) as out:
+            shutil.copyfileobj(src, out, 1024 * 1024)
+        os.remove(partial_path)
+        os.replace(final_path + '.partial', final_path)
+        stats['compress_seconds'] = round(time.perf_counter() - started, 3)
+    else:
+        os.replace(partial_path, final_path)
+
+    stats['file'] = final_path
+    stats['bytes'] = os.path.getsize(final_path)
+    stats['removed'] = rotate_backups(backup_dir, keep)
+    return stats
+
+# Keep only the newest `keep` snapshots
+def rotate_backups(backup_dir=None, keep=14):
+    backups = list_backups(backup_dir)
+    removed = []
+    for entry in backups[keep:]:
+        os.remove(entry['file'])
+        removed.append(entry['file'])
+    return removed
+
+# List snapshots, newest first
+def list_backups(backup_dir=None):
+    backup_dir = backup_dir or BACKUP_DIR
+    if not os.path.isdir(backup_dir):
+        return []
+    entries = []
+    for name in os.listdir(backup_dir):
+        if name.startswith(BACKUP_PREFIX) and (name.endswith('.db') or name.endswith('.db.gz')):
+            path = os.path.join(backup_dir, name)
+            entries.append({'file': path, 'bytes': os.path.getsize(path)})
+    entries.sort(key=lambda entry: entry['file'], reverse=True)
+    return entries
+
+# Take a backup every `interval_minutes` until interrupted
+def run_schedule(interval_minutes, **options):
+    while True:
+        try:
+            stats = backup_database(**options)
+            print(f"Backup written to {stats['file']} ({stats['bytes']} bytes, {stats['copy_seconds']}s)")
+        except (RuntimeError, sqlite3.Error, OSError) as e:
+            print(f"Backup failed: {e}")
+        time.sleep(interval_minutes * 60)
@@ -0,0 +1,151 @@
+import time
+from datetime import datetime
+from typing import NamedTuple
+
+import db
+
+# Students are checked and repaired in keyset chunks. Each chunk is one short
+# statement, so the database lock is released between chunks and payments
+# keep going while a check runs.
+CHUNK = 1000
+TOLERANCE = 0.005
+
+class BalanceMismatch(NamedTuple):
+    student_id: str
+    class_name: str
+    outstanding_balance: float
+    extra_balance: float
+    expected_outstanding: float
+    expected_extra: float
+    difference: float
+    ledger_entries: int
+    first_break_seq: int
+    first_break_source: str
+    first_break_reference: str
+
+# Net balance the ledger implies for each student in the chunk, the first ledger
+# entry whose recorded balance disagrees with the running total (where drift
+# started), and the students whose stored balance is off
+CHECK_QUERY = f'''
+    WITH running AS (
+        SELECT student_id, seq, delta, balance_after,
+               SUM(delta) OVER (PARTITION BY student_id ORDER BY seq) AS expected_after
+        FROM balance_ledger WHERE student_id > ? AND student_id <= ?
+    ),
+    totals AS (
+        SELECT student_id, COUNT(*) AS entries, SUM(delta) AS expected,
+               MIN(CASE WHEN ABS(balance_after - expected_after) > {TOLERANCE} THEN seq END) AS break_seq
+        FROM running GROUP BY student_id
+    )
+    SELECT s.student_id, s.class_name, COALESCE(s.outstanding_balance, 0.0), COALESCE(s.extra_balance, 0.0),
+           COALESCE(t.expected, 0.0), COALESCE(t.entries, 0), t.break_seq, l.source, l.reference
+    FROM students s
+    LEFT JOIN totals t ON t.student_id = s.student_id
+    LEFT JOIN balance_ledger l ON l.seq = t.break_seq
+    WHERE s.student_id > ? AND s.student_id <= ?
+      AND (ABS(COALESCE(s.outstanding_balance, 0.0) - COALESCE(s.extra_balance, 0.0) - COALESCE(t.expected, 0.0)) > {TOLERANCE}
+           OR (s.outstanding_balance > {TOLERANCE} AND s.extra_balance > {TOLERANCE}))
+'''
+
+# Set mismatched students in the chunk to the balance the ledger implies
+REPAIR_QUERY = f'''
+    UPDATE students SET outstanding_balance = MAX(0.0, t.expected), extra_balance = MAX(0.0, -t.expected)
+    FROM (SELECT s.student_id, COALESCE(SUM(l.delta), 0.0) AS expected
+          FROM students s LEFT JOIN balance_ledger l ON l.student_id = s.student_id
+          WHERE s.student_id > ? AND s.student_id <= ? GROUP BY s.student_id) AS t
+    WHERE students.student_id = t.student_id
+      AND (ABS(COALESCE(outstanding_balance, 0.0) - COALESCE(extra_balance, 0.0) - t.expected) > {TOLERANCE}
+           OR (outstanding_balance > {TOLERANCE} AND extra_balance > {TOLERANCE}))
+'''
+
+# (after, upto] student_id ranges of about `size` students each
+def student_ranges(size=CHUNK):
+    conn = None
+    try:
+        conn = db.get_connection()
+        c = conn.cursor()
+        ranges, after = [], ''
+        while True:
+            c.execute("SELECT MAX(student_id) FROM (SELECT student_id FROM students WHERE student_id > ? ORDER BY student_id LIMIT ?)",
+                      (after, size))
+            upto = c.fetchone()[0]
+            if upto is None:
+                return ranges
+            ranges.append((after, upto))
+            after = upto
+    finally:
+        if conn:
+            conn.close()
+
+def mismatch_record(row):
+    student_id, class_name, outstanding, extra, expected, entries, break_seq, break_source, break_reference = row
+    return BalanceMismatch(student_id, class_name, outstanding, extra, max(0.0, expected), max(0.0, -expected),
+                           round(outstanding - extra - expected, 2), entries, break_seq, break_source, break_reference)
+
+# Compare every student's stored balance with the ledger. With repair=True,
+# mismatched students are set to the ledger balance, one chunk per transaction.
+def check_balances(repair=False, chunk=CHUNK, progress=None):
+    started = time.perf_counter()
+    ranges = student_ranges(chunk)
+    mismatches, repaired = [], 0
+    conn = None
+    try:
+        conn = db.get_connection()
+        c = conn.cursor()
+        for done, (after, upto) in enumerate(ranges, 1):
+            c.execute(CHECK_QUERY, (after, upto) * 2)
+            found = [mismatch_record(row) for row in c.fetchall()]
+            mismatches.extend(found)
+            if repair and found:
+                c.execute("BEGIN IMMEDIATE")
+                try:
+                    c.execute(REPAIR_QUERY, (after, upto))
+                    repaired += c.rowcount
+                    conn.commit()
+                except Exception:
+                    conn.rollback()
+                    raise
+            if progress:
+                progress(done / len(ranges), f"{upto} ({len(mismatches)} mismatches)")
+        c.execute("SELECT COUNT(*) FROM students")
+        students = c.fetchone()[0]
+        checked_at = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+        seconds = round(time.perf_counter() - started, 3)
+        difference = round(sum((m.difference for m in mismatches), 0.0), 2)
+        c.execute('''INSERT INTO balance_checks (checked_at, students, mismatches, repaired, difference, seconds)
+                     VALUES (?, ?, ?, ?, ?, ?)''',
+                  (checked_at, students, len(mismatches), repaired, difference, seconds))
+        conn.commit()
+    finally:
+        if conn:
+            conn.close()
+    return {'checked_at': checked_at, 'students': students, 'mismatches': len(mismatches), 'repaired': repaired,
+            'difference': difference, 'seconds': seconds, 'details': mismatches}
+
+# A student's ledger with the running balance after each entry
+def ledger_for(student_id):
+    conn = None
+    try:
+        conn = db.get_connection()
+        c = conn.cursor()
+        c.execute('''SELECT seq, source, reference, delta, balance_after,
+                            SUM(delta) OVER (ORDER BY seq) AS expected_after, recorded_at
+                     FROM balance_ledger WHERE student_id = ? ORDER BY seq''', (student_id,))
+        return [dict(zip(['seq', 'source', 'reference', 'delta', 'balance_after', 'expected_after', 'recorded_at'], row))
+                for row in c.fetchall()]
+    finally:
+        if conn:
+            conn.close()
+
+def list_checks(limit=20):
+    conn = None
+    try:
+        conn = db.get_connection()
+        c = conn.cursor()
+        c.execute('''SELECT checked_at, students, mismatches, repaired, difference, seconds
+                     FROM balance_checks ORDER BY id DESC LIMIT ?''', (limit,))
+        return [dict(zip(['checked_at', 'students', 'mismatches', 'repaired', 'difference', 'seconds'], row))
+                for row in c.fetchall()]
+    finally:
+        if conn:
+            conn.close()
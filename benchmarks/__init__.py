@@ -0,0 +1,2 @@
+# Benchmarks and synthetic data for the school management system.
+# Run the full suite with: python -m benchmarks.suite --students 10000
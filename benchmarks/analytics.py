@@ -0,0 +1,137 @@
+import argparse
+import json
+import os
+import random
+import sys
+import tempfile
+import threading
+import time
+from datetime import date, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import analytics
+import db
+import reports
+from benchmarks import synthetic
+from benchmarks.suite import measure, percentile
+
+# The same reports the way they are written today: pandas over the live database
+def pandas_collections(start, end):
+    import pandas as pd
+    conn = db.get_connection()
+    try:
+        df = pd.read_sql_query('''SELECT p.payment_date, COALESCE(s.class_name, '') AS class_name, p.amount FROM payments p
+                                  LEFT JOIN students s ON s.student_id = p.student_id
+                                  WHERE p.payment_date BETWEEN ? AND ?''', conn, params=(start, end))
+    finally:
+        conn.close()
+    df['period'] = df['payment_date'].str[:7]
+    return df.groupby(['period', 'class_name'])['amount'].agg(['count', 'sum']).reset_index()
+
+def pandas_dues(as_of):
+    import pandas as pd
+    conn = db.get_connection()
+    try:
+        students = pd.read_sql_query("SELECT student_id, class_name, outstanding_balance, extra_balance FROM students", conn)
+        payments = pd.read_sql_query("SELECT student_id, payment_date FROM payments WHERE payment_date <= ?", conn, params=(as_of,))
+    finally:
+        conn.close()
+    last = payments.groupby('student_id')['payment_date'].max().rename('last_payment')
+    df = students.merge(last, left_on='student_id', right_index=True, how='left')
+    df['owes'] = df['outstanding_balance'] > 0.005
+    df['recent'] = df['owes'] & (df['last_payment'] > (date.fromisoformat(as_of) - timedelta(days=30)).isoformat())
+    return df.groupby('class_name').agg(students=('student_id', 'count'), owing=('owes', 'sum'),
+                                        outstanding=('outstanding_balance', 'sum'), recent=('recent', 'sum'))
+
+def pandas_performance():
+    import pandas as pd
+    conn = db.get_connection()
+    try:
+        df = pd.read_sql_query('''SELECT s.class_name, r.subject, r.student_id, r.marks FROM results r
+                                  LEFT JOIN students s ON s.student_id = r.student_id''', conn)
+    finally:
+        conn.close()
+    df['passed'] = df['marks'] >= analytics.PASS_MARKS
+    return df.groupby(['class_name', 'subject']).agg(students=('student_id', 'nunique'), average=('marks', 'mean'),
+                                                     highest=('marks', 'max'), lowest=('marks', 'min'), passed=('passed', 'mean'))
+
+# Take payments while `running` is set; latency of each in ms
+def take_payments(student_ids, running, latencies):
+    rng = random.Random(8)
+    while running.is_set():
+        started = time.perf_counter()
+        db.record_payment(rng.choice(student_ids), 0.0, 0.0, 100.0)
+        latencies.append((time.perf_counter() - started) * 1000)
+        time.sleep(0.005)
+
+# Export while payments are being taken and report both sides
+def export_under_load(student_ids, directory, full=False):
+    running, latencies = threading.Event(), []
+    running.set()
+    writer = threading.Thread(target=take_payments, args=(student_ids, running, latencies))
+    writer.start()
+    time.sleep(0.2)
+    try:
+        result = analytics.export_snapshot(directory, full)
+    finally:
+        time.sleep(0.2)
+        running.clear()
+        writer.join()
+    return {'seconds': result['seconds'], 'exported': {name: t['exported'] for name, t in result['tables'].items()},
+            'payments_during_export': len(latencies), 'payment_p50_ms': round(percentile(latencies, 50), 1),
+            'payment_max_ms': round(max(latencies), 1) if latencies else None}
+
+def directory_mb(directory):
+    return round(sum(os.path.getsize(os.path.join(root, name)) for root, _, names in os.walk(directory)
+                     for name in names) / 1024 / 1024, 1)
+
+def main():
+    parser = argparse.ArgumentParser(description="DuckDB over the Parquet snapshot vs. pandas over school.db")
+    parser.add_argument('--students', type=int, default=50000)
+    parser.add_argument('--years', type=int, default=2)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        db_path = os.path.join(tmp, 'school.db')
+        student_ids = synthetic.generate(db_path, args.students, args.years, blobs='stub')
+        db.DB_PATH = db_path
+        db.disable_replica()
+        db.init_db()
+        directory = os.path.join(tmp, 'analytics')
+        conn = db.get_connection()
+        payments, invoices, first_day, last_day = conn.execute(
+            "SELECT (SELECT COUNT(*) FROM payments), (SELECT COUNT(*) FROM invoices), MIN(payment_date), MAX(payment_date) FROM payments").fetchone()
+        conn.close()
+        report = {'students': args.students, 'payments': payments, 'invoices': invoices,
+                  'database_mb': round(os.path.getsize(db_path) / 1024 / 1024, 1)}
+
+        report['first_export'] = export_under_load(student_ids, directory)
+        report['snapshot_mb'] = directory_mb(directory)
+        report['incremental_export'] = export_under_load(student_ids, directory)
+        report['full_export'] = export_under_load(student_ids, directory, full=True)
+
+        today = date.today().isoformat()
+        report['results'] = [
+            measure('collections_by_month_and_class_duckdb',
+                    lambda i: analytics.collection_summary(first_day, last_day, 'month', True, directory), 10),
+            measure('collections_by_month_and_class_pandas', lambda i: pandas_collections(first_day, last_day), 3),
+            measure('dues_by_class_duckdb', lambda i: analytics.dues_by_class(today, directory), 10),
+            measure('dues_by_class_pandas', lambda i: pandas_dues(today), 3),
+            measure('academic_performance_duckdb', lambda i: analytics.academic_performance(directory=directory), 10),
+            measure('academic_performance_pandas', lambda i: pandas_performance(), 3),
+            measure('collections_by_month_and_class_sqlite_rollup',
+                    lambda i: reports.collection_summary(first_day, last_day, 'month', True), 10),
+        ]
+
+        # The snapshot must agree with the live database once it has caught up
+        analytics.export_snapshot(directory)
+        duck = {(t.period, t.class_name): (t.payments, round(t.amount, 2))
+                for t in analytics.collection_summary(first_day, today, 'month', True, directory)}
+        frame = pandas_collections(first_day, today)
+        panda = {(row.period, row.class_name): (int(row.count), round(row.sum, 2)) for row in frame.itertuples()}
+        report['matches_pandas'] = duck == panda
+    print(json.dumps(report, indent=2))
+
+if __name__ == "__main__":
+    main()
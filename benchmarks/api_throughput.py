@@ -0,0 +1,107 @@
+import argparse
+import http.client
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Send one JSON request and return (status, seconds)
+def request(host, port, method, path, body=None):
+    conn = http.client.HTTPConnection(host, port, timeout=60)
+    started = time.perf_counter()
+    try:
+        payload = json.dumps(body) if body is not None else None
+        conn.request(method, path, body=payload, headers={'Content-Type': 'application/json'})
+        response = conn.getresponse()
+        data = response.read()
+        return response.status, time.perf_counter() - started, data
+    finally:
+        conn.close()
+
+def wait_for_server(host, port, deadline=30):
+    end = time.time() + deadline
+    while time.time() < end:
+        try:
+            request(host, port, 'GET', '/receipts?student_id=none')
+            return
+        except OSError:
+            time.sleep(0.2)
+    raise RuntimeError("API server did not start")
+
+def percentile(values, pct):
+    values = sorted(values)
+    if not values:
+        return 0.0
+    return values[min(len(values) - 1, int(round(pct / 100 * (len(values) - 1))))]
+
+# Fire `count` requests from `concurrency` threads and summarise latency
+def run_scenario(name, host, port, concurrency, count, make_request):
+    latencies, errors = [], 0
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        for status, seconds, _ in pool.map(lambda i: request(host, port, *make_request(i)), range(count)):
+            latencies.append(seconds)
+            if status >= 400:
+                errors += 1
+    elapsed = time.perf_counter() - started
+    return {
+        'scenario': name,
+        'requests': count,
+        'concurrency': concurrency,
+        'errors': errors,
+        'throughput_rps': round(count / elapsed, 1),
+        'p50_ms': round(percentile(latencies, 50) * 1000, 2),
+        'p99_ms': round(percentile(latencies, 99) * 1000, 2),
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description="Throughput benchmark for the headless school API")
+    parser.add_argument('--students', type=int, default=200)
+    parser.add_argument('--requests', type=int, default=500)
+    parser.add_argument('--concurrency', type=int, default=8)
+    parser.add_argument('--pool-size', type=int, default=8)
+    parser.add_argument('--port', type=int, default=8611)
+    args = parser.parse_args()
+    host = '127.0.0.1'
+
+    with tempfile.TemporaryDirectory() as tmp:
+        db_path = os.path.join(tmp, 'bench.db')
+        server = subprocess.Popen([sys.executable, os.path.join(ROOT, 'cli.py'), '--db', db_path, 'serve',
+                                   '--port', str(args.port), '--pool-size', str(args.pool_size)],
+                                  stdout=subprocess.DEVNULL)
+        try:
+            wait_for_server(host, args.port)
+            student_ids = []
+            for i in range(args.students):
+                _, _, data = request(host, args.port, 'POST', '/students', {
+                    'first_name': f'Bench{i}', 'last_name': 'Student', 'mother_name': 'Mother',
+                    'father_name': 'Father', 'class_name': str(i % 10 + 1), 'roll_number': str(i + 1)})
+                student_ids.append(json.loads(data)['student_id'])
+
+            def pick(i):
+                return student_ids[i % len(student_ids)]
+
+            results = [
+                run_scenario('get_student', host, args.port, args.concurrency, args.requests,
+                             lambda i: ('GET', f'/students/{pick(i)}')),
+                run_scenario('record_payment+receipt', host, args.port, args.concurrency, args.requests,
+                             lambda i: ('POST', '/payments', {'student_id': pick(i), 'school_fee': 1200,
+                                                              'bus_fee': 500, 'amount': 1700})),
+                run_scenario('generate_invoice', host, args.port, args.concurrency, args.requests,
+                             lambda i: ('POST', '/invoices', {'student_id': pick(i), 'school_fee': 1200,
+                                                              'bus_fee': 500})),
+                run_scenario('search_receipts', host, args.port, args.concurrency, args.requests,
+                             lambda i: ('GET', f'/receipts?student_id={pick(i)}')),
+            ]
+        finally:
+            server.terminate()
+            server.wait()
+    print(json.dumps(results, indent=2))
+
+if __name__ == "__main__":
+    main()
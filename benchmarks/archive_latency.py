@@ -0,0 +1,62 @@
+import argparse
+import json
+import os
+import random
+import sys
+import tempfile
+import time
+from datetime import date
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import db
+import archive
+from benchmarks import synthetic
+
+# Average latency of the reprint searches for a sample of students
+def time_searches(student_ids, samples=50):
+    rng = random.Random(7)
+    sample = [rng.choice(student_ids) for _ in range(samples)]
+    timings = {}
+    for name, fn in (('search_invoices', lambda sid: db.search_invoices(sid)),
+                     ('search_receipts', lambda sid: db.search_receipts(sid)),
+                     ('search_report_cards', lambda sid: db.search_report_cards(sid, None))):
+        started = time.perf_counter()
+        rows = 0
+        for sid in sample:
+            rows += len(fn(sid))
+        timings[name] = {'avg_ms': round((time.perf_counter() - started) / samples * 1000, 2), 'avg_rows': rows / samples}
+    return timings
+
+def main():
+    parser = argparse.ArgumentParser(description="Live-DB size and search latency before and after academic-year archival")
+    parser.add_argument('--students', type=int, default=500)
+    parser.add_argument('--years', type=int, default=5, help="Number of academic years to generate")
+    args = parser.parse_args()
+    current = int(archive.academic_year_of(date.today())[:4])
+
+    with tempfile.TemporaryDirectory() as tmp:
+        db_path = os.path.join(tmp, 'school.db')
+        db.ARCHIVE_DIR = os.path.join(tmp, 'archive')
+        student_ids = synthetic.generate(db_path, args.students, args.years)
+        db.DB_PATH = db_path
+        report = {'students': args.students, 'academic_years': args.years}
+        report['before'] = {'db_bytes': archive.database_size(db_path), 'searches': time_searches(student_ids)}
+
+        started = time.perf_counter()
+        archived = archive.archive_closed_years(vacuum=True)
+        report['archive_seconds'] = round(time.perf_counter() - started, 2)
+        report['archived_years'] = [entry['academic_year'] for entry in archived]
+        archive_bytes = sum(archive.database_size(db.archive_path(entry['academic_year'])) for entry in archived)
+        report['after'] = {'db_bytes': archive.database_size(db_path), 'archive_bytes': archive_bytes,
+                           'searches_with_history': time_searches(student_ids)}
+
+        # Current-year lookups never touch the archives
+        started = time.perf_counter()
+        for sid in student_ids[:50]:
+            db.search_report_cards(sid, f"{current}-{current + 1}")
+        report['after']['report_card_current_year_avg_ms'] = round((time.perf_counter() - started) / 50 * 1000, 2)
+    print(json.dumps(report, indent=2))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,119 @@
+import argparse
+import json
+import os
+import random
+import sqlite3
+import sys
+import tempfile
+import time
+from datetime import date, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import attendance
+import db
+from benchmarks import synthetic
+from benchmarks.suite import measure
+
+# Working days of a finished session: Monday to Saturday, less a few holidays
+def school_days(academic_year, rng):
+    day, end = date(int(academic_year[:4]), 4, 1), date(int(academic_year[5:]), 4, 1)
+    days = []
+    while day < end:
+        if day.weekday() < 6 and rng.random() > 0.08:
+            days.append(day)
+        day += timedelta(days=1)
+    return days
+
+# The same register stored the obvious way: one row per student per day
+def mark_rows(conn, class_students, day, absent):
+    conn.executemany("INSERT OR REPLACE INTO attendance_rows (student_id, day, present) VALUES (?, ?, ?)",
+                     [(sid, day.isoformat(), sid not in absent) for sid in class_students])
+    conn.commit()
+
+def rows_summary(conn, start, end):
+    return conn.execute('''SELECT student_id, SUM(present), COUNT(*) FROM attendance_rows
+                           WHERE day >= ? AND day < ? GROUP BY student_id''', (start, end)).fetchall()
+
+def rows_daily_totals(conn, start, end):
+    return conn.execute('''SELECT day, SUM(present), COUNT(*) FROM attendance_rows
+                           WHERE day >= ? AND day < ? GROUP BY day ORDER BY day''', (start, end)).fetchall()
+
+def main():
+    parser = argparse.ArgumentParser(description="Bitset attendance register vs. one row per student per day")
+    parser.add_argument('--students', type=int, default=10000)
+    parser.add_argument('--absence-rate', type=float, default=0.08)
+    args = parser.parse_args()
+
+    rng = random.Random(5)
+    this_year = date.today().year if date.today().month >= 4 else date.today().year - 1
+    academic_year = f"{this_year - 1}-{this_year}"
+    start, end = f"{this_year - 1}-04-01", f"{this_year}-04-01"
+    days = school_days(academic_year, rng)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        db_path = os.path.join(tmp, 'school.db')
+        synthetic.generate(db_path, args.students, 1, blobs='none')
+        db.DB_PATH = db_path
+        db.disable_replica()
+        conn = db.get_connection()
+        classes = {}
+        for student_id, class_name in conn.execute("SELECT student_id, class_name FROM students"):
+            classes.setdefault(class_name, []).append(student_id)
+        conn.close()
+        rows_path = os.path.join(tmp, 'rows.db')
+        rows_conn = sqlite3.connect(rows_path)
+        rows_conn.execute('''CREATE TABLE attendance_rows (student_id TEXT NOT NULL, day TEXT NOT NULL,
+                             present INTEGER NOT NULL, PRIMARY KEY (student_id, day)) WITHOUT ROWID''')
+
+        report = {'students': args.students, 'academic_year': academic_year, 'school_days': len(days),
+                  'class_marks': len(days) * len(classes)}
+        bitset_seconds = rows_seconds = 0.0
+        for day in days:
+            for class_name, student_ids in classes.items():
+                absent = [sid for sid in student_ids if rng.random() < args.absence_rate]
+                started = time.perf_counter()
+                attendance.mark_class(class_name, day, absent)
+                bitset_seconds += time.perf_counter() - started
+                started = time.perf_counter()
+                mark_rows(rows_conn, student_ids, day, set(absent))
+                rows_seconds += time.perf_counter() - started
+        report['mark_full_year_seconds'] = {'bitset': round(bitset_seconds, 1), 'row_per_day': round(rows_seconds, 1)}
+        report['mark_one_class_ms'] = {'bitset': round(bitset_seconds / report['class_marks'] * 1000, 2),
+                                       'row_per_day': round(rows_seconds / report['class_marks'] * 1000, 2)}
+
+        conn = db.get_connection()
+        conn.execute("VACUUM")
+        bitset_bytes = conn.execute("SELECT SUM(LENGTH(present) + LENGTH(marked)) FROM attendance").fetchone()[0]
+        conn.close()
+        rows_conn.execute("VACUUM")
+        report['storage'] = {'bitset_rows': args.students, 'bitset_payload_kb': round(bitset_bytes / 1024, 1),
+                             'row_per_day_rows': rows_conn.execute("SELECT COUNT(*) FROM attendance_rows").fetchone()[0],
+                             'row_per_day_file_mb': round(os.path.getsize(rows_path) / 1024 / 1024, 1)}
+
+        student_ids = [sid for ids in classes.values() for sid in ids]
+        report['results'] = [
+            measure('school_summary', lambda i: attendance.summarise(academic_year), 20),
+            measure('school_summary_row_per_day', lambda i: rows_summary(rows_conn, start, end), 5),
+            measure('student_attendance', lambda i: attendance.student_attendance(rng.choice(student_ids), academic_year), 500),
+            measure('daily_totals_numpy', lambda i: attendance.daily_totals(academic_year), 20),
+            measure('daily_totals_row_per_day', lambda i: rows_daily_totals(rows_conn, start, end), 5),
+        ]
+        numpy = sys.modules.pop('numpy')
+        sys.modules['numpy'] = None
+        try:
+            report['results'].append(measure('school_summary_without_numpy', lambda i: attendance.summarise(academic_year), 20))
+            report['results'].append(measure('daily_totals_without_numpy', lambda i: attendance.daily_totals(academic_year), 3))
+        finally:
+            sys.modules['numpy'] = numpy
+
+        # Bitset counts must agree with the row-per-day register
+        expected = {sid: (present, marked) for sid, present, marked in rows_summary(rows_conn, start, end)}
+        report['matches_row_per_day'] = (
+            all(expected[r.student_id] == (r.present, r.marked) for r in attendance.summarise(academic_year))
+            and attendance.daily_totals(academic_year) == rows_daily_totals(rows_conn, start, end))
+        rows_conn.close()
+    print(json.dumps(report, indent=2))
+
+if __name__ == "__main__":
+    main()
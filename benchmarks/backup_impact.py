@@ -0,0 +1,85 @@
+import argparse
+import json
+import os
+import random
+import sys
+import tempfile
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import db
+import backup
+from benchmarks import synthetic
+
+def percentile(values, pct):
+    values = sorted(values)
+    if not values:
+        return 0.0
+    return values[min(len(values) - 1, int(round(pct / 100 * (len(values) - 1))))]
+
+# Record payments at a steady pace until `stop` is set, collecting latencies
+def payment_load(student_ids, stop, latencies, errors, think_time):
+    rng = random.Random(1)
+    while not stop.is_set():
+        started = time.perf_counter()
+        try:
+            db.record_payment(rng.choice(student_ids), 1200.0, 500.0, 1700.0)
+            latencies.append(time.perf_counter() - started)
+        except Exception as e:
+            errors.append(str(e))
+        time.sleep(think_time)
+
+def summarise(latencies, errors):
+    return {
+        'payments': len(latencies),
+        'errors': len(errors),
+        'p50_ms': round(percentile(latencies, 50) * 1000, 2),
+        'p99_ms': round(percentile(latencies, 99) * 1000, 2),
+        'max_ms': round(max(latencies, default=0) * 1000, 2),
+    }
+
+# Measure payment latency while `action` runs (or for `idle_seconds` when there is none)
+def measure(student_ids, think_time, action=None, idle_seconds=3.0):
+    stop, latencies, errors = threading.Event(), [], []
+    thread = threading.Thread(target=payment_load, args=(student_ids, stop, latencies, errors, think_time))
+    thread.start()
+    time.sleep(0.5)
+    result = None
+    try:
+        if action:
+            result = action()
+        else:
+            time.sleep(idle_seconds)
+    finally:
+        stop.set()
+        thread.join()
+    return summarise(latencies, errors), result
+
+def main():
+    parser = argparse.ArgumentParser(description="Impact of online backups on concurrent record_payment latency")
+    parser.add_argument('--students', type=int, default=500)
+    parser.add_argument('--years', type=int, default=4)
+    parser.add_argument('--think-time', type=float, default=0.05, help="Pause between payments (seconds)")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        db_path = os.path.join(tmp, 'school.db')
+        student_ids = synthetic.generate(db_path, args.students, args.years)
+        db.DB_PATH = db_path
+        backup_dir = os.path.join(tmp, 'backups')
+        report = {'db_bytes': os.path.getsize(db_path)}
+
+        report['no_backup'], _ = measure(student_ids, args.think_time)
+        for label, options in (('stepped_64_pages', {'pages': 64}),
+                               ('stepped_64_pages_gzip', {'pages': 64, 'compress': True}),
+                               ('single_step', {'pages': -1})):
+            latency, stats = measure(student_ids, args.think_time,
+                                     lambda: backup.backup_database(backup_dir, keep=1, **options))
+            stats.pop('removed', None)
+            report[label] = {'payment_latency': latency, 'backup': stats}
+    print(json.dumps(report, indent=2))
+
+if __name__ == "__main__":
+    main()
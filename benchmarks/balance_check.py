@@ -0,0 +1,73 @@
+import argparse
+import json
+import os
+import random
+import sqlite3
+import sys
+import tempfile
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import balances
+import db
+from benchmarks import synthetic
+from benchmarks.suite import percentile
+
+# Take payments in a loop while `running` is set; latency of each in ms
+def take_payments(student_ids, running, latencies):
+    rng = random.Random(8)
+    while running.is_set():
+        started = time.perf_counter()
+        db.record_payment(rng.choice(student_ids), 0.0, 0.0, 100.0)
+        latencies.append((time.perf_counter() - started) * 1000)
+        time.sleep(0.005)
+
+# Run a check while payments are being taken and report both sides
+def check_under_load(student_ids, chunk, repair=False):
+    running, latencies = threading.Event(), []
+    running.set()
+    writer = threading.Thread(target=take_payments, args=(student_ids, running, latencies))
+    writer.start()
+    time.sleep(0.2)
+    try:
+        result = balances.check_balances(repair, chunk=chunk)
+    finally:
+        time.sleep(0.2)
+        running.clear()
+        writer.join()
+    return {'seconds': result['seconds'], 'mismatches': result['mismatches'], 'repaired': result['repaired'],
+            'payments_during_check': len(latencies), 'payment_p50_ms': round(percentile(latencies, 50), 1),
+            'payment_max_ms': round(max(latencies), 1) if latencies else None}
+
+def main():
+    parser = argparse.ArgumentParser(description="Ledger balance check: chunked vs. one pass, with payments running")
+    parser.add_argument('--students', type=int, default=30000)
+    parser.add_argument('--years', type=int, default=2)
+    parser.add_argument('--drift', type=float, default=0.01, help="Share of students whose balance is tampered with")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        db_path = os.path.join(tmp, 'school.db')
+        student_ids = synthetic.generate(db_path, args.students, args.years, blobs='none')
+        db.DB_PATH = db_path
+        db.init_db()
+        conn = sqlite3.connect(db_path)
+        ledger_rows = conn.execute("SELECT COUNT(*) FROM balance_ledger").fetchone()[0]
+        rng = random.Random(4)
+        drifted = rng.sample(student_ids, int(len(student_ids) * args.drift))
+        conn.executemany("UPDATE students SET outstanding_balance = COALESCE(outstanding_balance, 0.0) + ? WHERE student_id = ?",
+                         [(rng.choice([-250.0, 100.0, 500.0]), sid) for sid in drifted])
+        conn.commit()
+        conn.close()
+
+        report = {'students': args.students, 'ledger_rows': ledger_rows, 'drifted': len(drifted)}
+        report['one_pass'] = check_under_load(student_ids, chunk=10 ** 9)
+        report['chunked'] = check_under_load(student_ids, chunk=balances.CHUNK)
+        report['chunked_repair'] = check_under_load(student_ids, chunk=balances.CHUNK, repair=True)
+        report['after_repair'] = check_under_load(student_ids, chunk=balances.CHUNK)
+    print(json.dumps(report, indent=2))
+
+if __name__ == "__main__":
+    main()
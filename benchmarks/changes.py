@@ -0,0 +1,84 @@
+import argparse
+import json
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import changes
+import db
+import fees
+import service
+from benchmarks import synthetic
+from benchmarks.suite import measure
+
+# Time fn with the change triggers installed and again without them
+def with_and_without(name, fn, iterations):
+    results = [measure(f'{name}_with_change_log', fn, iterations)]
+    conn = db.get_connection()
+    try:
+        db.drop_change_triggers(conn)
+        conn.commit()
+        results.append(measure(f'{name}_without_change_log', fn, iterations))
+        db.create_change_triggers(conn)
+        conn.commit()
+    finally:
+        conn.close()
+    return results
+
+def main():
+    parser = argparse.ArgumentParser(description="Write overhead of the change log, tail throughput and pruning")
+    parser.add_argument('--students', type=int, default=20000)
+    parser.add_argument('--payments', type=int, default=300)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        db_path = os.path.join(tmp, 'school.db')
+        student_ids = synthetic.generate(db_path, args.students, 1, blobs='stub')
+        db.DB_PATH = db_path
+        db.disable_replica()
+        db.init_db()
+        report = {'students': args.students}
+
+        report['results'] = with_and_without('payment_with_receipt', lambda i: service.take_payment(
+            student_ids[i % len(student_ids)], 100.0, 0.0, 100.0), args.payments)
+        for class_name in synthetic.CLASSES:
+            fees.set_fee(class_name, 'tuition', synthetic.school_fee_for(class_name))
+        # Posting charges updates every student in one transaction, one event each
+        periods = iter(f"{year}-{month:02d}" for year in range(2100, 2200) for month in range(1, 13))
+        report['results'] += with_and_without('post_charges', lambda i: fees.post_charges(next(periods)), 3)
+
+        conn = db.get_connection()
+        try:
+            total = conn.execute("SELECT COUNT(*) FROM change_events").fetchone()[0]
+            report['events'] = {'count': total, 'by_table': dict(conn.execute(
+                "SELECT table_name, COUNT(*) FROM change_events GROUP BY table_name").fetchall())}
+        finally:
+            conn.close()
+
+        # A consumer catching up from the start, and one following payments only
+        handled = []
+        started = time.perf_counter()
+        report['consume_all'] = changes.consume('benchmark', handled.extend)
+        seconds = time.perf_counter() - started
+        report['consume_all']['events_per_second'] = round(len(handled) / seconds) if seconds else None
+        started = time.perf_counter()
+        report['consume_payments'] = changes.consume('payments_only', lambda events: None, ['payments'])
+        report['consume_payments']['seconds'] = round(time.perf_counter() - started, 3)
+        report['results'].append(measure('read_changes_tail', lambda i: changes.read_changes(
+            max(0, total - changes.READ_LIMIT)), 50))
+
+        # Age every event so all of them are due, then prune what both consumers have read
+        conn = db.get_connection()
+        try:
+            conn.execute("UPDATE change_events SET recorded_at = '2000-01-01 00:00:00'")
+            conn.commit()
+        finally:
+            conn.close()
+        report['prune'] = changes.prune_changes()
+    print(json.dumps(report, indent=2))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,76 @@
+import argparse
+import json
+import os
+import random
+import sys
+import tempfile
+from datetime import date, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import db
+import reports
+from benchmarks import synthetic
+from benchmarks.suite import measure
+
+# The same summaries answered by scanning payments instead of the rollup
+def scan_summary(start, end, by, per_class):
+    period = reports.PERIODS[by].replace('collection_date', 'p.payment_date')
+    class_column = "COALESCE(s.class_name, '')" if per_class else "''"
+    conn = db.get_read_connection()
+    try:
+        return conn.execute(f'''SELECT {period} AS period, {class_column} AS class, COUNT(*), SUM(p.amount)
+                                FROM payments p LEFT JOIN students s ON s.student_id = p.student_id
+                                WHERE p.payment_date BETWEEN ? AND ?
+                                GROUP BY period, class''', (start, end)).fetchall()
+    finally:
+        conn.close()
+
+# Day book without the payment_date index
+def unindexed_day_book(day):
+    conn = db.get_read_connection()
+    try:
+        return conn.execute('''SELECT p.payment_id, p.student_id, p.amount FROM payments p NOT INDEXED
+                               WHERE p.payment_date = ? ORDER BY p.id''', (day,)).fetchall()
+    finally:
+        conn.close()
+
+def main():
+    parser = argparse.ArgumentParser(description="Collection reports from the daily rollup vs. scanning payments")
+    parser.add_argument('--students', type=int, default=3000)
+    parser.add_argument('--years', type=int, default=3)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        db_path = os.path.join(tmp, 'school.db')
+        student_ids = synthetic.generate(db_path, args.students, args.years, blobs='none')
+        db.DB_PATH = db_path
+        db.disable_replica()
+        conn = db.get_connection()
+        payments, first_day, last_day = conn.execute("SELECT COUNT(*), MIN(payment_date), MAX(payment_date) FROM payments").fetchone()
+        days = [row[0] for row in conn.execute("SELECT DISTINCT payment_date FROM payments")]
+        conn.close()
+        year_start = (date.fromisoformat(last_day) - timedelta(days=365)).isoformat()
+        rng = random.Random(3)
+        report = {'students': args.students, 'payments': payments, 'results': []}
+
+        for label, fn, iterations in (
+            ('year_by_month_rollup', lambda i: reports.collection_summary(year_start, last_day, 'month'), 50),
+            ('year_by_month_scan', lambda i: scan_summary(year_start, last_day, 'month', False), 10),
+            ('all_years_by_class_rollup', lambda i: reports.collection_summary(first_day, last_day, 'academic_year', True), 50),
+            ('all_years_by_class_scan', lambda i: scan_summary(first_day, last_day, 'academic_year', True), 10),
+            ('day_book_indexed', lambda i: reports.day_book(rng.choice(days)), 200),
+            ('day_book_unindexed', lambda i: unindexed_day_book(rng.choice(days)), 20),
+            ('record_payment', lambda i: db.record_payment(rng.choice(student_ids), 1200.0, 500.0, 1700.0), 200),
+        ):
+            report['results'].append(measure(label, fn, iterations))
+            print(f"{label}: {report['results'][-1]['p50_ms']} ms p50", file=sys.stderr)
+
+        # The rollup must agree with the payments it summarises
+        expected = sorted((period, count, round(amount, 2)) for period, _, count, amount in scan_summary(first_day, '9999-12-31', 'month', False))
+        actual = sorted((t.period, t.payments, round(t.amount, 2)) for t in reports.collection_summary(first_day, '9999-12-31', 'month'))
+        report['rollup_matches_payments'] = expected == actual
+    print(json.dumps(report, indent=2))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,89 @@
+import argparse
+import json
+import os
+import socket
+import subprocess
+import sys
+import tempfile
+import urllib.request
+from datetime import date
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import db
+import dispatch
+from benchmarks import synthetic
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+# Run sandbox.py in its own process, so the servers do not share our GIL
+class Sandbox:
+    def __init__(self, latency=0.0, failure_rate=0.0):
+        self.smtp_port, self.http_port = free_port(), free_port()
+        self.process = subprocess.Popen(
+            [sys.executable, os.path.join(ROOT, 'sandbox.py'), '--smtp-port', str(self.smtp_port),
+             '--http-port', str(self.http_port), '--latency', str(latency), '--failure-rate', str(failure_rate),
+             '--seed', '7'], stdout=subprocess.PIPE, text=True)
+        self.process.stdout.readline()
+
+    def transports(self):
+        return {'email': dispatch.SmtpTransport('127.0.0.1', self.smtp_port),
+                'whatsapp': dispatch.WhatsAppTransport(f'http://127.0.0.1:{self.http_port}/messages')}
+
+    def stats(self):
+        with urllib.request.urlopen(f'http://127.0.0.1:{self.http_port}/stats') as response:
+            return json.loads(response.read())
+
+    def stop(self):
+        self.process.terminate()
+        self.process.wait()
+
+# Queue this month's invoices again on both channels and send them through a fresh sandbox
+def run(name, channels=dispatch.CHANNELS, latency=0.0, failure_rate=0.0, concurrency=None, rates=None, limit=None):
+    queued = dispatch.queue_documents('invoice', channels, start=date.today().replace(day=1).isoformat(), resend=True)
+    sandbox = Sandbox(latency, failure_rate)
+    try:
+        result = dispatch.send_dispatches(channels, sandbox.transports(), concurrency, rates or {'email': 0, 'whatsapp': 0},
+                                          limit)
+        received = sandbox.stats()
+    finally:
+        sandbox.stop()
+    row = {'name': name, 'queued': sum(queued['queued'].values()), 'sent': result['sent'], 'retried': result['retried'],
+           'failed': result['failed'], 'seconds': result['seconds'], 'messages_per_second': result['per_second'],
+           'received': received['emails'] + received['whatsapp'], 'busy_replies': received['busy']}
+    print(f"{name}: {row['sent']} sent in {row['seconds']} s ({row['messages_per_second']}/s)", file=sys.stderr)
+    return row
+
+def main():
+    parser = argparse.ArgumentParser(description="Dispatch throughput against the local SMTP server and WhatsApp gateway")
+    parser.add_argument('--messages', type=int, default=5000, help="Messages per run (half email, half WhatsApp)")
+    parser.add_argument('--latency', type=float, default=0.05, help="Simulated provider latency per message, seconds")
+    parser.add_argument('--sequential', type=int, default=250, help="Messages per channel for the one-at-a-time run")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        db_path = os.path.join(tmp, 'school.db')
+        synthetic.generate(db_path, args.messages // 2, 1, blobs='pdf')
+        db.DB_PATH = db_path
+        db.disable_replica()
+        dispatch.RETRY_DELAYS = (1, 2, 4, 8)
+        report = {'messages': args.messages, 'latency_ms': args.latency * 1000, 'results': []}
+        results = report['results']
+        results.append(run('one_at_a_time', latency=args.latency, concurrency=1, limit=args.sequential))
+        results.append(run('concurrent', latency=args.latency))
+        results.append(run('concurrent_no_latency'))
+        results.append(run('concurrent_5pct_busy', latency=args.latency, failure_rate=0.05))
+        for channel in dispatch.CHANNELS:
+            rate = dispatch.RATE_LIMITS[channel]
+            row = run(f'{channel}_rate_limited', [channel], args.latency, rates={channel: rate}, limit=int(rate * 10))
+            row['limit_per_second'] = rate
+            results.append(row)
+    print(json.dumps(report, indent=2))
+
+if __name__ == "__main__":
+    main()
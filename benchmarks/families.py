@@ -0,0 +1,97 @@
+import argparse
+import json
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import db
+import families
+import fees
+import service
+from benchmarks import synthetic
+from benchmarks.suite import measure
+
+def stored_kb(invoice_ids):
+    conn = db.get_connection()
+    try:
+        total = 0
+        for i in range(0, len(invoice_ids), 500):
+            chunk = invoice_ids[i:i + 500]
+            total += conn.execute(f"SELECT COALESCE(SUM(LENGTH(pdf_data)), 0) FROM invoices WHERE invoice_id IN ({', '.join('?' for _ in chunk)})",
+                                  chunk).fetchone()[0]
+        return round(total / 1024, 1)
+    finally:
+        conn.close()
+
+# Undo an invoicing run so the same students can be invoiced again the other way
+def forget_invoices(period, invoice_ids):
+    conn = db.get_connection()
+    try:
+        for i in range(0, len(invoice_ids), 500):
+            chunk = invoice_ids[i:i + 500]
+            placeholders = ', '.join('?' for _ in chunk)
+            conn.execute(f"DELETE FROM posted_invoices WHERE period = ? AND invoice_id IN ({placeholders})", [period, *chunk])
+            conn.execute(f"DELETE FROM invoices WHERE invoice_id IN ({placeholders})", chunk)
+        conn.commit()
+    finally:
+        conn.close()
+
+def main():
+    parser = argparse.ArgumentParser(description="Household index build and per-family vs per-student invoicing")
+    parser.add_argument('--students', type=int, default=50000)
+    parser.add_argument('--sibling-rate', type=float, default=0.35, help="Share of students with an older sibling")
+    parser.add_argument('--render-class', default='5', help="Render invoices for the households with someone in this class")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        db_path = os.path.join(tmp, 'school.db')
+        synthetic.generate(db_path, args.students, 1, blobs='none', sibling_rate=args.sibling_rate)
+        db.DB_PATH = db_path
+        db.disable_replica()
+        db.init_db()
+        report = {'students': args.students, 'sibling_rate': args.sibling_rate}
+
+        report['index'] = families.rebuild_index()
+        report['results'] = [measure('rebuild_household_index', lambda i: families.rebuild_index(), 3)]
+        fields = {'first_name': 'New', 'last_name': 'Admission', 'mother_name': 'Sunita Devi', 'father_name': 'Ramesh Kumar',
+                  'class_name': '1'}
+        report['results'].append(measure('admit_student_with_index',
+                                         lambda i: service.admit_student({**fields, 'mobile_number': f'98{i + 10:08d}'}), 200))
+
+        for class_name in synthetic.CLASSES:
+            fees.set_fee(class_name, 'tuition', synthetic.school_fee_for(class_name))
+            fees.set_fee(class_name, 'bus', synthetic.BUS_FEE)
+        period = fees.post_charges()['period']
+        report['documents_per_cycle'] = {'per_student': len(fees.students_to_invoice(period)),
+                                         'per_family': len(families.households_to_invoice(period))}
+
+        # Render the same students both ways: every household with someone in one class
+        students = [sid for household in families.households_to_invoice(period, args.render_class) for sid in household]
+        started = time.perf_counter()
+        issued = [service.issue_posted_invoice(student_id, period)['invoice_id'] for student_id in students]
+        per_student = {'students': len(students), 'documents': len(issued), 'seconds': round(time.perf_counter() - started, 2),
+                       'stored_kb': stored_kb(issued)}
+        forget_invoices(period, issued)
+        started = time.perf_counter()
+        result = families.issue_family_invoices(period, args.render_class)
+        per_family = {'students': result['students'], 'documents': len(result['issued']),
+                      'family_invoices': result['family_invoices'], 'seconds': round(time.perf_counter() - started, 2),
+                      'stored_kb': stored_kb(result['issued'])}
+        report['render'] = {'class': args.render_class, 'per_student': per_student, 'per_family': per_family}
+
+        # One family payment and receipt against a payment and receipt per sibling
+        households = [household for household in families.households_to_invoice(period) if len(household) > 1][:60]
+        family_payments, sibling_payments = households[:30], households[30:]
+        report['results'].append(measure('family_payment_one_receipt',
+                                         lambda i: families.take_family_payment(family_payments[i % 30][0], 1000.0), 27))
+        report['results'].append(measure('payment_per_sibling', lambda i: [
+            service.take_payment(student_id, 0.0, 0.0, 1000.0 / len(sibling_payments[i % 30]))
+            for student_id in sibling_payments[i % 30]], 27))
+        report['siblings_per_family'] = round(sum(map(len, households)) / len(households), 2)
+    print(json.dumps(report, indent=2))
+
+if __name__ == "__main__":
+    main()
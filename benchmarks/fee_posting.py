@@ -0,0 +1,78 @@
+import argparse
+import json
+import os
+import random
+import sqlite3
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import db
+import fees
+from benchmarks import synthetic
+
+# Post a period one student at a time, the way a loop over get_all_students() would
+def post_row_by_row(period):
+    month = int(period[5:])
+    started = time.perf_counter()
+    conn = db.get_connection()
+    try:
+        c = conn.cursor()
+        schedule = {}
+        for fee in fees.list_fees():
+            if not fee.months or month in [int(m) for m in fee.months.split(',')]:
+                schedule.setdefault(fee.class_name, []).append((fee.fee_head, fee.amount))
+        exempt = set(c.execute("SELECT student_id, fee_head FROM fee_exemptions").fetchall())
+        students = c.execute("SELECT student_id, class_name, outstanding_balance, extra_balance FROM students").fetchall()
+        for student_id, class_name, outstanding, extra in students:
+            total = 0.0
+            for fee_head, amount in schedule.get(class_name, []):
+                if (student_id, fee_head) in exempt:
+                    continue
+                c.execute("INSERT INTO student_charges (period, student_id, fee_head, amount) VALUES (?, ?, ?, ?)",
+                          (period, student_id, fee_head, amount))
+                total += amount
+            net = (outstanding or 0.0) - (extra or 0.0) + total
+            db.update_balances(c, student_id, max(0.0, net), max(0.0, -net))
+        conn.commit()
+    finally:
+        conn.close()
+    return round(time.perf_counter() - started, 3)
+
+def main():
+    parser = argparse.ArgumentParser(description="Set-based monthly fee posting vs. a per-student loop")
+    parser.add_argument('--students', type=int, default=100000)
+    parser.add_argument('--bus-share', type=float, default=0.6, help="Share of students who use the bus")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        db_path = os.path.join(tmp, 'school.db')
+        started = time.perf_counter()
+        student_ids = synthetic.generate(db_path, args.students, 1, blobs='none')
+        db.DB_PATH = db_path
+        report = {'students': args.students, 'setup_seconds': round(time.perf_counter() - started, 1)}
+
+        for class_name in synthetic.CLASSES:
+            fees.set_fee(class_name, 'tuition', synthetic.school_fee_for(class_name))
+            fees.set_fee(class_name, 'bus', synthetic.BUS_FEE)
+            fees.set_fee(class_name, 'exam', 300.0, months='9,3')
+        rng = random.Random(11)
+        conn = sqlite3.connect(db_path)
+        conn.executemany("INSERT INTO fee_exemptions (student_id, fee_head) VALUES (?, 'bus')",
+                         [(sid,) for sid in student_ids if rng.random() > args.bus_share])
+        conn.commit()
+        conn.close()
+
+        report['set_based'] = fees.post_charges('2030-09')
+        started = time.perf_counter()
+        repost = fees.post_charges('2030-09')
+        report['repost_same_period'] = {'already_posted': repost['already_posted'],
+                                        'seconds': round(time.perf_counter() - started, 4)}
+        report['row_by_row_seconds'] = post_row_by_row('2030-10')
+        report['set_based_no_exam'] = fees.post_charges('2030-11')
+    print(json.dumps(report, indent=2))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,91 @@
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Cold-import budget (ms) per entry point and the heavy packages it must not pull in.
+# The headless modules stay free of Streamlit/ReportLab/pandas until a function needs them.
+BUDGETS = {
+    'db': (150, ['streamlit', 'reportlab', 'pandas']),
+    'documents': (150, ['streamlit', 'reportlab', 'pandas']),
+    'service': (150, ['streamlit', 'reportlab', 'pandas']),
+    'jobs': (150, ['streamlit', 'reportlab', 'pandas']),
+    'cli': (200, ['streamlit', 'reportlab', 'pandas', 'tornado', 'pypdf', 'duckdb', 'pyarrow']),
+    'app': (1500, ['reportlab', 'pandas']),
+}
+
+# Parse `python -X importtime` output into the imports triggered by `module`:
+# [(name, depth, cumulative microseconds)], children listed before their parent
+def parse_importtime(stderr, module):
+    entries = []
+    for line in stderr.splitlines():
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+        _, cumulative, name = line[len('import time:'):].split('|')
+        depth = (len(name) - len(name.lstrip())) // 2
+        entries.append((name.strip(), depth, int(cumulative)))
+    end = max(i for i, (name, depth, _) in enumerate(entries) if name == module and depth == 0)
+    start = end
+    # Everything since the previous top-level import belongs to `module` (skips interpreter start-up)
+    while start > 0 and entries[start - 1][1] > 0:
+        start -= 1
+    return entries[start:end + 1]
+
+# Import `module` in a fresh interpreter and return its import timings
+def import_once(module):
+    result = subprocess.run([sys.executable, '-X', 'importtime', '-c', f'import {module}'], cwd=ROOT,
+                            capture_output=True, text=True, timeout=120)
+    if result.returncode != 0:
+        raise RuntimeError(f"import {module} failed:\n{result.stderr[-2000:]}")
+    return parse_importtime(result.stderr, module)
+
+def measure(module, runs):
+    samples = [import_once(module) for _ in range(runs)]
+    entries = samples[-1]
+    forbidden = BUDGETS.get(module, (None, []))[1]
+    loaded = sorted({name.split('.')[0] for name, _, _ in entries} & set(forbidden))
+    slowest = sorted(((name, us) for name, depth, us in entries if depth == 1), key=lambda item: item[1], reverse=True)[:5]
+    return {
+        'module': module,
+        'median_ms': round(statistics.median(sample[-1][2] for sample in samples) / 1000, 1),
+        'modules_loaded': len(entries),
+        'heavy_imports': loaded,
+        'slowest_imports': [{'module': name, 'ms': round(us / 1000, 1)} for name, us in slowest],
+    }
+
+# Entry points that are over budget or load a package they should leave alone
+def find_violations(results):
+    violations = []
+    for entry in results:
+        budget, _ = BUDGETS.get(entry['module'], (None, []))
+        if budget is not None and entry['median_ms'] > budget:
+            violations.append(f"{entry['module']}: {entry['median_ms']} ms > {budget} ms budget")
+        if entry['heavy_imports']:
+            violations.append(f"{entry['module']}: imports {', '.join(entry['heavy_imports'])} at module load")
+    return violations
+
+def main():
+    parser = argparse.ArgumentParser(description="Cold import time of the app and CLI entry points (python -X importtime)")
+    parser.add_argument('modules', nargs='*', default=list(BUDGETS), help="Entry points to measure")
+    parser.add_argument('--runs', type=int, default=5, help="Fresh interpreters per module (median is reported)")
+    parser.add_argument('--check', action='store_true', help="Exit non-zero when a budget is exceeded")
+    parser.add_argument('--output', help="Also write the JSON report here")
+    args = parser.parse_args()
+
+    results = [measure(module, args.runs) for module in args.modules]
+    report = {'python': sys.version.split()[0], 'runs': args.runs, 'results': results,
+              'violations': find_violations(results)}
+    output = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(output)
+    print(output)
+    if args.check and report['violations']:
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,177 @@
+import argparse
+import json
+import logging
+import multiprocessing
+import os
+import random
+import shutil
+import sqlite3
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks import synthetic
+from benchmarks.suite import percentile
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+APP_PATH = os.path.join(ROOT, 'app.py')
+FLOWS = {'invoice': 0.3, 'payment': 0.3, 'reprint': 0.25, 'admission': 0.15}
+
+def widget(widgets, label):
+    for w in widgets:
+        if w.label == label:
+            return w
+    raise LookupError(f"No widget labelled {label!r}")
+
+# Problems a clerk would see after a rerun: uncaught exceptions and st.error messages
+def page_problems(at):
+    return [str(e.value) for e in at.exception] + [str(e.value) for e in at.error]
+
+# One simulated clerk: an AppTest session that logs in and then runs weighted flows
+class ClerkSession:
+    def __init__(self, rng, student_ids, timeout):
+        from streamlit.testing.v1 import AppTest
+        self.at = AppTest.from_file(APP_PATH, default_timeout=timeout)
+        self.rng = rng
+        self.student_ids = student_ids
+        self.records = []
+
+    def step(self, page, action):
+        started = time.perf_counter()
+        problems = []
+        try:
+            action()
+            problems = page_problems(self.at)
+        except Exception as e:
+            problems = [f"{type(e).__name__}: {e}"]
+        self.records.append({'page': page, 'seconds': time.perf_counter() - started, 'problems': problems})
+        return not problems
+
+    def open_page(self, name):
+        self.at.sidebar.selectbox[0].set_value(name).run()
+
+    def login(self):
+        self.at.run()
+        widget(self.at.text_input, "Username").input("admin")
+        widget(self.at.text_input, "Password").input("admin123")
+        return self.step('login', lambda: widget(self.at.button, "Login").click().run())
+
+    def admission(self):
+        self.open_page("Student Admission")
+        n = self.rng.randint(1, 10 ** 6)
+        for label, value in (("First Name", f"Load{n}"), ("Last Name", "Test"), ("Mother's Name", "Mother Devi"),
+                             ("Father's Name", "Father Kumar"), ("Roll Number", str(n % 60))):
+            widget(self.at.text_input, label).input(value)
+        return self.step('admission', lambda: widget(self.at.button, "Submit").click().run())
+
+    def invoice(self):
+        self.open_page("Generate Invoice")
+        widget(self.at.selectbox, "Select Action").set_value("Generate New Invoice").run()
+        widget(self.at.text_input, "Enter Student ID").input(self.rng.choice(self.student_ids))
+        widget(self.at.number_input, "School Fee").set_value(1200.0)
+        widget(self.at.number_input, "Bus Fee").set_value(500.0)
+        return self.step('invoice', lambda: widget(self.at.button, "Generate").click().run())
+
+    def payment(self):
+        self.open_page("Record Payment")
+        widget(self.at.selectbox, "Select Action").set_value("Record New Payment").run()
+        widget(self.at.text_input, "Enter Student ID").input(self.rng.choice(self.student_ids))
+        widget(self.at.number_input, "Payment Amount").set_value(float(self.rng.choice([500, 1000, 1700])))
+        return self.step('payment', lambda: widget(self.at.button, "Record Payment").click().run())
+
+    def reprint(self):
+        self.open_page("Generate Invoice")
+        widget(self.at.selectbox, "Select Action").set_value("Reprint Invoice").run()
+        widget(self.at.text_input, "Enter Student ID to Search").input(self.rng.choice(self.student_ids))
+        return self.step('reprint', lambda: widget(self.at.button, "Search").click().run())
+
+# Run one clerk session for `duration` seconds inside its own process
+def run_session(args):
+    session_no, workdir, student_ids, duration, think_time, timeout = args
+    logging.disable(logging.WARNING)
+    os.chdir(workdir)
+    rng = random.Random(session_no)
+    clerk = ClerkSession(rng, student_ids, timeout)
+    if not clerk.login():
+        return clerk.records
+    flows, weights = list(FLOWS), list(FLOWS.values())
+    deadline = time.time() + duration
+    while time.time() < deadline:
+        flow = rng.choices(flows, weights)[0]
+        try:
+            getattr(clerk, flow)()
+        except Exception as e:
+            # Navigation failed before the measured step (e.g. a page crashed while loading)
+            clerk.records.append({'page': flow, 'seconds': 0.0, 'problems': [f"{type(e).__name__}: {e}"]})
+        time.sleep(rng.expovariate(1 / think_time) if think_time > 0 else 0)
+    return clerk.records
+
+# Per-page latency and error summary across every session
+def aggregate(records, elapsed):
+    pages = {}
+    for record in records:
+        pages.setdefault(record['page'], []).append(record)
+    summary = {}
+    for page, entries in sorted(pages.items()):
+        seconds = [entry['seconds'] for entry in entries]
+        failed = [entry for entry in entries if entry['problems']]
+        locked = [entry for entry in failed if any('database is locked' in p for p in entry['problems'])]
+        summary[page] = {
+            'requests': len(entries),
+            'error_rate': round(len(failed) / len(entries), 4),
+            'locked_errors': len(locked),
+            'p50_ms': round(percentile(seconds, 50) * 1000, 1),
+            'p95_ms': round(percentile(seconds, 95) * 1000, 1),
+            'p99_ms': round(percentile(seconds, 99) * 1000, 1),
+            'max_ms': round(max(seconds) * 1000, 1),
+            'sample_errors': sorted({p[:200] for entry in failed for p in entry['problems']})[:3],
+        }
+    # Average number of reruns in flight: a rough count of CPU cores the server needs at this load
+    busy = sum(record['seconds'] for record in records) / elapsed
+    return {'requests_per_second': round(len(records) / elapsed, 2), 'average_busy_sessions': round(busy, 2),
+            'pages': summary}
+
+def main():
+    parser = argparse.ArgumentParser(description="Drive app.py with many concurrent Streamlit AppTest sessions")
+    parser.add_argument('--sessions', type=int, default=10, help="Concurrent clerks (one process each)")
+    parser.add_argument('--duration', type=float, default=60, help="Seconds each clerk keeps working")
+    parser.add_argument('--think-time', type=float, default=3.0, help="Mean pause between flows (seconds)")
+    parser.add_argument('--students', type=int, default=2000)
+    parser.add_argument('--dataset', help="Copy of a benchmarks.synthetic database to use instead of generating one")
+    parser.add_argument('--timeout', type=float, default=60, help="AppTest per-run timeout (seconds)")
+    parser.add_argument('--output', help="Also write the JSON report here")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as workdir:
+        db_path = os.path.join(workdir, 'school.db')
+        if args.dataset:
+            shutil.copyfile(args.dataset, db_path)
+        else:
+            synthetic.generate(db_path, args.students, 1)
+        conn = sqlite3.connect(db_path)
+        student_ids = [row[0] for row in conn.execute("SELECT student_id FROM students")]
+        conn.close()
+
+        jobs = [(n, workdir, student_ids, args.duration, args.think_time, args.timeout) for n in range(args.sessions)]
+        started = time.perf_counter()
+        with multiprocessing.get_context('spawn').Pool(args.sessions) as pool:
+            records = [record for session in pool.map(run_session, jobs) for record in session]
+        elapsed = time.perf_counter() - started
+
+    report = {
+        'sessions': args.sessions,
+        'duration_seconds': args.duration,
+        'think_time_seconds': args.think_time,
+        'students': len(student_ids),
+        **aggregate(records, elapsed),
+    }
+    output = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(output)
+    print(output)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,68 @@
+import argparse
+import json
+import os
+import sys
+import tempfile
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import db
+import drafts
+import fees
+import service
+from benchmarks import synthetic
+from benchmarks.suite import measure
+
+def main():
+    parser = argparse.ArgumentParser(description="Overnight invoice pre-rendering and counter latency with and without a draft")
+    parser.add_argument('--students', type=int, default=5000)
+    parser.add_argument('--changed', type=int, default=200, help="Students who pay between the night run and the counter")
+    parser.add_argument('--counter', type=int, default=200, help="Invoices issued at the counter per case")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        db_path = os.path.join(tmp, 'school.db')
+        student_ids = synthetic.generate(db_path, args.students, 1, blobs='none')
+        db.DB_PATH = db_path
+        db.disable_replica()
+        db.init_db()
+        for class_name in synthetic.CLASSES:
+            fees.set_fee(class_name, 'tuition', synthetic.school_fee_for(class_name))
+            fees.set_fee(class_name, 'bus', synthetic.BUS_FEE)
+        report = {'students': args.students}
+
+        report['night_run'] = drafts.prerender_invoices()
+        report['repeat_run'] = drafts.prerender_invoices()
+        # Payments after the night run leave those students' drafts out of date
+        changed = student_ids[-args.changed:]
+        for student_id in changed:
+            service.take_payment(student_id, 100.0, 0.0, 150.0)
+        period = fees.post_charges(report['night_run']['period'])['period']
+        report['drafts'] = drafts.draft_status()
+
+        counter = student_ids[:2 * args.counter]
+        with_draft, without_draft = counter[:args.counter], counter[args.counter:]
+        conn = db.get_connection()
+        try:
+            conn.executemany("DELETE FROM invoice_drafts WHERE period = ? AND student_id = ?",
+                             [(period, student_id) for student_id in without_draft])
+            conn.commit()
+        finally:
+            conn.close()
+        served = []
+        # measure() makes one warm-up call and a few memory calls past the timed ones
+        timed = args.counter - 4
+        report['results'] = [
+            measure('counter_invoice_from_draft',
+                    lambda i: served.append(service.issue_posted_invoice(with_draft[i + 1], period)['prerendered']), timed),
+            measure('counter_invoice_rendered', lambda i: service.issue_posted_invoice(without_draft[i + 1], period), timed),
+            measure('counter_invoice_stale_draft',
+                    lambda i: served.append(service.issue_posted_invoice(changed[i + 1], period)['prerendered']),
+                    min(timed, len(changed) - 4)),
+        ]
+        report['served_from_draft'] = sum(served)
+        report['rerendered_stale'] = len(served) - sum(served)
+    print(json.dumps(report, indent=2))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,80 @@
+import argparse
+import io
+import itertools
+import json
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import db
+import documents
+import printing
+from benchmarks import synthetic
+
+# Time one run, then repeat it under tracemalloc for its peak Python memory
+def traced(fn):
+    started = time.perf_counter()
+    result = fn()
+    seconds = round(time.perf_counter() - started, 3)
+    tracemalloc.start()
+    try:
+        fn()
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return result, seconds, round(peak / 1024 / 1024, 1)
+
+# The usual way to merge with pypdf: collect every page in a PdfWriter, then write
+def merge_in_memory(sources, output):
+    from pypdf import PdfReader, PdfWriter
+    writer = PdfWriter()
+    for pdf in sources:
+        for page in PdfReader(io.BytesIO(pdf)).pages:
+            writer.add_page(page)
+    with open(output, 'wb') as f:
+        writer.write(f)
+    return len(writer.pages)
+
+def main():
+    parser = argparse.ArgumentParser(description="Streaming print merge vs. an in-memory pypdf merge")
+    parser.add_argument('--students', type=int, default=5000)
+    parser.add_argument('--sizes', default='500,2000,5000', help="Comma-separated document counts")
+    parser.add_argument('--renders', type=int, default=200, help="Invoices rendered straight into a print file")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        db_path = os.path.join(tmp, 'school.db')
+        student_ids = synthetic.generate(db_path, args.students, 1, blobs='pdf')
+        db.DB_PATH = db_path
+        output = os.path.join(tmp, 'print.pdf')
+        report = {'students': args.students, 'results': []}
+
+        for size in (int(n) for n in args.sizes.split(',')):
+            row = {'documents': size}
+            for label, two_up in (('merged', False), ('two_up', True)):
+                summary, seconds, peak = traced(lambda: printing.print_documents(
+                    itertools.islice(printing.stored_documents('invoice'), size), output, two_up=two_up))
+                row[label] = {'sheets': summary['sheets'], 'seconds': seconds, 'peak_memory_mb': peak,
+                              'file_mb': round(summary['bytes'] / 1024 / 1024, 2)}
+            _, seconds, peak = traced(lambda: merge_in_memory(itertools.islice(printing.stored_documents('invoice'), size), output))
+            row['pypdf_in_memory'] = {'seconds': seconds, 'peak_memory_mb': peak,
+                                      'file_mb': round(os.path.getsize(output) / 1024 / 1024, 2)}
+            report['results'].append(row)
+            print(f"{size} documents: {row['two_up']['seconds']} s two-up, {row['two_up']['peak_memory_mb']} MB peak",
+                  file=sys.stderr)
+
+        # Render and impose in one pass, without storing the invoices
+        def renders():
+            for n, student_id in enumerate(student_ids[:args.renders]):
+                yield documents.generate_invoice(db.get_student(student_id), 1200.0, 500.0, f'INVP{n:05d}')
+        summary, seconds, peak = traced(lambda: printing.print_documents(renders(), output, two_up=True))
+        report['render_and_print'] = {'documents': summary['documents'], 'sheets': summary['sheets'],
+                                      'seconds': seconds, 'peak_memory_mb': peak}
+    print(json.dumps(report, indent=2))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,64 @@
+import argparse
+import json
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import db
+import promotion
+from benchmarks import synthetic
+
+# Promote one student at a time: read each class, sort in Python, UPDATE every row
+def promote_row_by_row():
+    started = time.perf_counter()
+    ladder = dict(promotion.LADDER)
+    conn = db.get_connection()
+    try:
+        c = conn.cursor()
+        students = c.execute("SELECT student_id, class_name, first_name, last_name FROM students WHERE class_name IS NOT ?",
+                             (promotion.GRADUATED,)).fetchall()
+        classes = {}
+        for student_id, class_name, first_name, last_name in students:
+            classes.setdefault(ladder.get(class_name, class_name), []).append((first_name.lower(), last_name.lower(), student_id))
+        for to_class, members in classes.items():
+            members.sort()
+            for roll, (_, _, student_id) in enumerate(members, 1):
+                roll_number = None if to_class == promotion.GRADUATED else str(roll)
+                c.execute("UPDATE students SET class_name = ?, roll_number = ? WHERE student_id = ?",
+                          (to_class, roll_number, student_id))
+        conn.commit()
+    finally:
+        conn.close()
+    return round(time.perf_counter() - started, 3)
+
+def main():
+    parser = argparse.ArgumentParser(description="Set-based year-end promotion vs. per-student updates")
+    parser.add_argument('--students', type=int, default=100000)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        db_path = os.path.join(tmp, 'school.db')
+        started = time.perf_counter()
+        synthetic.generate(db_path, args.students, 1, blobs='none')
+        copy_path = os.path.join(tmp, 'copy.db')
+        shutil.copyfile(db_path, copy_path)
+        report = {'students': args.students, 'setup_seconds': round(time.perf_counter() - started, 1)}
+
+        db.DB_PATH = db_path
+        dry_run = promotion.promote('2030-2031', dry_run=True)
+        report['dry_run_seconds'] = dry_run['seconds']
+        for order in ('name', 'previous_roll'):
+            year = '2030-2031' if order == 'name' else '2031-2032'
+            summary = promotion.promote(year, roll_order=order)
+            report[f'set_based_{order}'] = {key: summary[key] for key in ('promoted', 'graduated', 'seconds')}
+
+        db.DB_PATH = copy_path
+        report['row_by_row_seconds'] = promote_row_by_row()
+    print(json.dumps(report, indent=2))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,87 @@
+import argparse
+import json
+import os
+import random
+import sys
+import tempfile
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import db
+from benchmarks import synthetic
+from benchmarks.suite import measure
+
+# The pre-record lookups: pandas DataFrames walked with iterrows() like the reprint pages did
+def dataframe_get_student(student_id):
+    conn = db.get_connection()
+    try:
+        row = conn.execute("SELECT * FROM students WHERE student_id = ?", (student_id,)).fetchone()
+        return row[15], row[16]
+    finally:
+        conn.close()
+
+def dataframe_search(kind, student_id=None):
+    import pandas as pd
+    table = db.DOCUMENT_TABLES[kind][0]
+    columns = ', '.join(db.DOCUMENT_RECORDS[kind]._fields)
+    query = f"SELECT {columns} FROM {table} WHERE 1=1"
+    params = []
+    if student_id:
+        query += " AND student_id = ?"
+        params.append(student_id)
+    conn = db.get_read_connection()
+    try:
+        df = pd.read_sql_query(query + " ORDER BY generated_date DESC", conn, params=params)
+    finally:
+        conn.close()
+    return sum(len(row['pdf_data'] or b'') for _, row in df.iterrows())
+
+def record_get_student(student_id):
+    student = db.get_student(student_id)
+    return student.outstanding_balance, student.extra_balance
+
+def record_search(kind, student_id=None):
+    if kind == 'invoice':
+        found = db.search_invoices(student_id)
+    elif kind == 'receipt':
+        found = db.search_receipts(student_id)
+    else:
+        found = db.search_report_cards(student_id, None)
+    return sum(len(document.pdf_data or b'') for document in found)
+
+# (name, documents returned per call, function of the iteration number, iterations)
+def lookups(get, search, student_ids, list_size):
+    rng = random.Random(5)
+    pick = lambda i: student_ids[rng.randrange(len(student_ids))]
+    per_student = len(db.search_invoices(student_ids[0]))
+    return [
+        ('get_student', 1, lambda i: get(pick(i)), 500),
+        ('search_invoices_one_student', per_student, lambda i: search('invoice', pick(i)), 200),
+        ('search_report_cards_all', list_size, lambda i: search('report_card'), 20),
+        ('search_invoices_all', list_size * per_student, lambda i: search('invoice'), 5),
+    ]
+
+def main():
+    parser = argparse.ArgumentParser(description="Typed record lookups vs. pandas DataFrames for reprint searches")
+    parser.add_argument('--students', type=int, default=300, help="Students (= report cards in the full list)")
+    parser.add_argument('--blobs', choices=['pdf', 'stub', 'none'], default='pdf')
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        db_path = os.path.join(tmp, 'school.db')
+        student_ids = synthetic.generate(db_path, args.students, 1, args.blobs)
+        db.DB_PATH = db_path
+        db.ARCHIVE_DIR = os.path.join(tmp, 'archive')
+        db.disable_replica()
+        report = {'students': args.students, 'blobs': args.blobs, 'results': []}
+        modes = (('dataframe', dataframe_get_student, dataframe_search), ('records', record_get_student, record_search))
+        for mode, get, search in modes:
+            for name, documents, fn, iterations in lookups(get, search, student_ids, args.students):
+                entry = measure(name, fn, iterations)
+                entry.update({'mode': mode, 'documents_per_call': documents})
+                report['results'].append(entry)
+                print(f"{mode} {name}: {entry['p50_ms']} ms p50, {entry['peak_memory_kb']} KB peak", file=sys.stderr)
+    print(json.dumps(report, indent=2))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,68 @@
+import argparse
+import json
+import os
+import sys
+import tempfile
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import db
+import replica
+from benchmarks import synthetic
+from benchmarks.backup_impact import measure, percentile
+
+# Run heavy report queries back to back until `stop` is set
+def report_load(stop, timings):
+    while not stop.is_set():
+        started = time.perf_counter()
+        db.get_all_students()
+        db.search_receipts(None)
+        db.search_invoices(None)
+        timings.append(time.perf_counter() - started)
+
+# Payment latency while `readers` threads hammer the reporting queries
+def run_mode(student_ids, readers, think_time, seconds):
+    stop, timings = threading.Event(), []
+    threads = [threading.Thread(target=report_load, args=(stop, timings)) for _ in range(readers)]
+    for thread in threads:
+        thread.start()
+    try:
+        latency, _ = measure(student_ids, think_time, idle_seconds=seconds)
+    finally:
+        stop.set()
+        for thread in threads:
+            thread.join()
+    return {
+        'payment_latency': latency,
+        'reports_run': len(timings),
+        'report_p50_ms': round(percentile(timings, 50) * 1000, 1),
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description="record_payment latency with heavy reports on the primary vs. the replica")
+    parser.add_argument('--students', type=int, default=1000)
+    parser.add_argument('--years', type=int, default=2)
+    parser.add_argument('--readers', type=int, default=2)
+    parser.add_argument('--think-time', type=float, default=0.05)
+    parser.add_argument('--seconds', type=float, default=8.0)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        db_path = os.path.join(tmp, 'school.db')
+        student_ids = synthetic.generate(db_path, args.students, args.years)
+        db.DB_PATH = db_path
+        report = {'db_bytes': os.path.getsize(db_path), 'readers': args.readers}
+
+        db.disable_replica()
+        report['reports_on_primary'] = run_mode(student_ids, args.readers, args.think_time, args.seconds)
+
+        replica_path = os.path.join(tmp, 'replica.db')
+        db.enable_replica(replica_path, max_staleness=300)
+        report['replica_refresh'] = replica.refresh_replica()
+        report['reports_on_replica'] = run_mode(student_ids, args.readers, args.think_time, args.seconds)
+    print(json.dumps(report, indent=2))
+
+if __name__ == "__main__":
+    main()
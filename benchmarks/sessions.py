@@ -0,0 +1,100 @@
+import argparse
+import hashlib
+import json
+import os
+import sys
+import tempfile
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import auth
+import db
+from benchmarks.suite import measure
+
+statements = []
+
+# Connections that record every statement they run, to count database work per page load
+def traced_connection(connect):
+    def get_connection():
+        conn = connect()
+        conn.set_trace_callback(statements.append)
+        return conn
+    return get_connection
+
+# The old check every login form submit ran: unsalted sha256 against the users table
+def sha256_login(username, password):
+    conn = db.get_connection()
+    try:
+        return conn.execute("SELECT * FROM users WHERE username = ? AND password = ?",
+                            (username, hashlib.sha256(password.encode()).hexdigest())).fetchone() is not None
+    finally:
+        conn.close()
+
+# Run fn per page load and count the statements it sent, and those that read users
+def queries_per_load(fn, loads=100):
+    del statements[:]
+    for i in range(loads):
+        fn(i)
+    return {'loads': loads, 'statements': len(statements),
+            'users_queries': sum('users' in statement for statement in statements)}
+
+def main():
+    parser = argparse.ArgumentParser(description="Login cost, session checks per page load and throttled attempts")
+    parser.add_argument('--page-loads', type=int, default=5000)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        db.DB_PATH = os.path.join(tmp, 'school.db')
+        db.disable_replica()
+        db.init_db()
+        conn = db.get_connection()
+        try:
+            conn.execute("INSERT INTO users (username, password) VALUES ('legacy', ?)",
+                         (hashlib.sha256(b'legacy123').hexdigest(),))
+            conn.commit()
+        finally:
+            conn.close()
+        db.get_connection = traced_connection(db.get_connection)
+        report = {}
+
+        token = auth.login('admin', 'admin123')
+        report['results'] = [
+            measure('sha256_login_previous', lambda i: sha256_login('admin', 'admin123'), 200),
+            measure('login_with_session', lambda i: auth.login('admin', 'admin123'), 20),
+            measure('page_load_cached_session', lambda i: auth.session_user(token), args.page_loads),
+            measure('page_load_session_lookup', lambda i: (auth._sessions.clear(), auth.session_user(token)), 1000),
+            measure('page_load_forged_token', lambda i: auth.session_user(token[:-4] + 'beef'), args.page_loads),
+        ]
+        # Failed logins until the username is locked, then attempts while locked
+        auth.login('admin', 'admin123')
+        for _ in range(auth.MAX_USER_FAILURES):
+            auth.login('clerk', 'guess', '10.0.0.9')
+
+        def locked_attempt(i):
+            try:
+                auth.login('clerk', 'guess', '10.0.0.9')
+            except ValueError:
+                pass
+        report['results'].append(measure('login_while_locked', locked_attempt, 1000))
+
+        auth._sessions.clear()
+        report['queries'] = {
+            'previous_login_per_page_load': queries_per_load(lambda i: sha256_login('admin', 'admin123')),
+            'session_first_load': queries_per_load(lambda i: auth.session_user(token), 1),
+            'session_later_loads': queries_per_load(lambda i: auth.session_user(token)),
+        }
+
+        def stored():
+            conn = db.get_connection()
+            try:
+                return conn.execute("SELECT password FROM users WHERE username = 'legacy'").fetchone()[0]
+            finally:
+                conn.close()
+        before = stored()
+        auth.login('legacy', 'legacy123')
+        report['legacy_hash_upgraded'] = {'before': before.split('$')[0] if '$' in before else 'sha256',
+                                          'after': stored().split('$')[0]}
+    print(json.dumps(report, indent=2))
+
+if __name__ == "__main__":
+    main()
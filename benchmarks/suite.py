@@ -0,0 +1,160 @@
+import argparse
+import json
+import os
+import platform
+import random
+import shutil
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import db
+import documents
+from benchmarks import synthetic
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+def percentile(values, pct):
+    values = sorted(values)
+    if not values:
+        return 0.0
+    return values[min(len(values) - 1, int(round(pct / 100 * (len(values) - 1))))]
+
+# Time `fn(i)` for `iterations` calls, then measure peak Python memory over a few more
+def measure(name, fn, iterations, memory_iterations=3):
+    fn(-1)
+    latencies = []
+    started = time.perf_counter()
+    for i in range(iterations):
+        call_started = time.perf_counter()
+        fn(i)
+        latencies.append(time.perf_counter() - call_started)
+    elapsed = time.perf_counter() - started
+
+    tracemalloc.start()
+    try:
+        for i in range(min(memory_iterations, iterations)):
+            fn(iterations + i)
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return {
+        'operation': name,
+        'iterations': iterations,
+        'throughput_ops': round(iterations / elapsed, 2) if elapsed else None,
+        'p50_ms': round(percentile(latencies, 50) * 1000, 3),
+        'p99_ms': round(percentile(latencies, 99) * 1000, 3),
+        'peak_memory_kb': round(peak / 1024, 1),
+    }
+
+def git_revision():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=ROOT, capture_output=True,
+                              text=True, timeout=10).stdout.strip() or None
+    except (OSError, subprocess.SubprocessError):
+        return None
+
+# Every hot path in db.py and documents.py with its iteration count
+def operations(student_ids, scale):
+    rng = random.Random(99)
+    pick = lambda i: student_ids[rng.randrange(len(student_ids))]
+    student = db.get_student(student_ids[0])
+    admission = ('Bench', '', 'Student', 'Mother Devi', 'Father Kumar', 'Gopalganj', 'bench@example.com',
+                 '9000000000', '2015-01-01', '5', '9000000000', 'Male', '2024-04-01', '99')
+    results = [(student_ids[0], subject, 70.0 + n) for n, subject in enumerate(synthetic.SUBJECTS)]
+    return [
+        ('get_next_student_id', lambda i: db.get_next_student_id(), 200 * scale),
+        ('add_student', lambda i: db.add_student(admission), 100 * scale),
+        ('get_student', lambda i: db.get_student(pick(i)), 500 * scale),
+        ('record_payment', lambda i: db.record_payment(pick(i), 1200.0, 500.0, 1700.0), 100 * scale),
+        ('search_invoices', lambda i: db.search_invoices(pick(i)), 50 * scale),
+        ('search_receipts', lambda i: db.search_receipts(pick(i)), 50 * scale),
+        ('search_report_cards', lambda i: db.search_report_cards(pick(i), None), 50 * scale),
+        ('get_all_students', lambda i: db.get_all_students(), 3 * scale),
+        ('generate_invoice', lambda i: documents.generate_invoice(student, 1200.0, 500.0, 'INVBENCH'), 30 * scale),
+        ('generate_receipt', lambda i: documents.generate_receipt(student, 1200.0, 500.0, 1700.0, 'PAYBENCH', '2024-05-05',
+                                                            0.0, 0.0, 0.0, 0.0), 30 * scale),
+        ('generate_result_card', lambda i: documents.generate_result_card(student, results), 30 * scale),
+    ]
+
+# Compare against an earlier run; returns the operations that got slower than the threshold allows
+def find_regressions(current, baseline, threshold):
+    previous = {entry['operation']: entry for entry in baseline['results']}
+    regressions = []
+    for entry in current['results']:
+        before = previous.get(entry['operation'])
+        if not before:
+            continue
+        for metric in ('p50_ms', 'p99_ms'):
+            if before[metric] and entry[metric] > before[metric] * (1 + threshold):
+                regressions.append({'operation': entry['operation'], 'metric': metric,
+                                    'before': before[metric], 'after': entry[metric]})
+    return regressions
+
+def main():
+    parser = argparse.ArgumentParser(description="End-to-end benchmark of the school app's hot paths")
+    parser.add_argument('--students', type=int, default=10000)
+    parser.add_argument('--years', type=int, default=1)
+    parser.add_argument('--blobs', choices=['pdf', 'stub', 'none'], default='pdf')
+    parser.add_argument('--dataset', help="Reuse a database made by benchmarks.synthetic (copied, never modified)")
+    parser.add_argument('--scale', type=int, default=1, help="Multiply iteration counts")
+    parser.add_argument('--only', action='append', help="Run only these operations")
+    parser.add_argument('--output', help="Write the JSON report to this file")
+    parser.add_argument('--compare', help="Earlier JSON report to check for regressions")
+    parser.add_argument('--threshold', type=float, default=0.25, help="Allowed slowdown before failing (0.25 = 25%%)")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        db_path = os.path.join(tmp, 'school.db')
+        started = time.perf_counter()
+        if args.dataset:
+            shutil.copyfile(args.dataset, db_path)
+            conn = sqlite3.connect(db_path)
+            student_ids = [row[0] for row in conn.execute("SELECT student_id FROM students")]
+            conn.close()
+        else:
+            student_ids = synthetic.generate(db_path, args.students, args.years, args.blobs)
+        dataset = synthetic.describe(db_path)
+        dataset['setup_seconds'] = round(time.perf_counter() - started, 1)
+
+        db.DB_PATH = db_path
+        db.ARCHIVE_DIR = os.path.join(tmp, 'archive')
+        db.disable_replica()
+        db.init_db()
+        report = {
+            'meta': {
+                'revision': git_revision(),
+                'timestamp': datetime.now().isoformat(timespec='seconds'),
+                'python': platform.python_version(),
+                'sqlite': sqlite3.sqlite_version,
+                'platform': platform.platform(),
+            },
+            'dataset': dataset,
+            'results': [],
+        }
+        for name, fn, iterations in operations(student_ids, args.scale):
+            if args.only and name not in args.only:
+                continue
+            report['results'].append(measure(name, fn, iterations))
+            print(f"{name}: {report['results'][-1]['p50_ms']} ms p50", file=sys.stderr)
+
+    output = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(output)
+    print(output)
+    if args.compare:
+        with open(args.compare) as f:
+            regressions = find_regressions(report, json.load(f), args.threshold)
+        if regressions:
+            print(json.dumps({'regressions': regressions}, indent=2), file=sys.stderr)
+            sys.exit(1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,192 @@
+import argparse
+import os
+import random
+import sqlite3
+import sys
+import time
+from datetime import date, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import db
+import documents
+
+FIRST_NAMES = ['Aarav', 'Vivaan', 'Aditya', 'Arjun', 'Sai', 'Reyansh', 'Ayaan', 'Krishna', 'Ishaan', 'Shaurya',
+               'Ananya', 'Diya', 'Saanvi', 'Aadhya', 'Pari', 'Anika', 'Navya', 'Myra', 'Sara', 'Ira',
+               'Mohammad', 'Faizan', 'Ayesha', 'Zoya', 'Rahul', 'Priya', 'Neha', 'Amit', 'Pooja', 'Ravi']
+LAST_NAMES = ['Kumar', 'Singh', 'Sharma', 'Yadav', 'Prasad', 'Ansari', 'Khan', 'Gupta', 'Mishra', 'Pandey',
+              'Tiwari', 'Jha', 'Sinha', 'Ali', 'Choudhary', 'Verma', 'Thakur', 'Rai', 'Paswan', 'Mahto']
+VILLAGES = ['Tirmohani', 'Nawada Persauni', 'Gopalganj', 'Thawe', 'Barauli', 'Kuchaikote', 'Manjha', 'Sidhwalia']
+CLASSES = ["Nursery", "LKG", "UKG", "1", "2", "3", "4", "5", "6", "7", "8", "9", "10"]
+SUBJECTS = ['Math', 'Science', 'English', 'Hindi', 'Social Studies']
+SCHOOL_FEE = {'Nursery': 800.0, 'LKG': 900.0, 'UKG': 900.0}
+BUS_FEE = 500.0
+BATCH = 20000
+LEDGER_INSERT = "INSERT INTO balance_ledger (student_id, source, reference, delta, balance_after, recorded_at) VALUES (?, ?, ?, ?, ?, ?)"
+
+def school_fee_for(class_name):
+    if class_name in SCHOOL_FEE:
+        return SCHOOL_FEE[class_name]
+    return 1000.0 + 50.0 * int(class_name)
+
+# Render one real invoice, receipt and result card so stored BLOBs have realistic size
+def template_pdfs():
+    student = db.Student('EPS1001', 'Aarav', '', 'Kumar', 'Sunita Devi', 'Ramesh Kumar', 'Tirmohani', '', '9000000000',
+                         '2015-05-01', '5', '9000000000', 'Male', '2020-04-01', '12', 0.0, 0.0)
+    return {
+        'invoice': documents.generate_invoice(student, 1250.0, 500.0, 'INV00000000').getvalue(),
+        'receipt': documents.generate_receipt(student, 1250.0, 500.0, 1750.0, 'PAY00000000', '2024-05-05', 0.0, 0.0, 0.0, 0.0).getvalue(),
+        'report_card': documents.generate_result_card(student, [('EPS1001', s, 75.0) for s in SUBJECTS]).getvalue(),
+    }
+
+def flush(conn, sql, rows):
+    if rows:
+        conn.executemany(sql, rows)
+        rows.clear()
+
+# Generate a school into a scratch database.
+# students: number of students; years: academic years of history ending with the current one;
+# blobs: 'pdf' stores real rendered PDFs, 'stub' a few bytes, 'none' NULL;
+# pay_rate: share of months each student pays; sibling_rate: share of students who
+# are a younger sibling of an earlier one (parents' details written slightly
+# differently, as at a real admission desk); returns the list of student IDs.
+def generate(db_path, students=10000, years=2, blobs='pdf', pay_rate=0.85, seed=42, progress=None, sibling_rate=0.0):
+    if os.path.exists(db_path):
+        raise FileExistsError(f"Refusing to overwrite existing database: {db_path}")
+    previous_path = db.DB_PATH
+    db.DB_PATH = db_path
+    try:
+        db.init_db()
+    finally:
+        db.DB_PATH = previous_path
+    rng = random.Random(seed)
+    if blobs == 'pdf':
+        pdfs = template_pdfs()
+    elif blobs == 'stub':
+        pdfs = {kind: b'%PDF-1.4 stub' for kind in ('invoice', 'receipt', 'report_card')}
+    else:
+        pdfs = {kind: None for kind in ('invoice', 'receipt', 'report_card')}
+
+    conn = sqlite3.connect(db_path)
+    # The generated history is not a stream of changes, so it bypasses the change log
+    db.drop_change_triggers(conn)
+    conn.execute("PRAGMA synchronous = OFF")
+    conn.execute("PRAGMA journal_mode = MEMORY")
+    today = date.today()
+    current_start = today.year if today.month >= 4 else today.year - 1
+    first_start = current_start - years + 1
+
+    student_rows, roll_counters, student_ids, parents = [], {}, [], []
+    for i in range(students):
+        student_id = f'EPS{1001 + i:04d}'
+        class_name = rng.choice(CLASSES)
+        roll_counters[class_name] = roll_counters.get(class_name, 0) + 1
+        if sibling_rate and parents and rng.random() < sibling_rate:
+            last, father, mother, mobile = rng.choice(parents)
+            first = rng.choice(FIRST_NAMES)
+            father = rng.choice([father, father.upper(), f"Shri {father}", f" {father}."])
+            mobile = rng.choice([mobile, f"+91 {mobile}", f"{mobile[:5]} {mobile[5:]}"])
+        else:
+            first, last = rng.choice(FIRST_NAMES), rng.choice(LAST_NAMES)
+            father = f"{rng.choice(FIRST_NAMES)} {last}"
+            mother = f"{rng.choice(FIRST_NAMES)} Devi"
+            mobile = f"9{rng.randint(100000000, 999999999)}"
+            if sibling_rate:
+                parents.append((last, father, mother, mobile))
+        dob = date(2008, 1, 1) + timedelta(days=rng.randint(0, 365 * 14))
+        doa = date(first_start, 4, 1) + timedelta(days=rng.randint(0, 60))
+        student_rows.append((student_id, first, '', last, mother, father, f"{rng.choice(VILLAGES)}, Gopalganj, Bihar",
+                             f"{first.lower()}.{last.lower()}{i}@example.com", mobile, str(dob), class_name, mobile,
+                             rng.choice(['Male', 'Female']), str(doa), str(roll_counters[class_name]), 0.0, 0.0))
+        student_ids.append(student_id)
+        if len(student_rows) >= BATCH:
+            flush(conn, "INSERT INTO students VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)", student_rows)
+    flush(conn, "INSERT INTO students VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)", student_rows)
+    conn.commit()
+    classes = dict(conn.execute("SELECT student_id, class_name FROM students"))
+
+    payments, invoices, receipts, ledger, balances = [], [], [], [], {}
+    months = [(start + (m + 3) // 12, (m + 3) % 12 + 1) for start in range(first_start, current_start + 1) for m in range(12)]
+    months = [(y, m) for y, m in months if (y, m) <= (today.year, today.month)]
+    serial = 0
+    for month_no, (year, month) in enumerate(months, 1):
+        invoice_day = f"{year}-{month:02d}-0{rng.randint(1, 5)} 09:{rng.randint(10, 59)}:00"
+        for student_id in student_ids:
+            serial += 1
+            fee = school_fee_for(classes[student_id]) + BUS_FEE
+            invoices.append((f'INV{serial:08x}', student_id, fee - BUS_FEE, BUS_FEE, pdfs['invoice'], invoice_day))
+            outstanding = balances.get(student_id, 0.0) + fee
+            ledger.append((student_id, 'charges', f"{year}-{month:02d}", fee, outstanding, invoice_day))
+            if rng.random() < pay_rate:
+                amount = outstanding if rng.random() < 0.8 else round(outstanding * rng.uniform(0.3, 0.9), -1)
+                payment_id = f'PAY{serial:08x}'
+                pay_day = f"{year}-{month:02d}-{rng.randint(5, 28):02d}"
+                payments.append((payment_id, student_id, amount, pay_day))
+                receipts.append((f'REC{serial:08x}', student_id, payment_id, pdfs['receipt'], f"{pay_day} 11:00:00"))
+                outstanding -= amount
+                ledger.append((student_id, 'payment', payment_id, -amount, outstanding, f"{pay_day} 11:00:00"))
+            balances[student_id] = outstanding
+            if len(invoices) >= BATCH:
+                flush(conn, "INSERT INTO invoices VALUES (?, ?, ?, ?, ?, ?)", invoices)
+                flush(conn, "INSERT INTO payments (payment_id, student_id, amount, payment_date) VALUES (?, ?, ?, ?)", payments)
+                flush(conn, "INSERT INTO receipts VALUES (?, ?, ?, ?, ?)", receipts)
+                flush(conn, LEDGER_INSERT, ledger)
+        if progress:
+            progress(month_no / len(months), f"{year}-{month:02d}")
+    flush(conn, "INSERT INTO invoices VALUES (?, ?, ?, ?, ?, ?)", invoices)
+    flush(conn, "INSERT INTO payments (payment_id, student_id, amount, payment_date) VALUES (?, ?, ?, ?)", payments)
+    flush(conn, "INSERT INTO receipts VALUES (?, ?, ?, ?, ?)", receipts)
+    flush(conn, LEDGER_INSERT, ledger)
+    conn.executemany("UPDATE students SET outstanding_balance = ? WHERE student_id = ?",
+                     [(max(0.0, value), student_id) for student_id, value in balances.items()])
+    db.rebuild_daily_collections(conn)
+    db.rebuild_households(conn)
+
+    results, cards = [], []
+    for start in range(first_start, current_start + 1):
+        for student_id in student_ids:
+            cards.append((f'REP{start}{student_id}', student_id, f"{start}-{start + 1}", pdfs['report_card'], f"{start + 1}-03-25 10:00:00"))
+            if len(cards) >= BATCH:
+                flush(conn, "INSERT INTO report_cards VALUES (?, ?, ?, ?, ?)", cards)
+    flush(conn, "INSERT INTO report_cards VALUES (?, ?, ?, ?, ?)", cards)
+    for student_id in student_ids:
+        results.extend((student_id, subject, float(rng.randint(25, 100))) for subject in SUBJECTS)
+        if len(results) >= BATCH:
+            flush(conn, "INSERT INTO results VALUES (?, ?, ?)", results)
+    flush(conn, "INSERT INTO results VALUES (?, ?, ?)", results)
+    db.create_change_triggers(conn)
+    conn.commit()
+    conn.execute("PRAGMA journal_mode = DELETE")
+    conn.execute("ANALYZE")
+    conn.close()
+    return student_ids
+
+# Row counts and file size of a generated database
+def describe(db_path):
+    conn = sqlite3.connect(db_path)
+    try:
+        counts = {table: conn.execute(f"SELECT COUNT(*) FROM {table}").fetchone()[0]
+                  for table in ('students', 'payments', 'invoices', 'receipts', 'report_cards', 'results')}
+    finally:
+        conn.close()
+    counts['db_bytes'] = os.path.getsize(db_path)
+    return counts
+
+def main():
+    parser = argparse.ArgumentParser(description="Generate a synthetic school database for benchmarks")
+    parser.add_argument('db_path')
+    parser.add_argument('--students', type=int, default=10000)
+    parser.add_argument('--years', type=int, default=2)
+    parser.add_argument('--blobs', choices=['pdf', 'stub', 'none'], default='pdf')
+    parser.add_argument('--seed', type=int, default=42)
+    args = parser.parse_args()
+    started = time.perf_counter()
+    generate(args.db_path, args.students, args.years, args.blobs, seed=args.seed,
+             progress=lambda fraction, label: print(f"\r{label} {fraction:.0%}", end='', file=sys.stderr))
+    print(file=sys.stderr)
+    info = describe(args.db_path)
+    info['seconds'] = round(time.perf_counter() - started, 1)
+    print(info)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,176 @@
+import json
+import time
+from datetime import datetime, timedelta
+from typing import NamedTuple
+
+import db
+
+# Consumers (caches, rollups, replicas, exports) follow change_events by
+# sequence number instead of rescanning tables: read the events after the last
+# seq they handled, then save their new position. Events are pruned only once
+# every registered consumer has read them.
+READ_LIMIT = 1000
+PRUNE_CHUNK = 10000
+KEEP_DAYS = 30
+
+class ChangeEvent(NamedTuple):
+    seq: int
+    table_name: str
+    op: str
+    row_key: str
+    student_id: str
+    data: dict
+    recorded_at: str
+
+class Consumer(NamedTuple):
+    name: str
+    position: int
+    behind: int
+    updated_at: str
+
+def check_tables(tables):
+    unknown = [table for table in tables or () if table not in db.CHANGE_TABLES]
+    if unknown:
+        raise ValueError(f"Unknown table: {', '.join(unknown)}. Use one of: {', '.join(db.CHANGE_TABLES)}")
+
+def event_factory(cursor, row):
+    return ChangeEvent(*row[:5], json.loads(row[5]) if row[5] is not None else None, row[6])
+
+# Highest sequence number handed out so far (still known after the events are pruned)
+def latest_seq(conn):
+    row = conn.execute("SELECT seq FROM sqlite_sequence WHERE name = 'change_events'").fetchone()
+    return row[0] if row else 0
+
+# Whether a table has changed since an event sequence number
+def changed_since(conn, table, seq):
+    return conn.execute("SELECT EXISTS (SELECT 1 FROM change_events WHERE seq > ? AND table_name = ?)",
+                        (seq, table)).fetchone()[0] == 1
+
+# Events after `after_seq` in order, optionally for some tables only
+def read_changes(after_seq=0, tables=None, limit=READ_LIMIT):
+    check_tables(tables)
+    query = "SELECT seq, table_name, op, row_key, student_id, data, recorded_at FROM change_events WHERE seq > ?"
+    params = [after_seq]
+    if tables:
+        query += f" AND table_name IN ({', '.join('?' for _ in tables)})"
+        params += list(tables)
+    conn = None
+    try:
+        conn = db.get_connection()
+        c = conn.cursor()
+        c.row_factory = event_factory
+        c.execute(query + " ORDER BY seq LIMIT ?", params + [limit])
+        return c.fetchall()
+    finally:
+        if conn:
+            conn.close()
+
+# Yield events as they are written, polling every `interval` seconds when caught up
+def follow(after_seq=0, tables=None, interval=1.0):
+    while True:
+        events = read_changes(after_seq, tables)
+        for event in events:
+            yield event
+        if events:
+            after_seq = events[-1].seq
+        if len(events) < READ_LIMIT:
+            time.sleep(interval)
+
+def get_position(conn, name):
+    row = conn.execute("SELECT position FROM change_consumers WHERE name = ?", (name,)).fetchone()
+    return row[0] if row else None
+
+def set_position(conn, name, position):
+    conn.execute('''INSERT INTO change_consumers (name, position, updated_at) VALUES (?, ?, ?)
+                    ON CONFLICT (name) DO UPDATE SET position = excluded.position, updated_at = excluded.updated_at''',
+                 (name, position, datetime.now().strftime("%Y-%m-%d %H:%M:%S")))
+
+# Hand a named consumer every event it has not seen yet, a batch at a time.
+# The position is saved after each batch handle(events) returns, so a consumer
+# that fails part-way sees that batch again next time. A new consumer starts
+# from the oldest event still kept.
+def consume(name, handle, tables=None, batch=READ_LIMIT):
+    handled = 0
+    while True:
+        conn = None
+        try:
+            conn = db.get_connection()
+            position = get_position(conn, name) or 0
+            # Everything up to here is committed, so with a table filter a short
+            # read means the consumer is caught up to at least this point
+            ceiling = latest_seq(conn)
+        finally:
+            if conn:
+                conn.close()
+        events = read_changes(position, tables, batch)
+        if events:
+            handle(events)
+            handled += len(events)
+        if len(events) < batch:
+            position = max([position, ceiling] + [event.seq for event in events[-1:]])
+        else:
+            position = events[-1].seq
+        conn = None
+        try:
+            conn = db.get_connection()
+            set_position(conn, name, position)
+            conn.commit()
+        finally:
+            if conn:
+                conn.close()
+        if len(events) < batch:
+            return {'consumer': name, 'events': handled, 'position': position}
+
+def list_consumers():
+    conn = None
+    try:
+        conn = db.get_connection()
+        latest = latest_seq(conn)
+        return [Consumer(name, position, latest - position, updated_at) for name, position, updated_at in
+                conn.execute("SELECT name, position, updated_at FROM change_consumers ORDER BY name")]
+    finally:
+        if conn:
+            conn.close()
+
+# Stop holding events back for a consumer that is gone
+def remove_consumer(name):
+    conn = None
+    try:
+        conn = db.get_connection()
+        c = conn.cursor()
+        c.execute("DELETE FROM change_consumers WHERE name = ?", (name,))
+        conn.commit()
+        return c.rowcount > 0
+    finally:
+        if conn:
+            conn.close()
+
+# Delete events older than keep_days that every consumer has read, a chunk per
+# transaction so writers are never held up for long
+def prune_changes(keep_days=KEEP_DAYS):
+    started = time.perf_counter()
+    cutoff = (datetime.now() - timedelta(days=keep_days)).strftime("%Y-%m-%d %H:%M:%S")
+    conn = None
+    try:
+        conn = db.get_connection()
+        c = conn.cursor()
+        c.execute("SELECT MIN(position) FROM change_consumers")
+        upto = c.fetchone()[0]
+        if upto is None:
+            upto = latest_seq(conn)
+        deleted = 0
+        while True:
+            c.execute('''DELETE FROM change_events WHERE seq IN (
+                             SELECT seq FROM change_events WHERE seq <= ? AND recorded_at < ? ORDER BY seq LIMIT ?)''',
+                      (upto, cutoff, PRUNE_CHUNK))
+            conn.commit()
+            deleted += c.rowcount
+            if c.rowcount < PRUNE_CHUNK:
+                break
+        c.execute("SELECT COUNT(*), MIN(seq) FROM change_events")
+        kept, oldest = c.fetchone()
+    finally:
+        if conn:
+            conn.close()
+    return {'deleted': deleted, 'kept': kept, 'oldest_seq': oldest, 'read_by_all_upto': upto,
+            'seconds': round(time.perf_counter() - started, 3)}
@@ -0,0 +1,582 @@
+import argparse
+import csv
+import json
+import os
+import sys
+
+import db
+import service
+
+# Print a result as JSON for scripts and cron jobs
+def emit(data):
+    print(json.dumps(data, indent=2, default=str))
+
+def cmd_init_db(args):
+    db.init_db()
+    emit({'db': db.DB_PATH, 'status': 'ok'})
+
+def cmd_add_students(args):
+    added, failed = [], []
+    with open(args.csv_file, newline='', encoding='utf-8') as f:
+        for line_no, row in enumerate(csv.DictReader(f), 2):
+            try:
+                added.append(service.admit_student(row))
+            except ValueError as e:
+                failed.append({'line': line_no, 'error': str(e)})
+    emit({'added': added, 'failed': failed})
+    return 1 if failed else 0
+
+def cmd_students(args):
+    if args.output:
+        df = db.get_all_students()
+        df.to_csv(args.output, index=False)
+        emit({'exported': len(df), 'file': args.output})
+    else:
+        emit(service.list_students())
+
+def cmd_invoice(args):
+    if args.all or args.class_name:
+        emit(service.issue_invoices_for_all(args.school_fee, args.bus_fee, args.class_name))
+    else:
+        emit(service.issue_invoice(args.student_id, args.school_fee, args.bus_fee))
+
+def cmd_payment(args):
+    if args.family:
+        import families
+        emit(families.take_family_payment(args.student_id, args.amount))
+    else:
+        emit(service.take_payment(args.student_id, args.school_fee, args.bus_fee, args.amount))
+
+def cmd_family(args):
+    import families
+    if args.rebuild:
+        emit(families.rebuild_index())
+    elif not args.student_id:
+        emit([family._asdict() for family in families.list_families(args.class_name)])
+    elif args.link:
+        emit(families.link_students(args.student_id, args.link))
+    elif args.separate:
+        emit(families.separate_student(args.student_id))
+    elif args.clear_override:
+        emit(families.clear_override(args.student_id))
+    else:
+        emit([{name: getattr(student, name) for name in ('student_id', 'first_name', 'last_name', 'class_name', 'roll_number',
+                                                         'father_name', 'mother_name', 'mobile_number',
+                                                         'outstanding_balance', 'extra_balance')}
+              for student in families.siblings(args.student_id)])
+
+def cmd_result_card(args):
+    results = service.parse_results(args.student_id, args.subject)
+    emit(service.issue_result_card(args.student_id, results, args.academic_year, args.attendance))
+
+def cmd_search(args):
+    emit(service.find_documents(args.kind, args.student_id, args.academic_year))
+
+def cmd_export_pdfs(args):
+    os.makedirs(args.directory, exist_ok=True)
+    written, missing = [], []
+    for doc in service.find_documents(args.kind, args.student_id, args.academic_year):
+        document_id = doc[db.DOCUMENT_TABLES[args.kind][1]]
+        pdf_data = db.get_document_pdf(args.kind, document_id)
+        if pdf_data is None:
+            missing.append(document_id)
+            continue
+        path = os.path.join(args.directory, f"{args.kind}_{doc['student_id']}_{document_id}.pdf")
+        with open(path, 'wb') as f:
+            f.write(pdf_data)
+        written.append(path)
+    emit({'written': len(written), 'missing': missing, 'directory': args.directory})
+
+def cmd_print(args):
+    import printing
+    sources = printing.stored_documents(args.kind, args.class_name, args.student_id, args.start, args.end,
+                                        args.period, args.academic_year)
+    emit(printing.print_documents(sources, args.output, args.two_up, not args.no_cut_marks))
+
+def cmd_dispatch(args):
+    import dispatch
+    if args.status:
+        emit(dispatch.delivery_status())
+        return
+    if args.failed:
+        emit(dispatch.list_dispatches('failed', limit=args.limit or 50))
+        return
+    channels = args.channel or list(dispatch.CHANNELS)
+    result = {}
+    if args.kind:
+        result['queued'] = dispatch.queue_documents(args.kind, channels, args.class_name, args.student_id, args.start,
+                                                    args.end, args.period, args.academic_year, args.resend)
+    if not args.queue_only:
+        rates = {'email': args.email_rate, 'whatsapp': args.whatsapp_rate}
+        result.update(dispatch.send_dispatches(channels, concurrency=args.concurrency, rates=rates, limit=args.limit))
+    emit(result)
+
+def cmd_mark_attendance(args):
+    import attendance
+    if args.student_id:
+        attendance.set_attendance(args.student_id, args.day, not args.absent_student)
+        emit({'student_id': args.student_id, 'day': args.day, 'present': not args.absent_student})
+    elif args.class_name:
+        emit(attendance.mark_class(args.class_name, args.day, args.absent))
+    else:
+        raise ValueError("Give a class to mark or --student-id to correct one student")
+
+def cmd_attendance(args):
+    import attendance
+    import promotion
+    import reports
+    academic_year = args.academic_year or promotion.current_academic_year()
+    if args.student_id:
+        record = attendance.student_attendance(args.student_id, academic_year)
+        emit({'attendance': record._asdict() if record else None,
+              'absent_days': attendance.absent_days(args.student_id, academic_year)})
+        return
+    records = attendance.summarise(academic_year, args.class_name)
+    if args.output:
+        with open(args.output, 'w', newline='', encoding='utf-8') as f:
+            f.write(reports.to_csv(records))
+        emit({'exported': len(records), 'file': args.output})
+    else:
+        emit([record._asdict() for record in records])
+
+def cmd_collections(args):
+    import reports
+    if args.day or not (args.start or args.end):
+        records = reports.day_book(args.day)
+    else:
+        if not (args.start and args.end):
+            raise ValueError("--from and --to must be given together")
+        records = reports.collection_summary(args.start, args.end, args.by, args.per_class)
+    if args.output:
+        with open(args.output, 'w', newline='', encoding='utf-8') as f:
+            f.write(reports.to_csv(records))
+        emit({'exported': len(records), 'file': args.output})
+    else:
+        emit([record._asdict() for record in records])
+
+def cmd_analytics(args):
+    import analytics
+    import reports
+    if args.report == 'export':
+        emit(analytics.export_snapshot(args.dir, args.full))
+        return
+    if args.report == 'collections':
+        if not (args.start and args.end):
+            raise ValueError("--from and --to are required for the collections report")
+        records = analytics.collection_summary(args.start, args.end, args.by, args.per_class, args.dir)
+    elif args.report == 'dues':
+        records = analytics.dues_by_class(args.as_of, args.dir)
+    else:
+        records = analytics.academic_performance(args.class_name, args.dir)
+    if args.output:
+        with open(args.output, 'w', newline='', encoding='utf-8') as f:
+            f.write(reports.to_csv(records))
+        emit({'exported': len(records), 'file': args.output, 'snapshot': analytics.snapshot_info(args.dir)})
+    else:
+        emit([record._asdict() for record in records])
+
+def cmd_fees(args):
+    import fees
+    emit({'schedule': [fee._asdict() for fee in fees.list_fees()], 'postings': fees.list_postings()})
+
+def cmd_set_fee(args):
+    import fees
+    if args.remove:
+        emit({'removed': fees.remove_fee(args.class_name, args.fee_head)})
+    else:
+        emit(fees.set_fee(args.class_name, args.fee_head, args.amount, args.months)._asdict())
+
+def cmd_exempt(args):
+    import fees
+    fees.set_exemption(args.student_id, args.fee_head, not args.remove)
+    emit({'student_id': args.student_id, 'fee_head': args.fee_head, 'exempt': not args.remove})
+
+def cmd_post_charges(args):
+    import fees
+    posting = fees.post_charges(args.period)
+    if args.invoices:
+        result = service.issue_posted_invoices(posting['period'], args.class_name, by_family=args.by_family)
+        posting.update({'issued': len(result['issued']), 'skipped': result['skipped']})
+    emit(posting)
+
+def cmd_prerender(args):
+    import drafts
+    if args.status:
+        emit(drafts.draft_status())
+    elif args.schedule:
+        start, _, end = args.idle_hours.partition('-')
+        drafts.run_schedule(args.every, (int(start), int(end)))
+    else:
+        emit(drafts.prerender_invoices(args.period, args.class_name))
+
+def cmd_promote(args):
+    import promotion
+    if args.list:
+        emit(promotion.list_promotion_runs())
+    else:
+        emit(promotion.promote(args.academic_year, args.order, args.hold_back, dry_run=args.dry_run))
+
+def cmd_check_balances(args):
+    import balances
+    import reports
+    if args.student_id:
+        emit(balances.ledger_for(args.student_id))
+        return
+    if args.list:
+        emit(balances.list_checks())
+        return
+    result = balances.check_balances(args.repair)
+    details = result.pop('details')
+    if args.output:
+        with open(args.output, 'w', newline='', encoding='utf-8') as f:
+            f.write(reports.to_csv(details))
+        result['file'] = args.output
+    else:
+        result['details'] = [mismatch._asdict() for mismatch in details]
+    emit(result)
+    return 1 if result['mismatches'] and not args.repair else 0
+
+def cmd_changes(args):
+    import changes
+    if args.consumers:
+        emit([consumer._asdict() for consumer in changes.list_consumers()])
+    elif args.prune:
+        emit(changes.prune_changes(args.keep_days))
+    elif args.remove_consumer:
+        emit({'consumer': args.remove_consumer, 'removed': changes.remove_consumer(args.remove_consumer)})
+    elif args.follow:
+        # One JSON object per line, for piping into another program
+        try:
+            for event in changes.follow(args.after, args.table, args.interval):
+                print(json.dumps(event._asdict(), default=str), flush=True)
+        except KeyboardInterrupt:
+            pass
+    else:
+        emit([event._asdict() for event in changes.read_changes(args.after, args.table, args.limit)])
+
+def cmd_set_password(args):
+    import getpass
+    password = args.password or getpass.getpass(f"New password for {args.username}: ")
+    emit({'username': args.username, 'status': 'ok', 'sessions_ended': db.set_password(args.username, password)})
+
+def cmd_sessions(args):
+    import auth
+    if args.end:
+        emit({'username': args.end, 'sessions_ended': auth.end_user_sessions(args.end)})
+    elif args.prune:
+        emit(auth.prune_sessions())
+    else:
+        emit([session._asdict() for session in auth.list_sessions()])
+
+def cmd_enqueue(args):
+    import jobs
+    try:
+        payload = json.loads(args.payload)
+    except json.JSONDecodeError as e:
+        raise ValueError(f"--payload must be JSON: {e}")
+    emit({'job_id': jobs.enqueue(args.kind, payload, args.priority, args.max_attempts)})
+
+def cmd_jobs(args):
+    import jobs
+    if args.job_id:
+        emit(jobs.get_job(args.job_id))
+    else:
+        emit(jobs.list_jobs(args.limit, args.status))
+
+def cmd_archive(args):
+    import archive
+    if args.list:
+        emit(archive.list_archived_years())
+    elif args.academic_year:
+        emit(archive.archive_year(args.academic_year, vacuum=args.vacuum))
+    else:
+        emit(archive.archive_closed_years(vacuum=args.vacuum))
+
+def cmd_backup(args):
+    import backup
+    if args.list:
+        emit(backup.list_backups(args.dir))
+    elif args.verify:
+        problems = backup.verify_backup(args.verify, full=args.full_check)
+        emit({'file': args.verify, 'ok': not problems, 'problems': problems})
+        return 1 if problems else 0
+    elif args.every:
+        backup.run_schedule(args.every, backup_dir=args.dir, compress=args.compress,
+                            full_check=args.full_check, keep=args.keep)
+    else:
+        emit(backup.backup_database(args.dir, args.compress, args.full_check, args.keep))
+
+def cmd_replica(args):
+    import replica
+    if args.every:
+        replica.run_refresher(args.every, args.path)
+    else:
+        emit(replica.refresh_replica(args.path))
+
+def cmd_serve(args):
+    import api
+    if args.replica:
+        db.enable_replica(args.replica, args.max_staleness)
+    api.serve(args.host, args.port, args.pool_size)
+
+# Build the argument parser with one sub-command per operation
+def build_parser():
+    parser = argparse.ArgumentParser(description="Evergreen Public School - headless operations")
+    parser.add_argument('--db', default=db.DB_PATH, help="Path to the SQLite database (default: school.db)")
+    sub = parser.add_subparsers(dest='command', required=True)
+
+    p = sub.add_parser('init-db', help="Create or migrate the database schema")
+    p.set_defaults(func=cmd_init_db)
+
+    p = sub.add_parser('add-students', help="Admit students from a CSV file with admission columns")
+    p.add_argument('csv_file')
+    p.set_defaults(func=cmd_add_students)
+
+    p = sub.add_parser('students', help="List students as JSON or export them to CSV")
+    p.add_argument('--output', help="Write a CSV report instead of printing JSON")
+    p.set_defaults(func=cmd_students)
+
+    p = sub.add_parser('invoice', help="Generate invoices for one student, a class or everyone")
+    target = p.add_mutually_exclusive_group(required=True)
+    target.add_argument('--student-id')
+    target.add_argument('--class', dest='class_name')
+    target.add_argument('--all', action='store_true')
+    p.add_argument('--school-fee', type=float, default=0.0)
+    p.add_argument('--bus-fee', type=float, default=0.0)
+    p.set_defaults(func=cmd_invoice)
+
+    p = sub.add_parser('payment', help="Record a payment and store its receipt")
+    p.add_argument('--student-id', required=True)
+    p.add_argument('--school-fee', type=float, default=0.0)
+    p.add_argument('--bus-fee', type=float, default=0.0)
+    p.add_argument('--amount', type=float, required=True)
+    p.add_argument('--family', action='store_true', help="Pay for the student's whole family against posted balances")
+    p.set_defaults(func=cmd_payment)
+
+    p = sub.add_parser('family', help="Show a student's siblings, list families, or link/separate households")
+    p.add_argument('student_id', nargs='?', help="Default: list every family")
+    p.add_argument('--class', dest='class_name', help="With no student: only families with someone in this class")
+    action = p.add_mutually_exclusive_group()
+    action.add_argument('--link', metavar='SIBLING_ID', help="Move the student's household into this student's")
+    action.add_argument('--separate', action='store_true', help="Give the student a household of their own")
+    action.add_argument('--clear-override', action='store_true', help="Go back to the household their details match")
+    action.add_argument('--rebuild', action='store_true', help="Rebuild the household index for every student")
+    p.set_defaults(func=cmd_family)
+
+    p = sub.add_parser('result-card', help="Generate and store a result card")
+    p.add_argument('--student-id', required=True)
+    p.add_argument('--subject', action='append', default=[], help="Subject:Marks, repeatable")
+    p.add_argument('--academic-year', default="2024-2025")
+    p.add_argument('--attendance', type=float, help="Attendance percentage (default: from the attendance register)")
+    p.set_defaults(func=cmd_result_card)
+
+    for name, func in (('search', cmd_search), ('export-pdfs', cmd_export_pdfs)):
+        p = sub.add_parser(name, help="Search stored documents" if name == 'search' else "Write stored PDFs to a directory")
+        p.add_argument('kind', choices=sorted(db.DOCUMENT_TABLES))
+        p.add_argument('--student-id')
+        p.add_argument('--academic-year')
+        if name == 'export-pdfs':
+            p.add_argument('--directory', required=True)
+        p.set_defaults(func=func)
+
+    p = sub.add_parser('print', help="Merge stored PDFs into one print file, optionally two A5 pages per A4 sheet")
+    p.add_argument('kind', choices=sorted(db.DOCUMENT_TABLES))
+    p.add_argument('--output', required=True, help="PDF file to write")
+    p.add_argument('--class', dest='class_name')
+    p.add_argument('--student-id')
+    p.add_argument('--from', dest='start', help="YYYY-MM-DD: generated on or after")
+    p.add_argument('--to', dest='end', help="YYYY-MM-DD: generated on or before")
+    p.add_argument('--period', help="YYYY-MM: invoices issued for this posted month")
+    p.add_argument('--academic-year', help="Result cards for this session")
+    p.add_argument('--two-up', action='store_true', help="Impose two A5 documents on each A4 landscape sheet")
+    p.add_argument('--no-cut-marks', action='store_true', help="Leave out the cut marks between two-up halves")
+    p.set_defaults(func=cmd_print)
+
+    p = sub.add_parser('dispatch', help="Email / WhatsApp stored documents to parents, then send everything queued",
+                       epilog="Servers are set with SCHOOL_SMTP_HOST, SCHOOL_SMTP_PORT, SCHOOL_SMTP_USER, "
+                              "SCHOOL_SMTP_PASSWORD, SCHOOL_SMTP_STARTTLS, SCHOOL_SMTP_SENDER, SCHOOL_WHATSAPP_URL "
+                              "and SCHOOL_WHATSAPP_TOKEN (defaults: sandbox.py on localhost)")
+    p.add_argument('kind', nargs='?', choices=sorted(db.DOCUMENT_TABLES), help="Queue these documents first")
+    p.add_argument('--class', dest='class_name')
+    p.add_argument('--student-id')
+    p.add_argument('--from', dest='start', help="YYYY-MM-DD: generated on or after")
+    p.add_argument('--to', dest='end', help="YYYY-MM-DD: generated on or before")
+    p.add_argument('--period', help="YYYY-MM: invoices issued for this posted month")
+    p.add_argument('--academic-year', help="Result cards for this session")
+    p.add_argument('--channel', action='append', choices=['email', 'whatsapp'], help="Default: both")
+    p.add_argument('--resend', action='store_true', help="Queue documents again even if already sent")
+    p.add_argument('--queue-only', action='store_true', help="Queue without sending")
+    p.add_argument('--limit', type=int, help="Send at most this many messages per channel")
+    p.add_argument('--concurrency', type=int, help="Sends in flight per channel (default: 8 email, 16 WhatsApp)")
+    p.add_argument('--email-rate', type=float, help="Emails per second (default: 10; 0 = unlimited)")
+    p.add_argument('--whatsapp-rate', type=float, help="WhatsApp messages per second (default: 20; 0 = unlimited)")
+    p.add_argument('--status', action='store_true', help="Show delivery counts instead")
+    p.add_argument('--failed', action='store_true', help="Show failed deliveries instead")
+    p.set_defaults(func=cmd_dispatch)
+
+    p = sub.add_parser('mark-attendance', help="Mark a class present for a day except --absent students")
+    p.add_argument('class_name', nargs='?')
+    p.add_argument('--day', help="YYYY-MM-DD (default: today)")
+    p.add_argument('--absent', action='append', default=[], metavar='STUDENT_ID')
+    p.add_argument('--student-id', help="Correct one student's attendance instead of marking a class")
+    p.add_argument('--absent-student', action='store_true', help="With --student-id: mark them absent")
+    p.set_defaults(func=cmd_mark_attendance)
+
+    p = sub.add_parser('attendance', help="Attendance percentages for a session, a class or one student")
+    p.add_argument('academic_year', nargs='?', help="e.g. 2024-2025 (default: current)")
+    p.add_argument('--class', dest='class_name')
+    p.add_argument('--student-id', help="One student's counts and the days they were absent")
+    p.add_argument('--output', help="Write CSV here instead of printing JSON")
+    p.set_defaults(func=cmd_attendance)
+
+    p = sub.add_parser('fees', help="Show the fee schedule and past charge postings")
+    p.set_defaults(func=cmd_fees)
+
+    p = sub.add_parser('set-fee', help="Set (or --remove) the monthly charge for a class and fee head")
+    p.add_argument('class_name')
+    p.add_argument('fee_head', choices=['tuition', 'bus', 'exam'])
+    p.add_argument('amount', type=float, nargs='?', default=0.0)
+    p.add_argument('--months', help="Month numbers this head is charged in, e.g. 9,3 (default: every month)")
+    p.add_argument('--remove', action='store_true')
+    p.set_defaults(func=cmd_set_fee)
+
+    p = sub.add_parser('exempt', help="Exempt a student from a fee head (or --remove the exemption)")
+    p.add_argument('student_id')
+    p.add_argument('fee_head', choices=['tuition', 'bus', 'exam'])
+    p.add_argument('--remove', action='store_true')
+    p.set_defaults(func=cmd_exempt)
+
+    p = sub.add_parser('post-charges', help="Post a month's scheduled charges to every student's balance (once per month)")
+    p.add_argument('period', nargs='?', help="YYYY-MM (default: this month)")
+    p.add_argument('--invoices', action='store_true', help="Then render invoices for everyone charged")
+    p.add_argument('--class', dest='class_name', help="Only render invoices for this class")
+    p.add_argument('--by-family', action='store_true', help="One invoice per family for siblings charged together")
+    p.set_defaults(func=cmd_post_charges)
+
+    p = sub.add_parser('prerender', help="Render the coming period's invoices ahead of time so the counter serves them at once")
+    p.add_argument('period', nargs='?', help="YYYY-MM (default: this month until posted, then next month)")
+    p.add_argument('--class', dest='class_name', help="Only this class")
+    p.add_argument('--schedule', action='store_true', help="Keep running and pre-render during --idle-hours")
+    p.add_argument('--idle-hours', default='22-6', help="START-END hours for --schedule (default: 22-6)")
+    p.add_argument('--every', type=float, default=30, metavar='MINUTES', help="With --schedule: check interval")
+    p.add_argument('--status', action='store_true', help="Show stored drafts per period")
+    p.set_defaults(func=cmd_prerender)
+
+    p = sub.add_parser('promote', help="Year-end promotion: move every student up a class and renumber rolls")
+    p.add_argument('academic_year', nargs='?', help="Session being promoted into, e.g. 2025-2026 (default: current)")
+    p.add_argument('--order', choices=['name', 'previous_roll', 'admission', 'dob'], default='name',
+                   help="How roll numbers are assigned within each class")
+    p.add_argument('--hold-back', action='append', default=[], metavar='STUDENT_ID', help="Student who repeats the class")
+    p.add_argument('--dry-run', action='store_true', help="Show what would change without changing anything")
+    p.add_argument('--list', action='store_true', help="Show past promotions instead")
+    p.set_defaults(func=cmd_promote)
+
+    p = sub.add_parser('collections', help="Day book (default: today) or collection totals for a date range")
+    p.add_argument('--day', help="YYYY-MM-DD: list every payment taken that day")
+    p.add_argument('--from', dest='start', help="YYYY-MM-DD: first day of the summary")
+    p.add_argument('--to', dest='end', help="YYYY-MM-DD: last day of the summary")
+    p.add_argument('--by', choices=['day', 'month', 'year', 'academic_year'], default='month')
+    p.add_argument('--per-class', action='store_true', help="Split the summary by class")
+    p.add_argument('--output', help="Write CSV here instead of printing JSON")
+    p.set_defaults(func=cmd_collections)
+
+    p = sub.add_parser('analytics', help="Export the Parquet analytics snapshot, or run a report on it with DuckDB")
+    p.add_argument('report', choices=['export', 'collections', 'dues', 'performance'])
+    p.add_argument('--dir', help="Snapshot directory (default: analytics)")
+    p.add_argument('--full', action='store_true', help="With export: rebuild the snapshot from scratch")
+    p.add_argument('--from', dest='start', help="YYYY-MM-DD: first day of the collections report")
+    p.add_argument('--to', dest='end', help="YYYY-MM-DD: last day of the collections report")
+    p.add_argument('--by', choices=['day', 'month', 'year', 'academic_year'], default='month')
+    p.add_argument('--per-class', action='store_true', help="Split collections by class")
+    p.add_argument('--as-of', help="YYYY-MM-DD: day the dues ageing is measured from (default: today)")
+    p.add_argument('--class', dest='class_name', help="Only this class in the performance report")
+    p.add_argument('--output', help="Write CSV here instead of printing JSON")
+    p.set_defaults(func=cmd_analytics)
+
+    p = sub.add_parser('check-balances', help="Check student balances against the balance ledger (exits 1 on mismatches)")
+    p.add_argument('--repair', action='store_true', help="Set mismatched balances to what the ledger says")
+    p.add_argument('--output', help="Write mismatches as CSV here")
+    p.add_argument('--student-id', help="Show one student's ledger with running balances instead")
+    p.add_argument('--list', action='store_true', help="Show past checks instead")
+    p.set_defaults(func=cmd_check_balances)
+
+    p = sub.add_parser('changes', help="Read the change log of student, payment and document writes by sequence number")
+    p.add_argument('--after', type=int, default=0, metavar='SEQ', help="Only events after this sequence number")
+    p.add_argument('--table', action='append', help="Only this table (repeatable)")
+    p.add_argument('--limit', type=int, default=1000)
+    p.add_argument('--follow', action='store_true', help="Keep printing new events as JSON lines")
+    p.add_argument('--interval', type=float, default=1.0, help="Seconds between polls with --follow")
+    p.add_argument('--consumers', action='store_true', help="Show registered consumers and how far behind they are")
+    p.add_argument('--prune', action='store_true', help="Delete old events every consumer has read")
+    p.add_argument('--keep-days', type=int, default=30, help="With --prune: keep events this recent")
+    p.add_argument('--remove-consumer', metavar='NAME', help="Stop keeping events for this consumer")
+    p.set_defaults(func=cmd_changes)
+
+    p = sub.add_parser('set-password', help="Set a user's password (creating the user) and sign them out everywhere")
+    p.add_argument('username')
+    p.add_argument('--password', help="Default: prompt for it")
+    p.set_defaults(func=cmd_set_password)
+
+    p = sub.add_parser('sessions', help="Show active login sessions")
+    p.add_argument('--end', metavar='USERNAME', help="Sign this user out everywhere")
+    p.add_argument('--prune', action='store_true', help="Delete expired sessions and stale failed-login counts")
+    p.set_defaults(func=cmd_sessions)
+
+    p = sub.add_parser('enqueue', help="Queue a background job for worker.py")
+    p.add_argument('kind', choices=['invoice', 'bulk_invoices', 'post_charges', 'prerender_invoices', 'result_card',
+                                    'export_students', 'export_documents', 'print_documents', 'dispatch_documents',
+                                    'reconcile_receipts', 'check_balances', 'export_analytics', 'backup', 'refresh_replica'])
+    p.add_argument('--payload', default='{}', help="Job parameters as a JSON object")
+    p.add_argument('--priority', type=int, default=0)
+    p.add_argument('--max-attempts', type=int, default=3)
+    p.set_defaults(func=cmd_enqueue)
+
+    p = sub.add_parser('jobs', help="Show queued and finished background jobs")
+    p.add_argument('job_id', nargs='?', type=int)
+    p.add_argument('--status', choices=['queued', 'running', 'done', 'failed', 'cancelled'])
+    p.add_argument('--limit', type=int, default=50)
+    p.set_defaults(func=cmd_jobs)
+
+    p = sub.add_parser('archive', help="Move closed academic years into per-year archive databases")
+    p.add_argument('academic_year', nargs='?', help="e.g. 2023-2024; default: every closed year")
+    p.add_argument('--vacuum', action='store_true', help="Compact school.db afterwards")
+    p.add_argument('--list', action='store_true', help="Show archived years instead")
+    p.set_defaults(func=cmd_archive)
+
+    p = sub.add_parser('backup', help="Take a verified online backup of the database")
+    p.add_argument('--dir', help="Backup directory (default: backups)")
+    p.add_argument('--compress', action='store_true', help="gzip the snapshot")
+    p.add_argument('--full-check', action='store_true', help="Use PRAGMA integrity_check instead of quick_check")
+    p.add_argument('--keep', type=int, default=14, help="Number of snapshots to keep")
+    p.add_argument('--every', type=float, metavar='MINUTES', help="Keep running and back up on this interval")
+    p.add_argument('--verify', metavar='FILE', help="Only verify an existing snapshot")
+    p.add_argument('--list', action='store_true', help="List existing snapshots")
+    p.set_defaults(func=cmd_backup)
+
+    p = sub.add_parser('replica', help="Refresh the reporting replica from the primary database")
+    p.add_argument('--path', help="Replica file (default: school_replica.db)")
+    p.add_argument('--every', type=float, metavar='SECONDS', help="Keep refreshing on this interval")
+    p.set_defaults(func=cmd_replica)
+
+    p = sub.add_parser('serve', help="Run the HTTP API")
+    p.add_argument('--host', default='127.0.0.1')
+    p.add_argument('--port', type=int, default=8600)
+    p.add_argument('--pool-size', type=int, default=8)
+    p.add_argument('--replica', metavar='PATH', help="Serve student lists and searches from this reporting replica")
+    p.add_argument('--max-staleness', type=float, default=60, help="Seconds before the replica counts as stale")
+    p.set_defaults(func=cmd_serve)
+    return parser
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    db.DB_PATH = args.db
+    if args.command != 'init-db':
+        db.init_db()
+    try:
+        return args.func(args) or 0
+    except ValueError as e:
+        print(f"Error: {e}", file=sys.stderr)
+        return 2
+
+if __name__ == "__main__":
+    sys.exit(main())
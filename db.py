@@ -0,0 +1,1191 @@
+import sqlite3
+from datetime import datetime
+import os
+import re
+import hashlib
+import hmac
+import secrets
+import uuid
+import time
+import queue
+import threading
+from typing import NamedTuple
+
+DB_PATH = 'school.db'
+
+# Pooled connection that goes back to its pool instead of closing
+class PooledConnection(sqlite3.Connection):
+    pool = None
+
+    def close(self):
+        if self.pool is None:
+            super().close()
+            return
+        if self.in_transaction:
+            self.rollback()
+        self.pool.release(self)
+
+# Fixed-size pool of SQLite connections shared by headless callers (API, CLI workers)
+class ConnectionPool:
+    def __init__(self, db_path, size=8):
+        self.db_path = db_path
+        self.size = size
+        self._idle = queue.LifoQueue(maxsize=size)
+        self._created = 0
+        self._closed = False
+        self._lock = threading.Lock()
+
+    def acquire(self, timeout=10):
+        try:
+            return self._idle.get_nowait()
+        except queue.Empty:
+            pass
+        with self._lock:
+            can_create = self._created < self.size
+            if can_create:
+                self._created += 1
+        if can_create:
+            conn = sqlite3.connect(self.db_path, timeout=10, check_same_thread=False, factory=PooledConnection)
+            conn.pool = self
+            return conn
+        return self._idle.get(timeout=timeout)
+
+    def release(self, conn):
+        if self._closed:
+            conn.pool = None
+            conn.close()
+            return
+        self._idle.put_nowait(conn)
+
+    def close_all(self):
+        self._closed = True
+        while True:
+            try:
+                conn = self._idle.get_nowait()
+            except queue.Empty:
+                break
+            conn.pool = None
+            conn.close()
+
+_pool = None
+
+# Route every data-access call through a shared connection pool
+def enable_connection_pool(size=8):
+    global _pool
+    if _pool is not None:
+        _pool.close_all()
+    _pool = ConnectionPool(DB_PATH, size)
+    return _pool
+
+# Close pooled connections and go back to one connection per call
+def disable_connection_pool():
+    global _pool
+    if _pool is not None:
+        _pool.close_all()
+    _pool = None
+
+# Open a connection to the school database (pooled when a pool is enabled)
+def get_connection():
+    if _pool is not None:
+        return _pool.acquire()
+    return sqlite3.connect(DB_PATH, timeout=10)
+
+REPLICA_PATH = None
+REPLICA_MAX_STALENESS = 60
+_replica_refresh_lock = threading.Lock()
+
+# Serve reporting reads from a periodically refreshed snapshot of the database
+def enable_replica(path='school_replica.db', max_staleness=60):
+    global REPLICA_PATH, REPLICA_MAX_STALENESS
+    REPLICA_PATH = path
+    REPLICA_MAX_STALENESS = max_staleness
+
+# Send reporting reads back to the primary database
+def disable_replica():
+    global REPLICA_PATH
+    REPLICA_PATH = None
+
+# Seconds since the replica snapshot was taken (None when there is no replica)
+def replica_age():
+    if not REPLICA_PATH or not os.path.exists(REPLICA_PATH):
+        return None
+    return time.time() - os.path.getmtime(REPLICA_PATH)
+
+# Refresh the replica in a background thread unless a refresh is already running
+def refresh_replica_in_background():
+    lock = _replica_refresh_lock
+    if not lock.acquire(blocking=False):
+        return
+
+    def run():
+        try:
+            import replica
+            replica.refresh_replica()
+        except Exception as e:
+            print(f"Replica refresh failed: {e}")
+        finally:
+            lock.release()
+
+    threading.Thread(target=run, name='replica-refresh', daemon=True).start()
+
+# Open a connection for reporting reads. Uses the replica while it is within
+# REPLICA_MAX_STALENESS seconds of the primary, otherwise reads the primary and
+# kicks off a refresh. Reads that must see the latest writes (bulk issuing, a
+# reprint right after issuing) pass primary=True. Writes must always use get_connection().
+def get_read_connection(primary=False):
+    if REPLICA_PATH and not primary:
+        age = replica_age()
+        if age is not None and age <= REPLICA_MAX_STALENESS:
+            return sqlite3.connect(f'file:{REPLICA_PATH}?mode=ro', uri=True, timeout=10)
+        refresh_replica_in_background()
+    return get_connection()
+
+# Raised when a student ID does not exist. A ValueError, so callers that show
+# ValueError messages keep working, while the API can map it to 404.
+class StudentNotFound(ValueError):
+    def __init__(self, message="Student not found!"):
+        super().__init__(message)
+
+# Typed rows for the lookup paths. They are tuples, so positional access keeps
+# working, but callers use the field names.
+class Student(NamedTuple):
+    student_id: str
+    first_name: str
+    middle_name: str
+    last_name: str
+    mother_name: str
+    father_name: str
+    address: str
+    email: str
+    mobile_number: str
+    dob: str
+    class_name: str
+    whatsapp_no: str
+    gender: str
+    doa: str
+    roll_number: str
+    outstanding_balance: float
+    extra_balance: float
+
+class Invoice(NamedTuple):
+    invoice_id: str
+    student_id: str
+    school_fee: float
+    bus_fee: float
+    pdf_data: bytes
+    generated_date: str
+
+class Receipt(NamedTuple):
+    receipt_id: str
+    student_id: str
+    payment_id: str
+    pdf_data: bytes
+    generated_date: str
+
+class ReportCard(NamedTuple):
+    report_id: str
+    student_id: str
+    academic_year: str
+    pdf_data: bytes
+    generated_date: str
+
+# Cursor row_factory that builds `record` instances straight from SQLite rows
+def record_factory(record):
+    return lambda cursor, row: record._make(row)
+
+# Initialize SQLite database and handle schema migration
+def init_db():
+    conn = None
+    try:
+        conn = get_connection()
+        c = conn.cursor()
+    
+        # Create students table
+        c.execute('''CREATE TABLE IF NOT EXISTS students (
+            student_id TEXT PRIMARY KEY,
+            first_name VARCHAR(50) NOT NULL,
+            middle_name VARCHAR(50) DEFAULT '',
+            last_name VARCHAR(50) NOT NULL,
+            mother_name TEXT NOT NULL,
+            father_name TEXT NOT NULL,
+            address TEXT,
+            email TEXT,
+            mobile_number VARCHAR(15),
+            dob TEXT,
+            class_name VARCHAR(10),
+            whatsapp_no TEXT,
+            gender VARCHAR(20),
+            doa TEXT,
+            roll_number TEXT,
+            outstanding_balance REAL DEFAULT 0.0,
+            extra_balance REAL DEFAULT 0.0
+        )''')
+    
+        # Check and drop tuition_fee, bus_fee, total_amount if they exist
+        c.execute("PRAGMA table_info(students)")
+        columns = [col[1] for col in c.fetchall()]
+        if 'tuition_fee' in columns or 'bus_fee' in columns or 'total_amount' in columns:
+            c.execute('''CREATE TABLE students_temp (
+                student_id TEXT PRIMARY KEY,
+                first_name VARCHAR(50) NOT NULL,
+                middle_name VARCHAR(50),
+                last_name VARCHAR(50) NOT NULL,
+                mother_name TEXT,
+                father_name TEXT,
+                address TEXT,
+                email TEXT,
+                mobile_number VARCHAR(15),
+                dob TEXT,
+                class_name VARCHAR(10),
+                whatsapp_no TEXT,
+                gender VARCHAR(20),
+                doa TEXT,
+                roll_number TEXT,
+                outstanding_balance REAL DEFAULT 0.0,
+                extra_balance REAL DEFAULT 0.0
+            )''')
+            c.execute('''INSERT INTO students_temp (
+                student_id, first_name, middle_name, last_name,
+                mother_name, father_name, address, email,
+                mobile_number, dob, class_name, whatsapp_no,
+                gender, doa, roll_number, outstanding_balance, extra_balance)
+                SELECT student_id, first_name, middle_name, last_name,
+                mother_name, father_name, address, email,
+                mobile_number, dob, class_name, whatsapp_no,
+                gender, doa, roll_number, outstanding_balance, 0.0
+                FROM students''')
+            c.execute("DROP TABLE students")
+            c.execute("ALTER TABLE students_temp RENAME TO students")
+        
+        # Ensure roll_number column exists
+        c.execute("PRAGMA table_info(students)")
+        columns = [col[1] for col in c.fetchall()]
+        if 'roll_number' not in columns:
+            c.execute("ALTER TABLE students ADD COLUMN roll_number TEXT")
+        
+        # Ensure outstanding_balance column exists
+        if 'outstanding_balance' not in columns:
+            c.execute("ALTER TABLE students ADD COLUMN outstanding_balance REAL DEFAULT 0.0")
+        
+        # Ensure extra_balance column exists
+        if 'extra_balance' not in columns:
+            c.execute("ALTER TABLE students ADD COLUMN extra_balance REAL DEFAULT 0.0")
+        
+        c.execute("CREATE INDEX IF NOT EXISTS idx_students_id_length ON students (LENGTH(student_id), student_id)")
+
+        # Create household index: every student's household, matched on normalised
+        # parent names and mobile number and kept up to date by add_student.
+        # household_overrides pins a student to a household by hand and always
+        # wins over the match (see families.py).
+        c.execute('''CREATE TABLE IF NOT EXISTS household_overrides (
+            student_id TEXT PRIMARY KEY,
+            household_id TEXT NOT NULL,
+            created_at TEXT NOT NULL
+        )''')
+        c.execute('''CREATE TABLE IF NOT EXISTS student_households (
+            student_id TEXT PRIMARY KEY,
+            household_key TEXT NOT NULL,
+            household_id TEXT NOT NULL
+        ) WITHOUT ROWID''')
+        c.execute("CREATE INDEX IF NOT EXISTS idx_student_households_household ON student_households (household_id)")
+        c.execute("SELECT EXISTS (SELECT 1 FROM student_households), EXISTS (SELECT 1 FROM students)")
+        has_households, has_students = c.fetchone()
+        if has_students and not has_households:
+            rebuild_households(c)
+
+        # Create payments table
+        c.execute('''CREATE TABLE IF NOT EXISTS payments (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            payment_id TEXT NOT NULL,
+            student_id TEXT,
+            amount REAL NOT NULL,
+            payment_date TEXT,
+            household_payment_id TEXT,
+            FOREIGN KEY(student_id) REFERENCES students(student_id)
+        )''')
+        c.execute("CREATE INDEX IF NOT EXISTS idx_payments_date ON payments (payment_date)")
+        # A family payment is one payments row per sibling, each with its own
+        # payment_id, linked by household_payment_id (what its receipt carries).
+        # Older family payments shared one payment_id across the siblings' rows;
+        # those are linked under that shared ID.
+        c.execute("PRAGMA table_info(payments)")
+        if 'household_payment_id' not in [col[1] for col in c.fetchall()]:
+            c.execute("ALTER TABLE payments ADD COLUMN household_payment_id TEXT")
+            c.execute('''UPDATE payments SET household_payment_id = payment_id
+                         WHERE payment_id IN (SELECT payment_id FROM payments GROUP BY payment_id HAVING COUNT(*) > 1)''')
+        c.execute("CREATE INDEX IF NOT EXISTS idx_payments_household ON payments (household_payment_id)")
+
+        # Create daily collection rollup, kept up to date by record_payment.
+        # class_name is the student's class on the day of the payment.
+        c.execute('''CREATE TABLE IF NOT EXISTS daily_collections (
+            collection_date TEXT NOT NULL,
+            class_name TEXT NOT NULL DEFAULT '',
+            payments INTEGER NOT NULL DEFAULT 0,
+            amount REAL NOT NULL DEFAULT 0.0,
+            PRIMARY KEY (collection_date, class_name)
+        )''')
+        c.execute("SELECT EXISTS (SELECT 1 FROM daily_collections), EXISTS (SELECT 1 FROM payments)")
+        has_rollup, has_payments = c.fetchone()
+        if has_payments and not has_rollup:
+            rebuild_daily_collections(c)
+
+        # Create balance ledger: every change to a student's net balance
+        # (outstanding - extra) with the balance it left, written in the same
+        # transaction as the change. balances.py checks students against it.
+        c.execute('''CREATE TABLE IF NOT EXISTS balance_ledger (
+            seq INTEGER PRIMARY KEY AUTOINCREMENT,
+            student_id TEXT NOT NULL,
+            source TEXT NOT NULL,
+            reference TEXT,
+            delta REAL NOT NULL,
+            balance_after REAL NOT NULL,
+            recorded_at TEXT NOT NULL
+        )''')
+        c.execute("CREATE INDEX IF NOT EXISTS idx_balance_ledger_student ON balance_ledger (student_id, seq)")
+        c.execute('''SELECT EXISTS (SELECT 1 FROM balance_ledger),
+                            EXISTS (SELECT 1 FROM students WHERE COALESCE(outstanding_balance, 0.0) != 0.0
+                                                              OR COALESCE(extra_balance, 0.0) != 0.0)''')
+        has_ledger, has_balances = c.fetchone()
+        if has_balances and not has_ledger:
+            open_balance_ledger(c)
+        c.execute('''CREATE TABLE IF NOT EXISTS balance_checks (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            checked_at TEXT NOT NULL,
+            students INTEGER NOT NULL,
+            mismatches INTEGER NOT NULL,
+            repaired INTEGER NOT NULL,
+            difference REAL NOT NULL,
+            seconds REAL NOT NULL
+        )''')
+        
+        # Create results table
+        c.execute('''CREATE TABLE IF NOT EXISTS results (
+            student_id TEXT,
+            subject TEXT NOT NULL,
+            marks REAL NOT NULL,
+            FOREIGN KEY(student_id) REFERENCES students(student_id)
+        )''')
+        
+        # Create users table
+        c.execute('''CREATE TABLE IF NOT EXISTS users (
+            username TEXT PRIMARY KEY NOT NULL,
+            password TEXT NOT NULL
+        )''')
+        
+        # Create report_cards table
+        c.execute('''CREATE TABLE IF NOT EXISTS report_cards (
+            report_id TEXT PRIMARY KEY,
+            student_id TEXT,
+            academic_year TEXT,
+            pdf_data BLOB,
+            generated_date TEXT,
+            FOREIGN KEY(student_id) REFERENCES students(student_id)
+        )''')
+        
+        # Create invoices table
+        c.execute('''CREATE TABLE IF NOT EXISTS invoices (
+            invoice_id TEXT PRIMARY KEY,
+            student_id TEXT,
+            school_fee REAL,
+            bus_fee REAL,
+            pdf_data BLOB,
+            generated_date TEXT,
+            FOREIGN KEY(student_id) REFERENCES students(student_id)
+        )''')
+        
+        # Create receipts table
+        c.execute('''CREATE TABLE IF NOT EXISTS receipts (
+            receipt_id TEXT PRIMARY KEY,
+            student_id TEXT,
+            payment_id TEXT,
+            pdf_data BLOB,
+            generated_date TEXT,
+            FOREIGN KEY(student_id) REFERENCES students(student_id),
+            FOREIGN KEY(payment_id) REFERENCES payments(payment_id)
+        )''')
+
+        # Index the per-student reprint lookups
+        c.execute("CREATE INDEX IF NOT EXISTS idx_invoices_student ON invoices (student_id, generated_date)")
+        c.execute("CREATE INDEX IF NOT EXISTS idx_receipts_student ON receipts (student_id, generated_date)")
+        c.execute("CREATE INDEX IF NOT EXISTS idx_receipts_payment ON receipts (payment_id)")
+        c.execute("CREATE INDEX IF NOT EXISTS idx_report_cards_student ON report_cards (student_id, academic_year)")
+        # Index invoices by date for the analytics export watermark (see analytics.py)
+        c.execute("CREATE INDEX IF NOT EXISTS idx_invoices_generated ON invoices (generated_date, invoice_id)")
+
+        # Create jobs table for the background worker queue
+        c.execute('''CREATE TABLE IF NOT EXISTS jobs (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            kind TEXT NOT NULL,
+            payload TEXT NOT NULL DEFAULT '{}',
+            status TEXT NOT NULL DEFAULT 'queued',
+            priority INTEGER NOT NULL DEFAULT 0,
+            attempts INTEGER NOT NULL DEFAULT 0,
+            max_attempts INTEGER NOT NULL DEFAULT 3,
+            run_after TEXT NOT NULL,
+            lease_owner TEXT,
+            lease_expires TEXT,
+            progress REAL NOT NULL DEFAULT 0.0,
+            message TEXT,
+            result TEXT,
+            result_data BLOB,
+            result_name TEXT,
+            error TEXT,
+            created_at TEXT NOT NULL,
+            finished_at TEXT
+        )''')
+        c.execute("CREATE INDEX IF NOT EXISTS idx_jobs_claim ON jobs (status, priority DESC, run_after, id)")
+
+        # Create fee schedule tables: the monthly charge per class and fee head
+        # (months lists the month numbers a head is charged in, NULL = every month),
+        # per-student exemptions, and the ledger of charges posted per period (YYYY-MM)
+        c.execute('''CREATE TABLE IF NOT EXISTS fee_schedules (
+            class_name TEXT NOT NULL,
+            fee_head TEXT NOT NULL,
+            amount REAL NOT NULL,
+            months TEXT,
+            PRIMARY KEY (class_name, fee_head)
+        )''')
+        c.execute('''CREATE TABLE IF NOT EXISTS fee_exemptions (
+            student_id TEXT NOT NULL,
+            fee_head TEXT NOT NULL,
+            PRIMARY KEY (student_id, fee_head)
+        )''')
+        c.execute('''CREATE TABLE IF NOT EXISTS student_charges (
+            period TEXT NOT NULL,
+            student_id TEXT NOT NULL,
+            fee_head TEXT NOT NULL,
+            amount REAL NOT NULL,
+            PRIMARY KEY (period, student_id, fee_head)
+        ) WITHOUT ROWID''')
+        c.execute('''CREATE TABLE IF NOT EXISTS fee_postings (
+            period TEXT PRIMARY KEY,
+            students INTEGER NOT NULL,
+            charges INTEGER NOT NULL,
+            amount REAL NOT NULL,
+            posted_at TEXT NOT NULL
+        )''')
+        c.execute('''CREATE TABLE IF NOT EXISTS posted_invoices (
+            period TEXT NOT NULL,
+            student_id TEXT NOT NULL,
+            invoice_id TEXT NOT NULL,
+            PRIMARY KEY (period, student_id)
+        )''')
+        c.execute("CREATE INDEX IF NOT EXISTS idx_posted_invoices_invoice ON posted_invoices (invoice_id)")
+        # Students a family invoice or receipt covers besides the one it is filed
+        # under, so searching any sibling finds it
+        c.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'document_members'")
+        backfill_members = c.fetchone() is None
+        c.execute('''CREATE TABLE IF NOT EXISTS document_members (
+            kind TEXT NOT NULL,
+            document_id TEXT NOT NULL,
+            student_id TEXT NOT NULL,
+            PRIMARY KEY (kind, document_id, student_id)
+        ) WITHOUT ROWID''')
+        c.execute("CREATE INDEX IF NOT EXISTS idx_document_members_student ON document_members (student_id, kind)")
+        if backfill_members:
+            c.execute('''INSERT OR IGNORE INTO document_members (kind, document_id, student_id)
+                         SELECT 'invoice', invoice_id, student_id FROM posted_invoices
+                         WHERE invoice_id IN (SELECT invoice_id FROM posted_invoices GROUP BY invoice_id HAVING COUNT(*) > 1)''')
+            c.execute('''INSERT OR IGNORE INTO document_members (kind, document_id, student_id)
+                         SELECT 'receipt', r.receipt_id, p.student_id
+                         FROM receipts r JOIN payments p ON p.household_payment_id = r.payment_id''')
+        # Invoices rendered ahead of time for a coming period, used at the counter
+        # while the student's fingerprint (balances, charges, printed details) holds
+        c.execute('''CREATE TABLE IF NOT EXISTS invoice_drafts (
+            period TEXT NOT NULL,
+            student_id TEXT NOT NULL,
+            fingerprint TEXT NOT NULL,
+            invoice_id TEXT NOT NULL,
+            pdf_data BLOB NOT NULL,
+            rendered_at TEXT NOT NULL,
+            PRIMARY KEY (period, student_id)
+        )''')
+
+        # Create promotion history: one run per academic year being promoted into,
+        # and every student's class and roll number before and after
+        c.execute('''CREATE TABLE IF NOT EXISTS promotion_runs (
+            academic_year TEXT PRIMARY KEY,
+            roll_order TEXT NOT NULL,
+            promoted INTEGER NOT NULL,
+            held_back INTEGER NOT NULL,
+            graduated INTEGER NOT NULL,
+            promoted_at TEXT NOT NULL
+        )''')
+        c.execute('''CREATE TABLE IF NOT EXISTS promotions (
+            academic_year TEXT NOT NULL,
+            student_id TEXT NOT NULL,
+            from_class TEXT,
+            from_roll TEXT,
+            to_class TEXT,
+            to_roll TEXT,
+            PRIMARY KEY (academic_year, student_id)
+        ) WITHOUT ROWID''')
+
+        # Create attendance register: one row per student per academic year with
+        # bitsets of the days marked and the days present (see attendance.py)
+        c.execute('''CREATE TABLE IF NOT EXISTS attendance (
+            student_id TEXT NOT NULL,
+            academic_year TEXT NOT NULL,
+            present BLOB NOT NULL,
+            marked BLOB NOT NULL,
+            PRIMARY KEY (student_id, academic_year)
+        ) WITHOUT ROWID''')
+
+        # Create dispatch queue: one row per stored document per channel (email,
+        # whatsapp) with its delivery status, retry schedule and the provider's
+        # message reference (see dispatch.py)
+        c.execute('''CREATE TABLE IF NOT EXISTS dispatches (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            kind TEXT NOT NULL,
+            document_id TEXT NOT NULL,
+            student_id TEXT,
+            channel TEXT NOT NULL,
+            recipient TEXT NOT NULL,
+            status TEXT NOT NULL DEFAULT 'queued',
+            attempts INTEGER NOT NULL DEFAULT 0,
+            next_attempt_at TEXT NOT NULL,
+            lease_expires TEXT,
+            provider_ref TEXT,
+            error TEXT,
+            created_at TEXT NOT NULL,
+            sent_at TEXT,
+            UNIQUE (kind, document_id, channel)
+        )''')
+        c.execute("CREATE INDEX IF NOT EXISTS idx_dispatches_due ON dispatches (channel, status, next_attempt_at)")
+
+        # Create archive catalogue: closed years moved out to per-year files, and
+        # a BLOB-free index of their documents so searches attach only what they need
+        c.execute('''CREATE TABLE IF NOT EXISTS archived_years (
+            academic_year TEXT PRIMARY KEY,
+            file_path TEXT NOT NULL,
+            invoices INTEGER NOT NULL DEFAULT 0,
+            receipts INTEGER NOT NULL DEFAULT 0,
+            report_cards INTEGER NOT NULL DEFAULT 0,
+            archived_at TEXT NOT NULL
+        )''')
+        c.execute('''CREATE TABLE IF NOT EXISTS archived_documents (
+            kind TEXT NOT NULL,
+            document_id TEXT NOT NULL,
+            student_id TEXT,
+            academic_year TEXT NOT NULL,
+            PRIMARY KEY (kind, document_id)
+        )''')
+        c.execute("CREATE INDEX IF NOT EXISTS idx_archived_documents_student ON archived_documents (student_id, kind)")
+
+        # Create change log: every insert, update and delete on the CHANGE_TABLES,
+        # written by triggers in the same transaction as the change, so consumers
+        # can follow the database by sequence number (see changes.py).
+        # change_consumers holds how far each named consumer has read.
+        c.execute('''CREATE TABLE IF NOT EXISTS change_events (
+            seq INTEGER PRIMARY KEY AUTOINCREMENT,
+            table_name TEXT NOT NULL,
+            op TEXT NOT NULL,
+            row_key TEXT NOT NULL,
+            student_id TEXT,
+            data TEXT,
+            recorded_at TEXT NOT NULL
+        )''')
+        c.execute('''CREATE TABLE IF NOT EXISTS change_consumers (
+            name TEXT PRIMARY KEY,
+            position INTEGER NOT NULL,
+            updated_at TEXT NOT NULL
+        )''')
+        create_change_triggers(c)
+
+        # Login sessions (keyed by a hash of the token) and failed-login counters
+        # per username and per client address
+        c.execute('''CREATE TABLE IF NOT EXISTS sessions (
+            token_hash TEXT PRIMARY KEY,
+            username TEXT NOT NULL,
+            created_at TEXT NOT NULL,
+            expires_at REAL NOT NULL
+        )''')
+        c.execute("CREATE INDEX IF NOT EXISTS idx_sessions_username ON sessions(username)")
+        c.execute('''CREATE TABLE IF NOT EXISTS login_failures (
+            key TEXT PRIMARY KEY,
+            failures INTEGER NOT NULL,
+            first_failed REAL NOT NULL,
+            locked_until REAL
+        )''')
+        c.execute('''CREATE TABLE IF NOT EXISTS session_keys (
+            id INTEGER PRIMARY KEY CHECK (id = 1),
+            secret TEXT NOT NULL
+        )''')
+        if c.execute("SELECT 1 FROM session_keys WHERE id = 1").fetchone() is None:
+            c.execute("INSERT INTO session_keys (id, secret) VALUES (1, ?)", (secrets.token_hex(32),))
+
+        # Check if admin user exists, if not, create it
+        c.execute("SELECT * FROM users WHERE username = ?", ('admin',))
+        user = c.fetchone()
+        if not user:
+            c.execute("INSERT INTO users (username, password) VALUES (?, ?)",
+                   ('admin', hash_password('admin123')))
+        
+        conn.commit()
+    except sqlite3.OperationalError as e:
+        print(f"Database error during initialization: {e}")
+        raise
+    except Exception as e:
+        print(f"Error during database initialization: {e}")
+        raise
+    finally:
+        if conn:
+            conn.close()
+
+# Recompute the daily collection rollup from the payments table
+def rebuild_daily_collections(c):
+    c.execute("DELETE FROM daily_collections")
+    c.execute('''INSERT INTO daily_collections (collection_date, class_name, payments, amount)
+                 SELECT p.payment_date, COALESCE(s.class_name, ''), COUNT(*), SUM(p.amount)
+                 FROM payments p LEFT JOIN students s ON s.student_id = p.student_id
+                 GROUP BY p.payment_date, COALESCE(s.class_name, '')''')
+
+HONORIFICS = {'mr', 'mrs', 'ms', 'shri', 'sri', 'smt', 'late', 'dr'}
+HOUSEHOLD_BATCH = 5000
+
+# A parent's name as households are matched on: case, punctuation, spacing and titles ignored
+def normalise_parent_name(name):
+    words = re.sub(r'[^\w\s]', ' ', (name or '').casefold()).split()
+    return ' '.join(word for word in words if word not in HONORIFICS)
+
+# Household match key: both parents' names and the last ten digits of the mobile
+# number. Names alone are too common to match on, so a student without a mobile
+# number gets a household of their own until someone links them by hand.
+def household_key(student_id, father_name, mother_name, mobile_number):
+    digits = re.sub(r'\D', '', mobile_number or '')[-10:]
+    if not digits:
+        return f'student:{student_id}'
+    return '|'.join((normalise_parent_name(father_name), normalise_parent_name(mother_name), digits))
+
+# Household ID for a match key: a short hash of it, so students with the same key
+# land in the same household without looking anything up
+def household_id_for(key):
+    return 'FAM' + hashlib.blake2b(key.encode(), digest_size=5).hexdigest().upper()
+
+# Rebuild the household index in one pass over students, then apply the overrides
+def rebuild_households(c):
+    c.execute("DELETE FROM student_households")
+    students = c.execute("SELECT student_id, father_name, mother_name, mobile_number FROM students").fetchall()
+    for i in range(0, len(students), HOUSEHOLD_BATCH):
+        rows = []
+        for student in students[i:i + HOUSEHOLD_BATCH]:
+            key = household_key(*student)
+            rows.append((student[0], key, household_id_for(key)))
+        c.executemany("INSERT INTO student_households (student_id, household_key, household_id) VALUES (?, ?, ?)", rows)
+    c.execute('''UPDATE student_households SET household_id = o.household_id
+                 FROM household_overrides o WHERE o.student_id = student_households.student_id''')
+    return len(students)
+
+# Put one student in the household index (an override for them still wins)
+def record_household(c, student_id, father_name, mother_name, mobile_number):
+    key = household_key(student_id, father_name, mother_name, mobile_number)
+    c.execute('''INSERT OR REPLACE INTO student_households (student_id, household_key, household_id)
+                 VALUES (?, ?, COALESCE((SELECT household_id FROM household_overrides WHERE student_id = ?), ?))''',
+              (student_id, key, student_id, household_id_for(key)))
+
+# Tables whose writes are captured in change_events: the row key and the columns
+# recorded. A BLOB column is recorded as its size (pdf_data as pdf_bytes), so
+# events never carry document contents.
+CHANGE_TABLES = {
+    'students': ('student_id', [name for name in Student._fields if name != 'student_id']),
+    'payments': ('id', ['payment_id', 'student_id', 'amount', 'payment_date', 'household_payment_id']),
+    'invoices': ('invoice_id', ['student_id', 'school_fee', 'bus_fee', 'generated_date', 'pdf_data']),
+    'receipts': ('receipt_id', ['student_id', 'payment_id', 'generated_date', 'pdf_data']),
+    'report_cards': ('report_id', ['student_id', 'academic_year', 'generated_date', 'pdf_data']),
+}
+BLOB_COLUMNS = {'pdf_data': 'pdf_bytes'}
+
+def change_value(row, column):
+    return f"LENGTH({row}.{column})" if column in BLOB_COLUMNS else f"{row}.{column}"
+
+# (Re)create the triggers that write change_events. An insert records the new
+# row, an update only the columns that changed (and nothing when none did), a
+# delete just the key. The JSON for an update is concatenated rather than built
+# with json_group_object, which keeps the cost per row to a few comparisons.
+def change_trigger_sql():
+    triggers = {}
+    for table, (key, columns) in CHANGE_TABLES.items():
+        student_id = "{row}.student_id"
+        inserted = ", ".join(f"'{BLOB_COLUMNS.get(col, col)}', {change_value('NEW', col)}" for col in columns)
+        changed = " || ".join(f"""CASE WHEN NEW.{col} IS NOT OLD.{col} THEN '"{BLOB_COLUMNS.get(col, col)}":' || json_quote({change_value('NEW', col)}) || ',' ELSE '' END"""
+                              for col in columns)
+        any_changed = " OR ".join(f"NEW.{col} IS NOT OLD.{col}" for col in columns)
+        insert = ("INSERT INTO change_events (table_name, op, row_key, student_id, data, recorded_at) "
+                  "VALUES ('{table}', '{op}', {row}.{key}, {student_id}, {data}, datetime('now', 'localtime'))")
+        triggers[f'change_{table}_insert'] = f'''CREATE TRIGGER change_{table}_insert AFTER INSERT ON {table} BEGIN
+                         {insert.format(table=table, op='insert', row='NEW', key=key, student_id=student_id.format(row='NEW'),
+                                        data=f"json_object({inserted})")};
+                     END'''
+        triggers[f'change_{table}_update'] = f'''CREATE TRIGGER change_{table}_update AFTER UPDATE ON {table} WHEN {any_changed} BEGIN
+                         {insert.format(table=table, op='update', row='NEW', key=key, student_id=student_id.format(row='NEW'),
+                                        data=f"'{{' || rtrim({changed}, ',') || '}}'")};
+                     END'''
+        triggers[f'change_{table}_delete'] = f'''CREATE TRIGGER change_{table}_delete AFTER DELETE ON {table} BEGIN
+                         {insert.format(table=table, op='delete', row='OLD', key=key, student_id=student_id.format(row='OLD'),
+                                        data='NULL')};
+                     END'''
+    return triggers
+
+# Create the change triggers that are missing or out of date. Unchanged ones are
+# left alone: init_db runs on every page load, and touching the schema would make
+# every open connection re-prepare its statements.
+def create_change_triggers(c):
+    installed = dict(c.execute("SELECT name, sql FROM sqlite_master WHERE type = 'trigger' AND name LIKE 'change\\_%' ESCAPE '\\'").fetchall())
+    for name, sql in change_trigger_sql().items():
+        if installed.get(name) != sql:
+            c.execute(f"DROP TRIGGER IF EXISTS {name}")
+            c.execute(sql)
+
+# Drop the change triggers, e.g. around a bulk load that should not be logged row by row
+def drop_change_triggers(c):
+    for table in CHANGE_TABLES:
+        for op in ('insert', 'update', 'delete'):
+            c.execute(f"DROP TRIGGER IF EXISTS change_{table}_{op}")
+
+# Start the balance ledger from students' current balances
+def open_balance_ledger(c):
+    c.execute('''INSERT INTO balance_ledger (student_id, source, reference, delta, balance_after, recorded_at)
+                 SELECT student_id, 'opening', NULL, net, net, ?
+                 FROM (SELECT student_id, COALESCE(outstanding_balance, 0.0) - COALESCE(extra_balance, 0.0) AS net FROM students)
+                 WHERE net != 0.0''', (datetime.now().strftime("%Y-%m-%d %H:%M:%S"),))
+
+# Record a change to a student's net balance in the ledger
+def record_balance_change(c, student_id, source, reference, delta, balance_after):
+    c.execute('''INSERT INTO balance_ledger (student_id, source, reference, delta, balance_after, recorded_at)
+                 VALUES (?, ?, ?, ?, ?, ?)''',
+              (student_id, source, reference, delta, balance_after, datetime.now().strftime("%Y-%m-%d %H:%M:%S")))
+
+# Generate next student ID in EPSXXXX format
+def get_next_student_id():
+    conn = None
+    try:
+        conn = get_connection()
+        c = conn.cursor()
+        # Order by length first so EPS10000 sorts after EPS9999; the matching index avoids a sort
+        c.execute("SELECT student_id FROM students WHERE student_id LIKE 'EPS%' ORDER BY LENGTH(student_id) DESC, student_id DESC LIMIT 1")
+        last_id = c.fetchone()
+        if last_id:
+            last_number = int(last_id[0].replace('EPS', ''))
+            next_number = last_number + 1
+        else:
+            next_number = 1001
+        student_id = f'EPS{next_number:04d}'
+        return student_id
+    finally:
+        if conn:
+            conn.close()
+
+# Passwords are stored as salted scrypt hashes ("scrypt$n$r$p$salt$hash"), or
+# PBKDF2 where Python's OpenSSL has no scrypt. Unsalted sha256 hex digests from
+# older databases still verify and are rehashed on the next successful login.
+SCRYPT_PARAMS = (2 ** 14, 8, 1)
+PBKDF2_ITERATIONS = 600000
+
+def hash_password(password, salt=None):
+    salt = salt or secrets.token_bytes(16)
+    if hasattr(hashlib, 'scrypt'):
+        n, r, p = SCRYPT_PARAMS
+        digest = hashlib.scrypt(password.encode(), salt=salt, n=n, r=r, p=p)
+        return f"scrypt${n}${r}${p}${salt.hex()}${digest.hex()}"
+    digest = hashlib.pbkdf2_hmac('sha256', password.encode(), salt, PBKDF2_ITERATIONS)
+    return f"pbkdf2_sha256${PBKDF2_ITERATIONS}${salt.hex()}${digest.hex()}"
+
+# Returns (matches, should be rehashed with the current scheme)
+def check_password(password, stored):
+    scheme, _, rest = stored.partition('$')
+    if scheme == 'scrypt':
+        n, r, p, salt, digest = rest.split('$')
+        n, r, p = int(n), int(r), int(p)
+        actual = hashlib.scrypt(password.encode(), salt=bytes.fromhex(salt), n=n, r=r, p=p)
+        current = hasattr(hashlib, 'scrypt') and (n, r, p) == SCRYPT_PARAMS
+    elif scheme == 'pbkdf2_sha256':
+        iterations, salt, digest = rest.split('$')
+        actual = hashlib.pbkdf2_hmac('sha256', password.encode(), bytes.fromhex(salt), int(iterations))
+        current = not hasattr(hashlib, 'scrypt') and int(iterations) >= PBKDF2_ITERATIONS
+    else:
+        digest, actual, current = stored, hashlib.sha256(password.encode()).digest(), False
+    return hmac.compare_digest(actual.hex(), digest), not current
+
+# Verify login credentials, upgrading an old-style hash once the password is known
+def verify_login(username, password):
+    conn = None
+    try:
+        conn = get_connection()
+        c = conn.cursor()
+        c.execute("SELECT password FROM users WHERE username = ?", (username,))
+        user = c.fetchone()
+        if user is None:
+            # Same work as a real check, so unknown usernames take as long
+            hash_password(password)
+            return False
+        matches, outdated = check_password(password, user[0])
+        if matches and outdated:
+            c.execute("UPDATE users SET password = ? WHERE username = ? AND password = ?",
+                      (hash_password(password), username, user[0]))
+            conn.commit()
+        return matches
+    finally:
+        if conn:
+            conn.close()
+
+# Set a user's password, creating the user if needed, and sign them out
+# everywhere; returns how many sessions were ended
+def set_password(username, password):
+    if not username or not password:
+        raise ValueError("Username and password are required")
+    conn = None
+    try:
+        conn = get_connection()
+        conn.execute('''INSERT INTO users (username, password) VALUES (?, ?)
+                        ON CONFLICT (username) DO UPDATE SET password = excluded.password''',
+                     (username, hash_password(password)))
+        c = conn.execute("DELETE FROM sessions WHERE username = ?", (username,))
+        conn.commit()
+        import auth  # auth imports db
+        auth.forget_user(username)
+        return c.rowcount
+    finally:
+        if conn:
+            conn.close()
+
+# Add student to database
+def add_student(data):
+    conn = None
+    try:
+        conn = get_connection()
+        c = conn.cursor()
+        student_id = get_next_student_id()
+        c.execute('''INSERT INTO students (student_id, first_name, middle_name, last_name, mother_name, father_name,
+                   address, email, mobile_number, dob, class_name, whatsapp_no, gender, doa, roll_number, outstanding_balance, extra_balance)
+                   VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, 0.0, 0.0)''',
+                  (student_id, *data))
+        record_household(c, student_id, data[4], data[3], data[7])
+        conn.commit()
+        return student_id
+    finally:
+        if conn:
+            conn.close()
+
+# Fetch all students
+def get_all_students(primary=False):
+    import pandas as pd
+    conn = None
+    try:
+        conn = get_read_connection(primary)
+        df = pd.read_sql_query("SELECT * FROM students", conn)
+        return df
+    finally:
+        if conn:
+            conn.close()
+
+# Fetch student by ID
+def get_student(student_id):
+    conn = None
+    try:
+        conn = get_connection()
+        c = conn.cursor()
+        c.row_factory = record_factory(Student)
+        c.execute(f"SELECT {', '.join(Student._fields)} FROM students WHERE student_id = ?", (student_id,))
+        student = c.fetchone()
+        return student
+    finally:
+        if conn:
+            conn.close()
+
+# Update student's outstanding and extra balances
+def update_balances(c, student_id, new_outstanding, new_extra):
+    c.execute("UPDATE students SET outstanding_balance = ?, extra_balance = ? WHERE student_id = ?",
+              (new_outstanding, new_extra, student_id))
+
+# Record payment
+def record_payment(student_id, school_fee, bus_fee, amount):
+    conn = None
+    max_retries = 3
+    retry_delay = 1
+    
+    for attempt in range(max_retries):
+        try:
+            conn = get_connection()
+            c = conn.cursor()
+            
+            payment_id = f'PAY{str(uuid.uuid4())[:8]}'
+            payment_date = datetime.now().strftime("%Y-%m-%d")
+            
+            c.execute("INSERT INTO payments (payment_id, student_id, amount, payment_date) VALUES (?, ?, ?, ?)",
+                      (payment_id, student_id, amount, payment_date))
+            
+            total_due = school_fee + bus_fee
+            
+            c.execute("SELECT outstanding_balance, extra_balance, class_name FROM students WHERE student_id = ?", (student_id,))
+            current_outstanding, current_extra, class_name = c.fetchone()
+            current_outstanding = current_outstanding or 0.0
+            current_extra = current_extra or 0.0
+            
+            effective_total_due = total_due - current_extra
+            effective_total_due = max(0, effective_total_due)
+            transaction_difference = amount - effective_total_due
+            
+            if total_due == 0:
+                # Charges were already posted to the balance; pay against it
+                remaining = current_outstanding - current_extra - amount
+                new_outstanding = max(0.0, remaining)
+                new_extra = max(0.0, -remaining)
+                transaction_outstanding = new_outstanding
+                transaction_extra = new_extra
+            elif transaction_difference < 0:
+                new_outstanding = current_outstanding - transaction_difference
+                new_extra = 0.0
+                transaction_outstanding = -transaction_difference
+                transaction_extra = 0.0
+            else:
+                new_outstanding = 0.0
+                new_extra = transaction_difference
+                transaction_outstanding = 0.0
+                transaction_extra = transaction_difference if transaction_difference > 0 else 0.0
+            
+            update_balances(c, student_id, new_outstanding, new_extra)
+            record_balance_change(c, student_id, 'payment', payment_id, (new_outstanding - new_extra) - (current_outstanding - current_extra),
+                                  new_outstanding - new_extra)
+            c.execute('''INSERT INTO daily_collections (collection_date, class_name, payments, amount) VALUES (?, ?, 1, ?)
+                         ON CONFLICT (collection_date, class_name)
+                         DO UPDATE SET payments = payments + 1, amount = amount + excluded.amount''',
+                      (payment_date, class_name or '', amount))
+            
+            conn.commit()
+            return (payment_id, payment_date, transaction_outstanding, transaction_extra, new_outstanding, new_extra)
+        
+        except sqlite3.OperationalError as e:
+            if "database is locked" in str(e) and attempt < max_retries - 1:
+                print(f"Database is locked, retrying ({attempt + 1}/{max_retries})...")
+                time.sleep(retry_delay)
+                continue
+            else:
+                print(f"Database error in record_payment: {e}")
+                raise
+        except Exception as e:
+            print(f"Error in record_payment: {e}")
+            raise
+        finally:
+            if conn:
+                conn.close()
+
+DOCUMENT_TABLES = {
+    'invoice': ('invoices', 'invoice_id'),
+    'receipt': ('receipts', 'receipt_id'),
+    'report_card': ('report_cards', 'report_id'),
+}
+
+DOCUMENT_RECORDS = {
+    'invoice': Invoice,
+    'receipt': Receipt,
+    'report_card': ReportCard,
+}
+
+ARCHIVE_DIR = 'archive'
+MAX_ATTACHED_ARCHIVES = 8
+
+# Path of the per-year archive database for a closed academic year
+def archive_path(academic_year):
+    return os.path.join(ARCHIVE_DIR, f'school_{academic_year}.db')
+
+# Documents of one kind filed under a student or covering them as a sibling on a
+# family invoice or receipt: a WHERE condition on the id column and its params
+def student_documents_condition(kind, student_id, id_column=None):
+    id_column = id_column or DOCUMENT_TABLES[kind][1]
+    return (f"(student_id = ? OR {id_column} IN (SELECT document_id FROM main.document_members WHERE kind = ? AND student_id = ?))",
+            [student_id, kind, student_id])
+
+# Index a family document under every student it covers
+def record_document_members(c, kind, document_id, student_ids):
+    c.executemany("INSERT OR IGNORE INTO document_members (kind, document_id, student_id) VALUES (?, ?, ?)",
+                  [(kind, document_id, student_id) for student_id in student_ids])
+
+# Archived academic years that hold documents matching a search
+def find_archived_years(conn, kind, student_id=None, academic_year=None):
+    if student_id:
+        condition, params = student_documents_condition(kind, student_id, 'document_id')
+        query = f"SELECT DISTINCT academic_year FROM archived_documents WHERE kind = ? AND {condition}"
+        params = [kind] + params
+    else:
+        query = f"SELECT academic_year FROM archived_years WHERE {DOCUMENT_TABLES[kind][0]} > 0"
+        params = []
+    if academic_year:
+        query += " AND academic_year = ?"
+        params.append(academic_year)
+    c = conn.cursor()
+    c.execute(query, params)
+    return [row[0] for row in c.fetchall()]
+
+# ATTACH the archives of the given years a few at a time. Yields one list of
+# (schema, academic_year) per batch, the live database ('main', None) first;
+# each batch is DETACHed before the next one is attached.
+def attached_archives(conn, years):
+    chunks = [years[i:i + MAX_ATTACHED_ARCHIVES] for i in range(0, len(years), MAX_ATTACHED_ARCHIVES)] or [[]]
+    for chunk_no, chunk in enumerate(chunks):
+        schemas = [('main', None)] if chunk_no == 0 else []
+        attached = []
+        try:
+            for year in chunk:
+                path = archive_path(year)
+                if not os.path.exists(path):
+                    print(f"Archive for {year} is missing: {path}")
+                    continue
+                schema = f'archive_{len(attached)}'
+                conn.execute("ATTACH DATABASE ? AS " + schema, (path,))
+                attached.append((schema, year))
+            schemas += attached
+            if schemas:
+                yield schemas
+        finally:
+            for schema, _ in attached:
+                conn.execute("DETACH DATABASE " + schema)
+
+# Run a document search over the live table plus the archived years it needs and
+# return typed records, newest first. Archives are ATTACHed only for the duration
+# of the query, a few at a time.
+def query_documents(conn, kind, where, params, years):
+    table = DOCUMENT_TABLES[kind][0]
+    record = DOCUMENT_RECORDS[kind]
+    columns = ', '.join(record._fields)
+    documents = []
+    for schemas in attached_archives(conn, years):
+        query = " UNION ALL ".join(f"SELECT {columns} FROM {schema}.{table} WHERE {where}" for schema, _ in schemas)
+        query += " ORDER BY generated_date DESC"
+        c = conn.cursor()
+        c.row_factory = record_factory(record)
+        c.execute(query, params * len(schemas))
+        documents.extend(c.fetchall())
+    if len(years) > MAX_ATTACHED_ARCHIVES:
+        documents.sort(key=lambda document: document.generated_date, reverse=True)
+    return documents
+
+# Save invoice to database
+def save_invoice(student_id, school_fee, bus_fee, pdf_buffer, invoice_id):
+    conn = None
+    try:
+        conn = get_connection()
+        insert_invoice(conn.cursor(), student_id, school_fee, bus_fee, pdf_buffer, invoice_id)
+        conn.commit()
+        return invoice_id
+    finally:
+        if conn:
+            conn.close()
+
+def insert_invoice(c, student_id, school_fee, bus_fee, pdf_buffer, invoice_id):
+    c.execute("INSERT INTO invoices (invoice_id, student_id, school_fee, bus_fee, pdf_data, generated_date) VALUES (?, ?, ?, ?, ?, ?)",
+              (invoice_id, student_id, school_fee, bus_fee, pdf_buffer.getvalue(), datetime.now().strftime("%Y-%m-%d %H:%M:%S")))
+
+# Search invoices by student ID
+def search_invoices(student_id, primary=False):
+    conn = None
+    try:
+        conn = get_read_connection(primary)
+        where = "1=1"
+        params = []
+        if student_id:
+            condition, params = student_documents_condition('invoice', student_id)
+            where += " AND " + condition
+        years = find_archived_years(conn, 'invoice', student_id)
+        return query_documents(conn, 'invoice', where, params, years)
+    finally:
+        if conn:
+            conn.close()
+
+# Save receipt to database
+def save_receipt(student_id, payment_id, pdf_buffer):
+    conn = None
+    try:
+        conn = get_connection()
+        c = conn.cursor()
+        receipt_id = f'REC{str(uuid.uuid4())[:8]}'
+        generated_date = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+        pdf_data = pdf_buffer.getvalue()
+        c.execute("INSERT INTO receipts (receipt_id, student_id, payment_id, pdf_data, generated_date) VALUES (?, ?, ?, ?, ?)",
+                  (receipt_id, student_id, payment_id, pdf_data, generated_date))
+        conn.commit()
+        return receipt_id
+    finally:
+        if conn:
+            conn.close()
+
+# Search receipts by student ID
+def search_receipts(student_id, primary=False):
+    conn = None
+    try:
+        conn = get_read_connection(primary)
+        where = "1=1"
+        params = []
+        if student_id:
+            condition, params = student_documents_condition('receipt', student_id)
+            where += " AND " + condition
+        years = find_archived_years(conn, 'receipt', student_id)
+        return query_documents(conn, 'receipt', where, params, years)
+    finally:
+        if conn:
+            conn.close()
+
+# Save report card (and the marks on it) to database
+def save_report_card(student_id, academic_year, pdf_buffer, results=None):
+    conn = None
+    try:
+        conn = get_connection()
+        c = conn.cursor()
+        report_id = f'REP{str(uuid.uuid4())[:8]}'
+        generated_date = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+        pdf_data = pdf_buffer.getvalue()
+        c.execute("INSERT INTO report_cards (report_id, student_id, academic_year, pdf_data, generated_date) VALUES (?, ?, ?, ?, ?)",
+                  (report_id, student_id, academic_year, pdf_data, generated_date))
+        # The card's marks, (student_id, subject, marks) rows, replace the student's
+        # previous ones so the academic performance report reflects the latest card
+        if results:
+            c.execute("DELETE FROM results WHERE student_id = ?", (student_id,))
+            c.executemany("INSERT INTO results (student_id, subject, marks) VALUES (?, ?, ?)", results)
+        conn.commit()
+        return report_id
+    finally:
+        if conn:
+            conn.close()
+
+# Search report cards by student ID and academic year
+def search_report_cards(student_id, academic_year, primary=False):
+    conn = None
+    try:
+        conn = get_read_connection(primary)
+        where = "1=1"
+        params = []
+        if student_id:
+            where += " AND student_id = ?"
+            params.append(student_id)
+        if academic_year:
+            where += " AND academic_year = ?"
+            params.append(academic_year)
+        years = find_archived_years(conn, 'report_card', student_id, academic_year)
+        return query_documents(conn, 'report_card', where, params, years)
+    finally:
+        if conn:
+            conn.close()
+
+# Fetch the stored PDF of an invoice, receipt or report card by its ID
+def get_document_pdf(kind, document_id):
+    table, id_column = DOCUMENT_TABLES[kind]
+    conn = None
+    try:
+        conn = get_connection()
+        c = conn.cursor()
+        c.execute(f"SELECT pdf_data FROM {table} WHERE {id_column} = ?", (document_id,))
+        row = c.fetchone()
+        if row:
+            return row[0]
+        c.execute("SELECT academic_year FROM archived_documents WHERE kind = ? AND document_id = ?", (kind, document_id))
+        archived = c.fetchone()
+        if not archived or not os.path.exists(archive_path(archived[0])):
+            return None
+        archive_conn = sqlite3.connect(archive_path(archived[0]), timeout=10)
+        try:
+            row = archive_conn.execute(f"SELECT pdf_data FROM {table} WHERE {id_column} = ?", (document_id,)).fetchone()
+        finally:
+            archive_conn.close()
+        return row[0] if row else None
+    finally:
+        if conn:
+            conn.close()
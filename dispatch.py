@@ -0,0 +1,508 @@
+import asyncio
+import base64
+import json
+import os
+import queue
+import re
+import smtplib
+import ssl
+import time
+from concurrent.futures import ThreadPoolExecutor
+from email import policy as email_policy
+from email.message import EmailMessage
+from email.utils import formataddr, formatdate, make_msgid
+from typing import NamedTuple
+
+import db
+import jobs
+import printing
+
+# Stored documents are queued per channel in the dispatches table and sent by an
+# asyncio loop per channel: at most CONCURRENCY sends in flight, RATE_LIMITS
+# sends per second, failed sends retried after RETRY_DELAYS. Transports are
+# plain objects with `async send(message)` returning the provider's reference.
+CHANNELS = ('email', 'whatsapp')
+CONTACT_COLUMNS = {'email': 's.email', 'whatsapp': 's.whatsapp_no'}
+# An email is queued only if it is one bare address: a single @ and none of the
+# spaces, commas, angle brackets or line breaks that would let a stored value
+# add recipients or headers
+EMAIL_PATTERN = re.compile(r"[A-Za-z0-9.!#$%&'*+/=?^_`{|}~-]+@[A-Za-z0-9-]+(\.[A-Za-z0-9-]+)+")
+EMAIL_CHECK = ("(TRIM(s.email) LIKE '%_@_%._%' AND INSTR(SUBSTR(TRIM(s.email), INSTR(TRIM(s.email), '@') + 1), '@') = 0"
+               " AND TRIM(s.email) NOT GLOB '*[^A-Za-z0-9.!#$%&''*+/=?^_`{|}~@-]*')")
+CONTACT_CHECKS = {'email': EMAIL_CHECK, 'whatsapp': "TRIM(COALESCE(s.whatsapp_no, '')) != ''"}
+CONCURRENCY = {'email': 8, 'whatsapp': 16}
+RATE_LIMITS = {'email': 10.0, 'whatsapp': 20.0}
+RETRY_DELAYS = (10, 60, 300, 1800)
+MAX_ATTEMPTS = len(RETRY_DELAYS) + 1
+# A run waits for retries due within this many seconds; later ones are left for the next run
+RETRY_WAIT_SECONDS = 60
+LEASE_SECONDS = 600
+CLAIM_BATCH = 200
+
+SCHOOL_NAME = "Evergreen Public School"
+DOCUMENT_TITLES = {'invoice': 'Fee Invoice', 'receipt': 'Payment Receipt', 'report_card': 'Result Card'}
+
+# Transport settings come from the environment so the worker, the CLI and the
+# UI all send through the same servers. The defaults point at sandbox.py.
+SMTP_HOST = os.environ.get('SCHOOL_SMTP_HOST', 'localhost')
+SMTP_PORT = int(os.environ.get('SCHOOL_SMTP_PORT', '1025'))
+SMTP_USER = os.environ.get('SCHOOL_SMTP_USER')
+SMTP_PASSWORD = os.environ.get('SCHOOL_SMTP_PASSWORD')
+SMTP_STARTTLS = os.environ.get('SCHOOL_SMTP_STARTTLS', '') not in ('', '0', 'no')
+SMTP_SENDER = os.environ.get('SCHOOL_SMTP_SENDER', 'office@evergreen.school')
+WHATSAPP_URL = os.environ.get('SCHOOL_WHATSAPP_URL', 'http://127.0.0.1:8025/messages')
+WHATSAPP_TOKEN = os.environ.get('SCHOOL_WHATSAPP_TOKEN')
+COUNTRY_CODE = os.environ.get('SCHOOL_COUNTRY_CODE', '91')
+
+DISPATCH_COLUMNS = ['id', 'kind', 'document_id', 'student_id', 'channel', 'recipient', 'status', 'attempts',
+                    'next_attempt_at', 'provider_ref', 'error', 'created_at', 'sent_at']
+
+class DeliveryError(Exception):
+    # permanent: retrying cannot help (bad address, rejected by the provider);
+    # retry_after: seconds the provider asked us to wait
+    def __init__(self, message, permanent=False, retry_after=None):
+        super().__init__(message)
+        self.permanent = permanent
+        self.retry_after = retry_after
+
+class Message(NamedTuple):
+    id: int
+    kind: str
+    document_id: str
+    student_id: str
+    student_name: str
+    channel: str
+    recipient: str
+    attempts: int
+    pdf_data: bytes
+
+def valid_email(address):
+    return bool(address) and EMAIL_PATTERN.fullmatch(address) is not None
+
+def filename(message):
+    return f"{message.kind}_{message.document_id}.pdf"
+
+def caption(message):
+    return f"{DOCUMENT_TITLES[message.kind]} {message.document_id} for {message.student_name}"
+
+# Queue stored documents for the students' email and/or WhatsApp. Documents
+# already queued or sent on a channel are skipped unless resend=True.
+def queue_documents(kind, channels=CHANNELS, class_name=None, student_id=None, start=None, end=None, period=None,
+                    academic_year=None, resend=False):
+    unknown = set(channels) - set(CHANNELS)
+    if unknown or not channels:
+        raise ValueError(f"Channels must be chosen from: {', '.join(CHANNELS)}")
+    selection, params = printing.document_selection(kind, class_name, student_id, start, end, period, academic_year)
+    id_column = db.DOCUMENT_TABLES[kind][1]
+    joiner = " AND " if " WHERE " in selection else " WHERE "
+    if resend:
+        conflict = '''DO UPDATE SET recipient = excluded.recipient, status = 'queued', attempts = 0,
+                      next_attempt_at = excluded.next_attempt_at, lease_expires = NULL, provider_ref = NULL,
+                      error = NULL, sent_at = NULL'''
+    else:
+        conflict = "DO NOTHING"
+    conn = None
+    try:
+        conn = db.get_connection()
+        c = conn.cursor()
+        now = jobs.now_text()
+        c.execute("BEGIN IMMEDIATE")
+        try:
+            c.execute(f"SELECT COUNT(*), {', '.join(f'COALESCE(SUM({CONTACT_CHECKS[ch]}), 0)' for ch in channels)}"
+                      + selection, params)
+            documents, *reachable = c.fetchone()
+            queued = {}
+            for channel in channels:
+                c.execute(f'''INSERT INTO dispatches (kind, document_id, student_id, channel, recipient, next_attempt_at, created_at)
+                              SELECT ?, d.{id_column}, d.student_id, ?, TRIM({CONTACT_COLUMNS[channel]}), ?, ?'''
+                          + selection + joiner + CONTACT_CHECKS[channel]
+                          + f" ON CONFLICT (kind, document_id, channel) {conflict}",
+                          [kind, channel, now, now] + params)
+                queued[channel] = c.rowcount
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+    finally:
+        if conn:
+            conn.close()
+    return {'kind': kind, 'documents': documents, 'queued': queued,
+            'no_contact': {channel: documents - count for channel, count in zip(channels, reachable)}}
+
+# Lease up to `limit` due messages on a channel (queued and due, or sending with
+# an expired lease) and load their PDFs
+def claim_messages(channel, limit):
+    conn = None
+    try:
+        conn = db.get_connection()
+        c = conn.cursor()
+        now = jobs.now_text()
+        c.execute("BEGIN IMMEDIATE")
+        c.execute('''SELECT id FROM dispatches WHERE channel = ?
+                       AND ((status = 'queued' AND next_attempt_at <= ?) OR (status = 'sending' AND lease_expires < ?))
+                     ORDER BY next_attempt_at, id LIMIT ?''', (channel, now, now, limit))
+        ids = [row[0] for row in c.fetchall()]
+        if not ids:
+            conn.rollback()
+            return []
+        placeholders = ", ".join("?" for _ in ids)
+        c.execute(f"UPDATE dispatches SET status = 'sending', attempts = attempts + 1, lease_expires = ? WHERE id IN ({placeholders})",
+                  [jobs.now_text(LEASE_SECONDS)] + ids)
+        c.execute(f'''SELECT id, kind, document_id, student_id, channel, recipient, attempts FROM dispatches
+                      WHERE id IN ({placeholders}) ORDER BY id''', ids)
+        rows = c.fetchall()
+        conn.commit()
+        documents = {}
+        for kind in {row[1] for row in rows}:
+            table, id_column = db.DOCUMENT_TABLES[kind]
+            document_ids = [row[2] for row in rows if row[1] == kind]
+            c.execute(f'''SELECT d.{id_column}, d.pdf_data, TRIM(COALESCE(s.first_name, '') || ' ' || COALESCE(s.last_name, ''))
+                          FROM {table} d LEFT JOIN students s ON s.student_id = d.student_id
+                          WHERE d.{id_column} IN ({", ".join("?" for _ in document_ids)})''', document_ids)
+            for document_id, pdf_data, name in c.fetchall():
+                documents[kind, document_id] = (pdf_data, name)
+    finally:
+        if conn:
+            conn.close()
+    messages = []
+    for message_id, kind, document_id, student_id, channel, recipient, attempts in rows:
+        pdf_data, name = documents.get((kind, document_id), (None, ''))
+        messages.append(Message(message_id, kind, document_id, student_id, name or student_id, channel, recipient,
+                                attempts, pdf_data))
+    return messages
+
+# Store the outcome of each send: (message, status, provider_ref, error, retry_after)
+# where status is 'sent', 'retry' or 'failed'. Returns the counts.
+def record_outcomes(outcomes):
+    sent, retry, failed = [], [], []
+    for message, status, reference, error, retry_after in outcomes:
+        if status == 'retry' and message.attempts >= MAX_ATTEMPTS:
+            status = 'failed'
+        if status == 'sent':
+            sent.append((reference, jobs.now_text(), message.id))
+        elif status == 'retry':
+            delay = max(RETRY_DELAYS[message.attempts - 1], retry_after or 0)
+            retry.append((jobs.now_text(delay), error, message.id))
+        else:
+            failed.append((error, message.id))
+    conn = None
+    try:
+        conn = db.get_connection()
+        c = conn.cursor()
+        c.execute("BEGIN IMMEDIATE")
+        try:
+            c.executemany('''UPDATE dispatches SET status = 'sent', provider_ref = ?, sent_at = ?, error = NULL,
+                             lease_expires = NULL WHERE id = ?''', sent)
+            c.executemany('''UPDATE dispatches SET status = 'queued', next_attempt_at = ?, error = ?,
+                             lease_expires = NULL WHERE id = ?''', retry)
+            c.executemany("UPDATE dispatches SET status = 'failed', error = ?, lease_expires = NULL WHERE id = ?", failed)
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+    finally:
+        if conn:
+            conn.close()
+    return {'sent': len(sent), 'retried': len(retry), 'failed': len(failed)}
+
+# Seconds until the next queued retry on a channel, or None if nothing is queued
+def next_retry_in(channel):
+    conn = None
+    try:
+        conn = db.get_connection()
+        row = conn.execute("SELECT MIN(next_attempt_at) FROM dispatches WHERE channel = ? AND status = 'queued'",
+                           (channel,)).fetchone()
+    finally:
+        if conn:
+            conn.close()
+    if row[0] is None:
+        return None
+    return max(0.0, time.mktime(time.strptime(row[0], "%Y-%m-%d %H:%M:%S")) - time.time())
+
+# Spaces sends on one channel evenly at `rate` per second (no limit when rate is falsy)
+class RateLimiter:
+    def __init__(self, rate):
+        self.interval = 1.0 / rate if rate else 0.0
+        self.next_slot = 0.0
+
+    async def wait(self):
+        if not self.interval:
+            return
+        now = time.monotonic()
+        slot = max(now, self.next_slot)
+        self.next_slot = slot + self.interval
+        if slot > now:
+            await asyncio.sleep(slot - now)
+
+# Send through SMTP. smtplib blocks, so sends run on the event loop's thread pool,
+# each reusing an idle connection when there is one.
+class SmtpTransport:
+    channel = 'email'
+
+    def __init__(self, host=None, port=None, sender=None, username=None, password=None, starttls=None, timeout=30):
+        self.host = host or SMTP_HOST
+        self.port = port or SMTP_PORT
+        self.sender = sender or SMTP_SENDER
+        self.username = username or SMTP_USER
+        self.password = password or SMTP_PASSWORD
+        self.starttls = SMTP_STARTTLS if starttls is None else starttls
+        self.timeout = timeout
+        self.idle = queue.SimpleQueue()
+
+    def connect(self):
+        smtp = smtplib.SMTP(self.host, self.port, timeout=self.timeout)
+        if self.starttls:
+            smtp.starttls(context=ssl.create_default_context())
+        if self.username:
+            smtp.login(self.username, self.password or '')
+        return smtp
+
+    # The message as bytes. EmailMessage refuses header values containing CR/LF,
+    # and the recipient must be exactly one address.
+    def build(self, message):
+        if not valid_email(message.recipient):
+            raise DeliveryError(f"Not a single email address: {message.recipient!r}", permanent=True)
+        message_id = make_msgid(domain=self.sender.rpartition('@')[2] or 'localhost')
+        email = EmailMessage()
+        email['From'] = formataddr((SCHOOL_NAME, self.sender))
+        email['To'] = message.recipient
+        email['Subject'] = f"{caption(message)} - {SCHOOL_NAME}"
+        email['Date'] = formatdate(localtime=True)
+        email['Message-ID'] = message_id
+        email.set_content(f"Dear Parent,\n\nPlease find attached the {caption(message)}.\n\nRegards,\n{SCHOOL_NAME}\n")
+        email.add_attachment(message.pdf_data, maintype='application', subtype='pdf', filename=filename(message))
+        return message_id, email.as_bytes(policy=email_policy.SMTP)
+
+    def send_blocking(self, message):
+        message_id, data = self.build(message)
+        for attempt in range(2):
+            try:
+                smtp = self.idle.get_nowait()
+                reused = True
+            except queue.Empty:
+                smtp, reused = None, False
+            try:
+                smtp = smtp or self.connect()
+                smtp.sendmail(self.sender, [message.recipient], data)
+            except smtplib.SMTPServerDisconnected as e:
+                self.release(smtp, broken=True)
+                # An idle connection the server has since closed: try once on a fresh one
+                if reused and attempt == 0:
+                    continue
+                raise DeliveryError(f"SMTP connection lost: {e}")
+            except smtplib.SMTPRecipientsRefused as e:
+                self.idle.put(smtp)
+                code, reply = next(iter(e.recipients.values()))
+                raise DeliveryError(f"Recipient refused: {code} {reply.decode(errors='replace')}", permanent=code >= 500)
+            except smtplib.SMTPResponseException as e:
+                self.release(smtp, broken=True)
+                raise DeliveryError(f"SMTP error: {e.smtp_code} {e.smtp_error.decode(errors='replace')}",
+                                    permanent=e.smtp_code >= 500)
+            except (OSError, smtplib.SMTPException) as e:
+                self.release(smtp, broken=True)
+                raise DeliveryError(f"SMTP error: {e}")
+            self.idle.put(smtp)
+            return message_id
+
+    def release(self, smtp, broken=False):
+        if smtp is None:
+            return
+        try:
+            smtp.close() if broken else smtp.quit()
+        except (OSError, smtplib.SMTPException):
+            pass
+
+    async def send(self, message):
+        return await asyncio.get_running_loop().run_in_executor(None, self.send_blocking, message)
+
+    async def close(self):
+        while True:
+            try:
+                self.release(self.idle.get_nowait())
+            except queue.Empty:
+                return
+
+# Digits of a WhatsApp number with the country code, e.g. 919876543210
+def whatsapp_number(number, country_code=None):
+    digits = re.sub(r'\D', '', number or '')
+    country_code = country_code or COUNTRY_CODE
+    if len(digits) == 11 and digits.startswith('0'):
+        digits = digits[1:]
+    if len(digits) == 10:
+        digits = country_code + digits
+    if not 11 <= len(digits) <= 15:
+        raise DeliveryError(f"Not a WhatsApp number: {number}", permanent=True)
+    return digits
+
+# POST each document as JSON to a WhatsApp gateway, asynchronously through
+# Tornado's HTTP client (Tornado ships with Streamlit). Gateways with another
+# request format plug in by overriding request_body.
+class WhatsAppTransport:
+    channel = 'whatsapp'
+
+    def __init__(self, url=None, token=None, country_code=None, max_clients=None, timeout=30):
+        self.url = url or WHATSAPP_URL
+        self.token = token or WHATSAPP_TOKEN
+        self.country_code = country_code or COUNTRY_CODE
+        self.max_clients = max_clients or CONCURRENCY['whatsapp']
+        self.timeout = timeout
+        self.client = None
+
+    def request_body(self, message):
+        return json.dumps({'to': whatsapp_number(message.recipient, self.country_code), 'type': 'document',
+                           'document': {'filename': filename(message), 'caption': caption(message),
+                                        'data': base64.b64encode(message.pdf_data).decode('ascii')}})
+
+    async def send(self, message):
+        from tornado.httpclient import AsyncHTTPClient
+        if self.client is None:
+            self.client = AsyncHTTPClient(force_instance=True, max_clients=self.max_clients)
+        headers = {'Content-Type': 'application/json'}
+        if self.token:
+            headers['Authorization'] = f"Bearer {self.token}"
+        response = await self.client.fetch(self.url, method='POST', headers=headers, body=self.request_body(message),
+                                           request_timeout=self.timeout, raise_error=False)
+        if response.code == 599:
+            raise DeliveryError(f"WhatsApp gateway unreachable: {response.error}")
+        if 200 <= response.code < 300:
+            try:
+                return str(json.loads(response.body or b'{}').get('id', ''))
+            except (ValueError, AttributeError):
+                return ''
+        detail = (response.body or b'').decode(errors='replace')[:200]
+        if response.code == 429 or response.code >= 500:
+            retry_after = response.headers.get('Retry-After', '')
+            raise DeliveryError(f"WhatsApp gateway busy: HTTP {response.code} {detail}",
+                                retry_after=float(retry_after) if retry_after.isdigit() else None)
+        raise DeliveryError(f"WhatsApp gateway refused: HTTP {response.code} {detail}", permanent=True)
+
+    async def close(self):
+        if self.client is not None:
+            self.client.close()
+            self.client = None
+
+TRANSPORTS = {'email': SmtpTransport, 'whatsapp': WhatsAppTransport}
+
+async def deliver(transport, message, semaphore, limiter):
+    async with semaphore:
+        if message.pdf_data is None:
+            return message, 'failed', None, "Document is no longer in the database", None
+        await limiter.wait()
+        try:
+            return message, 'sent', await transport.send(message), None, None
+        except DeliveryError as e:
+            return message, 'failed' if e.permanent else 'retry', None, str(e), e.retry_after
+        except Exception as e:
+            return message, 'retry', None, f"{type(e).__name__}: {e}", None
+
+# Claim and send one channel's due messages a batch at a time until none are
+# left (waiting for retries due soon), recording each batch in one transaction
+async def run_channel(channel, transport, concurrency, rate, limit, totals, report):
+    loop = asyncio.get_running_loop()
+    semaphore, limiter = asyncio.Semaphore(concurrency), RateLimiter(rate)
+    batch_size = max(CLAIM_BATCH, concurrency * 4)
+    claimed = 0
+    while limit is None or claimed < limit:
+        batch = await loop.run_in_executor(None, claim_messages, channel,
+                                           batch_size if limit is None else min(batch_size, limit - claimed))
+        if not batch:
+            wait = await loop.run_in_executor(None, next_retry_in, channel)
+            if wait is None or wait > RETRY_WAIT_SECONDS:
+                return
+            await asyncio.sleep(max(wait, 0.5))
+            continue
+        claimed += len(batch)
+        outcomes = await asyncio.gather(*(deliver(transport, message, semaphore, limiter) for message in batch))
+        counts = await loop.run_in_executor(None, record_outcomes, outcomes)
+        for key in ('sent', 'retried', 'failed'):
+            totals[channel][key] += counts[key]
+        await report()
+
+async def run_channels(channels, transports, concurrency, rates, limit, progress):
+    loop = asyncio.get_running_loop()
+    loop.set_default_executor(ThreadPoolExecutor(max_workers=sum(concurrency[ch] for ch in channels) + 2))
+    totals = {channel: {'sent': 0, 'retried': 0, 'failed': 0} for channel in channels}
+    due = pending_count(channels)
+
+    # progress() writes to the jobs table, so it runs on the thread pool rather
+    # than blocking the event loop. The job's lease is renewed by the worker's
+    # own heartbeat thread, so waiting on retries cannot lose it.
+    async def report():
+        if progress:
+            done = sum(t['sent'] + t['failed'] for t in totals.values())
+            await loop.run_in_executor(None, progress, min(1.0, done / due) if due else 1.0,
+                                       ", ".join(f"{channel}: {t['sent']} sent, {t['failed']} failed"
+                                                 for channel, t in totals.items()))
+
+    try:
+        await asyncio.gather(*(run_channel(channel, transports[channel], concurrency[channel], rates.get(channel), limit,
+                                           totals, report) for channel in channels))
+    finally:
+        for channel in channels:
+            await transports[channel].close()
+    return totals
+
+# Send everything due on the given channels. concurrency is one number for every
+# channel or a {channel: n} dict; rates are sends per second (0 = unlimited).
+def send_dispatches(channels=CHANNELS, transports=None, concurrency=None, rates=None, limit=None, progress=None):
+    channels = list(channels)
+    unknown = set(channels) - set(CHANNELS)
+    if unknown or not channels:
+        raise ValueError(f"Channels must be chosen from: {', '.join(CHANNELS)}")
+    transports = dict(transports or {})
+    for channel in channels:
+        transports.setdefault(channel, TRANSPORTS[channel]())
+    if isinstance(concurrency, int):
+        concurrency = {channel: concurrency for channel in channels}
+    concurrency = {**CONCURRENCY, **(concurrency or {})}
+    rates = {**RATE_LIMITS, **{channel: rate for channel, rate in (rates or {}).items() if rate is not None}}
+    started = time.perf_counter()
+    totals = asyncio.run(run_channels(channels, transports, concurrency, rates, limit, progress))
+    seconds = time.perf_counter() - started
+    result = {key: sum(t[key] for t in totals.values()) for key in ('sent', 'retried', 'failed')}
+    result.update({'pending': pending_count(channels), 'seconds': round(seconds, 3),
+                   'per_second': round(result['sent'] / seconds, 1) if seconds else 0.0, 'channels': totals})
+    return result
+
+# Messages still to send (queued or in flight) on the given channels
+def pending_count(channels=CHANNELS):
+    conn = None
+    try:
+        conn = db.get_connection()
+        return conn.execute(f'''SELECT COUNT(*) FROM dispatches WHERE status IN ('queued', 'sending')
+                                AND channel IN ({", ".join("?" for _ in channels)})''', list(channels)).fetchone()[0]
+    finally:
+        if conn:
+            conn.close()
+
+# Message counts per kind, channel and status
+def delivery_status():
+    conn = None
+    try:
+        conn = db.get_connection()
+        c = conn.cursor()
+        c.execute('''SELECT kind, channel, status, COUNT(*), MAX(sent_at) FROM dispatches
+                     GROUP BY kind, channel, status ORDER BY kind, channel, status''')
+        return [dict(zip(['kind', 'channel', 'status', 'messages', 'last_sent_at'], row)) for row in c.fetchall()]
+    finally:
+        if conn:
+            conn.close()
+
+def list_dispatches(status=None, channel=None, student_id=None, limit=50):
+    conn = None
+    try:
+        conn = db.get_connection()
+        c = conn.cursor()
+        query = f"SELECT {', '.join(DISPATCH_COLUMNS)} FROM dispatches"
+        where, params = [], []
+        for condition, value in (("status = ?", status), ("channel = ?", channel), ("student_id = ?", student_id)):
+            if value:
+                where.append(condition)
+                params.append(value)
+        if where:
+            query += " WHERE " + " AND ".join(where)
+        c.execute(query + " ORDER BY id DESC LIMIT ?", params + [limit])
+        return [dict(zip(DISPATCH_COLUMNS, row)) for row in c.fetchall()]
+    finally:
+        if conn:
+            conn.close()
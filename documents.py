@@ -0,0 +1,623 @@
+import io
+from datetime import datetime
+
+# Generate PDF invoice
+def generate_invoice(student, school_fee, bus_fee, invoice_id, invoice_date=None):
+    from reportlab.lib.pagesizes import A5
+    from reportlab.lib import colors
+    from reportlab.platypus import SimpleDocTemplate, Table, TableStyle, Paragraph, Spacer
+    from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
+    from reportlab.lib.units import inch
+    buffer = io.BytesIO()
+    pdf = SimpleDocTemplate(buffer, pagesize=A5, topMargin=0.3*inch, bottomMargin=0.3*inch, leftMargin=0.3*inch, rightMargin=0.3*inch)
+    elements = []
+    styles = getSampleStyleSheet()
+    
+    bold_center = ParagraphStyle(name='BoldCenter', fontSize=12, alignment=1, fontName='Helvetica-Bold', textColor=colors.black)
+    subheader_center = ParagraphStyle(name='SubHeaderCenter', fontSize=8, alignment=1, fontName='Helvetica', textColor=colors.grey)
+    normal_center = ParagraphStyle(name='NormalCenter', fontSize=8, alignment=1, fontName='Helvetica')
+    normal_left = ParagraphStyle(name='NormalLeft', fontSize=8, alignment=0, fontName='Helvetica')
+    
+    header_data = [
+        [
+            [
+                Paragraph("Evergreen Public School", bold_center),
+                Spacer(1, 0.05*inch),
+                Paragraph("Tirmohani, Nawada Persauni, Gopalganj, Bihar, Pin Code – 841440", subheader_center),
+                Paragraph("Proprietor: Ansar Ali (Munna)", subheader_center),
+            ]
+        ]
+    ]
+    header_table = Table(header_data, colWidths=[A5[0] - 0.6*inch])
+    header_table.setStyle(TableStyle([
+        ('BOX', (0, 0), (-1, -1), 0.5, colors.black),
+        ('ALIGN', (0, 0), (-1, -1), 'CENTER'),
+        ('VALIGN', (0, 0), (-1, -1), 'MIDDLE'),
+        ('LEFTPADDING', (0, 0), (-1, -1), 4),
+        ('RIGHTPADDING', (0, 0), (-1, -1), 4),
+        ('TOPPADDING', (0, 0), (-1, -1), 4),
+        ('BOTTOMPADDING', (0, 0), (-1, -1), 4),
+        ('BACKGROUND', (0, 0), (-1, -1), colors.lightgrey),
+    ]))
+    elements.append(header_table)
+    elements.append(Spacer(1, 0.1*inch))
+    
+    invoice_date = invoice_date or datetime.now().strftime("%Y-%m-%d")
+    elements.append(Paragraph("Fee Invoice", ParagraphStyle(name='InvoiceTitle', fontSize=10, alignment=1, fontName='Helvetica-Bold')))
+    elements.append(Spacer(1, 0.05*inch))
+    invoice_details_data = [
+        [Paragraph(f"<b>Invoice No:</b> {invoice_id}", normal_left),
+         Paragraph(f"<b>Date:</b> {invoice_date}", normal_left)]
+    ]
+    invoice_details_table = Table(invoice_details_data, colWidths=[(A5[0] - 0.6*inch)/2, (A5[0] - 0.6*inch)/2])
+    invoice_details_table.setStyle(TableStyle([
+        ('VALIGN', (0, 0), (-1, -1), 'TOP'),
+        ('LEFTPADDING', (0, 0), (-1, -1), 2),
+        ('RIGHTPADDING', (0, 0), (-1, -1), 2),
+        ('FONTSIZE', (0, 0), (-1, -1), 8),
+    ]))
+    elements.append(invoice_details_table)
+    elements.append(Spacer(1, 0.1*inch))
+    
+    student_details_data = [
+        [Paragraph(f"<b>Name:</b> {student.first_name} {student.middle_name or ''} {student.last_name}", normal_left),
+         Paragraph(f"<b>Class:</b> {student.class_name}", normal_left)],
+        [Paragraph(f"<b>Student ID:</b> {student.student_id}", normal_left),
+         Paragraph(f"<b>Roll Number:</b> {student.roll_number}", normal_left)]
+    ]
+    student_details_table = Table(student_details_data, colWidths=[(A5[0] - 0.6*inch)/2, (A5[0] - 0.6*inch)/2])
+    student_details_table.setStyle(TableStyle([
+        ('VALIGN', (0, 0), (-1, -1), 'TOP'),
+        ('LEFTPADDING', (0, 0), (-1, -1), 2),
+        ('RIGHTPADDING', (0, 0), (-1, -1), 2),
+        ('FONTSIZE', (0, 0), (-1, -1), 8),
+        ('BOX', (0, 0), (-1, -1), 0.5, colors.grey),
+        ('INNERGRID', (0, 0), (-1, -1), 0.25, colors.grey),
+    ]))
+    elements.append(student_details_table)
+    elements.append(Spacer(1, 0.1*inch))
+    
+    outstanding_balance = student.outstanding_balance or 0.0
+    extra_balance = student.extra_balance or 0.0
+    subtotal = school_fee + bus_fee
+    adjusted_total = subtotal + outstanding_balance - extra_balance
+    adjusted_total = max(0, adjusted_total)
+    
+    fee_data = [
+        ['S.No.', 'Description', 'Amount'],
+        ['1', 'School Fee', f'₹{school_fee:.2f}'],
+        ['2', 'Bus Fee', f'₹{bus_fee:.2f}'],
+    ]
+    row_count = 3
+    if outstanding_balance > 0:
+        fee_data.append([str(row_count), 'Previous Outstanding', f'₹{outstanding_balance:.2f}'])
+        row_count += 1
+    if extra_balance > 0:
+        fee_data.append([str(row_count), 'Previous Extra (Deducted)', f'₹{extra_balance:.2f}'])
+        row_count += 1
+    fee_data.append(['', 'Total', f'₹{adjusted_total:.2f}'])
+    
+    fee_table = Table(fee_data, colWidths=[0.5*inch, (A5[0] - 1.3*inch), 1.2*inch])
+    fee_table.setStyle(TableStyle([
+        ('BACKGROUND', (0, 0), (-1, 0), colors.grey),
+        ('TEXTCOLOR', (0, 0), (-1, 0), colors.whitesmoke),
+        ('ALIGN', (0, 0), (-1, -1), 'CENTER'),
+        ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
+        ('FONTSIZE', (0, 0), (-1, -1), 8),
+        ('BOTTOMPADDING', (0, 0), (-1, 0), 4),
+        ('GRID', (0, 0), (-1, -1), 0.5, colors.black),
+        ('FONTNAME', (1, -1), (2, -1), 'Helvetica-Bold'),
+        ('BACKGROUND', (1, -1), (2, -1), colors.lightgrey),
+        ('BACKGROUND', (1, 2), (2, 2), colors.yellow) if outstanding_balance > 0 else ('BACKGROUND', (0, 0), (0, 0), colors.white),
+        ('BACKGROUND', (1, 3), (2, 3), colors.lightgreen) if extra_balance > 0 and outstanding_balance > 0 else 
+        ('BACKGROUND', (1, 2), (2, 2), colors.lightgreen) if extra_balance > 0 else ('BACKGROUND', (0, 0), (0, 0), colors.white),
+    ]))
+    elements.append(fee_table)
+    elements.append(Spacer(1, 0.2*inch))
+    
+    footer_data = [
+        [Paragraph("________________________", normal_center)],
+        [Paragraph("Authorized Signature", normal_center)],
+        [Paragraph(f"Date: {invoice_date}", normal_center)]
+    ]
+    footer_table = Table(footer_data, colWidths=[A5[0] - 0.6*inch])
+    footer_table.setStyle(TableStyle([
+        ('ALIGN', (0, 0), (-1, -1), 'CENTER'),
+        ('VALIGN', (0, 0), (-1, -1), 'TOP'),
+        ('FONTSIZE', (0, 0), (-1, -1), 8),
+    ]))
+    elements.append(footer_table)
+    
+    pdf.build(elements)
+    buffer.seek(0)
+    return buffer
+
+# Redesigned Payment Receipt with modern design
+def generate_receipt(student, school_fee, bus_fee, amount, payment_id, payment_date, transaction_outstanding, transaction_extra, total_outstanding, total_extra):
+    from reportlab.lib.pagesizes import A5
+    from reportlab.lib import colors
+    from reportlab.platypus import SimpleDocTemplate, Table, TableStyle, Paragraph, Spacer, HRFlowable
+    from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
+    from reportlab.lib.units import inch
+    buffer = io.BytesIO()
+    pdf = SimpleDocTemplate(buffer, pagesize=A5, topMargin=0.3*inch, bottomMargin=0.3*inch, leftMargin=0.3*inch, rightMargin=0.3*inch)
+    elements = []
+    styles = getSampleStyleSheet()
+    
+    # Define modern styles
+    bold_center = ParagraphStyle(name='BoldCenter', fontSize=12, alignment=1, fontName='Helvetica-Bold', textColor=colors.black)
+    subheader_center = ParagraphStyle(name='SubHeaderCenter', fontSize=8, alignment=1, fontName='Helvetica', textColor=colors.grey)
+    normal_center = ParagraphStyle(name='NormalCenter', fontSize=8, alignment=1, fontName='Helvetica')
+    normal_left = ParagraphStyle(name='NormalLeft', fontSize=8, alignment=0, fontName='Helvetica')
+    title_style = ParagraphStyle(name='Title', fontSize=14, alignment=1, fontName='Helvetica-Bold', textColor=colors.darkblue, spaceAfter=6)
+    label_style = ParagraphStyle(name='Label', fontSize=8, fontName='Helvetica-Bold', alignment=0)
+    
+    # Modern Header
+    header_data = [
+        [
+            Paragraph("[School Logo]", normal_center),  # Placeholder for logo
+            [
+                Paragraph("Evergreen Public School", bold_center),
+                Spacer(1, 0.05*inch),
+                Paragraph("Tirmohani, Nawada Persauni", subheader_center),
+                Paragraph("Gopalganj, Bihar – 841440", subheader_center),
+                Paragraph("Proprietor: Ansar Ali (Munna)", subheader_center),
+            ]
+        ]
+    ]
+    header_table = Table(header_data, colWidths=[1*inch, A5[0] - 1.6*inch])
+    header_table.setStyle(TableStyle([
+        ('BOX', (0, 0), (-1, -1), 0.5, colors.black),
+        ('ALIGN', (0, 0), (-1, -1), 'CENTER'),
+        ('VALIGN', (0, 0), (-1, -1), 'MIDDLE'),
+        ('LEFTPADDING', (0, 0), (-1, -1), 4),
+        ('RIGHTPADDING', (0, 0), (-1, -1), 4),
+        ('TOPPADDING', (0, 0), (-1, -1), 4),
+        ('BOTTOMPADDING', (0, 0), (-1, -1), 4),
+        ('BACKGROUND', (0, 0), (-1, -1), colors.lightgrey),
+    ]))
+    elements.append(header_table)
+    elements.append(Spacer(1, 0.1*inch))
+    
+    # Receipt Title and Details
+    elements.append(Paragraph("Payment Receipt", title_style))
+    receipt_details_data = [
+        [Paragraph(f"<b>Payment ID:</b> {payment_id}", normal_left),
+         Paragraph(f"<b>Date:</b> {payment_date}", normal_left)]
+    ]
+    receipt_details_table = Table(receipt_details_data, colWidths=[(A5[0] - 0.6*inch)/2, (A5[0] - 0.6*inch)/2])
+    receipt_details_table.setStyle(TableStyle([
+        ('VALIGN', (0, 0), (-1, -1), 'TOP'),
+        ('LEFTPADDING', (0, 0), (-1, -1), 2),
+        ('RIGHTPADDING', (0, 0), (-1, -1), 2),
+        ('FONTSIZE', (0, 0), (-1, -1), 8),
+    ]))
+    elements.append(receipt_details_table)
+    elements.append(Spacer(1, 0.1*inch))
+    
+    # Student Information
+    student_data = [
+        [Paragraph(f"<b>Name:</b> {student.first_name} {student.middle_name or ''} {student.last_name}", normal_left),
+         Paragraph(f"<b>Class:</b> {student.class_name}", normal_left)],
+        [Paragraph(f"<b>Student ID:</b> {student.student_id}", normal_left),
+         Paragraph(f"<b>Roll Number:</b> {student.roll_number}", normal_left)],
+    ]
+    student_table = Table(student_data, colWidths=[(A5[0] - 0.6*inch)/2, (A5[0] - 0.6*inch)/2])
+    student_table.setStyle(TableStyle([
+        ('VALIGN', (0, 0), (-1, -1), 'TOP'),
+        ('LEFTPADDING', (0, 0), (-1, -1), 2),
+        ('RIGHTPADDING', (0, 0), (-1, -1), 2),
+        ('FONTSIZE', (0, 0), (-1, -1), 8),
+        ('BOX', (0, 0), (-1, -1), 0.5, colors.grey),
+        ('INNERGRID', (0, 0), (-1, -1), 0.25, colors.grey),
+    ]))
+    elements.append(student_table)
+    elements.append(Spacer(1, 0.1*inch))
+    
+    # Fee Details Table
+    total_due = school_fee + bus_fee
+    due_label = 'Total Due'
+    if total_due == 0:
+        # Payment against a balance that already includes posted charges
+        total_due = student.outstanding_balance or 0.0
+        due_label = 'Balance Due'
+    previous_extra = student.extra_balance or 0.0
+    effective_total_due = max(0, total_due - previous_extra)
+    payment_type = "Full Payment" if amount >= effective_total_due else "Partial Payment"
+    
+    data = [
+        ['Description', 'Amount'],
+        ['School Fee', f'₹{school_fee:.2f}'],
+        ['Bus Fee', f'₹{bus_fee:.2f}'],
+        [due_label, f'₹{total_due:.2f}'],
+    ]
+    row_count = 4
+    if previous_extra > 0:
+        data.append(['Previous Extra (Deducted)', f'₹{previous_extra:.2f}'])
+        data.append(['Effective Total Due', f'₹{effective_total_due:.2f}'])
+        row_count += 2
+    data.extend([
+        ['Amount Paid', f'₹{amount:.2f}'],
+        ['Outstanding (This Transaction)', f'₹{transaction_outstanding:.2f}'],
+    ])
+    row_count += 2
+    if transaction_extra > 0:
+        data.append(['Extra Amount (This Transaction)', f'₹{transaction_extra:.2f}'])
+        row_count += 1
+    data.extend([
+        ['Total Outstanding Balance', f'₹{total_outstanding:.2f}'],
+        ['Total Extra Balance', f'₹{total_extra:.2f}'],
+        ['Payment Type', payment_type]
+    ])
+    
+    table = Table(data, colWidths=[3*inch, 1.5*inch])
+    table.setStyle(TableStyle([
+        ('BACKGROUND', (0, 0), (-1, 0), colors.grey),
+        ('TEXTCOLOR', (0, 0), (-1, 0), colors.whitesmoke),
+        ('ALIGN', (0, 0), (-1, -1), 'CENTER'),
+        ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
+        ('FONTSIZE', (0, 0), (-1, -1), 8),
+        ('BOTTOMPADDING', (0, 0), (-1, 0), 4),
+        ('GRID', (0, 0), (-1, -1), 0.5, colors.black),
+        ('FONTNAME', (0, row_count-5), (0, row_count-1), 'Helvetica-Bold'),
+        ('BACKGROUND', (0, 1), (-1, 1), colors.white),
+        ('BACKGROUND', (0, 2), (-1, 2), colors.lightgrey),
+        ('BACKGROUND', (0, 3), (-1, 3), colors.white),
+        ('BACKGROUND', (0, row_count-5), (-1, row_count-5), colors.lightgreen if amount >= effective_total_due else colors.lightcoral),
+        ('BACKGROUND', (0, row_count-4), (-1, row_count-4), colors.yellow if transaction_outstanding > 0 else colors.lightgrey),
+        ('BACKGROUND', (0, row_count-3), (-1, row_count-3), colors.lightgreen) if transaction_extra > 0 else ('BACKGROUND', (0, 0), (0, 0), colors.white),
+        ('BACKGROUND', (0, row_count-2), (-1, row_count-2), colors.yellow if total_outstanding > 0 else colors.lightgrey),
+        ('BACKGROUND', (0, row_count-1), (-1, row_count-1), colors.lightgreen if total_extra > 0 else colors.lightgrey),
+        ('BACKGROUND', (0, row_count), (-1, row_count), colors.lightblue),
+    ]))
+    elements.append(table)
+    elements.append(Spacer(1, 0.1*inch))
+    
+    # Divider Line
+    elements.append(HRFlowable(width="100%", thickness=0.5, color=colors.grey))
+    elements.append(Spacer(1, 0.05*inch))
+    
+    # Modern Footer
+    footer_data = [
+        [Paragraph(f"Date: {payment_date}", normal_left),
+         Paragraph("Thank you for your payment!", normal_center),
+         Paragraph("Authorized Signature: __________________", normal_left)]
+    ]
+    footer_table = Table(footer_data, colWidths=[1.5*inch, 1.5*inch, 2*inch])
+    footer_table.setStyle(TableStyle([
+        ('VALIGN', (0, 0), (-1, -1), 'TOP'),
+        ('FONTSIZE', (0, 0), (-1, -1), 8),
+    ]))
+    elements.append(footer_table)
+    
+    pdf.build(elements)
+    buffer.seek(0)
+    return buffer
+
+# Header shared by the family invoice and receipt: school, title and the parents they are addressed to
+def family_header(title, number_label, number, when, student, note=''):
+    from reportlab.lib.pagesizes import A5
+    from reportlab.lib import colors
+    from reportlab.platypus import Table, TableStyle, Paragraph, Spacer
+    from reportlab.lib.styles import ParagraphStyle
+    from reportlab.lib.units import inch
+    bold_center = ParagraphStyle(name='BoldCenter', fontSize=12, alignment=1, fontName='Helvetica-Bold', textColor=colors.black)
+    subheader_center = ParagraphStyle(name='SubHeaderCenter', fontSize=8, alignment=1, fontName='Helvetica', textColor=colors.grey)
+    normal_left = ParagraphStyle(name='NormalLeft', fontSize=8, alignment=0, fontName='Helvetica')
+    width = A5[0] - 0.6*inch
+    header_table = Table([[[
+        Paragraph("Evergreen Public School", bold_center),
+        Spacer(1, 0.05*inch),
+        Paragraph("Tirmohani, Nawada Persauni, Gopalganj, Bihar, Pin Code – 841440", subheader_center),
+        Paragraph("Proprietor: Ansar Ali (Munna)", subheader_center),
+    ]]], colWidths=[width])
+    header_table.setStyle(TableStyle([
+        ('BOX', (0, 0), (-1, -1), 0.5, colors.black),
+        ('ALIGN', (0, 0), (-1, -1), 'CENTER'),
+        ('VALIGN', (0, 0), (-1, -1), 'MIDDLE'),
+        ('TOPPADDING', (0, 0), (-1, -1), 4),
+        ('BOTTOMPADDING', (0, 0), (-1, -1), 4),
+        ('BACKGROUND', (0, 0), (-1, -1), colors.lightgrey),
+    ]))
+    details = [
+        [Paragraph(f"<b>{number_label}:</b> {number}", normal_left), Paragraph(f"<b>Date:</b> {when}", normal_left)],
+        [Paragraph(f"<b>Father's Name:</b> {student.father_name}", normal_left),
+         Paragraph(f"<b>Mother's Name:</b> {student.mother_name}", normal_left)],
+        [Paragraph(f"<b>Mobile:</b> {student.mobile_number or ''}", normal_left), Paragraph(note, normal_left)],
+    ]
+    details_table = Table(details, colWidths=[width/2, width/2])
+    details_table.setStyle(TableStyle([
+        ('VALIGN', (0, 0), (-1, -1), 'TOP'),
+        ('LEFTPADDING', (0, 0), (-1, -1), 2),
+        ('RIGHTPADDING', (0, 0), (-1, -1), 2),
+        ('BOX', (0, 1), (-1, -1), 0.5, colors.grey),
+        ('INNERGRID', (0, 1), (-1, -1), 0.25, colors.grey),
+    ]))
+    return [header_table, Spacer(1, 0.1*inch),
+            Paragraph(title, ParagraphStyle(name='FamilyTitle', fontSize=10, alignment=1, fontName='Helvetica-Bold')),
+            Spacer(1, 0.05*inch), details_table, Spacer(1, 0.1*inch)]
+
+# Generate one PDF invoice for siblings. lines are (student, school_fee, bus_fee)
+# with the student's balance before these fees, as for generate_invoice.
+def generate_family_invoice(lines, invoice_id, period):
+    from reportlab.lib.pagesizes import A5
+    from reportlab.lib import colors
+    from reportlab.platypus import SimpleDocTemplate, Table, TableStyle, Paragraph, Spacer
+    from reportlab.lib.styles import ParagraphStyle
+    from reportlab.lib.units import inch
+    buffer = io.BytesIO()
+    pdf = SimpleDocTemplate(buffer, pagesize=A5, topMargin=0.3*inch, bottomMargin=0.3*inch, leftMargin=0.3*inch, rightMargin=0.3*inch)
+    small_left = ParagraphStyle(name='SmallLeft', fontSize=7, alignment=0, fontName='Helvetica', leading=8)
+    normal_center = ParagraphStyle(name='NormalCenter', fontSize=8, alignment=1, fontName='Helvetica')
+    invoice_date = datetime.now().strftime("%Y-%m-%d")
+    elements = family_header("Family Fee Invoice", "Invoice No", invoice_id, invoice_date, lines[0][0],
+                             f"<b>Fees for:</b> {period}")
+
+    fee_data = [['S.No.', 'Student', 'School Fee', 'Bus Fee', 'Previous Due', 'Less Advance', 'Amount']]
+    totals = [0.0] * 5
+    for idx, (student, school_fee, bus_fee) in enumerate(lines, 1):
+        outstanding_balance = student.outstanding_balance or 0.0
+        extra_balance = student.extra_balance or 0.0
+        amount = max(0, school_fee + bus_fee + outstanding_balance - extra_balance)
+        for i, value in enumerate((school_fee, bus_fee, outstanding_balance, extra_balance, amount)):
+            totals[i] += value
+        name = f"{student.first_name} {student.middle_name or ''} {student.last_name}".replace('  ', ' ')
+        fee_data.append([str(idx), Paragraph(f"{name}<br/>Class {student.class_name}, Roll {student.roll_number} ({student.student_id})", small_left),
+                         f'₹{school_fee:.2f}', f'₹{bus_fee:.2f}', f'₹{outstanding_balance:.2f}', f'₹{extra_balance:.2f}', f'₹{amount:.2f}'])
+    fee_data.append(['', 'Total'] + [f'₹{value:.2f}' for value in totals])
+
+    fee_table = Table(fee_data, colWidths=[0.35*inch, 1.55*inch, 0.66*inch, 0.66*inch, 0.66*inch, 0.66*inch, 0.66*inch])
+    fee_table.setStyle(TableStyle([
+        ('BACKGROUND', (0, 0), (-1, 0), colors.grey),
+        ('TEXTCOLOR', (0, 0), (-1, 0), colors.whitesmoke),
+        ('ALIGN', (0, 0), (-1, -1), 'CENTER'),
+        ('VALIGN', (0, 0), (-1, -1), 'MIDDLE'),
+        ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
+        ('FONTSIZE', (0, 0), (-1, -1), 7),
+        ('GRID', (0, 0), (-1, -1), 0.5, colors.black),
+        ('FONTNAME', (1, -1), (-1, -1), 'Helvetica-Bold'),
+        ('BACKGROUND', (1, -1), (-1, -1), colors.lightgrey),
+    ]))
+    elements.append(fee_table)
+    elements.append(Spacer(1, 0.1*inch))
+    elements.append(Paragraph(f"<b>Total payable for the family: ₹{totals[4]:.2f}</b>", normal_center))
+    elements.append(Spacer(1, 0.2*inch))
+    elements.append(Paragraph("________________________", normal_center))
+    elements.append(Paragraph("Authorized Signature", normal_center))
+
+    pdf.build(elements)
+    buffer.seek(0)
+    return buffer
+
+# Generate one PDF receipt for a payment shared between siblings. allocations are
+# (student_id, class_name, balance_before, paid, balance_after) with net balances
+# (negative = advance); students maps student IDs to their records.
+def generate_family_receipt(students, allocations, amount, payment_id, payment_date):
+    from reportlab.lib.pagesizes import A5
+    from reportlab.lib import colors
+    from reportlab.platypus import SimpleDocTemplate, Table, TableStyle, Paragraph, Spacer, HRFlowable
+    from reportlab.lib.styles import ParagraphStyle
+    from reportlab.lib.units import inch
+    buffer = io.BytesIO()
+    pdf = SimpleDocTemplate(buffer, pagesize=A5, topMargin=0.3*inch, bottomMargin=0.3*inch, leftMargin=0.3*inch, rightMargin=0.3*inch)
+    small_left = ParagraphStyle(name='SmallLeft', fontSize=7, alignment=0, fontName='Helvetica', leading=8)
+    normal_center = ParagraphStyle(name='NormalCenter', fontSize=8, alignment=1, fontName='Helvetica')
+    lead = students[allocations[0][0]]
+    elements = family_header("Family Payment Receipt", "Payment ID", payment_id, payment_date, lead)
+
+    def balance(value):
+        return f'₹{value:.2f}' if value >= 0 else f'₹{-value:.2f} adv.'
+
+    data = [['Student', 'Due Before', 'Paid', 'Due After']]
+    due_after = 0.0
+    for student_id, class_name, balance_before, paid, balance_after, _ in allocations:
+        student = students[student_id]
+        name = f"{student.first_name} {student.middle_name or ''} {student.last_name}".replace('  ', ' ')
+        data.append([Paragraph(f"{name}<br/>Class {class_name}, Roll {student.roll_number} ({student_id})", small_left),
+                     balance(balance_before), f'₹{paid:.2f}', balance(balance_after)])
+        due_after += balance_after
+    data.append(['Total', '', f'₹{amount:.2f}', balance(due_after)])
+    table = Table(data, colWidths=[2.2*inch, 1*inch, 1*inch, 1*inch])
+    table.setStyle(TableStyle([
+        ('BACKGROUND', (0, 0), (-1, 0), colors.grey),
+        ('TEXTCOLOR', (0, 0), (-1, 0), colors.whitesmoke),
+        ('ALIGN', (1, 0), (-1, -1), 'CENTER'),
+        ('VALIGN', (0, 0), (-1, -1), 'MIDDLE'),
+        ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
+        ('FONTSIZE', (0, 0), (-1, -1), 8),
+        ('GRID', (0, 0), (-1, -1), 0.5, colors.black),
+        ('FONTNAME', (0, -1), (-1, -1), 'Helvetica-Bold'),
+        ('BACKGROUND', (0, -1), (-1, -1), colors.lightgreen if due_after <= 0 else colors.yellow),
+    ]))
+    elements.append(table)
+    elements.append(Spacer(1, 0.1*inch))
+    elements.append(HRFlowable(width="100%", thickness=0.5, color=colors.grey))
+    elements.append(Spacer(1, 0.05*inch))
+    elements.append(Paragraph("Thank you for your payment!", normal_center))
+    elements.append(Spacer(1, 0.15*inch))
+    elements.append(Paragraph("Authorized Signature: __________________", normal_center))
+
+    pdf.build(elements)
+    buffer.seek(0)
+    return buffer
+
+# Generate PDF result card
+def generate_result_card(student, results, academic_year="2024-2025", attendance_percentage=95):
+    from reportlab.lib.pagesizes import A5
+    from reportlab.lib import colors
+    from reportlab.platypus import SimpleDocTemplate, Table, TableStyle, Paragraph, Spacer
+    from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
+    from reportlab.lib.units import inch
+    buffer = io.BytesIO()
+    pdf = SimpleDocTemplate(buffer, pagesize=A5, topMargin=0.3*inch, bottomMargin=0.3*inch, leftMargin=0.5*inch, rightMargin=0.5*inch)
+    elements = []
+    styles = getSampleStyleSheet()
+    
+    header_style = ParagraphStyle(name='Header', fontSize=16, alignment=1, fontName='Helvetica-Bold', textColor=colors.darkblue)
+    subheader_style = ParagraphStyle(name='SubHeader', fontSize=9, alignment=1, fontName='Helvetica', textColor=colors.grey)
+    normal_center = ParagraphStyle(name='NormalCenter', fontSize=8, alignment=1)
+    normal_center_bold = ParagraphStyle(name='NormalCenterBold', fontSize=8, alignment=1, fontName='Helvetica-Bold')
+    normal_left = ParagraphStyle(name='NormalLeft', fontSize=8, alignment=0)
+    small_left = ParagraphStyle(name='SmallLeft', fontSize=7, alignment=0)
+    
+    header_data = [
+        [
+            [
+                Paragraph("Evergreen Public School", header_style),
+                Spacer(1, 0.05*inch),
+                Paragraph("Tirmohani, Nawada Persauni, Gopalganj, Bihar, Pin Code – 841440", subheader_style),
+                Paragraph("Proprietor: Ansar Ali (Munna)", subheader_style),
+                Spacer(1, 0.05*inch),
+                Paragraph(f"Academic Year: {academic_year}", normal_center_bold),
+            ]
+        ]
+    ]
+    header_table = Table(header_data, colWidths=[A5[0] - 1*inch])
+    header_table.setStyle(TableStyle([
+        ('BOX', (0, 0), (-1, -1), 1, colors.black),
+        ('ALIGN', (0, 0), (-1, -1), 'CENTER'),
+        ('VALIGN', (0, 0), (-1, -1), 'MIDDLE'),
+        ('LEFTPADDING', (0, 0), (-1, -1), 8),
+        ('RIGHTPADDING', (0, 0), (-1, -1), 8),
+        ('TOPPADDING', (0, 0), (-1, -1), 8),
+        ('BOTTOMPADDING', (0, 0), (-1, -1), 8),
+        ('BACKGROUND', (0, 0), (-1, -1), colors.lightgrey),
+    ]))
+    elements.append(header_table)
+    elements.append(Spacer(1, 0.1*inch))
+    
+    student_data = [
+        [Paragraph(f"<b>Name:</b> {student.first_name} {student.middle_name or ''} {student.last_name}", normal_left),
+         Paragraph(f"<b>Class:</b> {student.class_name}", normal_left)],
+        [Paragraph(f"<b>Student ID:</b> {student.student_id}", normal_left),
+         Paragraph(f"<b>Roll Number:</b> {student.roll_number}", normal_left)],
+        [Paragraph(f"<b>Father's Name:</b> {student.father_name}", normal_left),
+         Paragraph(f"<b>Mother's Name:</b> {student.mother_name}", normal_left)],
+        [Paragraph(f"<b>Date of Birth:</b> {student.dob}", normal_left),
+         Paragraph(f"<b>Admission Date:</b> {student.doa}", normal_left)]
+    ]
+    student_table = Table(student_data, colWidths=[2.5*inch, 2.5*inch])
+    student_table.setStyle(TableStyle([
+        ('VALIGN', (0, 0), (-1, -1), 'TOP'),
+        ('LEFTPADDING', (0, 0), (-1, -1), 4),
+        ('RIGHTPADDING', (0, 0), (-1, -1), 4),
+        ('BOX', (0, 0), (-1, -1), 0.5, colors.grey),
+        ('INNERGRID', (0, 0), (-1, -1), 0.25, colors.grey),
+        ('FONTSIZE', (0, 0), (-1, -1), 8),
+    ]))
+    elements.append(student_table)
+    elements.append(Spacer(1, 0.1*inch))
+    
+    max_marks_per_subject = 100
+    passing_marks = 40
+    data = [['S.No.', 'Subject', 'Marks', 'Max', 'Grade', 'Status']]
+    total_marks = 0
+    total_max_marks = 0
+    for idx, result in enumerate(results, 1):
+        marks = result[2]
+        total_marks += marks
+        total_max_marks += max_marks_per_subject
+        if marks >= 90:
+            subject_grade = "A+"
+        elif marks >= 80:
+            subject_grade = "A"
+        elif marks >= 70:
+            subject_grade = "B"
+        elif marks >= 60:
+            subject_grade = "C"
+        elif marks >= 50:
+            subject_grade = "D"
+        elif marks >= 40:
+            subject_grade = "E"
+        else:
+            subject_grade = "F"
+        status = "Pass" if marks >= passing_marks else "Fail"
+        row = [str(idx), result[1], f"{marks:.0f}", f"{max_marks_per_subject:.0f}", subject_grade, status]
+        data.append(row)
+    
+    marks_table = Table(data, colWidths=[0.4*inch, 1.8*inch, 0.8*inch, 0.8*inch, 0.6*inch, 0.6*inch])
+    marks_table.setStyle(TableStyle([
+        ('BACKGROUND', (0, 0), (-1, 0), colors.grey),
+        ('TEXTCOLOR', (0, 0), (-1, 0), colors.whitesmoke),
+        ('ALIGN', (0, 0), (-1, -1), 'CENTER'),
+        ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
+        ('FONTSIZE', (0, 0), (-1, -1), 8),
+        ('BOTTOMPADDING', (0, 0), (-1, 0), 4),
+        ('GRID', (0, 0), (-1, -1), 0.5, colors.black),
+        ('VALIGN', (0, 0), (-1, -1), 'MIDDLE'),
+    ]))
+    for i in range(1, len(data)):
+        status = data[i][5]
+        bg_color = colors.lightgreen if status == "Pass" else colors.lightcoral
+        marks_table.setStyle(TableStyle([
+            ('BACKGROUND', (0, i), (-1, i), bg_color),
+        ]))
+    elements.append(Paragraph("Academic Performance", styles['Heading4']))
+    elements.append(Spacer(1, 0.05*inch))
+    elements.append(marks_table)
+    elements.append(Spacer(1, 0.1*inch))
+    
+    percentage = (total_marks / total_max_marks * 100) if total_max_marks > 0 else 0
+    if percentage >= 90:
+        overall_grade = "A+"
+        remarks = "Outstanding! Keep up the excellent work."
+    elif percentage >= 80:
+        overall_grade = "A"
+        remarks = "Excellent. Continue to strive for greatness."
+    elif percentage >= 70:
+        overall_grade = "B"
+        remarks = "Good. Focus on consistency."
+    elif percentage >= 60:
+        overall_grade = "C"
+        remarks = "Satisfactory. Work on weak areas."
+    elif percentage >= 50:
+        overall_grade = "D"
+        remarks = "Needs improvement. Seek help."
+    elif percentage >= 40:
+        overall_grade = "E"
+        remarks = "Below average. Extra effort needed."
+    else:
+        overall_grade = "F"
+        remarks = "Unsatisfactory. Immediate attention needed."
+    
+    summary_data = [
+        ['Total Marks', f"{total_marks:.0f}"],
+        ['Max Marks', f"{total_max_marks:.0f}"],
+        ['Percentage', f"{percentage:.1f}%"],
+        ['Grade', overall_grade],
+        ['Attendance', f"{attendance_percentage}%"],
+        ['Remarks', remarks]
+    ]
+    summary_table = Table(summary_data, colWidths=[1.2*inch, 3.8*inch])
+    summary_table.setStyle(TableStyle([
+        ('ALIGN', (0, 0), (-1, -1), 'CENTER'),
+        ('FONTNAME', (0, 0), (0, -1), 'Helvetica-Bold'),
+        ('FONTSIZE', (0, 0), (-1, -1), 8),
+        ('BOTTOMPADDING', (0, 0), (-1, -1), 4),
+        ('GRID', (0, 0), (-1, -1), 0.5, colors.black),
+        ('VALIGN', (0, 0), (-1, -1), 'MIDDLE'),
+        ('BACKGROUND', (0, 0), (0, -1), colors.lightgrey),
+        ('BACKGROUND', (1, 3), (1, 3), colors.lightgreen if percentage >= 60 else colors.lightcoral),
+        ('BACKGROUND', (1, 4), (1, 4), colors.lightgreen if attendance_percentage >= 75 else colors.yellow),
+    ]))
+    elements.append(Paragraph("Summary", styles['Heading4']))
+    elements.append(Spacer(1, 0.05*inch))
+    elements.append(summary_table)
+    elements.append(Spacer(1, 0.1*inch))
+    
+    footer_data = [
+        [Paragraph(f"Date: {datetime.now().strftime('%Y-%m-%d')}", small_left),
+         Paragraph("School Stamp", normal_center),
+         Paragraph("____________________", normal_center)],
+        ['', '', Paragraph("Principal's Signature", normal_center)]
+    ]
+    footer_table = Table(footer_data, colWidths=[1.5*inch, 1.5*inch, 2*inch])
+    footer_table.setStyle(TableStyle([
+        ('VALIGN', (0, 0), (-1, -1), 'TOP'),
+        ('FONTSIZE', (0, 0), (-1, -1), 8),
+    ]))
+    elements.append(footer_table)
+    
+    pdf.build(elements)
+    buffer.seek(0)
+    return buffer
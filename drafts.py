@@ -0,0 +1,180 @@
+import hashlib
+import io
+import time
+import uuid
+from datetime import date, datetime, timedelta
+
+import db
+import documents
+import fees
+
+# Rendering an invoice takes a ReportLab build while the parent waits at the
+# counter. During idle hours every student's invoice for the coming period is
+# rendered ahead of time from their current balance and the fee schedule (or
+# the charges already posted) and stored with a fingerprint of everything the
+# invoice prints. At the counter the draft is used if the fingerprint still
+# matches, and rendered afresh only if something changed since. A draft is
+# dated the first day of the period it bills.
+DRAFT_BATCH = 200
+IDLE_HOURS = (22, 6)
+
+# The period to pre-render: this month until its charges are posted, then next month
+def upcoming_period(today=None):
+    today = today or date.today()
+    period = today.strftime("%Y-%m")
+    if fees.get_posting(period) is None:
+        return period
+    return f"{today.year + 1}-01" if today.month == 12 else f"{today.year}-{today.month + 1:02d}"
+
+def invoice_date(period):
+    return f"{period}-01"
+
+# Everything issue_posted_invoice would print for a student, hashed
+def fingerprint(statement, school_fee, bus_fee, period):
+    values = (period, statement.student_id, statement.first_name, statement.middle_name or '', statement.last_name,
+              statement.class_name, statement.roll_number, round(statement.outstanding_balance or 0.0, 2),
+              round(statement.extra_balance or 0.0, 2), round(school_fee, 2), round(bus_fee, 2))
+    return hashlib.blake2b(repr(values).encode(), digest_size=16).hexdigest()
+
+# The invoice statement for a student: this period's fees, and the balance
+# before them split into previous outstanding / extra. Once charges are posted
+# the balance already includes them.
+def statement_for(student, charges, posted):
+    bus_fee = charges.get('bus', 0.0)
+    school_fee = sum(charges.values()) - bus_fee
+    previous = (student.outstanding_balance or 0.0) - (student.extra_balance or 0.0)
+    if posted:
+        previous -= school_fee + bus_fee
+    return student._replace(outstanding_balance=max(0.0, previous), extra_balance=max(0.0, -previous)), school_fee, bus_fee
+
+# Charges per student in a chunk: the posted ones, or what posting would charge
+def chunk_charges(conn, period, posted, student_ids):
+    placeholders = ', '.join('?' for _ in student_ids)
+    if posted:
+        rows = conn.execute(f'''SELECT student_id, fee_head, amount FROM student_charges
+                                WHERE period = ? AND student_id IN ({placeholders})''', [period, *student_ids])
+    else:
+        rows = conn.execute(f'''SELECT s.student_id, f.fee_head, f.amount
+                                FROM students s JOIN fee_schedules f ON f.class_name = s.class_name
+                                WHERE s.student_id IN ({placeholders}) AND {fees.CHARGE_CONDITIONS}''',
+                            [*student_ids, str(int(period[5:]))])
+    charges = {}
+    for student_id, fee_head, amount in rows:
+        charges.setdefault(student_id, {})[fee_head] = amount
+    return charges
+
+# Render drafts for a period (default: the upcoming one), skipping students whose
+# draft is still current. Stops early at `until` (a time.time() value); a later
+# run picks up where it left off since finished drafts are skipped.
+def prerender_invoices(period=None, class_name=None, progress=None, until=None):
+    period = fees.normalise_period(period or upcoming_period())
+    started = time.perf_counter()
+    posted = fees.get_posting(period) is not None
+    rendered = unchanged = students = 0
+    key = ''
+    complete = True
+    conn = None
+    try:
+        conn = db.get_connection()
+        conn.execute("DELETE FROM invoice_drafts WHERE period < ?", (date.today().strftime("%Y-%m"),))
+        conn.commit()
+        total = conn.execute("SELECT COUNT(*) FROM students" + (" WHERE class_name = ?" if class_name else ""),
+                             [class_name] if class_name else []).fetchone()[0]
+        query = f'''SELECT {', '.join('s.' + name for name in db.Student._fields)} FROM students s
+                    WHERE s.student_id > ?{' AND s.class_name = ?' if class_name else ''}
+                      AND NOT EXISTS (SELECT 1 FROM posted_invoices pi WHERE pi.period = ? AND pi.student_id = s.student_id)
+                    ORDER BY s.student_id LIMIT ?'''
+        c = conn.cursor()
+        c.row_factory = db.record_factory(db.Student)
+        while True:
+            if until and time.time() >= until:
+                complete = False
+                break
+            chunk = c.execute(query, [key] + ([class_name] if class_name else []) + [period, DRAFT_BATCH]).fetchall()
+            if not chunk:
+                break
+            key = chunk[-1].student_id
+            student_ids = [student.student_id for student in chunk]
+            charges = chunk_charges(conn, period, posted, student_ids)
+            existing = dict(conn.execute(f'''SELECT student_id, fingerprint FROM invoice_drafts
+                                             WHERE period = ? AND student_id IN ({', '.join('?' for _ in student_ids)})''',
+                                         [period, *student_ids]).fetchall())
+            drafts = []
+            for student in chunk:
+                if student.student_id not in charges:
+                    continue
+                statement, school_fee, bus_fee = statement_for(student, charges[student.student_id], posted)
+                students += 1
+                print_key = fingerprint(statement, school_fee, bus_fee, period)
+                if existing.get(student.student_id) == print_key:
+                    unchanged += 1
+                    continue
+                invoice_id = f'INV{str(uuid.uuid4())[:8]}'
+                pdf_buffer = documents.generate_invoice(statement, school_fee, bus_fee, invoice_id, invoice_date(period))
+                drafts.append((period, student.student_id, print_key, invoice_id, pdf_buffer.getvalue(),
+                               datetime.now().strftime("%Y-%m-%d %H:%M:%S")))
+            conn.executemany("INSERT OR REPLACE INTO invoice_drafts VALUES (?, ?, ?, ?, ?, ?)", drafts)
+            conn.commit()
+            rendered += len(drafts)
+            if progress:
+                progress(min(1.0, students / total) if total else 1.0, f"{rendered} rendered, {unchanged} unchanged")
+            if len(chunk) < DRAFT_BATCH:
+                break
+    finally:
+        if conn:
+            conn.close()
+    return {'period': period, 'charges_posted': posted, 'students': students, 'rendered': rendered,
+            'unchanged': unchanged, 'complete': complete, 'seconds': round(time.perf_counter() - started, 2)}
+
+# Hand out a student's draft if it still prints what the counter would render
+# now. The draft is removed either way: it is used once, or it is out of date.
+def take_draft(period, statement, school_fee, bus_fee):
+    conn = None
+    try:
+        conn = db.get_connection()
+        c = conn.cursor()
+        c.execute("SELECT fingerprint, invoice_id, pdf_data FROM invoice_drafts WHERE period = ? AND student_id = ?",
+                  (period, statement.student_id))
+        row = c.fetchone()
+        if row is None:
+            return None
+        c.execute("DELETE FROM invoice_drafts WHERE period = ? AND student_id = ?", (period, statement.student_id))
+        conn.commit()
+    finally:
+        if conn:
+            conn.close()
+    if row[0] != fingerprint(statement, school_fee, bus_fee, period):
+        return None
+    return row[1], io.BytesIO(row[2])
+
+def draft_status():
+    conn = None
+    try:
+        conn = db.get_connection()
+        return [dict(zip(['period', 'drafts', 'stored_kb', 'last_rendered'], row)) for row in conn.execute(
+            '''SELECT period, COUNT(*), ROUND(SUM(LENGTH(pdf_data)) / 1024.0, 1), MAX(rendered_at)
+               FROM invoice_drafts GROUP BY period ORDER BY period''')]
+    finally:
+        if conn:
+            conn.close()
+
+def in_idle_hours(hour, idle_hours=IDLE_HOURS):
+    start, end = idle_hours
+    return start <= hour < end if start < end else hour >= start or hour < end
+
+# time.time() when the current idle window closes
+def idle_window_end(now, idle_hours=IDLE_HOURS):
+    end = now.replace(hour=idle_hours[1], minute=0, second=0, microsecond=0)
+    if end <= now:
+        end += timedelta(days=1)
+    return end.timestamp()
+
+# Pre-render during idle hours until interrupted, checking every `interval_minutes`
+def run_schedule(interval_minutes=30, idle_hours=IDLE_HOURS):
+    while True:
+        now = datetime.now()
+        if in_idle_hours(now.hour, idle_hours):
+            stats = prerender_invoices(until=idle_window_end(now, idle_hours))
+            print(f"Drafts for {stats['period']}: {stats['rendered']} rendered, {stats['unchanged']} unchanged "
+                  f"({stats['seconds']}s{'' if stats['complete'] else ', stopped at the end of idle hours'})")
+        time.sleep(interval_minutes * 60)
@@ -0,0 +1,373 @@
+import time
+import uuid
+from datetime import datetime
+from typing import NamedTuple
+
+import db
+import documents
+import drafts
+import fees
+
+# Siblings are listed, invoiced and paid for in admission order; the first one
+# is the family's lead student, who the family invoice and receipt are filed under
+SIBLING_ORDER = "LENGTH(s.student_id), s.student_id"
+
+class Family(NamedTuple):
+    household_id: str
+    students: int
+    student_ids: str
+    classes: str
+    father_name: str
+    mother_name: str
+    mobile_number: str
+    outstanding: float
+
+class Allocation(NamedTuple):
+    student_id: str
+    class_name: str
+    balance_before: float
+    paid: float
+    balance_after: float
+    payment_id: str = None
+
+# Rebuild the household index from scratch (overrides are kept and reapplied)
+def rebuild_index():
+    started = time.perf_counter()
+    conn = None
+    try:
+        conn = db.get_connection()
+        c = conn.cursor()
+        c.execute("BEGIN IMMEDIATE")
+        try:
+            students = db.rebuild_households(c)
+            c.execute('''SELECT COUNT(*), COALESCE(SUM(members > 1), 0), COALESCE(SUM(CASE WHEN members > 1 THEN members END), 0)
+                         FROM (SELECT COUNT(*) AS members FROM student_households GROUP BY household_id)''')
+            households, families, siblings = c.fetchone()
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+    finally:
+        if conn:
+            conn.close()
+    return {'students': students, 'households': households, 'families': families, 'students_in_families': siblings,
+            'seconds': round(time.perf_counter() - started, 3)}
+
+# A student's household ID, indexing them first if they were added some other way than add_student
+def household_of(c, student_id):
+    c.execute('''SELECT s.father_name, s.mother_name, s.mobile_number, h.household_id
+                 FROM students s LEFT JOIN student_households h ON h.student_id = s.student_id
+                 WHERE s.student_id = ?''', (student_id,))
+    row = c.fetchone()
+    if not row:
+        raise db.StudentNotFound()
+    if row[3] is None:
+        db.record_household(c, student_id, *row[:3])
+        c.execute("SELECT household_id FROM student_households WHERE student_id = ?", (student_id,))
+        return c.fetchone()[0]
+    return row[3]
+
+# Everyone in a student's household (including them), as student records in admission order
+def siblings(student_id):
+    conn = None
+    try:
+        conn = db.get_connection()
+        c = conn.cursor()
+        household_id = household_of(c, student_id)
+        conn.commit()
+        c.row_factory = db.record_factory(db.Student)
+        c.execute(f'''SELECT {', '.join('s.' + field for field in db.Student._fields)}
+                      FROM student_households h JOIN students s ON s.student_id = h.student_id
+                      WHERE h.household_id = ? ORDER BY {SIBLING_ORDER}''', (household_id,))
+        return c.fetchall()
+    finally:
+        if conn:
+            conn.close()
+
+# Pin students to a household by hand and update their index rows
+def set_overrides(c, student_ids, household_id):
+    created_at = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+    c.executemany("INSERT OR REPLACE INTO household_overrides (student_id, household_id, created_at) VALUES (?, ?, ?)",
+                  [(student_id, household_id, created_at) for student_id in student_ids])
+    c.executemany("UPDATE student_households SET household_id = ? WHERE student_id = ?",
+                  [(household_id, student_id) for student_id in student_ids])
+
+# Mark two students as siblings: the first one's whole household joins the second's
+def link_students(student_id, sibling_id):
+    if student_id == sibling_id:
+        raise ValueError("A student cannot be linked to themselves.")
+    conn = None
+    try:
+        conn = db.get_connection()
+        c = conn.cursor()
+        c.execute("BEGIN IMMEDIATE")
+        try:
+            household_id = household_of(c, sibling_id)
+            moving = [row[0] for row in c.execute("SELECT student_id FROM student_households WHERE household_id = ?",
+                                                  (household_of(c, student_id),))]
+            set_overrides(c, moving, household_id)
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+    finally:
+        if conn:
+            conn.close()
+    return {'household_id': household_id, 'moved': moving}
+
+# Take a student out of their household (e.g. two families sharing a phone) into one of their own
+def separate_student(student_id):
+    conn = None
+    try:
+        conn = db.get_connection()
+        c = conn.cursor()
+        c.execute("BEGIN IMMEDIATE")
+        try:
+            household_of(c, student_id)
+            household_id = db.household_id_for(f'student:{student_id}')
+            set_overrides(c, [student_id], household_id)
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+    finally:
+        if conn:
+            conn.close()
+    return {'student_id': student_id, 'household_id': household_id}
+
+# Drop a student's override so they go back to the household their details match
+def clear_override(student_id):
+    conn = None
+    try:
+        conn = db.get_connection()
+        c = conn.cursor()
+        c.execute("BEGIN IMMEDIATE")
+        try:
+            c.execute("SELECT father_name, mother_name, mobile_number FROM students WHERE student_id = ?", (student_id,))
+            student = c.fetchone()
+            if not student:
+                raise db.StudentNotFound()
+            c.execute("DELETE FROM household_overrides WHERE student_id = ?", (student_id,))
+            cleared = c.rowcount > 0
+            db.record_household(c, student_id, *student)
+            household_id = household_of(c, student_id)
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+    finally:
+        if conn:
+            conn.close()
+    return {'student_id': student_id, 'household_id': household_id, 'cleared': cleared}
+
+# Households with at least min_size students (optionally with someone in one class), largest dues first
+def list_families(class_name=None, min_size=2):
+    query = f'''SELECT household_id, COUNT(*), GROUP_CONCAT(student_id, ', '), GROUP_CONCAT(class_name, ', '),
+                       MAX(CASE WHEN position = 1 THEN father_name END), MAX(CASE WHEN position = 1 THEN mother_name END),
+                       MAX(CASE WHEN position = 1 THEN mobile_number END), SUM(balance)
+                FROM (SELECT h.household_id, s.student_id, s.class_name, s.father_name, s.mother_name, s.mobile_number,
+                             COALESCE(s.outstanding_balance, 0.0) - COALESCE(s.extra_balance, 0.0) AS balance,
+                             ROW_NUMBER() OVER (PARTITION BY h.household_id ORDER BY {SIBLING_ORDER}) AS position
+                      FROM student_households h JOIN students s ON s.student_id = h.student_id
+                      ORDER BY h.household_id, position)
+                GROUP BY household_id HAVING COUNT(*) >= ?'''
+    params = [min_size]
+    if class_name:
+        query += " AND SUM(class_name = ?) > 0"
+        params.append(class_name)
+    conn = None
+    try:
+        conn = db.get_read_connection()
+        c = conn.cursor()
+        c.row_factory = db.record_factory(Family)
+        c.execute(query + " ORDER BY 8 DESC, 1", params)
+        return c.fetchall()
+    finally:
+        if conn:
+            conn.close()
+
+# Students charged in a period without a posted invoice yet, grouped by household in
+# admission order of the lead student. With class_name, every household with
+# someone in that class is invoiced in full.
+def households_to_invoice(period, class_name=None, household_id=None):
+    query = '''SELECT COALESCE(h.household_id, s.student_id), s.student_id
+                FROM students s LEFT JOIN student_households h ON h.student_id = s.student_id
+                WHERE s.student_id IN (SELECT student_id FROM student_charges WHERE period = ?)
+                  AND NOT EXISTS (SELECT 1 FROM posted_invoices pi WHERE pi.period = ? AND pi.student_id = s.student_id)'''
+    params = [period, period]
+    if class_name:
+        query += '''
+                  AND COALESCE(h.household_id, s.student_id) IN (
+                      SELECT COALESCE(h2.household_id, s2.student_id)
+                      FROM students s2 LEFT JOIN student_households h2 ON h2.student_id = s2.student_id
+                      WHERE s2.class_name = ?)'''
+        params.append(class_name)
+    if household_id:
+        query += " AND h.household_id = ?"
+        params.append(household_id)
+    conn = None
+    try:
+        conn = db.get_connection()
+        households = {}
+        for household_id, student_id in conn.execute(query + f" ORDER BY {SIBLING_ORDER}", params):
+            households.setdefault(household_id, []).append(student_id)
+        return list(households.values())
+    finally:
+        if conn:
+            conn.close()
+
+# Render and store one invoice for siblings' posted charges in a period. Each
+# sibling's block shows this period's fees and their balance before them, as
+# service.issue_posted_invoice does; the invoice is filed under the lead student,
+# and posted for and indexed under every sibling on it.
+def issue_family_invoice(student_ids, period):
+    period = fees.normalise_period(period)
+    fees.require_not_invoiced(period, student_ids)
+    lines, total_school, total_bus = [], 0.0, 0.0
+    for student_id in student_ids:
+        student = db.get_student(student_id)
+        if not student:
+            raise db.StudentNotFound()
+        charges = fees.charges_for(student_id, period)
+        if not charges:
+            raise ValueError(f"No charges were posted for {student_id} in {period}.")
+        statement, school_fee, bus_fee = drafts.statement_for(student, charges, True)
+        lines.append((statement, school_fee, bus_fee))
+        total_school += school_fee
+        total_bus += bus_fee
+    invoice_id = f'INV{str(uuid.uuid4())[:8]}'
+    pdf_buffer = documents.generate_family_invoice(lines, invoice_id, period)
+    fees.save_posted_invoice(period, student_ids, total_school, total_bus, pdf_buffer, invoice_id)
+    return {'invoice_id': invoice_id, 'student_ids': list(student_ids), 'period': period,
+            'pdf_size': len(pdf_buffer.getvalue())}
+
+# Invoice a student's posted charges for a period together with any siblings not invoiced for it yet
+def issue_household_invoice(student_id, period):
+    import service
+    period = fees.normalise_period(period)
+    conn = None
+    try:
+        conn = db.get_connection()
+        household_id = household_of(conn.cursor(), student_id)
+        conn.commit()
+    finally:
+        if conn:
+            conn.close()
+    households = households_to_invoice(period, household_id=household_id)
+    if not households:
+        raise ValueError(f"No charges to invoice for {student_id} or their siblings in {period}.")
+    if len(households[0]) == 1:
+        invoice = service.issue_posted_invoice(households[0][0], period)
+        invoice['student_ids'] = [invoice.pop('student_id')]
+        return invoice
+    return issue_family_invoice(households[0], period)
+
+# Invoice a period's posted charges with one invoice per family: households with
+# two or more students to invoice get a family invoice, everyone else their own
+def issue_family_invoices(period, class_name=None, progress=None):
+    import service
+    period = fees.normalise_period(period)
+    households = households_to_invoice(period, class_name)
+    issued, skipped, families, students = [], [], 0, 0
+    total = len(households)
+    for done, student_ids in enumerate(households, 1):
+        try:
+            if len(student_ids) > 1:
+                issued.append(issue_family_invoice(student_ids, period)['invoice_id'])
+                families += 1
+            else:
+                issued.append(service.issue_posted_invoice(student_ids[0], period)['invoice_id'])
+            students += len(student_ids)
+        except ValueError:
+            skipped.extend(student_ids)
+        if progress and (done % 25 == 0 or done == total):
+            progress(done / total, f"{done}/{total} households")
+    return {'issued': issued, 'skipped': skipped, 'family_invoices': families, 'students': students}
+
+# Split a family payment between siblings. balances are (student_id, net balance)
+# in admission order: each sibling's dues are cleared in turn and whatever is left
+# over is held as advance by the first sibling. Returns the amount paid for each.
+def allocate(amount, balances):
+    paid = []
+    remaining = amount
+    for student_id, balance in balances:
+        share = round(min(remaining, max(0.0, balance)), 2)
+        paid.append(share)
+        remaining -= share
+    if paid:
+        paid[0] = round(paid[0] + remaining, 2)
+    return paid
+
+# Record one payment for a whole household: a payments row (with its own payment
+# ID, linked to the household payment ID), balance update, ledger entry and
+# collection total for each sibling it is allocated to, in a single transaction.
+# Returns the household payment ID, which the family receipt carries.
+def record_family_payment(student_id, amount):
+    household_payment_id = f'HPAY{str(uuid.uuid4())[:8]}'
+    payment_date = datetime.now().strftime("%Y-%m-%d")
+    conn = None
+    try:
+        conn = db.get_connection()
+        c = conn.cursor()
+        c.execute("BEGIN IMMEDIATE")
+        try:
+            household_id = household_of(c, student_id)
+            c.execute(f'''SELECT s.student_id, s.class_name,
+                                 COALESCE(s.outstanding_balance, 0.0) - COALESCE(s.extra_balance, 0.0)
+                          FROM student_households h JOIN students s ON s.student_id = h.student_id
+                          WHERE h.household_id = ? ORDER BY {SIBLING_ORDER}''', (household_id,))
+            members = c.fetchall()
+            allocations = []
+            for (member_id, class_name, before), paid in zip(members, allocate(amount, [(m[0], m[2]) for m in members])):
+                after = before - paid
+                if paid <= 0:
+                    allocations.append(Allocation(member_id, class_name, before, paid, after))
+                    continue
+                payment_id = f'PAY{str(uuid.uuid4())[:8]}'
+                allocations.append(Allocation(member_id, class_name, before, paid, after, payment_id))
+                c.execute('''INSERT INTO payments (payment_id, student_id, amount, payment_date, household_payment_id)
+                             VALUES (?, ?, ?, ?, ?)''', (payment_id, member_id, paid, payment_date, household_payment_id))
+                db.update_balances(c, member_id, max(0.0, after), max(0.0, -after))
+                db.record_balance_change(c, member_id, 'payment', payment_id, -paid, after)
+                c.execute('''INSERT INTO daily_collections (collection_date, class_name, payments, amount) VALUES (?, ?, 1, ?)
+                             ON CONFLICT (collection_date, class_name)
+                             DO UPDATE SET payments = payments + 1, amount = amount + excluded.amount''',
+                          (payment_date, class_name or '', paid))
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+    finally:
+        if conn:
+            conn.close()
+    return household_payment_id, payment_date, allocations
+
+# Take one payment from a family (given any sibling's ID), allocate it across the
+# siblings and store a single receipt for it under the lead student, indexed
+# under every sibling it paid for
+def take_family_payment(student_id, amount):
+    if amount <= 0:
+        raise ValueError("Payment Amount must be greater than zero.")
+    payment_id, payment_date, allocations = record_family_payment(student_id, amount)
+    students = {student.student_id: student for student in siblings(student_id)}
+    pdf_buffer = documents.generate_family_receipt(students, allocations, amount, payment_id, payment_date)
+    receipt_id = db.save_receipt(allocations[0].student_id, payment_id, pdf_buffer)
+    conn = None
+    try:
+        conn = db.get_connection()
+        db.record_document_members(conn.cursor(), 'receipt', receipt_id,
+                                   [allocation.student_id for allocation in allocations if allocation.paid > 0])
+        conn.commit()
+    finally:
+        if conn:
+            conn.close()
+    balance = sum(allocation.balance_after for allocation in allocations)
+    return {
+        'payment_id': payment_id,
+        'receipt_id': receipt_id,
+        'payment_date': payment_date,
+        'amount': amount,
+        'allocations': [allocation._asdict() for allocation in allocations],
+        'total_outstanding': round(max(0.0, balance), 2),
+        'total_extra': round(max(0.0, -balance), 2),
+    }
@@ -0,0 +1,268 @@
+import re
+import time
+from datetime import date, datetime
+from typing import NamedTuple
+
+import db
+import reports
+
+FEE_HEADS = ['tuition', 'bus', 'exam']
+
+# The schedule rows that charge student s in a month (parameter: the month number)
+CHARGE_CONDITIONS = '''f.amount > 0
+                       AND (f.months IS NULL OR ',' || f.months || ',' LIKE '%,' || ? || ',%')
+                       AND NOT EXISTS (SELECT 1 FROM fee_exemptions e
+                                       WHERE e.student_id = s.student_id AND e.fee_head = f.fee_head)'''
+
+class FeeSchedule(NamedTuple):
+    class_name: str
+    fee_head: str
+    amount: float
+    months: str
+
+# Validate a posting period and return it as YYYY-MM (default: this month)
+def normalise_period(period=None):
+    period = period or date.today().strftime("%Y-%m")
+    if not re.fullmatch(r'\d{4}-(0[1-9]|1[0-2])', period):
+        raise ValueError(f"Invalid period: {period}. Use YYYY-MM, e.g. 2024-05.")
+    return period
+
+# Turn "9, 3" or [9, 3] into the stored "3,9" form (None/"" = every month)
+def normalise_months(months):
+    if not months:
+        return None
+    if isinstance(months, str):
+        months = [m for m in re.split(r'[\s,]+', months) if m]
+    try:
+        numbers = sorted({int(m) for m in months})
+    except ValueError:
+        raise ValueError(f"Months must be numbers between 1 and 12, got: {months}")
+    if any(m < 1 or m > 12 for m in numbers):
+        raise ValueError(f"Months must be numbers between 1 and 12, got: {months}")
+    return ','.join(str(m) for m in numbers)
+
+def check_fee_head(fee_head):
+    if fee_head not in FEE_HEADS:
+        raise ValueError(f"Unknown fee head: {fee_head}. Use one of: {', '.join(FEE_HEADS)}")
+
+# Create or change the charge for one class and fee head
+def set_fee(class_name, fee_head, amount, months=None):
+    check_fee_head(fee_head)
+    if amount < 0:
+        raise ValueError("Fee amount cannot be negative.")
+    months = normalise_months(months)
+    conn = None
+    try:
+        conn = db.get_connection()
+        conn.execute('''INSERT INTO fee_schedules (class_name, fee_head, amount, months) VALUES (?, ?, ?, ?)
+                        ON CONFLICT (class_name, fee_head) DO UPDATE SET amount = excluded.amount, months = excluded.months''',
+                     (class_name, fee_head, amount, months))
+        conn.commit()
+        return FeeSchedule(class_name, fee_head, amount, months)
+    finally:
+        if conn:
+            conn.close()
+
+def remove_fee(class_name, fee_head):
+    conn = None
+    try:
+        conn = db.get_connection()
+        c = conn.cursor()
+        c.execute("DELETE FROM fee_schedules WHERE class_name = ? AND fee_head = ?", (class_name, fee_head))
+        conn.commit()
+        return c.rowcount > 0
+    finally:
+        if conn:
+            conn.close()
+
+def list_fees():
+    conn = None
+    try:
+        conn = db.get_connection()
+        c = conn.cursor()
+        c.row_factory = db.record_factory(FeeSchedule)
+        c.execute("SELECT class_name, fee_head, amount, months FROM fee_schedules")
+        schedules = c.fetchall()
+    finally:
+        if conn:
+            conn.close()
+    schedules.sort(key=lambda fee: (reports.class_rank(fee.class_name), FEE_HEADS.index(fee.fee_head)))
+    return schedules
+
+# Exempt a student from a fee head (e.g. students who do not use the bus), or lift it
+def set_exemption(student_id, fee_head, exempt=True):
+    check_fee_head(fee_head)
+    conn = None
+    try:
+        conn = db.get_connection()
+        if exempt:
+            conn.execute("INSERT OR IGNORE INTO fee_exemptions (student_id, fee_head) VALUES (?, ?)", (student_id, fee_head))
+        else:
+            conn.execute("DELETE FROM fee_exemptions WHERE student_id = ? AND fee_head = ?", (student_id, fee_head))
+        conn.commit()
+    finally:
+        if conn:
+            conn.close()
+
+def get_posting(period):
+    conn = None
+    try:
+        conn = db.get_connection()
+        c = conn.cursor()
+        c.execute("SELECT period, students, charges, amount, posted_at FROM fee_postings WHERE period = ?", (period,))
+        row = c.fetchone()
+        return dict(zip(['period', 'students', 'charges', 'amount', 'posted_at'], row)) if row else None
+    finally:
+        if conn:
+            conn.close()
+
+def list_postings(limit=24):
+    conn = None
+    try:
+        conn = db.get_connection()
+        c = conn.cursor()
+        c.execute("SELECT period, students, charges, amount, posted_at FROM fee_postings ORDER BY period DESC LIMIT ?", (limit,))
+        return [dict(zip(['period', 'students', 'charges', 'amount', 'posted_at'], row)) for row in c.fetchall()]
+    finally:
+        if conn:
+            conn.close()
+
+# Apply a month's scheduled charges to every student's balance in one transaction.
+# Charges are written to student_charges with INSERT ... SELECT, the balances moved
+# with a single UPDATE ... FROM and logged to the balance ledger; a period can
+# only be posted once.
+def post_charges(period=None):
+    period = normalise_period(period)
+    month = str(int(period[5:]))
+    started = time.perf_counter()
+    conn = None
+    try:
+        conn = db.get_connection()
+        c = conn.cursor()
+        c.execute("BEGIN IMMEDIATE")
+        try:
+            c.execute("SELECT students, charges, amount, posted_at FROM fee_postings WHERE period = ?", (period,))
+            posted = c.fetchone()
+            if posted:
+                conn.rollback()
+                students, charges, amount, posted_at = posted
+                return {'period': period, 'students': students, 'charges': charges, 'amount': amount,
+                        'posted_at': posted_at, 'already_posted': True}
+            c.execute(f'''INSERT INTO student_charges (period, student_id, fee_head, amount)
+                          SELECT ?, s.student_id, f.fee_head, f.amount
+                          FROM students s
+                          JOIN fee_schedules f ON f.class_name = s.class_name
+                          WHERE {CHARGE_CONDITIONS}''',
+                      (period, month))
+            charges = c.rowcount
+            # Net each student's balance: outstanding and extra never both stay positive
+            c.execute('''UPDATE students SET
+                             outstanding_balance = MAX(0.0, COALESCE(outstanding_balance, 0.0) - COALESCE(extra_balance, 0.0) + t.total),
+                             extra_balance = MAX(0.0, COALESCE(extra_balance, 0.0) - COALESCE(outstanding_balance, 0.0) - t.total)
+                         FROM (SELECT student_id, SUM(amount) AS total FROM student_charges
+                               WHERE period = ? GROUP BY student_id) AS t
+                         WHERE students.student_id = t.student_id''', (period,))
+            students = c.rowcount
+            posted_at = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+            c.execute('''INSERT INTO balance_ledger (student_id, source, reference, delta, balance_after, recorded_at)
+                         SELECT s.student_id, 'charges', ?, t.total,
+                                COALESCE(s.outstanding_balance, 0.0) - COALESCE(s.extra_balance, 0.0), ?
+                         FROM students s
+                         JOIN (SELECT student_id, SUM(amount) AS total FROM student_charges
+                               WHERE period = ? GROUP BY student_id) AS t ON t.student_id = s.student_id''',
+                      (period, posted_at, period))
+            c.execute("SELECT COALESCE(SUM(amount), 0.0) FROM student_charges WHERE period = ?", (period,))
+            amount = c.fetchone()[0]
+            c.execute("INSERT INTO fee_postings (period, students, charges, amount, posted_at) VALUES (?, ?, ?, ?, ?)",
+                      (period, students, charges, amount, posted_at))
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+    finally:
+        if conn:
+            conn.close()
+    return {'period': period, 'students': students, 'charges': charges, 'amount': amount, 'posted_at': posted_at,
+            'already_posted': False, 'seconds': round(time.perf_counter() - started, 3)}
+
+# A student's posted charges for a period as {fee_head: amount}
+def charges_for(student_id, period):
+    conn = None
+    try:
+        conn = db.get_connection()
+        c = conn.cursor()
+        c.execute("SELECT fee_head, amount FROM student_charges WHERE period = ? AND student_id = ?", (period, student_id))
+        return dict(c.fetchall())
+    finally:
+        if conn:
+            conn.close()
+
+# Students charged in a period who do not have a posted invoice for it yet
+def students_to_invoice(period, class_name=None):
+    conn = None
+    try:
+        conn = db.get_connection()
+        c = conn.cursor()
+        query = '''SELECT DISTINCT sc.student_id FROM student_charges sc
+                   JOIN students s ON s.student_id = sc.student_id
+                   WHERE sc.period = ?
+                     AND NOT EXISTS (SELECT 1 FROM posted_invoices pi WHERE pi.period = sc.period AND pi.student_id = sc.student_id)'''
+        params = [period]
+        if class_name:
+            query += " AND s.class_name = ?"
+            params.append(class_name)
+        c.execute(query + " ORDER BY sc.student_id", params)
+        return [row[0] for row in c.fetchall()]
+    finally:
+        if conn:
+            conn.close()
+
+# The invoice already issued for a student's posted charges in a period, if any
+def posted_invoice_id(c, period, student_id):
+    c.execute("SELECT invoice_id FROM posted_invoices WHERE period = ? AND student_id = ?", (period, student_id))
+    row = c.fetchone()
+    return row[0] if row else None
+
+def check_not_invoiced(c, period, student_id):
+    invoice_id = posted_invoice_id(c, period, student_id)
+    if invoice_id:
+        raise ValueError(f"{student_id} already has invoice {invoice_id} for {period}.")
+
+# Fail if any of the students' charges for the period were already invoiced
+def require_not_invoiced(period, student_ids):
+    conn = None
+    try:
+        conn = db.get_connection()
+        c = conn.cursor()
+        for student_id in student_ids:
+            check_not_invoiced(c, period, student_id)
+    finally:
+        if conn:
+            conn.close()
+
+# Store a posted-charges invoice and mark the period invoiced for its students in
+# one transaction, so a crash never leaves an invoice that is not marked posted.
+# The invoice is filed under the first student; a family invoice is also indexed
+# under every sibling on it. The postings are checked again under the write lock
+# in case another run got there first.
+def save_posted_invoice(period, student_ids, school_fee, bus_fee, pdf_buffer, invoice_id):
+    conn = None
+    try:
+        conn = db.get_connection()
+        c = conn.cursor()
+        c.execute("BEGIN IMMEDIATE")
+        try:
+            for student_id in student_ids:
+                check_not_invoiced(c, period, student_id)
+            db.insert_invoice(c, student_ids[0], school_fee, bus_fee, pdf_buffer, invoice_id)
+            c.executemany("INSERT INTO posted_invoices (period, student_id, invoice_id) VALUES (?, ?, ?)",
+                          [(period, student_id, invoice_id) for student_id in student_ids])
+            if len(student_ids) > 1:
+                db.record_document_members(c, 'invoice', invoice_id, student_ids)
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+    finally:
+        if conn:
+            conn.close()
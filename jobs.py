@@ -0,0 +1,199 @@
+import json
+import os
+import socket
+from datetime import datetime, timedelta
+
+import db
+
+LEASE_SECONDS = 60
+RETRY_DELAY_SECONDS = 30
+FINISHED_STATUSES = ('done', 'failed', 'cancelled')
+
+def now_text(offset_seconds=0):
+    return (datetime.now() + timedelta(seconds=offset_seconds)).strftime("%Y-%m-%d %H:%M:%S")
+
+def default_worker_id():
+    return f"{socket.gethostname()}:{os.getpid()}"
+
+JOB_COLUMNS = ['id', 'kind', 'payload', 'status', 'priority', 'attempts', 'max_attempts', 'run_after',
+               'lease_owner', 'lease_expires', 'progress', 'message', 'result', 'result_name', 'error',
+               'created_at', 'finished_at']
+
+def row_to_job(row):
+    job = dict(zip(JOB_COLUMNS, row))
+    job['payload'] = json.loads(job['payload'] or '{}')
+    job['result'] = json.loads(job['result']) if job['result'] else None
+    return job
+
+# Add a job to the queue and return its ID
+def enqueue(kind, payload=None, priority=0, max_attempts=3):
+    conn = None
+    try:
+        conn = db.get_connection()
+        c = conn.cursor()
+        created_at = now_text()
+        c.execute("INSERT INTO jobs (kind, payload, priority, max_attempts, run_after, created_at) VALUES (?, ?, ?, ?, ?, ?)",
+                  (kind, json.dumps(payload or {}), priority, max_attempts, created_at, created_at))
+        conn.commit()
+        return c.lastrowid
+    finally:
+        if conn:
+            conn.close()
+
+# Atomically lease the next runnable job (queued, or running with an expired lease
+# and attempts left)
+def claim(worker_id, kinds=None, lease_seconds=LEASE_SECONDS):
+    conn = None
+    try:
+        conn = db.get_connection()
+        c = conn.cursor()
+        now = now_text()
+        query = '''SELECT id FROM jobs
+                   WHERE ((status = 'queued' AND run_after <= ?) OR (status = 'running' AND lease_expires < ?))'''
+        params = [now, now]
+        if kinds:
+            query += f" AND kind IN ({', '.join('?' for _ in kinds)})"
+            params.extend(kinds)
+        query += " ORDER BY priority DESC, run_after, id LIMIT 1"
+        # BEGIN IMMEDIATE takes the write lock up front so two workers never lease the same job
+        c.execute("BEGIN IMMEDIATE")
+        # A lease that ran out on the last allowed attempt means the job keeps
+        # killing its worker; fail it rather than hand it out again
+        c.execute('''UPDATE jobs SET status = 'failed', lease_owner = NULL, lease_expires = NULL, finished_at = ?,
+                     error = COALESCE(error, 'Worker stopped while running the job (lease expired)')
+                     WHERE status = 'running' AND lease_expires < ? AND attempts >= max_attempts''', (now, now))
+        c.execute(query, params)
+        row = c.fetchone()
+        if not row:
+            conn.commit()
+            return None
+        c.execute('''UPDATE jobs SET status = 'running', attempts = attempts + 1, lease_owner = ?, lease_expires = ?,
+                     error = NULL WHERE id = ?''',
+                  (worker_id, now_text(lease_seconds), row[0]))
+        c.execute(f"SELECT {', '.join(JOB_COLUMNS)} FROM jobs WHERE id = ?", (row[0],))
+        job = row_to_job(c.fetchone())
+        conn.commit()
+        return job
+    finally:
+        if conn:
+            conn.close()
+
+# Record progress and extend the lease; returns False if the job was cancelled or taken over
+def heartbeat(job_id, worker_id, progress=None, message=None, lease_seconds=LEASE_SECONDS):
+    conn = None
+    try:
+        conn = db.get_connection()
+        c = conn.cursor()
+        c.execute('''UPDATE jobs SET lease_expires = ?, progress = COALESCE(?, progress), message = COALESCE(?, message)
+                     WHERE id = ? AND lease_owner = ? AND status = 'running' ''',
+                  (now_text(lease_seconds), progress, message, job_id, worker_id))
+        conn.commit()
+        return c.rowcount == 1
+    finally:
+        if conn:
+            conn.close()
+
+# Mark a leased job as finished with its result
+def complete(job_id, worker_id, result=None, result_data=None, result_name=None):
+    conn = None
+    try:
+        conn = db.get_connection()
+        c = conn.cursor()
+        c.execute('''UPDATE jobs SET status = 'done', progress = 1.0, result = ?, result_data = ?, result_name = ?,
+                     lease_owner = NULL, lease_expires = NULL, finished_at = ?
+                     WHERE id = ? AND lease_owner = ?''',
+                  (json.dumps(result, default=str) if result is not None else None, result_data, result_name,
+                   now_text(), job_id, worker_id))
+        conn.commit()
+    finally:
+        if conn:
+            conn.close()
+
+# Record a failure; the job is retried with a delay until max_attempts is reached
+def fail(job_id, worker_id, error):
+    conn = None
+    try:
+        conn = db.get_connection()
+        c = conn.cursor()
+        c.execute('''UPDATE jobs SET
+                     status = CASE WHEN attempts >= max_attempts THEN 'failed' ELSE 'queued' END,
+                     run_after = ?, error = ?, lease_owner = NULL, lease_expires = NULL,
+                     finished_at = CASE WHEN attempts >= max_attempts THEN ? ELSE NULL END
+                     WHERE id = ? AND lease_owner = ?''',
+                  (now_text(RETRY_DELAY_SECONDS), str(error), now_text(), job_id, worker_id))
+        conn.commit()
+    finally:
+        if conn:
+            conn.close()
+
+# Cancel a job that has not finished yet
+def cancel(job_id):
+    conn = None
+    try:
+        conn = db.get_connection()
+        c = conn.cursor()
+        c.execute('''UPDATE jobs SET status = 'cancelled', lease_owner = NULL, lease_expires = NULL, finished_at = ?
+                     WHERE id = ? AND status IN ('queued', 'running')''', (now_text(), job_id))
+        conn.commit()
+        return c.rowcount == 1
+    finally:
+        if conn:
+            conn.close()
+
+# Fetch one job (without its result file)
+def get_job(job_id):
+    conn = None
+    try:
+        conn = db.get_connection()
+        c = conn.cursor()
+        c.execute(f"SELECT {', '.join(JOB_COLUMNS)} FROM jobs WHERE id = ?", (job_id,))
+        row = c.fetchone()
+        return row_to_job(row) if row else None
+    finally:
+        if conn:
+            conn.close()
+
+# Fetch the file a finished job produced
+def get_job_result_file(job_id):
+    conn = None
+    try:
+        conn = db.get_connection()
+        c = conn.cursor()
+        c.execute("SELECT result_name, result_data FROM jobs WHERE id = ? AND status = 'done'", (job_id,))
+        return c.fetchone()
+    finally:
+        if conn:
+            conn.close()
+
+# List recent jobs, newest first
+def list_jobs(limit=50, status=None):
+    conn = None
+    try:
+        conn = db.get_connection()
+        c = conn.cursor()
+        query = f"SELECT {', '.join(JOB_COLUMNS)} FROM jobs"
+        params = []
+        if status:
+            query += " WHERE status = ?"
+            params.append(status)
+        query += " ORDER BY id DESC LIMIT ?"
+        params.append(limit)
+        c.execute(query, params)
+        return [row_to_job(row) for row in c.fetchall()]
+    finally:
+        if conn:
+            conn.close()
+
+# Drop finished jobs (and their result files) older than the given number of days
+def purge_finished(older_than_days=30):
+    conn = None
+    try:
+        conn = db.get_connection()
+        c = conn.cursor()
+        c.execute(f"DELETE FROM jobs WHERE status IN ({', '.join('?' for _ in FINISHED_STATUSES)}) AND finished_at < ?",
+                  (*FINISHED_STATUSES, now_text(-older_than_days * 86400)))
+        conn.commit()
+        return c.rowcount
+    finally:
+        if conn:
+            conn.close()
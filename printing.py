@@ -0,0 +1,290 @@
+import io
+import sqlite3
+import time
+import zlib
+
+import db
+import reports
+
+# A4 landscape holds two A5 portrait documents side by side
+A4_LANDSCAPE = (841.89, 595.28)
+CUT_MARK_LENGTH = 12
+FETCH_CHUNK = 50
+
+# FROM/WHERE clause selecting stored documents of one kind (aliased d, with the
+# student as s) by class, student, generated date, posting period or session.
+# `schema` names an attached archive to select from instead of the live table.
+def document_selection(kind, class_name=None, student_id=None, start=None, end=None, period=None, academic_year=None,
+                       schema='main'):
+    if kind not in db.DOCUMENT_TABLES:
+        raise ValueError(f"Unknown document type: {kind}")
+    if period and kind != 'invoice':
+        raise ValueError("Only invoices can be selected by posting period.")
+    if academic_year and kind != 'report_card':
+        raise ValueError("Only result cards can be selected by academic year.")
+    table = db.DOCUMENT_TABLES[kind][0]
+    query = f" FROM {schema}.{table} d LEFT JOIN main.students s ON s.student_id = d.student_id"
+    where, params = [], []
+    if period:
+        import fees
+        # A family invoice is posted for every sibling on it, so match it once
+        where.append("d.invoice_id IN (SELECT invoice_id FROM posted_invoices WHERE period = ?)")
+        params.append(fees.normalise_period(period))
+    for condition, value in (("s.class_name = ?", class_name), ("d.student_id = ?", student_id),
+                             ("d.generated_date >= ?", start), ("d.generated_date < date(?, '+1 day')", end),
+                             ("d.academic_year = ?", academic_year)):
+        if value:
+            where.append(condition)
+            params.append(value)
+    if where:
+        query += " WHERE " + " AND ".join(where)
+    return query, params
+
+# (academic year, document id) of every selected document in print order (class,
+# then roll number), the live table plus the archived years that hold the kind,
+# found and attached the same way document searches do
+def document_entries(kind, class_name=None, student_id=None, start=None, end=None, period=None, academic_year=None):
+    id_column = db.DOCUMENT_TABLES[kind][1]
+    ranks = " ".join("WHEN ? THEN ?" for _ in reports.CLASS_ORDER)
+    rank_params = [value for rank, name in enumerate(reports.CLASS_ORDER) for value in (name, rank)]
+    rows = []
+    conn = None
+    try:
+        conn = db.get_connection()
+        years = db.find_archived_years(conn, kind, student_id, academic_year)
+        for schemas in db.attached_archives(conn, years):
+            for schema, year in schemas:
+                selection, params = document_selection(kind, class_name, student_id, start, end, period, academic_year,
+                                                       schema)
+                query = (f"SELECT CASE s.class_name {ranks} ELSE {len(reports.CLASS_ORDER)} END, "
+                         f"CAST(s.roll_number AS INTEGER), d.student_id, d.generated_date, d.{id_column}" + selection)
+                rows += [(row, year) for row in conn.execute(query, rank_params + params)]
+    finally:
+        if conn:
+            conn.close()
+    # Students no longer on the roll (no roll number) sort first, as SQLite puts NULLs first
+    rows.sort(key=lambda entry: (entry[0][0], entry[0][1] is not None, entry[0][1] or 0, *entry[0][2:]))
+    return [(year, row[4]) for row, year in rows]
+
+# How many stored documents the same filters select, for progress reporting
+def count_documents(kind, class_name=None, student_id=None, start=None, end=None, period=None, academic_year=None):
+    return len(document_entries(kind, class_name, student_id, start, end, period, academic_year))
+
+# Stored PDFs of one kind in print order. The ids are listed first and the PDFs
+# fetched a chunk at a time, so only a few documents are in memory at once and no
+# read stays open while the caller writes. Archived PDFs are read from their
+# year's archive file, like db.get_document_pdf does.
+def stored_documents(kind, class_name=None, student_id=None, start=None, end=None, period=None, academic_year=None):
+    entries = document_entries(kind, class_name, student_id, start, end, period, academic_year)
+    table, id_column = db.DOCUMENT_TABLES[kind]
+    connections = {}
+    try:
+        for i in range(0, len(entries), FETCH_CHUNK):
+            chunk = entries[i:i + FETCH_CHUNK]
+            pdfs = {}
+            for year in {year for year, _ in chunk}:
+                if year not in connections:
+                    connections[year] = (sqlite3.connect(db.archive_path(year), timeout=10) if year
+                                         else db.get_connection())
+                document_ids = [document_id for entry_year, document_id in chunk if entry_year == year]
+                placeholders = ", ".join("?" for _ in document_ids)
+                pdfs.update(((year, document_id), pdf) for document_id, pdf in connections[year].execute(
+                    f"SELECT {id_column}, pdf_data FROM {table} WHERE {id_column} IN ({placeholders})", document_ids))
+            for entry in chunk:
+                # Skip a document deleted or archived away since it was listed
+                if entry in pdfs:
+                    yield pdfs[entry]
+    finally:
+        for conn in connections.values():
+            conn.close()
+
+def format_number(value):
+    return f"{float(value):.4f}".rstrip('0').rstrip('.')
+
+# A source stream's data exactly as stored, still encoded. pypdf's public
+# serialiser writes "<<dictionary>>\nstream\n<data>\nendstream", and it escapes
+# line breaks inside strings, so the first "\nstream\n" ends the dictionary.
+def encoded_stream_data(obj):
+    buffer = io.BytesIO()
+    obj.write_to_stream(buffer)
+    raw = buffer.getvalue()
+    return raw[raw.index(b"\nstream\n") + len(b"\nstream\n"):-len(b"\nendstream")]
+
+# Writes a PDF front to back: every object goes to the file as soon as it is
+# complete, and only object offsets and page numbers stay in memory. Source
+# pages are copied in as Form XObjects, so they can be placed on any sheet.
+class PrintWriter:
+    def __init__(self, f):
+        self.f = f
+        self.offsets = [None]
+        self.sheets = []
+        self.shared = {}
+        self.pages_number = self.reserve()
+        self.f.write(b"%PDF-1.4\n%\xe2\xe3\xcf\xd3\n")
+
+    def reserve(self):
+        self.offsets.append(None)
+        return len(self.offsets) - 1
+
+    def write_object(self, number, body):
+        self.offsets[number] = self.f.tell()
+        self.f.write(b"%d 0 obj\n" % number + body + b"\nendobj\n")
+
+    def write_stream(self, number, entries, data, compress=True):
+        if compress:
+            data = zlib.compress(data)
+            entries += b" /Filter /FlateDecode"
+        self.write_object(number, b"<<" + entries + b" /Length %d>>\nstream\n" % len(data) + data + b"\nendstream")
+
+    # Dictionary entries of a source stream: all but /Length, or just `names`
+    def stream_entries(self, obj, memo, names=None):
+        return b"".join(b" " + self.serialise(name, memo) + b" " + self.serialise(value, memo)
+                        for name, value in obj.items() if (name in names if names else name != '/Length'))
+
+    def serialise(self, obj, memo):
+        from pypdf.generic import ArrayObject, DictionaryObject, IndirectObject
+        if isinstance(obj, IndirectObject):
+            return b"%d 0 R" % self.copy_object(obj, memo)
+        if isinstance(obj, DictionaryObject):
+            return b"<<" + b" ".join(self.serialise(key, memo) + b" " + self.serialise(value, memo)
+                                     for key, value in obj.items()) + b">>"
+        if isinstance(obj, ArrayObject):
+            return b"[" + b" ".join(self.serialise(item, memo) for item in obj) + b"]"
+        buffer = io.BytesIO()
+        obj.write_to_stream(buffer)
+        return buffer.getvalue()
+
+    # Copy an indirect object (and what it points to) from a source document.
+    # Small objects with identical bodies, such as the standard font
+    # dictionaries every document carries, are written once and shared.
+    def copy_object(self, ref, memo):
+        from pypdf.generic import StreamObject
+        key = (ref.idnum, ref.generation)
+        if key in memo:
+            if memo[key] is None:
+                memo[key] = self.reserve()
+            return memo[key]
+        obj = ref.get_object()
+        if isinstance(obj, StreamObject):
+            # Copied still encoded, so fonts and images are never decoded
+            number = memo[key] = self.reserve()
+            self.write_stream(number, self.stream_entries(obj, memo), encoded_stream_data(obj), compress=False)
+            return number
+        memo[key] = None
+        body = self.serialise(obj, memo)
+        number = memo[key]
+        if number is None and len(body) <= 512:
+            number = self.shared.get(body)
+            if number is None:
+                number = self.shared[body] = self.reserve()
+                self.write_object(number, body)
+        elif number is None:
+            number = self.reserve()
+            self.write_object(number, body)
+        else:
+            # Referenced from inside itself, so it already has a number
+            self.write_object(number, body)
+        memo[key] = number
+        return number
+
+    # Turn every page of one PDF into a Form XObject: [(number, x0, y0, width, height)]
+    def add_document(self, pdf):
+        try:
+            from pypdf import PdfReader
+        except ImportError:
+            raise ValueError("Batch printing needs the pypdf package (pip install pypdf).")
+        from pypdf.generic import StreamObject
+        if hasattr(pdf, 'getvalue'):
+            pdf = pdf.getvalue()
+        reader = PdfReader(io.BytesIO(pdf))
+        memo = {}
+        forms = []
+        for page in reader.pages:
+            x0, y0, x1, y1 = (float(value) for value in page.mediabox)
+            resources = page.get('/Resources')
+            entries = b" /Type /XObject /Subtype /Form /BBox [%s]" % " ".join(format_number(v) for v in (x0, y0, x1, y1)).encode()
+            if resources is not None:
+                entries += b" /Resources " + self.serialise(resources, memo)
+            number = self.reserve()
+            contents = page.get('/Contents')
+            contents = contents.get_object() if contents is not None else None
+            if isinstance(contents, StreamObject):
+                # One content stream (what ReportLab writes): keep its encoding as is
+                entries += self.stream_entries(contents, memo, ('/Filter', '/DecodeParms'))
+                self.write_stream(number, entries, encoded_stream_data(contents), compress=False)
+            else:
+                contents = page.get_contents()
+                self.write_stream(number, entries, contents.get_data() if contents is not None else b"")
+            forms.append((number, x0, y0, x1 - x0, y1 - y0))
+        return forms
+
+    # Write one output page of the given size with forms placed into slots
+    # (x, y, width, height), each scaled to fit and centred
+    def add_sheet(self, size, placements, marks=b""):
+        content, names = [], []
+        for index, ((number, x0, y0, width, height), (sx, sy, slot_width, slot_height)) in enumerate(placements):
+            scale = min(slot_width / width, slot_height / height)
+            tx = sx + (slot_width - width * scale) / 2 - x0 * scale
+            ty = sy + (slot_height - height * scale) / 2 - y0 * scale
+            content.append(f"q {format_number(scale)} 0 0 {format_number(scale)} {format_number(tx)} {format_number(ty)} cm /D{index} Do Q")
+            names.append(b"/D%d %d 0 R" % (index, number))
+        contents_number = self.reserve()
+        self.write_stream(contents_number, b"", "\n".join(content).encode() + marks)
+        number = self.reserve()
+        self.write_object(number, b"<< /Type /Page /Parent %d 0 R /MediaBox [0 0 %s %s] /Resources << /XObject << %s >> >> /Contents %d 0 R >>"
+                          % (self.pages_number, format_number(size[0]).encode(), format_number(size[1]).encode(),
+                             b" ".join(names), contents_number))
+        self.sheets.append(number)
+
+    def close(self):
+        kids = b" ".join(b"%d 0 R" % number for number in self.sheets)
+        self.write_object(self.pages_number, b"<< /Type /Pages /Kids [%s] /Count %d >>" % (kids, len(self.sheets)))
+        catalog = self.reserve()
+        self.write_object(catalog, b"<< /Type /Catalog /Pages %d 0 R >>" % self.pages_number)
+        xref = self.f.tell()
+        self.f.write(b"xref\n0 %d\n0000000000 65535 f \n" % len(self.offsets))
+        for offset in self.offsets[1:]:
+            self.f.write(b"%010d 00000 n \n" % offset if offset is not None else b"0000000000 65535 f \n")
+        self.f.write(b"trailer\n<< /Size %d /Root %d 0 R >>\nstartxref\n%d\n%%%%EOF\n" % (len(self.offsets), catalog, xref))
+
+# Cut marks on the fold between the two A5 halves, in the top and bottom margins
+def cut_marks(size):
+    middle, height = format_number(size[0] / 2), size[1]
+    return (f"\nq 0.5 w 0 G {middle} 0 m {middle} {CUT_MARK_LENGTH} l S "
+            f"{middle} {format_number(height - CUT_MARK_LENGTH)} m {middle} {format_number(height)} l S Q").encode()
+
+# Merge PDFs (stored pdf_data bytes or the BytesIO buffers documents.py renders)
+# into one print file, optionally two A5 pages to each A4 sheet with cut marks.
+# The output is written as it goes, so memory does not grow with the batch size.
+def print_documents(sources, output, two_up=False, marks=True, progress=None, total=None):
+    started = time.perf_counter()
+    f = open(output, 'wb') if isinstance(output, str) else output
+    try:
+        writer = PrintWriter(f)
+        slots = [(0, 0, A4_LANDSCAPE[0] / 2, A4_LANDSCAPE[1]), (A4_LANDSCAPE[0] / 2, 0, A4_LANDSCAPE[0] / 2, A4_LANDSCAPE[1])]
+        pending = []
+        documents = pages = 0
+        for pdf in sources:
+            for form in writer.add_document(pdf):
+                pages += 1
+                if not two_up:
+                    writer.add_sheet(form[3:], [(form, (0, 0) + form[3:])])
+                    continue
+                pending.append(form)
+                if len(pending) == 2:
+                    writer.add_sheet(A4_LANDSCAPE, list(zip(pending, slots)), cut_marks(A4_LANDSCAPE) if marks else b"")
+                    pending = []
+            documents += 1
+            if progress and documents % 50 == 0:
+                progress(documents / total if total else 0.0, f"{documents} documents, {pages} pages")
+        if pending:
+            writer.add_sheet(A4_LANDSCAPE, list(zip(pending, slots)), cut_marks(A4_LANDSCAPE) if marks else b"")
+        if not writer.sheets:
+            raise ValueError("No documents to print.")
+        writer.close()
+        size = f.tell()
+    finally:
+        if isinstance(output, str):
+            f.close()
+    return {'documents': documents, 'pages': pages, 'sheets': len(writer.sheets), 'two_up': two_up,
+            'bytes': size, 'seconds': round(time.perf_counter() - started, 3)}
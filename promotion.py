@@ -0,0 +1,135 @@
+import time
+from datetime import date, datetime
+
+import archive
+import db
+import reports
+
+GRADUATED = 'Graduated'
+
+# Class a student moves to at the start of the next session; class 10 graduates
+LADDER = [('Nursery', 'LKG'), ('LKG', 'UKG'), ('UKG', '1'), ('1', '2'), ('2', '3'), ('3', '4'), ('4', '5'),
+          ('5', '6'), ('6', '7'), ('7', '8'), ('8', '9'), ('9', '10'), ('10', GRADUATED)]
+
+# How roll numbers are handed out inside each new class
+ROLL_ORDERS = {
+    'name': "first_name COLLATE NOCASE, last_name COLLATE NOCASE, student_id",
+    'previous_roll': "CAST(from_roll AS INTEGER), student_id",
+    'admission': "doa, LENGTH(student_id), student_id",
+    'dob': "dob, LENGTH(student_id), student_id",
+}
+
+# The session running today (promotion happens at its start, in April)
+def current_academic_year():
+    return archive.academic_year_of(date.today())
+
+# Build temp.promotion_plan: every enrolled student's new class and roll number.
+# Students in hold_back repeat their class; classes not on the ladder stay put
+# and keep their roll numbers. Students with no class are left out.
+def build_plan(c, roll_order, hold_back):
+    if roll_order not in ROLL_ORDERS:
+        raise ValueError(f"Unknown roll order: {roll_order}. Use one of: {', '.join(ROLL_ORDERS)}")
+    c.execute("DROP TABLE IF EXISTS temp.promotion_hold_back")
+    c.execute("CREATE TEMP TABLE promotion_hold_back (student_id TEXT PRIMARY KEY)")
+    c.executemany("INSERT OR IGNORE INTO temp.promotion_hold_back VALUES (?)", [(sid,) for sid in hold_back])
+    ladder = ", ".join("(?, ?)" for _ in LADDER)
+    c.execute("DROP TABLE IF EXISTS temp.promotion_plan")
+    c.execute(f'''CREATE TEMP TABLE promotion_plan AS
+                  WITH ladder (from_class, to_class) AS (VALUES {ladder}),
+                  moves AS (
+                      SELECT s.student_id, s.first_name, s.last_name, s.dob, s.doa,
+                             s.class_name AS from_class, s.roll_number AS from_roll,
+                             h.student_id IS NOT NULL AS held_back, l.from_class IS NULL AS unrecognised,
+                             CASE WHEN h.student_id IS NOT NULL OR l.from_class IS NULL THEN s.class_name
+                                  ELSE l.to_class END AS to_class
+                      FROM students s
+                      LEFT JOIN ladder l ON l.from_class = s.class_name
+                      LEFT JOIN temp.promotion_hold_back h ON h.student_id = s.student_id
+                      WHERE s.class_name IS NOT ? AND s.class_name IS NOT NULL
+                  )
+                  SELECT student_id, from_class, from_roll, to_class, held_back, unrecognised,
+                         CASE WHEN to_class = ? THEN NULL
+                              WHEN unrecognised THEN from_roll
+                              ELSE CAST(ROW_NUMBER() OVER (PARTITION BY to_class ORDER BY {ROLL_ORDERS[roll_order]}) AS TEXT)
+                         END AS to_roll
+                  FROM moves''',
+              [name for pair in LADDER for name in pair] + [GRADUATED, GRADUATED])
+
+# Per-class summary of the plan plus a few example moves
+def summarise_plan(c, sample=10):
+    c.execute('''SELECT from_class, to_class, COUNT(*), SUM(held_back), SUM(unrecognised)
+                 FROM temp.promotion_plan GROUP BY from_class, to_class''')
+    classes = [{'from_class': from_class, 'to_class': to_class, 'students': students, 'held_back': held, 'unrecognised': unknown}
+               for from_class, to_class, students, held, unknown in c.fetchall()]
+    classes.sort(key=lambda row: reports.class_rank(row['from_class']))
+    c.execute(f'''SELECT student_id, from_class, from_roll, to_class, to_roll FROM temp.promotion_plan
+                  ORDER BY LENGTH(student_id), student_id LIMIT {int(sample)}''')
+    moves = [dict(zip(['student_id', 'from_class', 'from_roll', 'to_class', 'to_roll'], row)) for row in c.fetchall()]
+    return {
+        'students': sum(row['students'] for row in classes),
+        'promoted': sum(row['students'] - row['held_back'] - row['unrecognised'] for row in classes if row['to_class'] != GRADUATED),
+        'held_back': sum(row['held_back'] for row in classes),
+        'graduated': sum(row['students'] for row in classes if row['to_class'] == GRADUATED),
+        'unrecognised': sum(row['unrecognised'] for row in classes),
+        'classes': classes,
+        'sample': moves,
+    }
+
+# Move every student up one class for the session starting `academic_year`
+# (default: the current one) and renumber rolls within each class. Runs as a
+# handful of set-based statements in one transaction; dry_run returns the same
+# summary and rolls back. Each academic year can only be promoted into once.
+def promote(academic_year=None, roll_order='name', hold_back=(), dry_run=False):
+    academic_year = academic_year or current_academic_year()
+    archive.academic_year_bounds(academic_year)
+    started = time.perf_counter()
+    conn = None
+    try:
+        conn = db.get_connection()
+        c = conn.cursor()
+        c.execute("BEGIN IMMEDIATE")
+        try:
+            c.execute("SELECT promoted_at FROM promotion_runs WHERE academic_year = ?", (academic_year,))
+            done = c.fetchone()
+            if done:
+                raise ValueError(f"Students were already promoted into {academic_year} on {done[0]}.")
+            build_plan(c, roll_order, hold_back)
+            summary = summarise_plan(c)
+            if dry_run:
+                conn.rollback()
+            else:
+                c.execute('''UPDATE students SET class_name = p.to_class, roll_number = p.to_roll
+                             FROM temp.promotion_plan p WHERE students.student_id = p.student_id''')
+                c.execute('''INSERT INTO promotions (academic_year, student_id, from_class, from_roll, to_class, to_roll)
+                             SELECT ?, student_id, from_class, from_roll, to_class, to_roll FROM temp.promotion_plan''',
+                          (academic_year,))
+                c.execute('''INSERT INTO promotion_runs (academic_year, roll_order, promoted, held_back, graduated, promoted_at)
+                             VALUES (?, ?, ?, ?, ?, ?)''',
+                          (academic_year, roll_order, summary['promoted'], summary['held_back'], summary['graduated'],
+                           datetime.now().strftime("%Y-%m-%d %H:%M:%S")))
+                conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+        finally:
+            c.execute("DROP TABLE IF EXISTS temp.promotion_plan")
+            c.execute("DROP TABLE IF EXISTS temp.promotion_hold_back")
+    finally:
+        if conn:
+            conn.close()
+    summary.update({'academic_year': academic_year, 'roll_order': roll_order, 'dry_run': dry_run,
+                    'seconds': round(time.perf_counter() - started, 3)})
+    return summary
+
+def list_promotion_runs():
+    conn = None
+    try:
+        conn = db.get_connection()
+        c = conn.cursor()
+        c.execute('''SELECT academic_year, roll_order, promoted, held_back, graduated, promoted_at
+                     FROM promotion_runs ORDER BY academic_year DESC''')
+        return [dict(zip(['academic_year', 'roll_order', 'promoted', 'held_back', 'graduated', 'promoted_at'], row))
+                for row in c.fetchall()]
+    finally:
+        if conn:
+            conn.close()
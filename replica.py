@@ -0,0 +1,31 @@
+import os
+import time
+
+import db
+import backup
+
+# Rebuild the reporting replica from the primary with the online backup API.
+# The copy is written beside the replica and swapped in with os.replace, so
+# readers holding the old file keep a consistent snapshot until they close it.
+# The file's mtime is set to when the copy started, which is what staleness is measured against.
+def refresh_replica(path=None):
+    path = path or db.REPLICA_PATH or 'school_replica.db'
+    partial_path = path + '.partial'
+    started_at = time.time()
+    started = time.perf_counter()
+    stats = backup.snapshot(partial_path)
+    os.utime(partial_path, (started_at, started_at))
+    os.replace(partial_path, path)
+    stats['file'] = path
+    stats['seconds'] = round(time.perf_counter() - started, 3)
+    return stats
+
+# Keep the replica refreshed every `interval` seconds until interrupted
+def run_refresher(interval, path=None):
+    while True:
+        try:
+            stats = refresh_replica(path)
+            print(f"Replica {stats['file']} refreshed in {stats['seconds']}s")
+        except Exception as e:
+            print(f"Replica refresh failed: {e}")
+        time.sleep(interval)
@@ -0,0 +1,94 @@
+import csv
+import io
+from datetime import date
+from typing import NamedTuple
+
+import db
+
+CLASS_ORDER = ["Nursery", "LKG", "UKG", "1", "2", "3", "4", "5", "6", "7", "8", "9", "10"]
+
+# How each summary period is derived from a YYYY-MM-DD collection date.
+# Academic years run April to March, e.g. 2024-04-01 .. 2025-03-31 is "2024-2025".
+PERIODS = {
+    'day': "collection_date",
+    'month': "substr(collection_date, 1, 7)",
+    'year': "substr(collection_date, 1, 4)",
+    'academic_year': "CASE WHEN substr(collection_date, 6, 2) >= '04'"
+                     " THEN substr(collection_date, 1, 4) || '-' || (CAST(substr(collection_date, 1, 4) AS INTEGER) + 1)"
+                     " ELSE (CAST(substr(collection_date, 1, 4) AS INTEGER) - 1) || '-' || substr(collection_date, 1, 4) END",
+}
+
+class DayBookEntry(NamedTuple):
+    payment_id: str
+    payment_date: str
+    student_id: str
+    student_name: str
+    class_name: str
+    amount: float
+    receipt_id: str
+
+class CollectionTotal(NamedTuple):
+    period: str
+    class_name: str
+    payments: int
+    amount: float
+
+def class_rank(class_name):
+    return CLASS_ORDER.index(class_name) if class_name in CLASS_ORDER else len(CLASS_ORDER)
+
+# Every payment taken on one day, in the order it was recorded
+def day_book(day=None):
+    day = day or date.today().strftime("%Y-%m-%d")
+    conn = None
+    try:
+        conn = db.get_read_connection()
+        c = conn.cursor()
+        c.row_factory = db.record_factory(DayBookEntry)
+        c.execute('''SELECT p.payment_id, p.payment_date, p.student_id,
+                            TRIM(COALESCE(s.first_name, '') || ' ' || COALESCE(s.last_name, '')),
+                            s.class_name, p.amount, r.receipt_id
+                     FROM payments p
+                     LEFT JOIN students s ON s.student_id = p.student_id
+                     LEFT JOIN receipts r ON r.payment_id = COALESCE(p.household_payment_id, p.payment_id)
+                     WHERE p.payment_date = ?
+                     ORDER BY p.id''', (day,))
+        return c.fetchall()
+    finally:
+        if conn:
+            conn.close()
+
+# Collection totals between two dates (inclusive) grouped by day, month, year or
+# academic year, optionally split by class. Answered from the daily rollup.
+def collection_summary(start, end, by='month', per_class=False):
+    if by not in PERIODS:
+        raise ValueError(f"Unknown period: {by}. Use one of: {', '.join(PERIODS)}")
+    class_column = "class_name" if per_class else "''"
+    conn = None
+    try:
+        conn = db.get_read_connection()
+        c = conn.cursor()
+        c.row_factory = db.record_factory(CollectionTotal)
+        c.execute(f'''SELECT {PERIODS[by]} AS period, {class_column} AS class, SUM(payments), SUM(amount)
+                      FROM daily_collections
+                      WHERE collection_date BETWEEN ? AND ?
+                      GROUP BY period, class''', (start, end))
+        totals = c.fetchall()
+    finally:
+        if conn:
+            conn.close()
+    totals.sort(key=lambda total: (total.period, class_rank(total.class_name)))
+    return totals
+
+# Grand total collected between two dates (inclusive)
+def collection_total(start, end):
+    totals = collection_summary(start, end, by='year')
+    return sum(total.payments for total in totals), sum(total.amount for total in totals)
+
+# Render report records as CSV text with a header row
+def to_csv(records):
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    if records:
+        writer.writerow(records[0]._fields)
+    writer.writerows(records)
+    return buffer.getvalue()
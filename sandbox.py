@@ -0,0 +1,161 @@
+import argparse
+import asyncio
+import base64
+import json
+import os
+import random
+import re
+
+import tornado.web
+
+# Local stand-ins for the dispatch transports: an SMTP server that accepts (and
+# optionally saves) every message, and a WhatsApp gateway that answers like a
+# real one. Recipients starting with "bounce" are refused, so permanent failures
+# can be tried too. Point dispatch.py at them with its SCHOOL_* settings (the
+# defaults already match).
+class Stats:
+    def __init__(self, latency=0.0, failure_rate=0.0, maildir=None, seed=None):
+        self.latency = latency
+        self.failure_rate = failure_rate
+        self.maildir = maildir
+        self.rng = random.Random(seed)
+        self.emails = self.whatsapp = self.refused = self.busy = 0
+        self.bytes = 0
+
+    def as_dict(self):
+        return {'emails': self.emails, 'whatsapp': self.whatsapp, 'refused': self.refused, 'busy': self.busy,
+                'bytes': self.bytes}
+
+# Just enough SMTP for smtplib: EHLO/HELO, MAIL, RCPT, DATA, RSET, NOOP, QUIT
+async def smtp_session(stats, reader, writer):
+    def reply(*lines):
+        for line in lines[:-1]:
+            writer.write(b"250-" + line + b"\r\n")
+        writer.write(lines[-1] + b"\r\n")
+
+    reply(b"220 sandbox ESMTP")
+    recipients = []
+    try:
+        while True:
+            await writer.drain()
+            line = await reader.readline()
+            if not line:
+                break
+            verb = line[:4].upper()
+            if verb == b'EHLO':
+                reply(b"sandbox", b"8BITMIME", b"250 SIZE 52428800")
+            elif verb == b'HELO':
+                reply(b"250 sandbox")
+            elif verb == b'MAIL':
+                recipients = []
+                reply(b"250 OK")
+            elif verb == b'RCPT':
+                address = re.search(rb'<([^>]*)>', line)
+                address = address.group(1) if address else b''
+                if address.lower().startswith(b'bounce'):
+                    stats.refused += 1
+                    reply(b"550 No such user here")
+                else:
+                    recipients.append(address)
+                    reply(b"250 OK")
+            elif verb == b'DATA':
+                if not recipients:
+                    reply(b"503 Need RCPT first")
+                    continue
+                reply(b"354 End data with <CR><LF>.<CR><LF>")
+                await writer.drain()
+                data = await reader.readuntil(b"\r\n.\r\n")
+                if stats.latency:
+                    await asyncio.sleep(stats.latency)
+                stats.emails += 1
+                stats.bytes += len(data)
+                if stats.maildir:
+                    with open(os.path.join(stats.maildir, f"{stats.emails:06d}.eml"), 'wb') as f:
+                        f.write(data[:-5].replace(b"\r\n..", b"\r\n."))
+                reply(b"250 OK queued as %d" % stats.emails)
+            elif verb in (b'RSET', b'NOOP'):
+                recipients = [] if verb == b'RSET' else recipients
+                reply(b"250 OK")
+            elif verb == b'QUIT':
+                reply(b"221 Bye")
+                await writer.drain()
+                break
+            else:
+                reply(b"502 Command not implemented")
+    except (ConnectionError, asyncio.IncompleteReadError):
+        pass
+    finally:
+        writer.close()
+
+class MessagesHandler(tornado.web.RequestHandler):
+    def initialize(self, stats):
+        self.stats = stats
+
+    async def post(self):
+        stats = self.stats
+        if stats.latency:
+            await asyncio.sleep(stats.latency)
+        if stats.failure_rate and stats.rng.random() < stats.failure_rate:
+            stats.busy += 1
+            self.set_status(429)
+            self.set_header('Retry-After', '1')
+            self.finish({'error': 'rate limited'})
+            return
+        try:
+            body = json.loads(self.request.body)
+            to = body['to']
+            base64.b64decode(body['document']['data'], validate=True)
+        except (ValueError, KeyError, TypeError):
+            self.set_status(400)
+            self.finish({'error': 'expected {"to", "document": {"data"}}'})
+            return
+        if not to.isdigit():
+            stats.refused += 1
+            self.set_status(400)
+            self.finish({'error': f'{to} is not on WhatsApp'})
+            return
+        stats.whatsapp += 1
+        stats.bytes += len(self.request.body)
+        self.finish({'id': f'wamid.sandbox.{stats.whatsapp}'})
+
+class StatsHandler(tornado.web.RequestHandler):
+    def initialize(self, stats):
+        self.stats = stats
+
+    def get(self):
+        self.finish(self.stats.as_dict())
+
+# Start both servers on the running event loop; returns the SMTP server
+async def start(stats, host='127.0.0.1', smtp_port=1025, http_port=8025):
+    smtp = await asyncio.start_server(lambda r, w: smtp_session(stats, r, w), host, smtp_port, limit=2 ** 26)
+    app = tornado.web.Application([(r'/messages', MessagesHandler, {'stats': stats}),
+                                   (r'/stats', StatsHandler, {'stats': stats})], log_function=lambda handler: None)
+    app.listen(http_port, address=host, max_body_size=2 ** 26)
+    return smtp
+
+async def serve(args):
+    stats = Stats(args.latency, args.failure_rate, args.maildir, args.seed)
+    await start(stats, args.host, args.smtp_port, args.http_port)
+    print(f"Sandbox SMTP on {args.host}:{args.smtp_port}, WhatsApp gateway on http://{args.host}:{args.http_port}/messages",
+          flush=True)
+    await asyncio.Event().wait()
+
+def main():
+    parser = argparse.ArgumentParser(description="Local SMTP server and fake WhatsApp gateway for testing dispatch")
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--smtp-port', type=int, default=1025)
+    parser.add_argument('--http-port', type=int, default=8025)
+    parser.add_argument('--latency', type=float, default=0.0, help="Seconds added to every accepted message")
+    parser.add_argument('--failure-rate', type=float, default=0.0, help="Share of WhatsApp sends answered with 429")
+    parser.add_argument('--maildir', help="Save each email here as an .eml file")
+    parser.add_argument('--seed', type=int)
+    args = parser.parse_args()
+    if args.maildir:
+        os.makedirs(args.maildir, exist_ok=True)
+    try:
+        asyncio.run(serve(args))
+    except KeyboardInterrupt:
+        print("Sandbox stopped")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,171 @@
+import uuid
+
+import db
+import documents
+
+STUDENT_FIELDS = ['first_name', 'middle_name', 'last_name', 'mother_name', 'father_name', 'address',
+                  'email', 'mobile_number', 'dob', 'class_name', 'whatsapp_no', 'gender', 'doa',
+                  'roll_number']
+
+# Turn a student record into a dict keyed by column name
+def student_to_dict(student):
+    return student._asdict()
+
+# Fetch a student or fail with the same message the UI shows
+def require_student(student_id):
+    student = db.get_student(student_id)
+    if not student:
+        raise db.StudentNotFound()
+    return student
+
+# Admit a student from a dict of admission fields
+def admit_student(fields):
+    missing = [name for name in ('first_name', 'last_name', 'mother_name', 'father_name') if not fields.get(name)]
+    if missing:
+        raise ValueError(f"Missing required fields: {', '.join(missing)}")
+    data = tuple(str(fields.get(name) or '') for name in STUDENT_FIELDS)
+    return db.add_student(data)
+
+# List every student as plain dicts; missing values become None so the rows serialise as JSON
+def list_students():
+    df = db.get_all_students()
+    return df.astype(object).where(df.notna(), None).to_dict(orient='records')
+
+# Generate, store and return an invoice for one student
+def issue_invoice(student_id, school_fee, bus_fee):
+    student = require_student(student_id)
+    if school_fee == 0 and bus_fee == 0 and (student.outstanding_balance or 0) == 0 and (student.extra_balance or 0) == 0:
+        raise ValueError("Please enter at least one fee (School Fee or Bus Fee), or ensure there is an outstanding or extra balance.")
+    invoice_id = f'INV{str(uuid.uuid4())[:8]}'
+    pdf_buffer = documents.generate_invoice(student, school_fee, bus_fee, invoice_id)
+    db.save_invoice(student_id, school_fee, bus_fee, pdf_buffer, invoice_id)
+    return {'invoice_id': invoice_id, 'student_id': student_id, 'pdf_size': len(pdf_buffer.getvalue())}
+
+# Generate invoices for every student (optionally one class) in a single batch
+def issue_invoices_for_all(school_fee, bus_fee, class_name=None, progress=None):
+    df = db.get_all_students(primary=True)
+    if class_name:
+        df = df[df['class_name'] == class_name]
+    issued, skipped = [], []
+    total = len(df)
+    for done, student_id in enumerate(df['student_id'], 1):
+        try:
+            issued.append(issue_invoice(student_id, school_fee, bus_fee)['invoice_id'])
+        except ValueError:
+            skipped.append(student_id)
+        if progress and (done % 25 == 0 or done == total):
+            progress(done / total, f"{done}/{total} invoices")
+    return {'issued': issued, 'skipped': skipped}
+
+# Render and store the invoice for a student's posted charges in a period. The
+# balance already includes those charges, so the invoice shows them as this
+# period's fees and the rest of the balance as previous outstanding/extra.
+# A pre-rendered draft is used instead while it still matches (see drafts.py).
+def issue_posted_invoice(student_id, period):
+    import drafts
+    import fees
+    period = fees.normalise_period(period)
+    student = require_student(student_id)
+    fees.require_not_invoiced(period, [student_id])
+    charges = fees.charges_for(student_id, period)
+    if not charges:
+        raise ValueError(f"No charges were posted for {student_id} in {period}.")
+    statement, school_fee, bus_fee = drafts.statement_for(student, charges, True)
+    draft = drafts.take_draft(period, statement, school_fee, bus_fee)
+    if draft:
+        invoice_id, pdf_buffer = draft
+    else:
+        invoice_id = f'INV{str(uuid.uuid4())[:8]}'
+        pdf_buffer = documents.generate_invoice(statement, school_fee, bus_fee, invoice_id, drafts.invoice_date(period))
+    fees.save_posted_invoice(period, [student_id], school_fee, bus_fee, pdf_buffer, invoice_id)
+    return {'invoice_id': invoice_id, 'student_id': student_id, 'period': period, 'pdf_size': len(pdf_buffer.getvalue()),
+            'prerendered': draft is not None}
+
+# Invoice every student charged in a period (optionally one class) who has no invoice for it yet.
+# by_family: siblings share one family invoice (see families.py)
+def issue_posted_invoices(period, class_name=None, progress=None, by_family=False):
+    import fees
+    if by_family:
+        import families
+        return families.issue_family_invoices(period, class_name, progress)
+    period = fees.normalise_period(period)
+    student_ids = fees.students_to_invoice(period, class_name)
+    issued, skipped = [], []
+    total = len(student_ids)
+    for done, student_id in enumerate(student_ids, 1):
+        try:
+            issued.append(issue_posted_invoice(student_id, period)['invoice_id'])
+        except ValueError:
+            skipped.append(student_id)
+        if progress and (done % 25 == 0 or done == total):
+            progress(done / total, f"{done}/{total} invoices")
+    return {'issued': issued, 'skipped': skipped}
+
+# Record a payment, render its receipt and store it
+def take_payment(student_id, school_fee, bus_fee, amount):
+    if amount <= 0:
+        raise ValueError("Payment Amount must be greater than zero.")
+    student = require_student(student_id)
+    if school_fee == 0 and bus_fee == 0 and (student.outstanding_balance or 0) == 0:
+        raise ValueError("Please enter at least one fee (School Fee or Bus Fee), or pay against an outstanding balance.")
+    payment_id, payment_date, transaction_outstanding, transaction_extra, total_outstanding, total_extra = db.record_payment(student_id, school_fee, bus_fee, amount)
+    pdf_buffer = documents.generate_receipt(student, school_fee, bus_fee, amount, payment_id, payment_date, transaction_outstanding, transaction_extra, total_outstanding, total_extra)
+    receipt_id = db.save_receipt(student_id, payment_id, pdf_buffer)
+    return {
+        'payment_id': payment_id,
+        'receipt_id': receipt_id,
+        'payment_date': payment_date,
+        'transaction_outstanding': transaction_outstanding,
+        'transaction_extra': transaction_extra,
+        'total_outstanding': total_outstanding,
+        'total_extra': total_extra,
+    }
+
+# Parse "Subject:Marks" lines into result tuples, as the Result Card page does
+def parse_results(student_id, lines):
+    results = []
+    for line in lines:
+        if not line.strip():
+            continue
+        if ':' not in line:
+            raise ValueError(f"Invalid format in line: {line}. Use format 'Subject:Marks'.")
+        subject, marks = line.split(':', 1)
+        try:
+            marks = float(marks.strip())
+        except ValueError:
+            raise ValueError(f"Invalid format for marks in line: {line}. Use format 'Subject:Marks'.")
+        if marks < 0 or marks > 100:
+            raise ValueError(f"Marks for {subject} must be between 0 and 100.")
+        results.append((student_id, subject.strip(), marks))
+    return results
+
+# Attendance percentage for a result card, taken from the attendance register
+def attendance_for(student_id, academic_year):
+    import attendance
+    record = attendance.student_attendance(student_id, academic_year)
+    if record is None or not record.marked:
+        raise ValueError(f"No attendance has been marked for {student_id} in {academic_year}. Enter the attendance percentage instead.")
+    return record.percentage
+
+# Generate and store a result card; attendance comes from the register unless given
+def issue_result_card(student_id, results, academic_year="2024-2025", attendance_percentage=None):
+    student = require_student(student_id)
+    if not results:
+        raise ValueError("At least one subject is required.")
+    if attendance_percentage is None:
+        attendance_percentage = attendance_for(student_id, academic_year)
+    pdf_buffer = documents.generate_result_card(student, results, academic_year, attendance_percentage)
+    report_id = db.save_report_card(student_id, academic_year, pdf_buffer, results)
+    return {'report_id': report_id, 'student_id': student_id, 'academic_year': academic_year}
+
+# Search stored documents and return their metadata (without the PDF bytes)
+def find_documents(kind, student_id=None, academic_year=None, primary=False):
+    if kind == 'invoice':
+        found = db.search_invoices(student_id, primary)
+    elif kind == 'receipt':
+        found = db.search_receipts(student_id, primary)
+    elif kind == 'report_card':
+        found = db.search_report_cards(student_id, academic_year, primary)
+    else:
+        raise ValueError(f"Unknown document type: {kind}")
+    return [{name: value for name, value in document._asdict().items() if name != 'pdf_data'} for document in found]
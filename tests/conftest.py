@@ -0,0 +1,27 @@
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import db
+import service
+
+# A fresh school database in a temporary directory for each test
+@pytest.fixture
+def database(tmp_path, monkeypatch):
+    monkeypatch.setattr(db, 'DB_PATH', str(tmp_path / 'school.db'))
+    monkeypatch.setattr(db, 'ARCHIVE_DIR', str(tmp_path / 'archive'))
+    monkeypatch.setattr(db, 'REPLICA_PATH', None)
+    db.init_db()
+    return db.DB_PATH
+
+# Admit students through the service layer: admit(class_name='5', **fields) -> student ID
+@pytest.fixture
+def admit(database):
+    def admit_student(class_name='5', **fields):
+        fields = {'first_name': 'Asha', 'last_name': 'Rao', 'mother_name': 'Meena Rao', 'father_name': 'Vikram Rao',
+                  'mobile_number': '9800000000', 'class_name': class_name, **fields}
+        return service.admit_student(fields)
+    return admit_student
@@ -0,0 +1,70 @@
+import pytest
+
+import auth
+import db
+
+def test_login_starts_a_session(database):
+    token = auth.login('admin', 'admin123')
+
+    assert auth.session_user(token) == 'admin'
+    assert auth.login('admin', 'wrong') is None
+    assert auth.session_user(token + 'x') is None
+    assert auth.session_user(token + 'é') is None
+
+def test_user_is_locked_after_too_many_failures(database):
+    for _ in range(auth.MAX_USER_FAILURES):
+        assert auth.login('admin', 'wrong') is None
+
+    # Even the right password is refused while the lock lasts
+    with pytest.raises(ValueError, match="Too many failed logins"):
+        auth.login('admin', 'admin123')
+    with pytest.raises(ValueError, match="Too many failed logins"):
+        auth.login(' ADMIN ', 'admin123')
+
+def test_failures_below_the_limit_are_cleared_by_a_login(database):
+    for _ in range(auth.MAX_USER_FAILURES - 1):
+        auth.login('admin', 'wrong')
+    assert auth.login('admin', 'admin123') is not None
+
+    for _ in range(auth.MAX_USER_FAILURES - 1):
+        auth.login('admin', 'wrong')
+    assert auth.login('admin', 'admin123') is not None
+
+def test_client_is_locked_after_failures_across_usernames(database, monkeypatch):
+    monkeypatch.setattr(auth, 'MAX_CLIENT_FAILURES', 4)
+    for n in range(4):
+        assert auth.login(f'user{n}', 'wrong', client='10.0.0.5') is None
+
+    with pytest.raises(ValueError, match="Too many failed logins"):
+        auth.login('admin', 'admin123', client='10.0.0.5')
+    assert auth.login('admin', 'admin123', client='10.0.0.6') is not None
+
+def test_lock_lifts_after_lock_seconds(database):
+    for _ in range(auth.MAX_USER_FAILURES):
+        auth.login('admin', 'wrong')
+    conn = db.get_connection()
+    try:
+        conn.execute("UPDATE login_failures SET locked_until = locked_until - ?", (auth.LOCK_SECONDS + 1,))
+        conn.commit()
+    finally:
+        conn.close()
+
+    assert auth.login('admin', 'admin123') is not None
+
+def test_password_change_ends_sessions(database):
+    tokens = [auth.login('admin', 'admin123') for _ in range(2)]
+
+    assert db.set_password('admin', 'new-password') == 2
+    assert [auth.session_user(token) for token in tokens] == [None, None]
+    # As in another process once its cached entry is CACHE_SECONDS old: the rows are gone
+    auth._sessions.clear()
+    assert [auth.session_user(token) for token in tokens] == [None, None]
+    assert auth.login('admin', 'admin123') is None
+    assert auth.login('admin', 'new-password') is not None
+
+def test_end_user_sessions_revokes_cached_sessions(database):
+    token = auth.login('admin', 'admin123')
+    assert auth.session_user(token) == 'admin'
+
+    assert auth.end_user_sessions('admin') == 1
+    assert auth.session_user(token) is None
@@ -0,0 +1,100 @@
+import pytest
+
+import balances
+import db
+import families
+import fees
+import service
+
+def charge_rows(period):
+    conn = db.get_connection()
+    try:
+        return conn.execute("SELECT student_id, fee_head, amount FROM student_charges WHERE period = ? ORDER BY 1, 2",
+                            (period,)).fetchall()
+    finally:
+        conn.close()
+
+def test_post_charges_charges_each_student_once(admit):
+    fifth = admit(class_name='5')
+    seventh = admit(class_name='7')
+    fees.set_fee('5', 'tuition', 1200.0)
+    fees.set_fee('5', 'bus', 300.0)
+    fees.set_fee('7', 'tuition', 1500.0)
+
+    posting = fees.post_charges('2025-06')
+
+    assert posting['charges'] == 3 and posting['students'] == 2
+    assert posting['amount'] == pytest.approx(3000.0)
+    assert db.get_student(fifth).outstanding_balance == pytest.approx(1500.0)
+    assert db.get_student(seventh).outstanding_balance == pytest.approx(1500.0)
+    assert [(entry['source'], entry['reference']) for entry in balances.ledger_for(fifth)] == [('charges', '2025-06')]
+
+def test_post_charges_rerun_changes_nothing(admit):
+    student_id = admit()
+    fees.set_fee('5', 'tuition', 1200.0)
+    first = fees.post_charges('2025-06')
+    charges = charge_rows('2025-06')
+
+    # A fee changed after posting does not reach a period that was already posted
+    fees.set_fee('5', 'tuition', 5000.0)
+    again = fees.post_charges('2025-06')
+
+    assert again['already_posted'] is True
+    assert (again['charges'], again['amount'], again['posted_at']) == (first['charges'], first['amount'], first['posted_at'])
+    assert charge_rows('2025-06') == charges
+    assert db.get_student(student_id).outstanding_balance == pytest.approx(1200.0)
+    assert len(balances.ledger_for(student_id)) == 1
+    assert balances.check_balances()['mismatches'] == 0
+
+def test_post_charges_nets_advance_against_charges(admit):
+    student_id = admit()
+    conn = db.get_connection()
+    try:
+        c = conn.cursor()
+        db.update_balances(c, student_id, 0.0, 500.0)
+        db.record_balance_change(c, student_id, 'payment', 'PAYadvance', -500.0, -500.0)
+        conn.commit()
+    finally:
+        conn.close()
+    fees.set_fee('5', 'tuition', 1200.0)
+
+    fees.post_charges('2025-06')
+
+    student = db.get_student(student_id)
+    assert (student.outstanding_balance, student.extra_balance) == pytest.approx((700.0, 0.0))
+    assert balances.check_balances()['mismatches'] == 0
+
+def test_exempt_student_is_not_charged(admit):
+    charged = admit()
+    exempt = admit(first_name='Ravi')
+    fees.set_fee('5', 'bus', 300.0)
+    fees.set_exemption(exempt, 'bus')
+
+    fees.post_charges('2025-06')
+
+    assert charge_rows('2025-06') == [(charged, 'bus', 300.0)]
+    assert (db.get_student(exempt).outstanding_balance or 0.0) == 0.0
+
+def test_posted_invoice_is_issued_once_per_period(admit):
+    student_id = admit()
+    fees.set_fee('5', 'tuition', 1200.0)
+    fees.post_charges('2025-06')
+    invoice = service.issue_posted_invoice(student_id, '2025-06')
+
+    with pytest.raises(ValueError, match="already has invoice"):
+        service.issue_posted_invoice(student_id, '2025-06')
+
+    assert [row.invoice_id for row in db.search_invoices(student_id)] == [invoice['invoice_id']]
+
+def test_family_invoice_is_issued_once_per_period(admit):
+    siblings = [admit(class_name='7'), admit(class_name='3', first_name='Ravi')]
+    fees.set_fee('7', 'tuition', 1500.0)
+    fees.set_fee('3', 'tuition', 900.0)
+    fees.post_charges('2025-06')
+    invoice = families.issue_family_invoice(siblings, '2025-06')
+
+    with pytest.raises(ValueError, match="already has invoice"):
+        families.issue_family_invoice(siblings, '2025-06')
+
+    for student_id in siblings:
+        assert [row.invoice_id for row in db.search_invoices(student_id)] == [invoice['invoice_id']]
@@ -0,0 +1,17 @@
+import pytest
+
+from benchmarks import import_time
+
+# Each entry point must leave the heavy packages listed in import_time.BUDGETS
+# unimported until a function needs them. The millisecond budgets depend on the
+# machine, so they are checked by benchmarks/import_time.py --check instead.
+@pytest.mark.parametrize('module', sorted(import_time.BUDGETS))
+def test_entry_point_defers_heavy_imports(module):
+    result = import_time.measure(module, runs=1)
+    assert result['heavy_imports'] == [], f"{module} imports {', '.join(result['heavy_imports'])} at module load"
+
+def test_violations_report_forbidden_imports_and_slow_modules():
+    results = [{'module': 'db', 'median_ms': 1.0, 'heavy_imports': ['pandas']},
+               {'module': 'cli', 'median_ms': 10_000.0, 'heavy_imports': []}]
+    assert import_time.find_violations(results) == ["db: imports pandas at module load",
+                                                    "cli: 10000.0 ms > 200 ms budget"]
@@ -0,0 +1,88 @@
+import db
+import jobs
+import worker
+
+def expire_lease(job_id):
+    conn = db.get_connection()
+    try:
+        conn.execute("UPDATE jobs SET lease_expires = ? WHERE id = ?", (jobs.now_text(-5), job_id))
+        conn.commit()
+    finally:
+        conn.close()
+
+def test_leased_job_is_not_claimed_twice(database):
+    job_id = jobs.enqueue('export_students')
+
+    job = jobs.claim('worker-a')
+
+    assert (job['id'], job['status'], job['attempts'], job['lease_owner']) == (job_id, 'running', 1, 'worker-a')
+    assert jobs.claim('worker-b') is None
+
+def test_expired_lease_is_reclaimed_by_another_worker(database):
+    job_id = jobs.enqueue('export_students')
+    jobs.claim('worker-a')
+    expire_lease(job_id)
+
+    job = jobs.claim('worker-b')
+
+    assert (job['id'], job['attempts'], job['lease_owner']) == (job_id, 2, 'worker-b')
+    # The first worker lost the job: its heartbeat fails and it cannot complete it
+    assert jobs.heartbeat(job_id, 'worker-a') is False
+    jobs.complete(job_id, 'worker-a', {'rows': 0})
+    assert jobs.get_job(job_id)['status'] == 'running'
+    jobs.complete(job_id, 'worker-b', {'rows': 0})
+    assert jobs.get_job(job_id)['status'] == 'done'
+
+def test_heartbeat_extends_the_lease(database):
+    job_id = jobs.enqueue('export_students')
+    jobs.claim('worker-a', lease_seconds=1)
+    expire_lease(job_id)
+
+    assert jobs.heartbeat(job_id, 'worker-a', 0.5, "halfway") is True
+    assert jobs.claim('worker-b') is None
+    job = jobs.get_job(job_id)
+    assert (job['progress'], job['message']) == (0.5, "halfway")
+
+def test_job_whose_lease_keeps_expiring_fails_after_max_attempts(database):
+    job_id = jobs.enqueue('export_students', max_attempts=2)
+    for worker_id in ('worker-a', 'worker-b'):
+        assert jobs.claim(worker_id)['id'] == job_id
+        expire_lease(job_id)
+
+    assert jobs.claim('worker-c') is None
+    job = jobs.get_job(job_id)
+    assert (job['status'], job['attempts'], job['lease_owner']) == ('failed', 2, None)
+    assert 'lease expired' in job['error']
+
+def test_failed_job_is_retried_until_max_attempts(database):
+    job_id = jobs.enqueue('no_such_kind', max_attempts=2)
+
+    worker.execute(jobs.claim('worker-a'), 'worker-a')
+    job = jobs.get_job(job_id)
+    assert (job['status'], job['attempts']) == ('queued', 1)
+    assert 'Unknown job kind' in job['error']
+
+    conn = db.get_connection()
+    try:
+        conn.execute("UPDATE jobs SET run_after = ? WHERE id = ?", (jobs.now_text(), job_id))
+        conn.commit()
+    finally:
+        conn.close()
+    worker.execute(jobs.claim('worker-a'), 'worker-a')
+    assert jobs.get_job(job_id)['status'] == 'failed'
+
+def test_cancelled_job_stops_at_next_progress_report(database):
+    job_id = jobs.enqueue('export_students')
+    job = jobs.claim('worker-a')
+    jobs.cancel(job_id)
+
+    def handler(payload, progress):
+        progress(0.5, "working")
+        raise AssertionError("progress() should have stopped the handler")
+
+    worker.HANDLERS['cancel_probe'] = handler
+    try:
+        worker.execute({**job, 'kind': 'cancel_probe'}, 'worker-a')
+    finally:
+        del worker.HANDLERS['cancel_probe']
+    assert jobs.get_job(job_id)['status'] == 'cancelled'
@@ -0,0 +1,83 @@
+import pytest
+
+import balances
+import db
+import families
+import service
+
+def net_balance(student_id):
+    student = db.get_student(student_id)
+    return (student.outstanding_balance or 0.0) - (student.extra_balance or 0.0)
+
+def ledger_total(student_id):
+    return sum(entry['delta'] for entry in balances.ledger_for(student_id))
+
+def test_payment_records_row_receipt_and_ledger_entry(admit):
+    student_id = admit()
+    payment = service.take_payment(student_id, 1500.0, 500.0, 1200.0)
+
+    assert net_balance(student_id) == pytest.approx(800.0)
+    conn = db.get_connection()
+    try:
+        assert conn.execute("SELECT student_id, amount FROM payments WHERE payment_id = ?",
+                            (payment['payment_id'],)).fetchall() == [(student_id, 1200.0)]
+        assert conn.execute("SELECT receipt_id FROM receipts WHERE payment_id = ?",
+                            (payment['payment_id'],)).fetchall() == [(payment['receipt_id'],)]
+    finally:
+        conn.close()
+    ledger = balances.ledger_for(student_id)
+    assert [(entry['source'], entry['reference']) for entry in ledger] == [('payment', payment['payment_id'])]
+    assert ledger[-1]['balance_after'] == pytest.approx(net_balance(student_id))
+
+def test_ledger_tracks_balance_across_payments(admit):
+    student_id = admit()
+    service.take_payment(student_id, 1500.0, 0.0, 1000.0)
+    service.take_payment(student_id, 0.0, 0.0, 200.0)
+    service.take_payment(student_id, 0.0, 0.0, 900.0)
+
+    assert net_balance(student_id) == pytest.approx(-600.0)
+    assert ledger_total(student_id) == pytest.approx(net_balance(student_id))
+    assert all(entry['balance_after'] == pytest.approx(entry['expected_after']) for entry in balances.ledger_for(student_id))
+    assert balances.check_balances()['mismatches'] == 0
+
+def test_family_payment_gives_each_sibling_a_linked_payment(admit):
+    older = admit(class_name='7')
+    younger = admit(class_name='3', first_name='Ravi')
+    service.take_payment(older, 1000.0, 0.0, 400.0)
+    service.take_payment(younger, 800.0, 0.0, 300.0)
+
+    payment = families.take_family_payment(younger, 1100.0)
+
+    paid = {allocation['student_id']: allocation for allocation in payment['allocations']}
+    assert paid[older]['paid'] == pytest.approx(600.0)
+    assert paid[younger]['paid'] == pytest.approx(500.0)
+    assert paid[older]['payment_id'] != paid[younger]['payment_id']
+    conn = db.get_connection()
+    try:
+        rows = conn.execute("SELECT payment_id, student_id FROM payments WHERE household_payment_id = ?",
+                            (payment['payment_id'],)).fetchall()
+    finally:
+        conn.close()
+    assert sorted(rows) == sorted((allocation['payment_id'], student_id) for student_id, allocation in paid.items())
+    for student_id in (older, younger):
+        assert net_balance(student_id) == pytest.approx(0.0)
+        assert ledger_total(student_id) == pytest.approx(0.0)
+        assert payment['receipt_id'] in [receipt.receipt_id for receipt in db.search_receipts(student_id)]
+    assert balances.check_balances()['mismatches'] == 0
+
+def test_check_balances_finds_and_repairs_drift(admit):
+    student_id = admit()
+    service.take_payment(student_id, 1000.0, 0.0, 400.0)
+    conn = db.get_connection()
+    try:
+        conn.execute("UPDATE students SET outstanding_balance = 250.0 WHERE student_id = ?", (student_id,))
+        conn.commit()
+    finally:
+        conn.close()
+
+    result = balances.check_balances(repair=True)
+
+    assert result['mismatches'] == 1 and result['repaired'] == 1
+    assert result['details'][0].expected_outstanding == pytest.approx(600.0)
+    assert net_balance(student_id) == pytest.approx(600.0)
+    assert balances.check_balances()['mismatches'] == 0
@@ -0,0 +1,27 @@
+import db
+import service
+
+def stored_results(student_id):
+    conn = db.get_connection()
+    try:
+        return conn.execute("SELECT subject, marks FROM results WHERE student_id = ? ORDER BY subject",
+                            (student_id,)).fetchall()
+    finally:
+        conn.close()
+
+def test_result_card_stores_its_marks(admit):
+    student_id = admit()
+    results = service.parse_results(student_id, ["Maths: 81", "English:74", ""])
+
+    card = service.issue_result_card(student_id, results, "2024-2025", 92.0)
+
+    assert [row.report_id for row in db.search_report_cards(student_id, "2024-2025")] == [card['report_id']]
+    assert stored_results(student_id) == [('English', 74.0), ('Maths', 81.0)]
+
+def test_reissued_card_replaces_previous_marks(admit):
+    student_id = admit()
+    service.issue_result_card(student_id, service.parse_results(student_id, ["Maths:40", "Art:90"]), "2024-2025", 90.0)
+
+    service.issue_result_card(student_id, service.parse_results(student_id, ["Maths:55"]), "2024-2025", 90.0)
+
+    assert stored_results(student_id) == [('Maths', 55.0)]
@@ -0,0 +1,246 @@
+import argparse
+import csv
+import io
+import threading
+import time
+import traceback
+import zipfile
+
+import db
+import jobs
+import service
+
+class JobCancelled(Exception):
+    pass
+
+# Render one invoice
+def run_invoice(payload, progress):
+    return service.issue_invoice(payload['student_id'], float(payload.get('school_fee', 0)), float(payload.get('bus_fee', 0)))
+
+# Render invoices for a class or the whole school
+def run_bulk_invoices(payload, progress):
+    result = service.issue_invoices_for_all(float(payload.get('school_fee', 0)), float(payload.get('bus_fee', 0)),
+                                            payload.get('class_name'), progress=progress)
+    return {'issued': len(result['issued']), 'skipped': result['skipped']}
+
+# Post a month's scheduled charges, then optionally invoice everyone charged
+def run_post_charges(payload, progress):
+    import fees
+    posting = fees.post_charges(payload.get('period'))
+    progress(0.05, f"Posted {posting['charges']} charges")
+    if payload.get('invoices'):
+        result = service.issue_posted_invoices(posting['period'], payload.get('class_name'),
+                                               progress=lambda fraction, message: progress(0.05 + 0.95 * fraction, message),
+                                               by_family=bool(payload.get('by_family')))
+        posting.update({'issued': len(result['issued']), 'skipped': result['skipped']})
+    return posting
+
+# Render one result card
+def run_result_card(payload, progress):
+    results = service.parse_results(payload['student_id'], payload.get('results', []))
+    attendance_percentage = payload.get('attendance_percentage')
+    return service.issue_result_card(payload['student_id'], results, payload.get('academic_year', "2024-2025"),
+                                     float(attendance_percentage) if attendance_percentage is not None else None)
+
+# Export the student report as CSV
+def run_export_students(payload, progress):
+    df = db.get_all_students()
+    if payload.get('class_name'):
+        df = df[df['class_name'] == payload['class_name']]
+    return {'rows': len(df)}, df.to_csv(index=False).encode('utf-8'), "student_report.csv"
+
+# Zip stored PDFs of one document type
+def run_export_documents(payload, progress):
+    kind = payload.get('kind', 'invoice')
+    id_column = db.DOCUMENT_TABLES[kind][1]
+    documents = service.find_documents(kind, payload.get('student_id'), payload.get('academic_year'))
+    buffer = io.BytesIO()
+    missing = []
+    with zipfile.ZipFile(buffer, 'w', zipfile.ZIP_DEFLATED) as archive:
+        for done, doc in enumerate(documents, 1):
+            # A document can be deleted, or its archive removed, after it was listed
+            pdf_data = db.get_document_pdf(kind, doc[id_column])
+            if pdf_data is None:
+                missing.append(doc[id_column])
+            else:
+                archive.writestr(f"{kind}_{doc['student_id']}_{doc[id_column]}.pdf", pdf_data)
+            if done % 50 == 0 or done == len(documents):
+                progress(done / len(documents), f"{done}/{len(documents)} files")
+    return {'files': len(documents) - len(missing), 'missing': missing}, buffer.getvalue(), f"{kind}s.zip"
+
+# Merge stored PDFs into one print file, written through a temporary file
+def run_print_documents(payload, progress):
+    import tempfile
+    import printing
+    kind = payload.get('kind', 'invoice')
+    filters = (kind, payload.get('class_name'), payload.get('student_id'), payload.get('start'), payload.get('end'),
+               payload.get('period'), payload.get('academic_year'))
+    total = printing.count_documents(*filters)
+    with tempfile.TemporaryFile() as f:
+        summary = printing.print_documents(printing.stored_documents(*filters), f, bool(payload.get('two_up')),
+                                           payload.get('cut_marks', True), progress, total)
+        f.seek(0)
+        return summary, f.read(), f"{kind}s_print.pdf"
+
+# Queue stored documents for email/WhatsApp (when a kind is given), then send
+# everything due on the chosen channels
+def run_dispatch_documents(payload, progress):
+    import dispatch
+    channels = payload.get('channels') or list(dispatch.CHANNELS)
+    result = {}
+    if payload.get('kind'):
+        result['queued'] = dispatch.queue_documents(payload['kind'], channels, payload.get('class_name'),
+                                                    payload.get('student_id'), payload.get('start'), payload.get('end'),
+                                                    payload.get('period'), payload.get('academic_year'),
+                                                    bool(payload.get('resend')))
+        progress(0.0, f"Queued {sum(result['queued']['queued'].values())} messages")
+    result.update(dispatch.send_dispatches(channels, progress=progress))
+    return result
+
+# Cross-check payments against stored receipts
+def run_reconcile_receipts(payload, progress):
+    conn = None
+    try:
+        conn = db.get_connection()
+        c = conn.cursor()
+        # A family receipt carries the household payment ID its siblings' rows are linked by
+        c.execute('''SELECT p.payment_id, p.student_id, p.amount, p.payment_date FROM payments p
+                     LEFT JOIN receipts r ON r.payment_id = COALESCE(p.household_payment_id, p.payment_id)
+                     WHERE r.receipt_id IS NULL''')
+        missing = c.fetchall()
+        c.execute('''SELECT r.receipt_id, r.payment_id FROM receipts r
+                     WHERE NOT EXISTS (SELECT 1 FROM payments p WHERE p.payment_id = r.payment_id)
+                       AND NOT EXISTS (SELECT 1 FROM payments p WHERE p.household_payment_id = r.payment_id)''')
+        orphaned = c.fetchall()
+    finally:
+        if conn:
+            conn.close()
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(['issue', 'payment_id', 'student_id', 'amount', 'payment_date', 'receipt_id'])
+    for payment_id, student_id, amount, payment_date in missing:
+        writer.writerow(['payment_without_receipt', payment_id, student_id, amount, payment_date, ''])
+    for receipt_id, payment_id in orphaned:
+        writer.writerow(['receipt_without_payment', payment_id, '', '', '', receipt_id])
+    summary = {'payments_without_receipt': len(missing), 'receipts_without_payment': len(orphaned)}
+    return summary, buffer.getvalue().encode('utf-8'), "reconciliation.csv"
+
+# Check every balance against the ledger (optionally repairing it); CSV of mismatches
+def run_check_balances(payload, progress):
+    import balances
+    import reports
+    result = balances.check_balances(bool(payload.get('repair')), progress=progress)
+    details = result.pop('details')
+    return result, reports.to_csv(details).encode('utf-8'), "balance_check.csv"
+
+# Bring the Parquet analytics snapshot up to date
+def run_export_analytics(payload, progress):
+    import analytics
+    return analytics.export_snapshot(payload.get('directory'), bool(payload.get('full')), progress)
+
+# Take a verified online backup
+def run_backup(payload, progress):
+    import backup
+    return backup.backup_database(payload.get('backup_dir'), bool(payload.get('compress')),
+                                  bool(payload.get('full_check')), int(payload.get('keep', 14)))
+
+# Rebuild the reporting replica
+def run_refresh_replica(payload, progress):
+    import replica
+    return replica.refresh_replica(payload.get('path'))
+
+# Render next period's invoices ahead of the counter (see drafts.py)
+def run_prerender_invoices(payload, progress):
+    import drafts
+    return drafts.prerender_invoices(payload.get('period'), payload.get('class_name'), progress)
+
+HANDLERS = {
+    'invoice': run_invoice,
+    'bulk_invoices': run_bulk_invoices,
+    'post_charges': run_post_charges,
+    'prerender_invoices': run_prerender_invoices,
+    'result_card': run_result_card,
+    'export_students': run_export_students,
+    'export_documents': run_export_documents,
+    'print_documents': run_print_documents,
+    'dispatch_documents': run_dispatch_documents,
+    'reconcile_receipts': run_reconcile_receipts,
+    'check_balances': run_check_balances,
+    'export_analytics': run_export_analytics,
+    'backup': run_backup,
+    'refresh_replica': run_refresh_replica,
+}
+
+# Renew a job's lease every third of LEASE_SECONDS while its handler runs, so
+# handlers that never report progress keep the job. Sets `lost` if the job was
+# cancelled or taken over.
+def keep_lease(job_id, worker_id, stop, lost):
+    while not stop.wait(jobs.LEASE_SECONDS / 3):
+        try:
+            if not jobs.heartbeat(job_id, worker_id):
+                lost.set()
+                return
+        except Exception as e:
+            print(f"Lease renewal for job {job_id} failed: {e}")
+
+# Run one leased job to completion, failure or cancellation
+def execute(job, worker_id):
+    stop, lost = threading.Event(), threading.Event()
+
+    def progress(fraction, message=None):
+        if lost.is_set() or not jobs.heartbeat(job['id'], worker_id, fraction, message):
+            raise JobCancelled()
+
+    lease = threading.Thread(target=keep_lease, args=(job['id'], worker_id, stop, lost), name=f"lease-{job['id']}",
+                             daemon=True)
+    lease.start()
+    handler = HANDLERS.get(job['kind'])
+    try:
+        if handler is None:
+            raise ValueError(f"Unknown job kind: {job['kind']}")
+        outcome = handler(job['payload'], progress)
+        if isinstance(outcome, tuple):
+            result, data, name = outcome
+            jobs.complete(job['id'], worker_id, result, data, name)
+        else:
+            jobs.complete(job['id'], worker_id, outcome)
+    except JobCancelled:
+        print(f"Job {job['id']} was cancelled")
+    except Exception as e:
+        print(f"Job {job['id']} ({job['kind']}) failed: {e}")
+        traceback.print_exc()
+        jobs.fail(job['id'], worker_id, e)
+    finally:
+        stop.set()
+        lease.join()
+
+# Poll the queue until stopped; `once` drains what is runnable and returns
+def run_worker(worker_id=None, kinds=None, poll_interval=2.0, once=False):
+    worker_id = worker_id or jobs.default_worker_id()
+    print(f"Worker {worker_id} started (db={db.DB_PATH})")
+    while True:
+        job = jobs.claim(worker_id, kinds)
+        if job is None:
+            if once:
+                return
+            time.sleep(poll_interval)
+            continue
+        print(f"Running job {job['id']} ({job['kind']}), attempt {job['attempts']}")
+        execute(job, worker_id)
+
+def main():
+    parser = argparse.ArgumentParser(description="Background worker for queued school jobs")
+    parser.add_argument('--db', default=db.DB_PATH)
+    parser.add_argument('--kind', action='append', choices=sorted(HANDLERS), help="Only run these job kinds")
+    parser.add_argument('--poll-interval', type=float, default=2.0)
+    parser.add_argument('--once', action='store_true', help="Exit when the queue is empty")
+    args = parser.parse_args()
+    db.DB_PATH = args.db
+    db.init_db()
+    try:
+        run_worker(kinds=args.kind, poll_interval=args.poll_interval, once=args.once)
+    except KeyboardInterrupt:
+        print("Worker stopped")
+
+if __name__ == "__main__":
+    main()